@@ -1,13 +1,26 @@
+import asyncio
 import json
 import os
 import re
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from langchain_core.messages import HumanMessage, SystemMessage
 from models.study_plan_models import StructuredStudyPlan
 from utils.file_utils import save_structured_output
+from utils.json_extraction import extract_json_value, record_retry
+from utils.model_scheduler import model_scheduler, BATCH
+from utils.prompt_assembly import load_plan_template, minify_json, record_prompt_cache, static_prefix
+from utils.plan_validation import InvalidElement, build_element_prompt, find_invalid_elements, splice_elements
+from utils.rescheduler import reschedule_plan
+from utils.spaced_repetition import schedule_reviews
+from utils.formula_detection import detect_formulas, formula_annotation_enabled, merge_annotations
+from utils.stream_json import IncrementalJSONParser
+from utils.structured_output import (
+    JSON_SCHEMA, TEMPLATE, constrained_call_arguments, is_unsupported_error, mark_unsupported,
+    prompt_tokens, record_structuring_call, record_structuring_retry
+)
 from dotenv import load_dotenv
 
 # Configure logging
@@ -17,6 +30,188 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Top-level fields produced by the first structuring step
+CORE_SECTIONS = ("overall_goal", "total_study_day", "hour_per_day", "core_concepts", "general_tip")
+
+# Used when templates/study_plan_template.json is missing
+FALLBACK_TEMPLATE = {
+    "overall_goal": "Master the fundamental concepts of [SUBJECT], focusing on [KEY_AREA_1], [KEY_AREA_2], and [KEY_AREA_3].",
+    "total_study_day": "[TOTAL_STUDY_DAYS]",
+    "hour_per_day": "[HOURS_PER_DAY]",
+    "core_concepts": [
+        {
+            "name": "[CONCEPT_NAME]",
+            "explanation": "[DETAILED_EXPLANATION_OF_CONCEPT]",
+            "importance": "[WHY_THIS_CONCEPT_IS_IMPORTANT]",
+            "related_concepts": ["[RELATED_CONCEPT_1]", "[RELATED_CONCEPT_2]"],
+            "examples": ["[EXAMPLE_1_ILLUSTRATING_CONCEPT]", "[EXAMPLE_2_ILLUSTRATING_CONCEPT]"],
+            "difficulty_level": "basic"
+        }
+    ],
+    "daily_schedule": [
+        {
+            "day": 1,
+            "date": None,
+            "focus_area": "[MAIN_FOCUS_FOR_DAY_1]",
+            "study_item": [
+                {
+                    "topic": "[SPECIFIC_TOPIC_TO_STUDY]",
+                    "description": "[DETAILED_DESCRIPTION_OF_WHAT_TO_STUDY]",
+                    "duration_minutes": 30,
+                    "resource": [
+                        {
+                            "title": "[RESOURCE_TITLE]",
+                            "type": "textbook",
+                            "url": None,
+                            "description": "[RESOURCE_DESCRIPTION]"
+                        }
+                    ],
+                    "is_completed": False,
+                    "learning_objectives": ["[SPECIFIC_LEARNING_OBJECTIVE_1]", "[SPECIFIC_LEARNING_OBJECTIVE_2]"],
+                    "priority": "high"
+                }
+            ],
+            "summary": "[SUMMARY_OF_DAY'S_LEARNING]",
+            "learning_goals": ["[LEARNING_GOAL_1_FOR_DAY]", "[LEARNING_GOAL_2_FOR_DAY]"]
+        }
+    ],
+    "general_tip": ["[GENERAL_STUDY_TIP_1]", "[GENERAL_STUDY_TIP_2]", "[GENERAL_STUDY_TIP_3]"],
+    "key_formulas": [
+        {
+            "name": "[FORMULA_NAME]",
+            "formula": "[ACTUAL_FORMULA_EXPRESSION]",
+            "description": "[WHAT_THE_FORMULA_REPRESENTS]",
+            "usage_context": "[WHEN_AND_HOW_TO_USE_FORMULA]",
+            "variables": {"[VARIABLE_1]": "[DEFINITION_OF_VARIABLE_1]", "[VARIABLE_2]": "[DEFINITION_OF_VARIABLE_2]"},
+            "examples": ["[EXAMPLE_APPLICATION_OF_FORMULA_1]", "[EXAMPLE_APPLICATION_OF_FORMULA_2]"]
+        }
+    ],
+    "resources": [
+        {
+            "title": "[GENERAL_RESOURCE_TITLE]",
+            "type": "[RESOURCE_TYPE]",
+            "url": "[RESOURCE_URL]",
+            "description": "[RESOURCE_DESCRIPTION]",
+            "relevance": "[RELEVANCE_TO_STUDY_PLAN]"
+        }
+    ],
+    "assessments": [
+        {
+            "name": "[ASSESSMENT_NAME]",
+            "description": "[ASSESSMENT_DESCRIPTION]",
+            "type": "[ASSESSMENT_TYPE]",
+            "topics_covered": ["[TOPIC_1]", "[TOPIC_2]"]
+        }
+    ],
+    "prerequisites": ["[PREREQUISITE_1]", "[PREREQUISITE_2]"],
+    "difficulty_level": "intermediate",
+    "estimated_completion_time": 14.0
+}
+
+STUDY_PLAN_TEMPLATE = load_plan_template() or FALLBACK_TEMPLATE
+
+
+def build_system_prompt(template: Dict[str, Any], include_template: bool = True) -> str:
+    """
+    Create the system prompt for the structurer agent.
+    
+    Args:
+        template: The study plan JSON template
+        include_template: Paste the JSON template into the prompt. Not needed when the
+                          provider constrains the output to the plan's JSON schema.
+    """
+    if include_template:
+        # Minified, so the template costs as few prompt tokens as possible
+        format_section = f"""The output must strictly follow this JSON template structure:
+    ```json
+    {minify_json(template)}
+    ```"""
+        format_rules = [
+            "Follow the EXACT structure of the template, including all fields and nested objects.",
+            "Replace placeholder values (like [CONCEPT_NAME]) with appropriate content from the raw study plan.",
+            "Maintain the same data types as shown in the template.",
+        ]
+        closing = "Your response must be a single, valid JSON object that follows the template structure exactly."
+    else:
+        format_section = "The output format is enforced by the StructuredStudyPlan JSON schema attached to this request."
+        format_rules = ["Fill in every field the schema requires, using the field types the schema declares."]
+        closing = "Your response must be a single, valid JSON object that matches the schema."
+    rules = format_rules + [
+        "Ensure all JSON is valid and properly formatted.",
+        "Be comprehensive but concise in filling out each section.",
+        "If information for a field is not available in the raw plan, make a reasonable inference based on the context.",
+        "Your output should ONLY contain the JSON object, nothing else.",
+        "Keep your response within reasonable length to avoid truncation.",
+        "Limit the number of study items per day to 3-4 maximum.",
+        "Limit the number of core concepts to 5 maximum.",
+    ]
+    numbered_rules = "\n    ".join(f"{number}. {rule}" for number, rule in enumerate(rules, 1))
+    
+    # Create the system prompt
+    return static_prefix(f"""You are an expert study plan structurer. Your task is to convert a raw study plan into a structured JSON format.
+    
+    {format_section}
+    
+    CRITICAL REQUIREMENTS:
+    1. You MUST preserve the exact number of study days provided in the user input
+    2. You MUST preserve the exact number of hours per day provided in the user input
+    3. NEVER modify the total_study_day or hour_per_day values under any circumstances
+    4. If the raw plan has a different timeline, adjust the content to fit the required days/hours
+    
+    Important rules:
+    {numbered_rules}
+    
+    {closing}""")
+
+
+# Built at import so every request sends byte-identical prefixes the provider can cache
+SYSTEM_PROMPT = build_system_prompt(STUDY_PLAN_TEMPLATE)
+SCHEMA_SYSTEM_PROMPT = build_system_prompt(STUDY_PLAN_TEMPLATE, include_template=False)
+
+# Step instructions, sent after the raw plan so all steps of one request share the same prefix
+CORE_STEP_PROMPT = static_prefix("""First, create the core structure of the study plan with these essential fields:
+    1. overall_goal
+    2. total_study_day
+    3. hour_per_day
+    4. core_concepts (limit to 5 max)
+    5. general_tip
+    
+    Do not include daily_schedule or key_formulas yet. Keep your response concise and focused.
+    Return a valid JSON object with just these fields.""")
+
+SCHEDULE_STEP_PROMPT = static_prefix("""Now, create only the daily_schedule array for the study plan.
+    Limit each day to 3-4 study items maximum to keep the response concise.
+    Include focus_area, study_item, summary and learning_goals for each day (review topics are added afterwards).
+    Return a valid JSON object with a single daily_schedule field containing the array.""")
+
+FORMULAS_STEP_PROMPT = static_prefix("""Finally, create only the key_formulas array for the study plan.
+    Include name, formula, description, and usage_context for each formula.
+    Return a valid JSON object with a single key_formulas field containing the array.""")
+
+# Sent with only the locally detected formulas, instead of the raw plan
+FORMULAS_ANNOTATE_PROMPT = static_prefix("""These formulas were found in the study plan. For each one, in the same order,
+    give name, formula (unchanged), description and usage_context.
+    Return a valid JSON object with a single key_formulas field containing the array.""")
+
+FULL_PLAN_PROMPT = static_prefix("""Convert this raw study plan into a structured JSON format following the schema provided.
+    Return ONLY valid JSON without any explanations, markdown formatting, or non-JSON text.""")
+
+SYNC_FULL_PLAN_PROMPT = static_prefix("""Convert this raw study plan into a structured JSON format following the schema provided.
+    Focus on creating a COMPLETE and COMPREHENSIVE study plan.
+    Return ONLY valid JSON without any explanations, markdown formatting, or non-JSON text.""")
+
+RETRY_PROMPT = static_prefix("""Your previous response could not be parsed as valid JSON. Please try again.
+    Return ONLY a valid JSON object following the schema.
+    NO explanations, NO markdown formatting (no ```), NO additional text.
+    Just the raw JSON object starting with {.
+    
+    Make sure all strings are properly quoted and all JSON syntax is valid.""")
+
+
+def raw_plan_message(raw_plan: str, step_prompt: str) -> str:
+    """User message for one structuring step: the raw plan first, then the step's fixed instructions."""
+    return f"Here is the raw study plan:\n\n{raw_plan}\n\n{step_prompt}"
+
 
 class StructurerAgent:
     """
@@ -24,14 +219,18 @@ class StructurerAgent:
     that follows the StructuredStudyPlan Pydantic model.
     """
     
-    def __init__(self, model_name: str = "deepseek/deepseek-chat-v3-0324:free", temperature: float = 0.7):
+    def __init__(self, model_name: str = "deepseek/deepseek-chat-v3-0324:free", temperature: float = 0.7,
+                 session_id: str = None):
         """
         Initialize the structurer agent.
         
         Args:
             model_name: The model to use (default: deepseek/deepseek-chat-v3-0324:free via OpenRouter)
             temperature: The temperature for generation
+            session_id: Optional session identifier used for fair-share scheduling
         """
+        self.session_id = session_id
+        self.model_name = model_name
         openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
         if not openrouter_api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable not found")
@@ -46,127 +245,12 @@ class StructurerAgent:
         )
         self.output_parser = PydanticOutputParser(pydantic_object=StructuredStudyPlan)
         
-        # Load the template
-        template_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                                     "templates", "study_plan_template.json")
-        try:
-            with open(template_path, "r") as f:
-                self.template = json.load(f)
-                logger.info("Successfully loaded study plan template from %s", template_path)
-        except FileNotFoundError:
-            # Fallback to a basic template if file not found
-            logger.warning("Template file not found at %s, using fallback template", template_path)
-            self.template = {
-                "overall_goal": "Master the fundamental concepts of [SUBJECT], focusing on [KEY_AREA_1], [KEY_AREA_2], and [KEY_AREA_3].",
-                "total_study_day": "[TOTAL_STUDY_DAYS]",
-                "hour_per_day": "[HOURS_PER_DAY]",
-                "core_concepts": [
-                    {
-                        "name": "[CONCEPT_NAME]",
-                        "explanation": "[DETAILED_EXPLANATION_OF_CONCEPT]",
-                        "importance": "[WHY_THIS_CONCEPT_IS_IMPORTANT]",
-                        "related_concepts": ["[RELATED_CONCEPT_1]", "[RELATED_CONCEPT_2]"],
-                        "examples": ["[EXAMPLE_1_ILLUSTRATING_CONCEPT]", "[EXAMPLE_2_ILLUSTRATING_CONCEPT]"],
-                        "difficulty_level": "basic"
-                    }
-                ],
-                "daily_schedule": [
-                    {
-                        "day": 1,
-                        "date": None,
-                        "focus_area": "[MAIN_FOCUS_FOR_DAY_1]",
-                        "study_item": [
-                            {
-                                "topic": "[SPECIFIC_TOPIC_TO_STUDY]",
-                                "description": "[DETAILED_DESCRIPTION_OF_WHAT_TO_STUDY]",
-                                "duration_minutes": 30,
-                                "resource": [
-                                    {
-                                        "title": "[RESOURCE_TITLE]",
-                                        "type": "textbook",
-                                        "url": None,
-                                        "description": "[RESOURCE_DESCRIPTION]"
-                                    }
-                                ],
-                                "is_completed": False,
-                                "learning_objectives": ["[SPECIFIC_LEARNING_OBJECTIVE_1]", "[SPECIFIC_LEARNING_OBJECTIVE_2]"],
-                                "priority": "high"
-                            }
-                        ],
-                        "summary": "[SUMMARY_OF_DAY'S_LEARNING]",
-                        "learning_goals": ["[LEARNING_GOAL_1_FOR_DAY]", "[LEARNING_GOAL_2_FOR_DAY]"],
-                        "review_topics": ["[TOPIC_TO_REVIEW_FROM_PREVIOUS_DAYS]"]
-                    }
-                ],
-                "general_tip": ["[GENERAL_STUDY_TIP_1]", "[GENERAL_STUDY_TIP_2]", "[GENERAL_STUDY_TIP_3]"],
-                "key_formulas": [
-                    {
-                        "name": "[FORMULA_NAME]",
-                        "formula": "[ACTUAL_FORMULA_EXPRESSION]",
-                        "description": "[WHAT_THE_FORMULA_REPRESENTS]",
-                        "usage_context": "[WHEN_AND_HOW_TO_USE_FORMULA]",
-                        "variables": {"[VARIABLE_1]": "[DEFINITION_OF_VARIABLE_1]", "[VARIABLE_2]": "[DEFINITION_OF_VARIABLE_2]"},
-                        "examples": ["[EXAMPLE_APPLICATION_OF_FORMULA_1]", "[EXAMPLE_APPLICATION_OF_FORMULA_2]"]
-                    }
-                ],
-                "resources": [
-                    {
-                        "title": "[GENERAL_RESOURCE_TITLE]",
-                        "type": "[RESOURCE_TYPE]",
-                        "url": "[RESOURCE_URL]",
-                        "description": "[RESOURCE_DESCRIPTION]",
-                        "relevance": "[RELEVANCE_TO_STUDY_PLAN]"
-                    }
-                ],
-                "assessments": [
-                    {
-                        "name": "[ASSESSMENT_NAME]",
-                        "description": "[ASSESSMENT_DESCRIPTION]",
-                        "type": "[ASSESSMENT_TYPE]",
-                        "topics_covered": ["[TOPIC_1]", "[TOPIC_2]"]
-                    }
-                ],
-                "prerequisites": ["[PREREQUISITE_1]", "[PREREQUISITE_2]"],
-                "difficulty_level": "intermediate",
-                "estimated_completion_time": 14.0
-            }
-            
-        # Create the system prompt with instructions and format requirements
-        self.system_prompt = self._create_system_prompt()
-        
-    def _create_system_prompt(self):
-        """Create the system prompt for the structurer agent."""
-        # Convert the template to a pretty-printed JSON string
-        template_json = json.dumps(self.template, indent=2)
-        
-        # Create the system prompt
-        return f"""You are an expert study plan structurer. Your task is to convert a raw study plan into a structured JSON format.
-        
-        The output must strictly follow this JSON template structure:
-        ```json
-        {template_json}
-        ```
-        
-        CRITICAL REQUIREMENTS:
-        1. You MUST preserve the exact number of study days provided in the user input
-        2. You MUST preserve the exact number of hours per day provided in the user input
-        3. NEVER modify the total_study_day or hour_per_day values under any circumstances
-        4. If the raw plan has a different timeline, adjust the content to fit the required days/hours
-        
-        Important rules:
-        1. Follow the EXACT structure of the template, including all fields and nested objects.
-        2. Replace placeholder values (like [CONCEPT_NAME]) with appropriate content from the raw study plan.
-        3. Maintain the same data types as shown in the template.
-        4. Ensure all JSON is valid and properly formatted.
-        5. Be comprehensive but concise in filling out each section.
-        6. If information for a field is not available in the raw plan, make a reasonable inference based on the context.
-        7. Your output should ONLY contain the JSON object, nothing else.
-        8. Keep your response within reasonable length to avoid truncation.
-        9. Limit the number of study items per day to 3-4 maximum.
-        10. Limit the number of core concepts to 5 maximum.
-        
-        Your response must be a single, valid JSON object that follows the template structure exactly."""
-
+        # The template and system prompts are built once per process, not per instance
+        self.template = STUDY_PLAN_TEMPLATE
+        self.system_prompt = SYSTEM_PROMPT
+        # Template-free prompt for providers that enforce the JSON schema themselves
+        self.schema_system_prompt = SCHEMA_SYSTEM_PROMPT
+        
     def _enforce_user_constraints(self, structured_plan: Dict[str, Any], user_days: int = None, user_hours: float = None, is_sync: bool = False) -> Dict[str, Any]:
         """
         Enforce user-specified days and hours in the structured plan.
@@ -182,6 +266,16 @@ class StructurerAgent:
         """
         sync_label = " (sync)" if is_sync else ""
         
+        schedule = structured_plan.get('daily_schedule') or []
+        if user_days is not None and schedule and len(schedule) != user_days:
+            # Re-pack the existing items into the requested grid instead of cutting or cloning days
+            try:
+                logger.info(f"Rescheduling {len(schedule)} days into {user_days} days{sync_label}")
+                hours = user_hours if user_hours is not None else structured_plan.get('hour_per_day') or 2
+                return reschedule_plan(structured_plan, user_days, hours)
+            except ValueError as e:
+                logger.warning(f"Local rescheduling failed, adjusting the day list instead: {e}{sync_label}")
+        
         if user_days is not None:
             logger.info(f"Enforcing user-specified days: {user_days}{sync_label}")
             structured_plan['total_study_day'] = user_days
@@ -219,42 +313,214 @@ class StructurerAgent:
             logger.info(f"Enforcing user-specified hours per day: {user_hours}{sync_label}")
             structured_plan['hour_per_day'] = user_hours
             
-        return structured_plan
+        # Review topics are computed locally rather than taken from the model
+        return schedule_reviews(structured_plan)
         
-    def _extract_json(self, text: str) -> Dict[str, Any]:
+    async def _ainvoke(self, messages, source: str = "structurer"):
+        """Invoke the model once the scheduler grants a batch slot."""
+        async with model_scheduler.slot(BATCH, self.session_id):
+            response = await self.model.ainvoke(messages)
+        record_prompt_cache(source, response)
+        return response
+
+    def _plan_call(self, user_content: str, schema_name: str, sections: Tuple[str, ...] = None):
+        """
+        Model, messages and mode for the next structuring call.
+        
+        Uses the most constrained response_format this model has not rejected. In JSON
+        schema mode the template is left out of the system prompt.
+        """
+        mode, response_format = constrained_call_arguments(self.model_name, schema_name, sections)
+        model = self.model.bind(response_format=response_format) if response_format else self.model
+        system_prompt = self.schema_system_prompt if mode == JSON_SCHEMA else self.system_prompt
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_content)
+        ]
+        return model, messages, mode
+
+    async def _ainvoke_plan(self, user_content: str, schema_name: str, sections: Tuple[str, ...] = None):
         """
-        Extract JSON from text using multiple parsing strategies.
+        Invoke a structuring step with schema-constrained output when the provider supports it.
+        
+        If the provider rejects the response_format, the model is remembered as unsupported
+        for that mode and the call is repeated with the next one, down to the template prompt.
+        
+        Args:
+            user_content: The user message for this step
+            schema_name: Name of the schema sent to the provider
+            sections: Top-level plan fields this step produces, or None for the whole plan
+            
+        Returns:
+            tuple: ``(response, mode)``
+        """
+        while True:
+            model, messages, mode = self._plan_call(user_content, schema_name, sections)
+            try:
+                async with model_scheduler.slot(BATCH, self.session_id):
+                    response = await model.ainvoke(messages)
+            except Exception as e:
+                if mode == TEMPLATE or not is_unsupported_error(e):
+                    raise
+                mark_unsupported(self.model_name, mode, e)
+                continue
+            record_structuring_call(mode, prompt_tokens(response, messages))
+            record_prompt_cache(f"structurer.{schema_name}", response)
+            return response, mode
+
+    def _invoke_plan(self, user_content: str, schema_name: str, sections: Tuple[str, ...] = None):
+        """Synchronous version of _ainvoke_plan."""
+        while True:
+            model, messages, mode = self._plan_call(user_content, schema_name, sections)
+            try:
+                response = model.invoke(messages)
+            except Exception as e:
+                if mode == TEMPLATE or not is_unsupported_error(e):
+                    raise
+                mark_unsupported(self.model_name, mode, e)
+                continue
+            record_structuring_call(mode, prompt_tokens(response, messages))
+            record_prompt_cache(f"structurer.{schema_name}", response)
+            return response, mode
+
+    def _extract_json(self, text: str, expect: Optional[type] = None, source: str = "structurer",
+                      repair: bool = False) -> Any:
+        """
+        Extract JSON from text using the shared linear-time extraction strategies.
         
         Args:
             text: The text to extract JSON from
+            expect: Required type of the value (``dict`` or ``list``), or None for either
+            source: Name used to attribute extraction metrics
+            repair: Repair truncated or malformed JSON locally instead of failing
             
         Returns:
-            The extracted JSON as a dictionary, or None if extraction fails
+            The extracted JSON value, or None if extraction fails
         """
-        # First, try to parse the entire response as JSON
+        return extract_json_value(text, expect=expect, source=source, repair=repair)
+
+    def _element_messages(self, invalid: InvalidElement) -> List[Any]:
+        """Short messages asking the model to fix one invalid plan element."""
+        return [
+            SystemMessage(content="You fix single JSON elements of a study plan. Respond with JSON only."),
+            HumanMessage(content=build_element_prompt(invalid))
+        ]
+
+    def _accept_regenerated(self, invalid: InvalidElement, response: Any) -> Optional[Dict[str, Any]]:
+        """The regenerated element if it now validates, otherwise None so it is dropped."""
+        if isinstance(response, Exception):
+            logger.warning(f"Regenerating {invalid.path} failed: {str(response)}")
+            return None
+        element = self._extract_json(response.content, expect=dict, source="structurer.element", repair=True)
+        if element is None:
+            logger.warning(f"No JSON in regenerated element {invalid.path}, dropping it")
+            return None
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            logger.debug("Direct JSON parsing failed, trying pattern matching")
+            invalid.model(**element)
+        except Exception as validation_error:
+            logger.warning(f"Regenerated element {invalid.path} is still invalid, dropping it: {str(validation_error)}")
+            return None
+        return element
+
+    def _log_regeneration(self, invalid: List[InvalidElement], replacements: Dict[Any, Any]) -> None:
+        fixed = sum(1 for element in replacements.values() if element is not None)
+        logger.info(f"Regenerated {fixed} of {len(invalid)} invalid plan elements, "
+                    f"dropped {len(invalid) - fixed}; kept the rest of the plan as generated")
+
+    async def _generate_key_formulas(self, raw_plan: str) -> Tuple[List[Any], str]:
+        """
+        Generate the key formulas, sending the raw plan to the model only when no formulas are found locally.
         
-        # Try to extract JSON using regex pattern matching
-        try:
-            # Look for JSON between triple backticks
-            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
-            if json_match:
-                json_str = json_match.group(1).strip()
-                return json.loads(json_str)
-            
-            # Try to find JSON without backticks
-            json_match = re.search(r'(\{[\s\S]*\})', text)
-            if json_match:
-                json_str = json_match.group(1).strip()
-                return json.loads(json_str)
-        except Exception as pattern_error:
-            logger.debug(f"Pattern matching parsing failed: {str(pattern_error)}")
-        
-        # If all parsing attempts fail, return None
-        return None
+        Formulas detected in the raw plan (utils.formula_detection) are used as they are when
+        ANNOTATE_FORMULAS is off, and otherwise sent on their own for the model to name and
+        describe. If that short call fails, the local names and descriptions are kept.
+        
+        Args:
+            raw_plan: The raw study plan text
+            
+        Returns:
+            tuple: ``(key_formulas, response_text)``
+        """
+        detected = detect_formulas(raw_plan)
+        if detected and not formula_annotation_enabled():
+            logger.info(f"Using {len(detected)} locally detected formulas without a model call")
+            return [formula.as_key_formula() for formula in detected], "LOCAL"
+        if detected:
+            candidates = [{"name": formula.name, "formula": formula.formula} for formula in detected]
+            try:
+                annotate_response, _ = await self._ainvoke_plan(
+                    f"{FORMULAS_ANNOTATE_PROMPT}\n\n{minify_json(candidates)}",
+                    "study_plan_key_formulas", ("key_formulas",)
+                )
+            except Exception as e:
+                logger.warning(f"Annotating {len(detected)} detected formulas failed, keeping local names: {e}")
+                return [formula.as_key_formula() for formula in detected], "LOCAL"
+            annotated = self._extract_json(annotate_response.content, source="structurer.formulas", repair=True)
+            logger.info(f"Annotated {len(detected)} locally detected formulas")
+            return merge_annotations(detected, annotated), annotate_response.content
+        
+        # Get the key formulas response
+        formulas_response, _ = await self._ainvoke_plan(
+            raw_plan_message(raw_plan, FORMULAS_STEP_PROMPT),
+            "study_plan_key_formulas", ("key_formulas",)
+        )
+        formulas_text = formulas_response.content
+        
+        # Parse the key formulas
+        key_formulas = self._extract_json(formulas_text, source="structurer.formulas", repair=True)
+        if not key_formulas:
+            logger.warning("Failed to extract key formulas")
+            key_formulas = []
+        
+        # If we got an object with a key_formulas field, extract it
+        if isinstance(key_formulas, dict) and 'key_formulas' in key_formulas:
+            key_formulas = key_formulas['key_formulas']
+        return key_formulas, formulas_text
+
+    async def _regenerate_invalid_elements(self, structured_plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Re-request only the days, study items, concepts and formulas that fail validation.
+        
+        Every element that validates is kept as is. Each invalid one is sent back to the
+        model on its own with a short focused prompt, and the results are spliced into the
+        plan. Elements that still fail are dropped so the rest of the plan can be used.
+        
+        Args:
+            structured_plan: The parsed plan, before validation
+            
+        Returns:
+            The plan with invalid elements replaced or removed
+        """
+        invalid = find_invalid_elements(structured_plan)
+        if not invalid:
+            return structured_plan
+        
+        logger.info(f"{len(invalid)} plan elements failed validation, regenerating only those")
+        responses = await asyncio.gather(
+            *(self._ainvoke(self._element_messages(element), "structurer.element") for element in invalid),
+            return_exceptions=True
+        )
+        replacements = {element.path: self._accept_regenerated(element, response)
+                        for element, response in zip(invalid, responses)}
+        self._log_regeneration(invalid, replacements)
+        return splice_elements(structured_plan, replacements)
+
+    def _regenerate_invalid_elements_sync(self, structured_plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Synchronous version of _regenerate_invalid_elements."""
+        invalid = find_invalid_elements(structured_plan)
+        if not invalid:
+            return structured_plan
+        
+        logger.info(f"{len(invalid)} plan elements failed validation, regenerating only those (sync)")
+        replacements = {}
+        for element in invalid:
+            try:
+                response = self.model.invoke(self._element_messages(element))
+            except Exception as e:
+                response = e
+            replacements[element.path] = self._accept_regenerated(element, response)
+        self._log_regeneration(invalid, replacements)
+        return splice_elements(structured_plan, replacements)
         
     async def structure_plan(self, raw_plan: str, save_output: bool = True, output_filename: str = None, 
                             user_days: int = None, user_hours: float = None) -> Dict[str, Any]:
@@ -294,67 +560,39 @@ class StructurerAgent:
             
             response_text = ""
             structured_plan = None
+            plan_mode = None
             error_message = None
             
             # Break down the task into smaller chunks to avoid truncation issues
             # First, generate the core structure with essential fields
-            core_prompt = """First, create the core structure of the study plan with these essential fields:
-            1. overall_goal
-            2. total_study_day
-            3. hour_per_day
-            4. core_concepts (limit to 5 max)
-            5. general_tip
-            
-            Do not include daily_schedule or key_formulas yet. Keep your response concise and focused.
-            Return a valid JSON object with just these fields."""
-            
-            # Create the messages for the core structure
-            core_messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=f"Here is the raw study plan to structure:\n\n{raw_plan}\n\n{core_prompt}")
-            ]
-            
-            # Get the core structure response
-            core_response = await self.model.ainvoke(core_messages)
+            # Get the core structure response, schema-constrained when the provider supports it
+            core_response, plan_mode = await self._ainvoke_plan(
+                raw_plan_message(raw_plan, CORE_STEP_PROMPT),
+                "study_plan_core", CORE_SECTIONS
+            )
             core_text = core_response.content
             
             # Parse the core structure
-            core_structure = self._extract_json(core_text)
+            # Repair a cut-off or malformed core locally before falling back to a full retry
+            core_structure = self._extract_json(core_text, expect=dict, source="structurer.core", repair=True)
             if not core_structure:
                 raise ValueError("Failed to generate core structure")
             
             logger.info("Successfully generated core structure")
             
             # Now generate the daily schedule separately
-            schedule_prompt = """Now, create only the daily_schedule array for the study plan.
-            Limit each day to 3-4 study items maximum to keep the response concise.
-            Include focus_area, study_item, summary, learning_goals, and review_topics for each day.
-            Return a valid JSON array containing just the daily schedule."""
-            
-            # Create the messages for the daily schedule
-            schedule_messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=f"Here is the raw study plan:\n\n{raw_plan}\n\n{schedule_prompt}")
-            ]
-            
             # Get the daily schedule response
-            schedule_response = await self.model.ainvoke(schedule_messages)
+            schedule_response, _ = await self._ainvoke_plan(
+                raw_plan_message(raw_plan, SCHEDULE_STEP_PROMPT),
+                "study_plan_daily_schedule", ("daily_schedule",)
+            )
             schedule_text = schedule_response.content
             
             # Parse the daily schedule
-            daily_schedule = self._extract_json(schedule_text)
+            daily_schedule = self._extract_json(schedule_text, source="structurer.schedule", repair=True)
             if not daily_schedule:
-                # Try to extract just the array
-                array_match = re.search(r'\[\s*\{[\s\S]*?\}\s*\]', schedule_text)
-                if array_match:
-                    try:
-                        daily_schedule = json.loads(array_match.group(0))
-                    except json.JSONDecodeError:
-                        logger.warning("Failed to parse daily schedule array")
-                        daily_schedule = []
-                else:
-                    logger.warning("Failed to extract daily schedule")
-                    daily_schedule = []
+                logger.warning("Failed to extract daily schedule")
+                daily_schedule = []
             
             # If we got an object with a daily_schedule field, extract it
             if isinstance(daily_schedule, dict) and 'daily_schedule' in daily_schedule:
@@ -363,38 +601,7 @@ class StructurerAgent:
             logger.info(f"Successfully generated daily schedule with {len(daily_schedule)} days")
             
             # Finally, generate the key formulas separately
-            formulas_prompt = """Finally, create only the key_formulas array for the study plan.
-            Include name, formula, description, and usage_context for each formula.
-            Return a valid JSON array containing just the key formulas."""
-            
-            # Create the messages for the key formulas
-            formulas_messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=f"Here is the raw study plan:\n\n{raw_plan}\n\n{formulas_prompt}")
-            ]
-            
-            # Get the key formulas response
-            formulas_response = await self.model.ainvoke(formulas_messages)
-            formulas_text = formulas_response.content
-            
-            # Parse the key formulas
-            key_formulas = self._extract_json(formulas_text)
-            if not key_formulas:
-                # Try to extract just the array
-                array_match = re.search(r'\[\s*\{[\s\S]*?\}\s*\]', formulas_text)
-                if array_match:
-                    try:
-                        key_formulas = json.loads(array_match.group(0))
-                    except json.JSONDecodeError:
-                        logger.warning("Failed to parse key formulas array")
-                        key_formulas = []
-                else:
-                    logger.warning("Failed to extract key formulas")
-                    key_formulas = []
-            
-            # If we got an object with a key_formulas field, extract it
-            if isinstance(key_formulas, dict) and 'key_formulas' in key_formulas:
-                key_formulas = key_formulas['key_formulas']
+            key_formulas, formulas_text = await self._generate_key_formulas(raw_plan)
             
             logger.info(f"Successfully generated key formulas with {len(key_formulas)} formulas")
             
@@ -403,7 +610,8 @@ class StructurerAgent:
             structured_plan['daily_schedule'] = daily_schedule
             structured_plan['key_formulas'] = key_formulas
             
-            # Enforce user constraints
+            # Fix only the elements that fail validation, then enforce user constraints
+            structured_plan = await self._regenerate_invalid_elements(structured_plan)
             structured_plan = self._enforce_user_constraints(structured_plan, user_days, user_hours, is_sync=False)
             
             # Combine all responses for logging
@@ -479,53 +687,32 @@ class StructurerAgent:
                 try:
                     logger.warning("Initial parsing attempts failed. Trying again with explicit JSON-only instructions.")
                     
-                    retry_prompt = f"""
-                    Your previous response could not be parsed as valid JSON. Please try again.
-                    
-                    Here is the raw study plan:
-                    
-                    {raw_plan}
-                    
-                    Return ONLY a valid JSON object following the schema. 
-                    NO explanations, NO markdown formatting (no ```), NO additional text.
-                    Just the raw JSON object starting with {{.
-                    
-                    Make sure all strings are properly quoted and all JSON syntax is valid.
-                    """
+                    retry_prompt = raw_plan_message(raw_plan, RETRY_PROMPT)
                     
                     retry_messages = [
                         SystemMessage(content=self.system_prompt),
                         HumanMessage(content=retry_prompt)
                     ]
                     
-                    retry_response = await self.model.ainvoke(retry_messages)
+                    record_retry("structurer.core")
+                    record_structuring_retry(plan_mode or TEMPLATE)
+                    retry_response = await self._ainvoke(retry_messages, "structurer.retry")
                     retry_text = retry_response.content
                     
                     logger.info("Retry response from structurer agent: %s", retry_text)
                     
-                    try:
-                        structured_plan = json.loads(retry_text)
+                    structured_plan = self._extract_json(retry_text, expect=dict, source="structurer.retry")
+                    if structured_plan is not None:
                         logger.info("Successfully parsed JSON from retry")
                         response_text = retry_text
-                    except json.JSONDecodeError as e:
-                        # One last attempt - try to extract any JSON-like content from retry
-                        json_pattern = re.search(r'({.*})', retry_text, re.DOTALL)
-                        if json_pattern:
-                            potential_json = json_pattern.group(1).strip()
-                            try:
-                                structured_plan = json.loads(potential_json)
-                                logger.info("Successfully parsed JSON from retry pattern matching")
-                                response_text = retry_text
-                            except json.JSONDecodeError as e2:
-                                error_message = f"All parsing attempts failed. Final error: {str(e2)}"
-                                logger.error(error_message)
-                        else:
-                            error_message = f"All parsing attempts failed. Final error: {str(e)}"
-                            logger.error(error_message)
+                    else:
+                        error_message = "All parsing attempts failed. No JSON object found in retry response"
+                        logger.error(error_message)
                             
                     # If we have a structured plan from the retry, validate and return it
                     if structured_plan:
                         try:
+                            structured_plan = await self._regenerate_invalid_elements(structured_plan)
                             validated_plan = StructuredStudyPlan(**structured_plan)
                             result = validated_plan.dict()
                             
@@ -585,6 +772,76 @@ class StructurerAgent:
             
             return error_result
     
+    async def stream_structure_plan(self, raw_plan: str, user_days: int = None,
+                                    user_hours: float = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Structure a raw study plan while streaming partial results.
+        
+        The model output is fed token by token into an incremental JSON parser, so each
+        day, core concept and formula is yielded as soon as its closing brace arrives.
+        Reading stops as soon as the top-level object closes.
+        
+        Args:
+            raw_plan: The raw study plan to structure
+            user_days: Explicitly specified number of study days
+            user_hours: Explicitly specified hours per day
+        
+        Yields:
+            ``(section, element)`` tuples for partial results, then ``("complete", plan)``
+            with the validated plan or ``("error", details)`` if the plan could not be built
+        """
+        prompt = raw_plan_message(raw_plan, FULL_PLAN_PROMPT)
+        parser = IncrementalJSONParser()
+        while True:
+            model, messages, mode = self._plan_call(prompt, "StructuredStudyPlan")
+            try:
+                async with model_scheduler.slot(BATCH, self.session_id):
+                    stream = model.astream(messages)
+                    try:
+                        async for message_chunk in stream:
+                            for section, element in parser.feed(message_chunk.content or ""):
+                                if section != "complete":
+                                    yield section, element
+                            if parser.done:
+                                logger.info("Top-level JSON object closed, stopping stream early")
+                                break
+                    finally:
+                        await stream.aclose()
+            except Exception as e:
+                # A rejected response_format fails before any output, so fall back and start over
+                if mode != TEMPLATE and not parser.text and is_unsupported_error(e):
+                    mark_unsupported(self.model_name, mode, e)
+                    continue
+                logger.error(f"Error while streaming structured plan: {str(e)}")
+                yield "error", {"error": "Failed to stream structured plan", "details": str(e)}
+                return
+            record_structuring_call(mode, prompt_tokens(None, messages))
+            break
+        
+        result = parser.result
+        if result is None:
+            # Output was cut off (e.g. at max_tokens); close it locally rather than failing the stream
+            result = self._extract_json(parser.text, expect=dict, source="structurer.stream", repair=True)
+        if result is None:
+            yield "error", {
+                "error": "Failed to structure the study plan",
+                "details": "Model output ended before the JSON object was complete",
+                "raw_response": parser.text
+            }
+            return
+        
+        result = await self._regenerate_invalid_elements(result)
+        structured_plan = self._enforce_user_constraints(result, user_days, user_hours)
+        try:
+            yield "complete", StructuredStudyPlan(**structured_plan).dict()
+        except Exception as validation_error:
+            logger.error(f"Validation error (stream): {str(validation_error)}")
+            yield "error", {
+                "error": "Failed to validate structured plan",
+                "details": str(validation_error),
+                "parsed_json": structured_plan
+            }
+    
     def structure_plan_sync(self, raw_plan: str, save_output: bool = True, output_filename: str = None, 
                          user_days: int = None, user_hours: float = None) -> Dict[str, Any]:
         """
@@ -620,115 +877,52 @@ class StructurerAgent:
                     logger.info(f"Extracted user-specified hours per day: {user_hours} (sync)")
             
             logger.info(f"Structuring study plan with {self.model.model_name} (sync)")
-            prompt = f"""
-            Here is a raw study plan:
-            
-            {raw_plan}
-            
-            Convert this raw study plan into a structured JSON format following the schema provided.
-            Focus on creating a COMPLETE and COMPREHENSIVE study plan.
-            Return ONLY valid JSON without any explanations, markdown formatting, or non-JSON text.
-            """
+            prompt = raw_plan_message(raw_plan, SYNC_FULL_PLAN_PROMPT)
             
-            messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=prompt)
-            ]
-            
-            # First attempt
-            response = self.model.invoke(messages)
+            # First attempt, schema-constrained when the provider supports it
+            response, plan_mode = self._invoke_plan(prompt, "StructuredStudyPlan")
             response_text = response.content
             
             # Log the raw response for debugging
             logger.info("Raw response from structurer agent (sync): %s", response_text)
             
-            # Multiple parsing attempts with increasingly aggressive cleanup
-            structured_plan = None
+            # Attempts 1-3: direct parsing, code blocks, any balanced JSON object, then local repair
             error_message = None
-            
-            # Attempt 1: Direct JSON parsing
-            try:
-                structured_plan = json.loads(response_text)
-                logger.info("Successfully parsed JSON directly (sync)")
-            except json.JSONDecodeError as e:
-                error_message = f"Direct parsing failed (sync): {str(e)}"
-                logger.warning(error_message)
-            
-            # Attempt 2: Extract from code blocks
-            if structured_plan is None:
-                json_match = re.search(r'```(?:json)?(.*?)```', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                    try:
-                        structured_plan = json.loads(json_str)
-                        logger.info("Successfully parsed JSON from code block (sync)")
-                    except json.JSONDecodeError as e:
-                        error_message = f"Code block parsing failed (sync): {str(e)}"
-                        logger.warning(error_message)
-            
-            # Attempt 3: Find any JSON-like content
+            structured_plan = self._extract_json(response_text, expect=dict, source="structurer.sync", repair=True)
             if structured_plan is None:
-                # Look for content that looks like JSON object (starts with { and ends with })
-                json_pattern = re.search(r'({.*})', response_text, re.DOTALL)
-                if json_pattern:
-                    potential_json = json_pattern.group(1).strip()
-                    try:
-                        structured_plan = json.loads(potential_json)
-                        logger.info("Successfully parsed JSON from pattern matching (sync)")
-                    except json.JSONDecodeError as e:
-                        error_message = f"Pattern matching parsing failed (sync): {str(e)}"
-                        logger.warning(error_message)
+                error_message = "No JSON object found in response (sync)"
+                logger.warning(error_message)
             
             # Attempt 4: If still failing, try a retry with explicit instructions
             if structured_plan is None:
                 logger.warning("Initial parsing attempts failed. Trying again with explicit JSON-only instructions (sync).")
                 
-                retry_prompt = f"""
-                Your previous response could not be parsed as valid JSON. Please try again.
-                
-                Here is the raw study plan:
-                
-                {raw_plan}
-                
-                Return ONLY a valid JSON object following the schema. 
-                NO explanations, NO markdown formatting (no ```), NO additional text.
-                Just the raw JSON object starting with {{.
-                
-                Make sure all strings are properly quoted and all JSON syntax is valid.
-                """
+                retry_prompt = raw_plan_message(raw_plan, RETRY_PROMPT)
                 
                 retry_messages = [
                     SystemMessage(content=self.system_prompt),
                     HumanMessage(content=retry_prompt)
                 ]
                 
+                record_retry("structurer.sync")
+                record_structuring_retry(plan_mode)
                 retry_response = self.model.invoke(retry_messages)
                 retry_text = retry_response.content
                 
                 logger.info("Retry response from structurer agent (sync): %s", retry_text)
                 
-                try:
-                    structured_plan = json.loads(retry_text)
+                structured_plan = self._extract_json(retry_text, expect=dict, source="structurer.sync_retry")
+                if structured_plan is not None:
                     logger.info("Successfully parsed JSON from retry (sync)")
-                except json.JSONDecodeError as e:
-                    # One last attempt - try to extract any JSON-like content from retry
-                    json_pattern = re.search(r'({.*})', retry_text, re.DOTALL)
-                    if json_pattern:
-                        potential_json = json_pattern.group(1).strip()
-                        try:
-                            structured_plan = json.loads(potential_json)
-                            logger.info("Successfully parsed JSON from retry pattern matching (sync)")
-                        except json.JSONDecodeError as e2:
-                            error_message = f"All parsing attempts failed. Final error (sync): {str(e2)}"
-                            logger.error(error_message)
-                    else:
-                        error_message = f"All parsing attempts failed. Final error (sync): {str(e)}"
-                        logger.error(error_message)
+                else:
+                    error_message = "All parsing attempts failed. No JSON object found in retry response (sync)"
+                    logger.error(error_message)
             
             # If we have a structured plan, validate and save it
             if structured_plan:
                 try:
-                    # Validate against the Pydantic model
+                    # Fix only the elements that fail validation, then validate against the Pydantic model
+                    structured_plan = self._regenerate_invalid_elements_sync(structured_plan)
                     validated_plan = StructuredStudyPlan(**structured_plan)
                     result = validated_plan.dict()
                     
@@ -0,0 +1,73 @@
+"""
+Shared fixtures for the backend tests.
+"""
+import pytest
+
+
+def build_sample_plan(days: int = 14) -> dict:
+    """A plan shaped like the structurer's usual output, with the optional fields filled in."""
+    return {
+        "overall_goal": "Master heat transfer fundamentals: conduction, convection and radiation.",
+        "total_study_day": days,
+        "hour_per_day": 2.0,
+        "core_concepts": [
+            {
+                "name": f"Concept {i}",
+                "explanation": f"How concept {i} governs the rate of heat flow between bodies.",
+                "importance": "Appears in most exam problems",
+                "related_concepts": [f"Concept {i + 1}", "Thermal resistance"],
+                "examples": ["Insulated pipe", "Heat sink fins"],
+                "difficulty_level": "intermediate",
+            }
+            for i in range(5)
+        ],
+        "daily_schedule": [
+            {
+                "day": day,
+                "date": None,
+                "focus_area": f"Topic block {day}",
+                "study_item": [
+                    {
+                        "topic": f"Topic {day}.{item}",
+                        "description": f"Work through section {day}.{item} and its solved examples.",
+                        "duration_minutes": 40,
+                        "resource": ["Incropera, chapter 3"],
+                        "is_completed": False,
+                        "learning_objectives": ["Derive the governing equation", "Solve a 1D problem"],
+                        "priority": "high",
+                    }
+                    for item in range(3)
+                ],
+                "summary": f"Day {day} covers topic block {day}.",
+                "learning_goals": ["Apply the energy balance"],
+                "review_topics": [f"Topic block {day - 1}"] if day > 1 else [],
+            }
+            for day in range(1, days + 1)
+        ],
+        "general_tip": ["Draw the thermal circuit first", "Check units at every step"],
+        "key_formulas": [
+            {
+                "name": "Fourier's law",
+                "formula": "q = -k dT/dx",
+                "description": "Conductive heat flux",
+                "usage_context": "Steady conduction through walls",
+                "variables": {"k": "thermal conductivity", "T": "temperature"},
+                "examples": ["Heat loss through a window"],
+            }
+        ],
+        "resources": [
+            {"title": "Incropera", "type": "book", "url": None, "description": "Main textbook", "relevance": "Core"}
+        ],
+        "assessments": [
+            {"name": "Quiz 1", "description": "Conduction problems", "type": "quiz", "topics_covered": ["Conduction"]}
+        ],
+        "prerequisites": ["Calculus"],
+        "difficulty_level": "intermediate",
+        "estimated_completion_time": float(days * 2),
+    }
+
+
+@pytest.fixture
+def sample_plan():
+    """Builds sample plans: ``sample_plan(days)``."""
+    return build_sample_plan
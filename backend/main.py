@@ -1,7 +1,14 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import upload_routes, study_plan_routes, chat_routes
+from routers import upload_routes, study_plan_routes, chat_routes, plans_routes
+from utils.model_scheduler import model_scheduler
+from utils.json_extraction import extraction_stats
+from utils.structured_output import structuring_stats
+from utils.prompt_assembly import prompt_cache_stats
+from utils.speculative_structuring import speculative_structurer
+from utils.materials_store import materials_store
+from utils.text_cleaning import cleaning_stats
 
 app = FastAPI(title="Study Agent API")
 
@@ -27,8 +34,44 @@ app.add_middleware(
 
 app.include_router(upload_routes.router)
 app.include_router(study_plan_routes.router, prefix="/plan", tags=["Study Plan"])
+app.include_router(plans_routes.router, prefix="/plans", tags=["Plans"])
 app.include_router(chat_routes.router, tags=["Chat"]) # No prefix needed as routes already have /chat prefix
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the Study Agent API"}
\ No newline at end of file
+    return {"message": "Welcome to the Study Agent API"}
+
+@app.get("/metrics/scheduler")
+def scheduler_metrics():
+    """Queue depth and wait times per priority class for model execution."""
+    return model_scheduler.stats()
+
+@app.get("/metrics/json-extraction")
+def json_extraction_metrics():
+    """Which JSON extraction strategy succeeded per model output parser, and retries sent or avoided."""
+    return extraction_stats()
+
+@app.get("/metrics/structuring")
+def structuring_metrics():
+    """Retry rate and average prompt tokens per structured output mode (json_schema, json_object, template)."""
+    return structuring_stats()
+
+@app.get("/metrics/prompt-cache")
+def prompt_cache_metrics():
+    """Share of prompt tokens the provider served from its prefix cache, per prompt."""
+    return prompt_cache_stats()
+
+@app.get("/metrics/speculation")
+def speculation_metrics():
+    """Background structuring started after /preview: hits, joins, misses and unused work cancelled after the TTL."""
+    return speculative_structurer.stats()
+
+@app.get("/metrics/materials")
+def materials_metrics():
+    """Stored upload materials, sessions referring to them and their compressed size."""
+    return materials_store.stats()
+
+@app.get("/metrics/cleaning")
+def cleaning_metrics():
+    """Headers, footers and near-duplicate paragraphs removed from uploaded notes and questions, in bytes and estimated tokens."""
+    return cleaning_stats()
@@ -179,3 +179,37 @@ class StructuredStudyPlan(BaseModel):
                 "estimated_completion_time": 14.0
             }
         }
+
+class FrontendStudyItem(BaseModel):
+    """Study item in the frontend plan format (an entry of a day's items)"""
+    topic: str = Field(..., description="Topic to study")
+    details: Optional[str] = Field(None, description="Description of what to study")
+    durationMinutes: Optional[float] = Field(None, description="Duration in minutes")
+    estimatedTimeHours: Optional[float] = Field(None, description="Duration in hours")
+    resources: Optional[List[Any]] = Field(None, description="Resources to use")
+    isCompleted: bool = Field(False, description="Whether this item is completed")
+    learningObjectives: Optional[List[str]] = Field(None, description="Specific learning objectives for this study item")
+    priority: Optional[str] = Field(None, description="Priority of this study item (high, medium, low)")
+
+class FrontendDay(BaseModel):
+    """Day in the frontend plan format (an entry of dailyBreakdown)"""
+    day: int = Field(..., description="Day number")
+    daySummary: Optional[str] = Field(None, description="Summary of what will be covered this day")
+    focusArea: Optional[str] = Field(None, description="Main focus area for this day")
+    learningGoals: Optional[List[str]] = Field(None, description="Learning goals for this day")
+    reviewTopics: Optional[List[str]] = Field(None, description="Topics to review from previous days")
+    items: List[FrontendStudyItem] = Field(..., description="Study items for this day")
+
+class FrontendConcept(BaseModel):
+    """Key concept in the frontend plan format"""
+    concept: str = Field(..., description="Name of the concept")
+    explanation: Optional[str] = Field(None, description="Explanation of the concept")
+
+class FrontendFormula(BaseModel):
+    """Key formula in the frontend plan format"""
+    formula_name: Optional[str] = Field(None, description="Name of the formula")
+    formula: str = Field(..., description="The formula expression")
+    description: Optional[str] = Field(None, description="Description of what the formula represents")
+    usage_context: Optional[str] = Field(None, description="When and how to use this formula")
+    variables: Optional[Dict[str, str]] = Field(None, description="Definition of variables used in the formula")
+    examples: Optional[List[str]] = Field(None, description="Example applications of the formula")
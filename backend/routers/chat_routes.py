@@ -10,6 +10,9 @@ from crewai.crews.crew_output import CrewOutput
 
 # Assuming ai_workflow.py is in utils and contains the llm and chat_support_agent
 from utils.ai_workflow import llm, chat_support_agent # Corrected import for running from backend/
+from utils.model_scheduler import model_scheduler, INTERACTIVE
+from utils.materials_store import materials_store
+from utils.plan_store import plan_store
 
 router = APIRouter()
 
@@ -23,6 +26,8 @@ class ChatRequest(BaseModel):
     session_id: str = Field(..., description="A unique session identifier to track conversation history or context.")
     study_materials_context: Optional[str] = Field(None, description="Context from uploaded study materials.")
     study_plan_context: Optional[str] = Field(None, description="Optional context from the current study plan.")
+    materials_id: Optional[str] = Field(None, description="Stored materials to use when study_materials_context is not sent; defaults to the session's latest upload.")
+    plan_id: Optional[str] = Field(None, description="Stored plan to use when study_plan_context is not sent.")
     stream: Optional[bool] = Field(False, description="Whether to stream the response or return it as a single JSON object.")
 
 class ChatResponse(BaseModel):
@@ -60,7 +65,7 @@ def create_chat_interaction_task(agent: Agent, user_query: str, study_materials:
 import asyncio # Added for asyncio.to_thread
 
 # --- Crew Definition and Execution for Chat --- (Subtask 7.2 & 7.3)
-async def run_chat_crew(user_query: str, study_materials_context: Optional[str], study_plan_context: Optional[str]) -> Dict[str, Any]:
+async def run_chat_crew(user_query: str, study_materials_context: Optional[str], study_plan_context: Optional[str], session_id: Optional[str] = None) -> Dict[str, Any]:
     logger.info(f"Starting ASYNC Chat Crew AI workflow for query: {user_query[:50]}...")
 
     if not os.getenv("OPENROUTER_API_KEY") or not os.getenv("DEEPSEEK_MODEL_NAME"):
@@ -89,8 +94,8 @@ async def run_chat_crew(user_query: str, study_materials_context: Optional[str],
         )
 
         logger.info("Kicking off the chat crew asynchronously...")
-        # Run the blocking kickoff in a separate thread
-        crew_result = await asyncio.to_thread(chat_crew.kickoff)
+        # Run the blocking kickoff in a separate thread, ahead of any queued plan generation
+        crew_result = await model_scheduler.run_blocking(chat_crew.kickoff, priority=INTERACTIVE, session_id=session_id)
         logger.info(f"Async chat crew execution finished. Raw output type: {type(crew_result)}. Output (first 200 chars): {str(crew_result)[:200]}...")
 
         ai_response_text = ""
@@ -119,6 +124,21 @@ async def run_chat_crew(user_query: str, study_materials_context: Optional[str],
 from fastapi.responses import StreamingResponse
 import json
 
+def resolve_chat_context(request: ChatRequest) -> ChatRequest:
+    """
+    Fill in the materials and plan context from the stores when the request refers to them by id.
+    
+    Context sent in full takes precedence, so existing clients are unaffected.
+    """
+    materials_context = request.study_materials_context or materials_store.resolve_text(
+        request.materials_id, request.session_id
+    )
+    plan_context = request.study_plan_context
+    if not plan_context and request.plan_id:
+        stored_plan = plan_store.get(request.plan_id)
+        plan_context = stored_plan["raw_plan"] if stored_plan else None
+    return request.copy(update={"study_materials_context": materials_context, "study_plan_context": plan_context})
+
 @router.post("/chat", response_model=ChatResponse)
 async def handle_chat(request: ChatRequest):
     """
@@ -128,6 +148,8 @@ async def handle_chat(request: ChatRequest):
     logger.info(f"Received chat request: Query='{request.user_query}', SessionID='{request.session_id}', Stream={request.stream}")
 
     try:
+        request = resolve_chat_context(request)
+
         # If streaming is requested, handle it differently
         if request.stream:
             return StreamingResponse(
@@ -139,7 +161,8 @@ async def handle_chat(request: ChatRequest):
         crew_response_data = await run_chat_crew(
             user_query=request.user_query,
             study_materials_context=request.study_materials_context,
-            study_plan_context=request.study_plan_context
+            study_plan_context=request.study_plan_context,
+            session_id=request.session_id
         )
         
         return ChatResponse(
@@ -165,7 +188,8 @@ async def stream_chat_response(request: ChatRequest):
         crew_response_data = await run_chat_crew(
             user_query=request.user_query,
             study_materials_context=request.study_materials_context,
-            study_plan_context=request.study_plan_context
+            study_plan_context=request.study_plan_context,
+            session_id=request.session_id
         )
         
         # Get the full response
@@ -0,0 +1,300 @@
+from fastapi import APIRouter, Body, Header, HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from utils.plan_store import plan_store, VersionConflict
+from utils.plan_patch import PatchError, PatchTestFailed, make_etag, parse_etag
+from utils.adapter_utils import transform_backend_to_frontend, transform_frontend_to_backend
+from utils.rescheduler import MIN_HOURS_PER_DAY, reschedule_plan
+from utils.incremental_plan import REUSED_SECTIONS, diff_plan_request, merge_generated_days
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+class RescheduleRequest(BaseModel):
+    total_days: int
+    hours_per_day: float
+
+class RegenerateRequest(BaseModel):
+    total_days: Optional[int] = None
+    hours_per_day: Optional[float] = None
+    replace_topics: Optional[Dict[str, str]] = None # Old topic -> new topic
+
+def _get_plan_or_404(plan_id: str) -> Dict[str, Any]:
+    plan = plan_store.get(plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} not found")
+    return plan
+
+def _not_modified(response: Response, plan: Dict[str, Any], if_none_match: Optional[str]) -> bool:
+    """Set the plan's ETag on the response and tell whether the client's copy is current."""
+    response.headers["ETag"] = make_etag(plan["version"])
+    if not if_none_match:
+        return False
+    try:
+        return parse_etag(if_none_match) == plan["version"]
+    except PatchError:
+        return False
+
+def _expected_version(if_match: Optional[str]) -> Optional[int]:
+    """The plan version an If-Match header names, or None when it is missing or ``*``."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    try:
+        return parse_etag(if_match)
+    except PatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _precondition_failed(plan_id: str, current_version: int) -> HTTPException:
+    """412 for a request whose If-Match version is not the stored one, with the current ETag."""
+    return HTTPException(status_code=412, detail=f"Plan {plan_id} has changed (version {current_version})",
+                         headers={"ETag": make_etag(current_version)})
+
+@router.get("/{plan_id}")
+async def get_plan_route(plan_id: str):
+    """
+    Returns a stored plan's parameters and an outline of its structured plan.
+
+    The outline lists the stored sections and each day's focus area, so a page can
+    fetch only the days and sections it shows.
+    """
+    plan = _get_plan_or_404(plan_id)
+    outline = plan_store.outline(plan_id)
+    return {
+        "plan_id": plan_id,
+        "session_id": plan["session_id"],
+        "study_days": plan["study_days"],
+        "hours_per_day": plan["hours_per_day"],
+        "structured": bool(outline["sections"]),
+        "version": plan["version"],
+        "outline": outline,
+        "created_at": plan["created_at"],
+        "updated_at": plan["updated_at"],
+    }
+
+@router.get("/{plan_id}/preview")
+async def get_plan_preview_route(plan_id: str):
+    """
+    Returns the preview data stored for a plan: ``preview_plan``, ``raw_plan`` and ``simplified_json``.
+    """
+    plan = _get_plan_or_404(plan_id)
+    return {
+        "plan_id": plan_id,
+        "preview_plan": plan["preview_plan"],
+        "raw_plan": plan["raw_plan"],
+        "simplified_json": plan["simplified_json"],
+    }
+
+@router.get("/{plan_id}/structured")
+async def get_structured_plan_route(plan_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    """
+    Returns the full structured plan in frontend format, with the plan version as its ETag.
+    """
+    plan = _get_plan_or_404(plan_id)
+    if _not_modified(response, plan, if_none_match):
+        return Response(status_code=304, headers={"ETag": make_etag(plan["version"])})
+    structured_plan = plan_store.get_structured_plan(plan_id)
+    if structured_plan is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} has not been structured yet")
+    return {"plan_id": plan_id, "structured_plan": structured_plan}
+
+@router.get("/{plan_id}/days/{day}")
+async def get_plan_day_route(plan_id: str, day: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    """
+    Returns one day of the structured plan (an entry of ``dailyBreakdown``).
+    """
+    plan = _get_plan_or_404(plan_id)
+    if _not_modified(response, plan, if_none_match):
+        return Response(status_code=304, headers={"ETag": make_etag(plan["version"])})
+    entry = plan_store.get_day(plan_id, day)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Day {day} not found in plan {plan_id}")
+    return {"plan_id": plan_id, "day": day, "item": entry}
+
+@router.get("/{plan_id}/sections/{section}")
+async def get_plan_section_route(plan_id: str, section: str, response: Response,
+                                 if_none_match: Optional[str] = Header(None)):
+    """
+    Returns one top-level section of the structured plan, e.g. ``keyConcepts`` or ``keyFormulas``.
+    """
+    plan = _get_plan_or_404(plan_id)
+    if _not_modified(response, plan, if_none_match):
+        return Response(status_code=304, headers={"ETag": make_etag(plan["version"])})
+    value = plan_store.get_section(plan_id, section)
+    if value is None:
+        raise HTTPException(status_code=404, detail=f"Section {section} not found in plan {plan_id}")
+    return {"plan_id": plan_id, "section": section, "item": value}
+
+@router.patch("/{plan_id}/structured")
+async def patch_structured_plan_route(plan_id: str, operations: List[Dict[str, Any]] = Body(...),
+                                      if_match: Optional[str] = Header(None)):
+    """
+    Applies JSON Patch (RFC 6902) operations to the stored structured plan.
+
+    Paths point into the frontend plan, e.g. ``/dailyBreakdown/0/items/2/isCompleted`` to
+    complete an item, a ``move`` between ``/dailyBreakdown/0/items/N`` paths to reorder items,
+    or ``replace`` on ``/dailyBreakdown/1/focusArea`` to edit a day. Only the touched days
+    and sections are validated and rewritten. Send the ETag from a previous response as
+    ``If-Match`` to reject the patch (412) if the plan changed in the meantime.
+
+    Returns the new version and the pointers of the rewritten parts, with the new ETag.
+    """
+    expected_version = _expected_version(if_match)
+    try:
+        result = plan_store.patch_structured_plan(plan_id, operations, expected_version)
+    except VersionConflict as e:
+        raise _precondition_failed(plan_id, e.current_version)
+    except PatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} not found")
+
+    logger.info(f"Patched plan {plan_id} to version {result['version']}: {result['changed']}")
+    return JSONResponse(
+        content={"plan_id": plan_id, "version": result["version"], "changed": result["changed"]},
+        headers={"ETag": make_etag(result["version"])}
+    )
+
+@router.get("/{plan_id}/changes")
+async def get_plan_changes_route(plan_id: str, since: int):
+    """
+    Returns the patch operations applied since version ``since``, so another client can catch up.
+
+    ``reset`` is true when the plan was regenerated in the meantime and must be fetched again.
+    """
+    changes = plan_store.changes_since(plan_id, since)
+    if changes is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} not found")
+    return JSONResponse(content=dict(changes, plan_id=plan_id), headers={"ETag": make_etag(changes["version"])})
+
+@router.post("/{plan_id}/reschedule")
+async def reschedule_plan_route(plan_id: str, request: RescheduleRequest, if_match: Optional[str] = Header(None)):
+    """
+    Re-packs the stored plan's study items into a new number of days and hours per day.
+
+    Runs locally (utils.rescheduler) without a model call; see reschedule_plan for the rules.
+    Send the plan's ETag as ``If-Match`` to reject the request (412) if the plan changed.
+    Returns the rescheduled plan in frontend format with its new ETag.
+    """
+    if not 1 <= request.total_days <= 60 or not MIN_HOURS_PER_DAY <= request.hours_per_day <= 24:
+        raise HTTPException(status_code=400,
+                            detail=f"Days must be between 1 and 60 and hours per day between {MIN_HOURS_PER_DAY} and 24")
+    expected_version = _expected_version(if_match)
+    plan = _get_plan_or_404(plan_id)
+    if expected_version is not None and expected_version != plan["version"]:
+        raise _precondition_failed(plan_id, plan["version"])
+    structured_plan = plan_store.get_structured_plan(plan_id)
+    if structured_plan is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} has not been structured yet")
+
+    started = time.perf_counter()
+    try:
+        rescheduled = reschedule_plan(
+            transform_frontend_to_backend(structured_plan), request.total_days, request.hours_per_day
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    frontend_plan = transform_backend_to_frontend(rescheduled)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    try:
+        plan_store.save_structured_plan(plan_id, frontend_plan, request.total_days, request.hours_per_day,
+                                        expected_version=expected_version)
+    except VersionConflict as e:
+        raise _precondition_failed(plan_id, e.current_version)
+    version = plan_store.get(plan_id)["version"]
+
+    logger.info(f"Rescheduled plan {plan_id} to {request.total_days} x {request.hours_per_day} h in {elapsed_ms:.1f} ms")
+    return JSONResponse(
+        content={"plan_id": plan_id, "version": version, "structured_plan": frontend_plan,
+                 "elapsed_ms": round(elapsed_ms, 2)},
+        headers={"ETag": make_etag(version)}
+    )
+
+@router.post("/{plan_id}/regenerate")
+async def regenerate_plan_route(plan_id: str, request: RegenerateRequest, if_match: Optional[str] = Header(None)):
+    """
+    Updates a stored plan for new days, hours or swapped topics, regenerating only what changed.
+
+    Core concepts, formulas, tips and every day that is still valid are kept. The model is
+    asked only for added days and days that mention a swapped topic, with the plan's outline
+    as (cacheable) context; fewer days or other hours are handled by the local rescheduler.
+
+    Send the plan's ETag as ``If-Match`` to reject the request (412) if the plan changed. A
+    plan edited while the model was writing is not overwritten: that returns 409 (412 with
+    ``If-Match``).
+    """
+    expected_version = _expected_version(if_match)
+    plan = _get_plan_or_404(plan_id)
+    if expected_version is not None and expected_version != plan["version"]:
+        raise _precondition_failed(plan_id, plan["version"])
+    structured_plan = plan_store.get_structured_plan(plan_id)
+    if structured_plan is None:
+        raise HTTPException(status_code=404, detail=f"Plan {plan_id} has not been structured yet")
+    if request.total_days is not None and not 1 <= request.total_days <= 60:
+        raise HTTPException(status_code=400, detail="Days must be between 1 and 60")
+    if request.hours_per_day is not None and not MIN_HOURS_PER_DAY <= request.hours_per_day <= 24:
+        raise HTTPException(status_code=400, detail=f"Hours per day must be between {MIN_HOURS_PER_DAY} and 24")
+
+    backend_plan = transform_frontend_to_backend(structured_plan)
+    try:
+        edit = diff_plan_request(backend_plan, request.total_days, request.hours_per_day, request.replace_topics)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    updated = backend_plan
+    if edit.needs_model:
+        # Imported lazily so the plan routes do not require the model clients at import time
+        from utils.ai_workflow import regenerate_plan_days
+
+        logger.info(f"Regenerating days {edit.generate_days} of plan {plan_id}")
+        try:
+            generated = await regenerate_plan_days(backend_plan, edit, plan["session_id"])
+        except Exception as e:
+            logger.error(f"Regenerating days of plan {plan_id} failed: {e}")
+            raise HTTPException(status_code=502, detail=f"Failed to regenerate days: {e}")
+        try:
+            updated = merge_generated_days(backend_plan, edit, generated)
+        except ValueError as e:
+            raise HTTPException(status_code=502, detail=f"Failed to regenerate days: {e}")
+    if edit.reschedule:
+        try:
+            updated = reschedule_plan(updated, edit.days, edit.hours_per_day)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    frontend_plan = transform_backend_to_frontend(updated)
+    try:
+        # The model call can take a while; edits made meanwhile (e.g. completed items) are not overwritten
+        plan_store.save_structured_plan(plan_id, frontend_plan, edit.days, edit.hours_per_day,
+                                        expected_version=plan["version"])
+    except VersionConflict as e:
+        if expected_version is not None:
+            raise _precondition_failed(plan_id, e.current_version)
+        raise HTTPException(status_code=409, detail=f"Plan {plan_id} changed while it was regenerated "
+                                                    f"(version {e.current_version}), try again",
+                            headers={"ETag": make_etag(e.current_version)})
+    version = plan_store.get(plan_id)["version"]
+    regenerated = set(edit.generate_days)
+    return JSONResponse(
+        content={
+            "plan_id": plan_id,
+            "version": version,
+            "structured_plan": frontend_plan,
+            "regenerated_days": edit.generate_days,
+            # Rescheduling moves items between days, so no day is kept as it was
+            "reused_days": [] if edit.reschedule else [
+                day for day in range(1, len(backend_plan.get("daily_schedule") or []) + 1)
+                if day not in regenerated and day <= edit.days
+            ],
+            "reused_sections": list(REUSED_SECTIONS),
+            "rescheduled": edit.reschedule,
+        },
+        headers={"ETag": make_etag(version)}
+    )
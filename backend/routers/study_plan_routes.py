@@ -1,9 +1,21 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Dict, Optional, Tuple
 import json # Added for JSON validation
-from utils.ai_workflow import run_study_plan_crew, structure_raw_plan # Import the AI workflow functions
+from utils.ai_workflow import generate_preview_study_plan, structure_raw_plan # Import the AI workflow functions
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.local_structurer import structure_from_simplified_json
+from utils.speculative_structuring import speculative_structurer
+from utils.plan_store import plan_store
+from utils.materials_store import materials_store
+from utils.model_scheduler import model_scheduler
+from utils.rescheduler import MIN_HOURS_PER_DAY
+from utils.degraded_structuring import (
+    DEADLINE, SATURATED, UNPARSEABLE, Deadline, degradation_enabled, structure_with_regex, structuring_deadline_seconds
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,10 +26,17 @@ router = APIRouter()
 class StudyPlanRequest(BaseModel):
     total_days: int
     hours_per_day: int
+    materials_id: Optional[str] = None # From /upload or /preview; defaults to the session's latest upload
+    session_id: Optional[str] = None
 
 class RawPlanRequest(BaseModel):
-    raw_plan: str
+    raw_plan: Optional[str] = None # Not needed when plan_id refers to a stored preview
+    plan_id: Optional[str] = None
     simplified_json: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
+    total_days: Optional[int] = None
+    hours_per_day: Optional[float] = None
+    upgrade: bool = False # Replace a degraded plan with the model's once it is ready
 
 class StudyPlanData(BaseModel):
     text_plan: str
@@ -26,15 +45,25 @@ class StudyPlanData(BaseModel):
 class StructuredPlanResponse(BaseModel):
     structured_plan: Dict[str, Any]
     message: Optional[str] = "Plan structured successfully"
+    plan_id: Optional[str] = None
+    structuring_path: Optional[str] = None # "local" when built from simplified_json, "speculative" when precomputed after /preview, "regex" when degraded, "llm" otherwise
+    degraded: bool = False
+    degraded_reason: Optional[str] = None # "saturated", "deadline" or "unparseable"
+    upgrading: bool = False # The model's plan replaces the degraded one in the background
+
 
 class StudyPlanResponse(BaseModel):
     message: str
     plan: StudyPlanData
+    plan_id: Optional[str] = None
 
 @router.post("/generate-plan", response_model=StudyPlanResponse)
 async def generate_plan_route(request: StudyPlanRequest):
     """
     Generates a study plan based on the total number of days and hours per day.
+    
+    The plan is built from stored materials: ``materials_id`` from /upload or /preview,
+    or the latest upload of ``session_id``.
     """
     try:
         logger.info(f"Received request to generate plan: {request.total_days} days, {request.hours_per_day} hours/day")
@@ -42,56 +71,54 @@ async def generate_plan_route(request: StudyPlanRequest):
         if total_hours <= 0:
             raise HTTPException(status_code=400, detail="Total study hours must be positive.")
 
-        # Placeholder for study_materials_text - this should come from uploaded files
-        # In a real scenario, this text would be retrieved based on a session or user ID
-        # linking to previously uploaded and processed notes and questions.
-        # For now, using a placeholder.
-        placeholder_study_materials = "Placeholder: Text from notes and questions would go here."
-
-        logger.info("Calling Crew AI to generate study plan...")
-        # The run_study_plan_crew now returns a dictionary with 'text_plan' and 'topic_list_json'
-        crew_output = run_study_plan_crew(
-            study_materials_text=placeholder_study_materials,
-            study_duration_days=str(request.total_days),
-            study_hours_per_day=str(request.hours_per_day)
+        materials_id = request.materials_id or (
+            materials_store.latest_for_session(request.session_id) if request.session_id else None
         )
+        materials = materials_store.get(materials_id) if materials_id else None
+        if materials is None:
+            raise HTTPException(status_code=400, detail="No stored study materials found. Upload materials first or pass a valid materials_id.")
 
-        # Check if the crew_output itself is an error dictionary
-        if isinstance(crew_output, dict) and "error" in crew_output:
-            error_detail = crew_output.get('details', crew_output['error'])
-            logger.error(f"Crew AI execution failed: {error_detail}")
-            raise HTTPException(status_code=500, detail=f"Failed to generate study plan: {error_detail}")
-
-        # Validate that crew_output is a dictionary and contains the expected keys
-        if not isinstance(crew_output, dict):
-            logger.error(f"Unexpected output type from Crew AI: {type(crew_output)}. Expected a dictionary.")
-            raise HTTPException(status_code=500, detail="Failed to process study plan: Unexpected output format from AI.")
+        logger.info(f"Generating study plan from materials {materials_id}...")
+        preview_result = await generate_preview_study_plan(
+            study_materials_text=materials["notes"],
+            study_duration_days=request.total_days,
+            study_hours_per_day=request.hours_per_day,
+            questions_text=materials["questions"],
+            session_id=request.session_id,
+            outline=materials_store.get_outline(materials_id)
+        )
 
-        text_plan_content = crew_output.get("text_plan")
-        topic_list_json_content = crew_output.get("topic_list_json")
+        # Check if the preview itself is an error dictionary
+        if preview_result.get("status") == "error":
+            error_detail = preview_result.get('details', preview_result.get('error'))
+            logger.error(f"Study plan generation failed: {error_detail}")
+            raise HTTPException(status_code=500, detail=f"Failed to generate study plan: {error_detail}")
 
+        text_plan_content = preview_result.get("raw_plan")
+        simplified_json = preview_result.get("simplified_json")
         if not text_plan_content or not isinstance(text_plan_content, str):
-            logger.error(f"'text_plan' missing or not a string in Crew AI output. Output: {crew_output}")
+            logger.error(f"'raw_plan' missing or not a string in the generated plan. Output: {preview_result}")
             raise HTTPException(status_code=500, detail="Failed to process study plan: 'text_plan' missing or invalid.")
-
-        if not topic_list_json_content or not isinstance(topic_list_json_content, str):
-            logger.error(f"'topic_list_json' missing or not a string in Crew AI output. Output: {crew_output}")
-            raise HTTPException(status_code=500, detail="Failed to process study plan: 'topic_list_json' missing or invalid.")
-        
-        # Basic validation for JSON string
-        try:
-            json.loads(topic_list_json_content) # Check if it's valid JSON
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON detected for topic list: {topic_list_json_content[:500]}... Error: {e}")
+        if not simplified_json:
+            logger.error(f"No topic data could be parsed from the generated plan: {preview_result.get('details')}")
             raise HTTPException(status_code=500, detail="Failed to parse topic list: Invalid JSON format.")
 
         study_plan_data = StudyPlanData(
             text_plan=text_plan_content,
-            topic_list_json=topic_list_json_content
+            topic_list_json=json.dumps(simplified_json)
+        )
+        plan_id = plan_store.create(
+            raw_plan=text_plan_content,
+            simplified_json=simplified_json,
+            preview_plan=preview_result.get("preview_plan"),
+            study_days=request.total_days,
+            hours_per_day=request.hours_per_day,
+            session_id=request.session_id,
+            materials_id=materials_id
         )
 
         logger.info(f"Successfully generated and parsed study plan. Total hours: {total_hours}")
-        return StudyPlanResponse(message="Study plan generated successfully.", plan=study_plan_data)
+        return StudyPlanResponse(message="Study plan generated successfully.", plan=study_plan_data, plan_id=plan_id)
     except HTTPException as http_exc:
         logger.error(f"HTTPException in generate_plan_route: {http_exc.detail}")
         raise http_exc # Re-raise HTTPException to let FastAPI handle it
@@ -99,45 +126,192 @@ async def generate_plan_route(request: StudyPlanRequest):
         logger.error(f"Unexpected error in generate_plan_route: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+def _resolve_stored_plan(request: RawPlanRequest) -> RawPlanRequest:
+    """
+    Fill in the raw plan, simplified JSON and constraints of a request that names a stored plan.
+    
+    Fields sent in the request take precedence over the stored ones.
+    """
+    if not request.plan_id:
+        return request
+    stored = plan_store.get(request.plan_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Plan {request.plan_id} not found")
+    return request.copy(update={
+        "raw_plan": request.raw_plan or stored["raw_plan"],
+        "simplified_json": request.simplified_json or stored["simplified_json"],
+        "session_id": request.session_id or stored["session_id"],
+        "total_days": request.total_days or stored["study_days"],
+        "hours_per_day": request.hours_per_day or stored["hours_per_day"],
+    })
+
+def _store_structured_plan(request: RawPlanRequest, structured_plan: Dict[str, Any]) -> Optional[str]:
+    """Save the structured plan under the request's plan id, creating a plan entry for text-only requests."""
+    if request.plan_id and plan_store.save_structured_plan(request.plan_id, structured_plan):
+        return request.plan_id
+    return plan_store.create(
+        raw_plan=request.raw_plan,
+        simplified_json=request.simplified_json,
+        structured_plan=structured_plan,
+        study_days=request.total_days,
+        hours_per_day=request.hours_per_day,
+        session_id=request.session_id
+    )
+
+# Fields every structured plan in frontend format has
+REQUIRED_PLAN_FIELDS = ["overallGoal", "totalStudyDays", "hoursPerDay", "dailyBreakdown"]
+
+# Background upgrades of degraded plans, referenced so they are not garbage collected while running
+_upgrades: set = set()
+
+def _plan_error(structured_plan: Any) -> Optional[str]:
+    """Why a structuring result cannot be used, or None if it is a complete frontend plan."""
+    if not structured_plan or not isinstance(structured_plan, dict):
+        return f"Invalid format: {type(structured_plan).__name__}"
+    if "error" in structured_plan:
+        return structured_plan.get("details", structured_plan["error"])
+    missing_fields = [field for field in REQUIRED_PLAN_FIELDS if field not in structured_plan]
+    if missing_fields:
+        return f"Missing fields {missing_fields}"
+    return None
+
+async def _structure_with_model(request: RawPlanRequest) -> Tuple[Any, str]:
+    """The structuring /preview started in the background for this plan, finished or not, or a new model call."""
+    structured_plan = await speculative_structurer.claim(request.raw_plan)
+    if structured_plan is not None:
+        return structured_plan, "speculative"
+    structured_plan = await structure_raw_plan(
+        raw_plan_text=request.raw_plan,
+        simplified_json=request.simplified_json,
+        session_id=request.session_id
+    )
+    return structured_plan, "llm"
+
+async def _upgrade_degraded_plan(plan_id: str, structuring: Awaitable[Tuple[Any, str]]) -> None:
+    """
+    Replace a degraded plan with the model's plan once it is ready.
+    
+    The degraded plan is only replaced while it is unchanged, so edits made to it in the
+    meantime are kept. Clients see the new version through GET /plans/{plan_id}.
+    """
+    degraded_version = (plan_store.get(plan_id) or {}).get("version")
+    try:
+        structured_plan, _ = await structuring
+    except Exception as e:
+        logger.warning(f"Upgrading degraded plan {plan_id} failed: {e}")
+        return
+    error = _plan_error(structured_plan)
+    if error:
+        logger.warning(f"Upgrading degraded plan {plan_id} produced no usable plan: {error}")
+        return
+    if (plan_store.get(plan_id) or {}).get("version") != degraded_version:
+        logger.info(f"Degraded plan {plan_id} was edited, keeping it instead of the model's plan")
+        return
+    plan_store.save_structured_plan(plan_id, structured_plan)
+    logger.info(f"Replaced degraded plan {plan_id} with the model's plan")
+
+def _start_upgrade(plan_id: str, structuring: Awaitable[Tuple[Any, str]]) -> None:
+    task = asyncio.ensure_future(_upgrade_degraded_plan(plan_id, structuring))
+    _upgrades.add(task)
+    task.add_done_callback(_upgrades.discard)
+
 @router.post("/structure-plan", response_model=StructuredPlanResponse)
 async def structure_plan_route(request: RawPlanRequest):
     """
     Structures a raw study plan text into a structured format for the frontend.
+    
+    Send ``plan_id`` from /preview instead of the plan text to structure a stored plan.
+    The result is stored as well and its ``plan_id`` returned.
+    
+    When no model slot is free, the STRUCTURING_DEADLINE_SECONDS budget runs out or the model's
+    output is unusable, the plan is built by the regex structurer instead and the response is
+    marked ``degraded`` (DEGRADED_STRUCTURING=false restores the error responses). With
+    ``upgrade`` the model's plan replaces the degraded one in the background when it is ready.
     """
     try:
-        logger.info(f"Received request to structure plan, content length: {len(request.raw_plan)} characters")
+        deadline = Deadline(structuring_deadline_seconds())
+        request = _resolve_stored_plan(request)
+        logger.info(f"Received request to structure plan, content length: {len(request.raw_plan or '')} characters")
         
         if not request.raw_plan or len(request.raw_plan.strip()) < 10:
             raise HTTPException(status_code=400, detail="Raw plan text is too short or empty.")
+        if request.hours_per_day is not None and not MIN_HOURS_PER_DAY <= request.hours_per_day <= 24:
+            raise HTTPException(status_code=400, detail=f"Hours per day must be between {MIN_HOURS_PER_DAY} and 24.")
 
-        # Call the AI workflow function to structure the raw plan
-        # Pass simplified_json if available
+        # Map the preview's simplified_json straight onto the plan when it is complete,
+        # the model is only needed when that input is missing or does not validate
         logger.info(f"Simplified JSON available: {request.simplified_json is not None}")
-        structured_plan = await structure_raw_plan(
-            raw_plan_text=request.raw_plan,
-            simplified_json=request.simplified_json
-        )
-        
-        # Check if there was an error in the structuring process
-        if structured_plan and isinstance(structured_plan, dict) and "error" in structured_plan:
-            error_message = structured_plan.get("details", structured_plan["error"])
-            logger.error(f"Error structuring plan: {error_message}")
-            raise HTTPException(status_code=500, detail=f"Failed to structure study plan: {error_message}")
-        
-        # Validate that we have a proper structured plan
-        if not structured_plan or not isinstance(structured_plan, dict):
-            logger.error(f"Invalid structured plan format: {type(structured_plan)}")
-            raise HTTPException(status_code=500, detail="Failed to structure study plan: Invalid format")
-            
-        # Validate required fields are present
-        required_fields = ["overallGoal", "totalStudyDays", "hoursPerDay", "dailyBreakdown"]
-        missing_fields = [field for field in required_fields if field not in structured_plan]
-        if missing_fields:
-            logger.error(f"Missing required fields in structured plan: {missing_fields}")
-            raise HTTPException(status_code=500, detail=f"Failed to structure study plan: Missing fields {missing_fields}")
+        if request.simplified_json:
+            try:
+                local_plan = structure_from_simplified_json(
+                    request.simplified_json,
+                    days=request.total_days,
+                    hours_per_day=request.hours_per_day
+                )
+                logger.info("Structured plan locally from simplified JSON")
+                frontend_plan = transform_backend_to_frontend(local_plan)
+                return StructuredPlanResponse(
+                    structured_plan=frontend_plan,
+                    plan_id=_store_structured_plan(request, frontend_plan),
+                    structuring_path="local"
+                )
+            except ValueError as e:
+                logger.warning(f"Local structuring unavailable, falling back to the model: {e}")
+
+        # Answer from the regex structurer when the model cannot deliver in time: no free
+        # batch slot, the deadline (nearly) spent, or output that is not a usable plan
+        degrade = degradation_enabled()
+        structuring = None
+        structured_plan, structuring_path, degraded_reason = None, "llm", None
+        if degrade and not speculative_structurer.pending(request.raw_plan) and model_scheduler.saturated():
+            degraded_reason = SATURATED
+        elif degrade and deadline.nearly_spent:
+            degraded_reason = DEADLINE
+        else:
+            # Shielded, so a call that runs past the deadline can still finish for an upgrade
+            structuring = asyncio.ensure_future(_structure_with_model(request))
+            try:
+                structured_plan, structuring_path = await asyncio.wait_for(
+                    asyncio.shield(structuring), deadline.model_budget() if degrade else None
+                )
+            except asyncio.TimeoutError:
+                degraded_reason = DEADLINE
+            else:
+                error = _plan_error(structured_plan)
+                if error and not degrade:
+                    logger.error(f"Error structuring plan: {error}")
+                    raise HTTPException(status_code=500, detail=f"Failed to structure study plan: {error}")
+                if error:
+                    logger.warning(f"Unusable structured plan from the model: {error}")
+                    degraded_reason = UNPARSEABLE
+
+        if degraded_reason:
+            logger.warning(f"Structuring plan with the regex structurer ({degraded_reason})")
+            frontend_plan = structure_with_regex(request.raw_plan, request.total_days, request.hours_per_day)
+            plan_id = _store_structured_plan(request, frontend_plan)
+            if request.upgrade:
+                # A call that ran past the deadline is still the quickest way to the model's plan
+                if degraded_reason != DEADLINE or structuring is None:
+                    structuring = _structure_with_model(request)
+                _start_upgrade(plan_id, structuring)
+            elif structuring is not None and not structuring.done():
+                structuring.cancel()
+            return StructuredPlanResponse(
+                structured_plan=frontend_plan,
+                message="Plan structured without the model",
+                plan_id=plan_id,
+                structuring_path="regex",
+                degraded=True,
+                degraded_reason=degraded_reason,
+                upgrading=request.upgrade
+            )
         
         logger.info("Successfully structured the raw plan")
-        return StructuredPlanResponse(structured_plan=structured_plan)
+        return StructuredPlanResponse(
+            structured_plan=structured_plan,
+            plan_id=_store_structured_plan(request, structured_plan),
+            structuring_path=structuring_path
+        )
     except json.JSONDecodeError as json_exc:
         error_msg = f"JSON parsing error: {str(json_exc)}"
         logger.error(f"Error structuring plan: {error_msg}")
@@ -147,4 +321,59 @@ async def structure_plan_route(request: RawPlanRequest):
         raise http_exc
     except Exception as e:
         logger.error(f"Unexpected error in structure_plan_route: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+# Frontend key for each streamed section of the backend plan
+STREAMED_SECTION_KEYS = {
+    "daily_schedule": "dailyBreakdown",
+    "core_concepts": "keyConcepts",
+    "key_formulas": "keyFormulas",
+}
+
+async def stream_structured_plan(request: RawPlanRequest):
+    """
+    Generator that forwards each completed day, concept and formula as soon as the
+    model has finished writing it, followed by the full frontend plan.
+    """
+    # Imported lazily so the non-streaming routes do not require langchain at import time
+    from agents.structurer_agent import StructurerAgent
+
+    try:
+        yield json.dumps({"status": "processing"}) + "\n"
+        agent = StructurerAgent(temperature=0.1, session_id=request.session_id)
+        async for section, element in agent.stream_structure_plan(
+            request.raw_plan,
+            user_days=request.total_days,
+            user_hours=request.hours_per_day
+        ):
+            if section == "error":
+                logger.error(f"Error streaming structured plan: {element.get('details')}")
+                yield json.dumps({"error": element.get("error"), "details": element.get("details")}) + "\n"
+            elif section == "complete":
+                frontend_plan = transform_backend_to_frontend(element)
+                plan_id = _store_structured_plan(request, frontend_plan)
+                yield json.dumps({"structured_plan": frontend_plan, "plan_id": plan_id}) + "\n"
+            else:
+                frontend_key = STREAMED_SECTION_KEYS[section]
+                partial = transform_backend_to_frontend({section: [element]}).get(frontend_key, [])
+                if partial:
+                    yield json.dumps({"section": frontend_key, "item": partial[0]}) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+    except Exception as e:
+        logger.error(f"Unexpected error in structured plan stream: {str(e)}", exc_info=True)
+        yield json.dumps({"error": f"An unexpected error occurred: {str(e)}"}) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+
+@router.post("/structure-plan/stream")
+async def structure_plan_stream_route(request: RawPlanRequest):
+    """
+    Structures a raw study plan and streams partial results as newline-delimited JSON.
+    """
+    request = _resolve_stored_plan(request)
+    logger.info(f"Received request to stream structured plan, content length: {len(request.raw_plan or '')} characters")
+    if not request.raw_plan or len(request.raw_plan.strip()) < 10:
+        raise HTTPException(status_code=400, detail="Raw plan text is too short or empty.")
+    return StreamingResponse(
+        content=stream_structured_plan(request),
+        media_type="application/x-ndjson"
+    )
@@ -1,12 +1,26 @@
+import asyncio
 import json
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import os
 import logging
 from pathlib import Path
-from utils.file_parser import extract_text_from_file
-from utils.ai_workflow import run_study_plan_crew, generate_preview_study_plan # Import the crew runner
+from typing import Any, Dict, Optional
+from utils.file_parser import extract_document_from_file
+from utils.document_outline import ExtractedDocument, combine_documents, document_from_pages, read_pdf
+from utils.ai_workflow import (  # Import the crew runner
+    generate_preview_study_plan, generate_single_pass_study_plan, single_pass_enabled,
+    stream_preview_study_plan, stream_single_pass_study_plan, structure_raw_plan
+)
+from utils.local_structurer import structure_from_simplified_json
+from routers.study_plan_routes import RawPlanRequest, structure_plan_route
+from utils.draft_plan import draft_enabled, generate_draft_study_plan
+from utils.speculative_structuring import speculation_enabled, speculative_structurer
+from utils.plan_store import plan_store
+from utils.materials_store import materials_store
+from utils.text_cleaning import clean_document, cleaning_enabled
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,9 +34,18 @@ UPLOAD_DIR = "./uploads"
 async def upload_files(
     notes: list[UploadFile] = File(...), 
     questions: list[UploadFile] = File(None), 
-    study_duration_days: str = None, 
-    study_hours_per_day: str = None
+    study_duration_days: str = Form(None), 
+    study_hours_per_day: str = Form(None),
+    session_id: str = Form(None),
+    include_plan_text: bool = Form(True)
 ):
+    """
+    Extract and store uploaded materials, then generate and structure a study plan from them.
+    
+    The plan is generated like /preview and structured like /plan/structure-plan, so the
+    response carries the stored ``plan_id`` and the finished plan as ``frontend_plan``.
+    Set ``include_plan_text`` to false to leave ``raw_plan`` and ``simplified_json`` out.
+    """
     logger.info("Received upload request")
     logger.info(f"Notes files: {[n.filename for n in notes] if notes else 'None'}")
     logger.info(f"Question files: {[q.filename for q in questions] if questions else 'None'}")
@@ -45,15 +68,14 @@ async def upload_files(
         
         if days <= 0 or days > 7:  # Set reasonable limits
             logger.warning(f"Invalid study duration days: {days}, using default value of 7")
-            study_duration_days = "7"
+            days = 7
             
         if hours <= 0 or hours > 24:  # Set reasonable limits
             logger.warning(f"Invalid study hours per day: {hours}, using default value of 2")
-            study_hours_per_day = "2"
+            hours = 2.0
     except ValueError:
         logger.warning(f"Invalid numeric values: days={study_duration_days}, hours={study_hours_per_day}, using defaults")
-        study_duration_days = "7"
-        study_hours_per_day = "2"
+        days, hours = 7, 2.0
     if not os.path.exists(UPLOAD_DIR):
         os.makedirs(UPLOAD_DIR)
 
@@ -92,15 +114,15 @@ async def upload_files(
         raise HTTPException(status_code=500, detail=f"Could not save one or more files: {e}")
 
     # Extract text from uploaded files
-    extracted_notes_text_list = []
-    extracted_questions_text_list = []
+    extracted_notes_documents = []
+    extracted_questions_documents = []
 
     try:
         for note_info in processed_notes_files:
-            extracted_notes_text_list.append(extract_text_from_file(note_info["path"]))
+            extracted_notes_documents.append(extract_document_from_file(note_info["path"]))
         
         for question_info in processed_questions_files:
-            extracted_questions_text_list.append(extract_text_from_file(question_info["path"]))
+            extracted_questions_documents.append(extract_document_from_file(question_info["path"]))
 
     except HTTPException as e:
         raise e # Re-raise the HTTPException from text extraction
@@ -112,152 +134,326 @@ async def upload_files(
             if os.path.exists(path):
                 os.remove(path)
 
-    extracted_notes_text = "\n\n".join(extracted_notes_text_list)
-    extracted_questions_text = "\n\n".join(extracted_questions_text_list)
+    notes_document = _clean(combine_documents(extracted_notes_documents), "notes")
+    extracted_notes_text = notes_document.text
+    extracted_questions_text = _clean(combine_documents(extracted_questions_documents), "questions").text
 
-    # Combine extracted texts for the crew
-    combined_study_materials = f"Class Notes:\n{extracted_notes_text}\n\nPractice Questions:\n{extracted_questions_text}"
+    # Keep the extracted text and the notes outline so chat and planning can refer to them by id
+    materials_id = materials_store.save(extracted_notes_text, extracted_questions_text or None, session_id,
+                                        outline=_outline_dicts(notes_document)) \
+        if extracted_notes_text or extracted_questions_text else None
 
-    study_plan_result = None
-    if extracted_notes_text or extracted_questions_text: # Only run crew if there's content
-        try:
-            print(f"Calling run_study_plan_crew with duration: {study_duration_days} days, hours: {study_hours_per_day} per day.")
-            print(f"Combined study materials length: {len(combined_study_materials)} characters")
-            
-            # Log the first 500 characters for debugging
-            print(f"First 500 chars of study materials: {combined_study_materials[:500]}...")
-            
-            # Generate the study plan
-            study_plan_result = await run_study_plan_crew(
-                study_materials=combined_study_materials,
-                days=int(study_duration_days),
-                hours_per_day=int(study_hours_per_day)
-            )
-            
-            print("Successfully generated study plan result")
-            
-        except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            error_msg = f"Error calling run_study_plan_crew: {str(e)}\n\nTraceback:\n{error_traceback}"
-            print(error_msg)
-            study_plan_result = {
-                "error": "Failed to generate study plan due to an internal error.", 
-                "details": error_msg,
-                "type": type(e).__name__
-            }
-    else:
-        study_plan_result = {"message": "No text content extracted from files, skipping study plan generation."}
+    if not (extracted_notes_text or extracted_questions_text):
+        return {
+            "status": "success",
+            "plan_id": None,
+            "materials_id": None,
+            "message": "No text content extracted from files, skipping study plan generation."
+        }
 
-    # Return the study plan result directly as the main response
+    # Generate the plan the same way as /preview and /plan/generate-plan
     try:
-        if study_plan_result:
-            logger.info("Study plan generated successfully")
-            return {
-                "status": "success",
-                "raw_plan": study_plan_result.get("raw_plan", ""),
-                "structured_plan": study_plan_result.get("structured_plan", {}),
-                "frontend_plan": study_plan_result.get("frontend_plan", {})
-            }
-        else:
-            error_msg = "Failed to generate study plan"
-            logger.error(f"Error generating study plan: {error_msg}")
-            return {
-                "status": "error",
-                "message": error_msg,
-                "details": ""
-            }
+        logger.info(f"Generating study plan for {days} days, {hours} hours per day from "
+                    f"{len(extracted_notes_text)} characters of notes")
+        preview_result = await generate_preview_study_plan(
+            study_materials_text=extracted_notes_text,
+            study_duration_days=days,
+            study_hours_per_day=hours,
+            questions_text=extracted_questions_text or None,
+            outline=_outline_dicts(notes_document)
+        )
     except Exception as e:
-        logger.exception("Error processing study plan result:")
+        logger.exception("Error generating study plan for upload:")
         return {
             "status": "error",
-            "message": "Failed to process study plan result",
+            "message": "Failed to generate study plan due to an internal error.",
+            "materials_id": materials_id,
             "details": str(e)
         }
 
+    if preview_result.get("status") == "error":
+        error_message = preview_result.get("details", preview_result.get("error", "Unknown error"))
+        logger.error(f"Error generating study plan: {error_message}")
+        return {
+            "status": "error",
+            "message": "Failed to generate study plan",
+            "materials_id": materials_id,
+            "details": error_message
+        }
+    if preview_result.get("status") == "partial_success":
+        logger.warning("Generated study plan with partial success (no structured JSON)")
+        return {
+            "status": "partial_success",
+            "plan_id": None,
+            "materials_id": materials_id,
+            "preview_plan": preview_result.get("preview_plan"),
+            "warnings": preview_result.get("details", "Could not parse structured data")
+        }
+
+    plan_id = _store_preview(preview_result, days, hours, session_id, materials_id)
+    logger.info(f"Study plan {plan_id} generated, structuring it")
+    try:
+        structured = await structure_plan_route(RawPlanRequest(plan_id=plan_id))
+    except HTTPException as e:
+        return {
+            "status": "error",
+            "message": "Failed to structure study plan",
+            "plan_id": plan_id,
+            "materials_id": materials_id,
+            "details": e.detail
+        }
+
+    payload = _preview_payload(preview_result, plan_id, include_plan_text, materials_id)
+    payload.pop("structured_plan", None)
+    payload.update(
+        status="success",
+        message="Study plan generated successfully",
+        frontend_plan=structured.structured_plan,
+        structuring_path=structured.structuring_path
+    )
+    return payload
+
+def _validate_preview_constraints(study_duration_days: str, study_hours_per_day: str) -> tuple[int, int]:
+    """Convert and range-check the preview form fields, raising HTTP 400 on bad input."""
+    try:
+        study_duration_days_int = int(study_duration_days)
+        study_hours_per_day_int = int(study_hours_per_day)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Study duration and hours per day must be valid integers")
+        
+    if study_duration_days_int < 1 or study_duration_days_int > 14:
+        raise HTTPException(status_code=400, detail="Study duration must be between 1 and 14 days")
+    
+    if study_hours_per_day_int < 1 or study_hours_per_day_int > 24:
+        raise HTTPException(status_code=400, detail="Hours per day must be between 1 and 24")
+    
+    return study_duration_days_int, study_hours_per_day_int
+
+def _clean(document: ExtractedDocument, label: str) -> ExtractedDocument:
+    """The document without repeated headers, footers and near-duplicate paragraphs, unless CLEAN_MATERIALS is off."""
+    if not cleaning_enabled() or not document.text:
+        return document
+    return clean_document(document, label)[0]
+
+def _outline_dicts(document: ExtractedDocument) -> Optional[list]:
+    """The document outline as stored with the materials, or None when the document has none."""
+    return [entry.to_dict() for entry in document.outline] or None
+
+async def _read_preview_files(files: list[UploadFile], fallback_label: str, materials: str) -> ExtractedDocument:
+    """
+    Read uploaded preview files into a single cleaned document.
+    
+    Args:
+        files: The uploaded files
+        fallback_label: Label used for files whose text is not extracted (e.g. "Content from")
+        materials: Kind of material ("notes" or "questions"), for the cleaning totals
+        
+    Returns:
+        ExtractedDocument: The concatenated text of all files, with the outline of each file
+    """
+    documents = []
+    for upload in files or []:
+        content = await upload.read()
+        
+        # Extract text from the file based on its type (simplified for now)
+        suffix = Path(upload.filename).suffix.lower()
+        if suffix in [".txt"]:
+            documents.append(document_from_pages([content.decode("utf-8", errors="ignore")]))
+        elif suffix == ".pdf":
+            # Text extraction is slow for long PDFs, keep it off the event loop
+            documents.append(await asyncio.to_thread(read_pdf, content))
+        else:
+            # For now, just include filename for non-text files
+            documents.append(document_from_pages([f"{fallback_label} {upload.filename}"]))
+    return await asyncio.to_thread(_clean, combine_documents(documents), materials)
+
+# Background refinements of draft plans, referenced so they are not garbage collected while running
+_refinements: set = set()
+
+def _use_draft(draft: Optional[bool]) -> bool:
+    """The request's draft flag, or the DRAFT_PLAN default when it is not set."""
+    return draft_enabled() if draft is None else draft
+
+async def _refine_draft(plan_id: str, notes_text: str, study_duration_days: int, study_hours_per_day: int,
+                        questions_text: Optional[str], session_id: Optional[str],
+                        outline: Optional[list] = None) -> None:
+    """
+    Generate the model's plan for a stored draft and replace the draft with it.
+    
+    The draft is only replaced while it is unchanged, so edits the student made to it
+    in the meantime are kept. Clients see the new version through GET /plans/{plan_id}.
+    """
+    draft_version = (plan_store.get(plan_id) or {}).get("version")
+    try:
+        result = await generate_single_pass_study_plan(
+            study_materials_text=notes_text,
+            study_duration_days=study_duration_days,
+            study_hours_per_day=study_hours_per_day,
+            questions_text=questions_text,
+            session_id=session_id,
+            outline=outline
+        )
+    except Exception as e:
+        logger.warning(f"Refining draft plan {plan_id} failed: {e}")
+        return
+    if result.get("status") != "success" or not result.get("structured_plan"):
+        logger.warning(f"Refining draft plan {plan_id} produced no structured plan: {result.get('details')}")
+        return
+    if (plan_store.get(plan_id) or {}).get("version") != draft_version:
+        logger.info(f"Draft plan {plan_id} was edited, keeping it instead of the refined plan")
+        return
+    plan_store.save_structured_plan(plan_id, result["structured_plan"])
+    logger.info(f"Replaced draft plan {plan_id} with the refined plan")
+
+def _start_refinement(plan_id: str, *args) -> None:
+    task = asyncio.create_task(_refine_draft(plan_id, *args))
+    _refinements.add(task)
+    task.add_done_callback(_refinements.discard)
+
+def _use_single_pass(single_pass: Optional[bool]) -> bool:
+    """The request's single_pass flag, or the SINGLE_PASS_PLAN default when it is not set."""
+    return single_pass_enabled() if single_pass is None else single_pass
+
+def _store_preview(preview_result: Dict[str, Any], study_duration_days: int, study_hours_per_day: int,
+                   session_id: Optional[str], materials_id: Optional[str] = None) -> str:
+    """Persist a successful preview so later requests can refer to it by id."""
+    return plan_store.create(
+        raw_plan=preview_result.get("raw_plan"),
+        simplified_json=preview_result.get("simplified_json"),
+        preview_plan=preview_result.get("preview_plan"),
+        structured_plan=preview_result.get("structured_plan"),
+        study_days=study_duration_days,
+        hours_per_day=study_hours_per_day,
+        session_id=session_id,
+        materials_id=materials_id
+    )
+
+def _preview_payload(preview_result: Dict[str, Any], plan_id: Optional[str] = None,
+                     include_plan_text: bool = True, materials_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Response body for a successful preview; single-pass results also carry the finished plan.
+    
+    Without ``include_plan_text`` the raw plan and simplified JSON are left out, the client
+    refers to them by ``plan_id`` instead.
+    """
+    payload = {
+        "message": "Preview generated successfully", 
+        "plan_id": plan_id,
+        "materials_id": materials_id,
+        "preview_plan": preview_result.get("preview_plan")
+    }
+    if include_plan_text:
+        payload["raw_plan"] = preview_result.get("raw_plan")
+        payload["simplified_json"] = preview_result.get("simplified_json")
+    if preview_result.get("structured_plan"):
+        payload["structured_plan"] = preview_result["structured_plan"]
+        payload["structuring_path"] = preview_result.get("structuring_path")
+    return payload
+
+def _speculate_structuring(preview_result: Dict[str, Any], study_duration_days: int, study_hours_per_day: int,
+                           session_id: Optional[str]) -> None:
+    """
+    Start structuring a successful preview in the background while the student reads it.
+    
+    Skipped when the preview already carries the finished plan, or when its simplified JSON
+    maps onto the plan locally, since /plan/structure-plan answers those without the model.
+    """
+    raw_plan = preview_result.get("raw_plan")
+    if not speculation_enabled() or not raw_plan or preview_result.get("structured_plan"):
+        return
+    simplified_json = preview_result.get("simplified_json")
+    if simplified_json:
+        try:
+            structure_from_simplified_json(simplified_json, days=study_duration_days, hours_per_day=study_hours_per_day)
+            return
+        except ValueError:
+            pass
+    speculative_structurer.start(
+        raw_plan,
+        lambda: structure_raw_plan(raw_plan_text=raw_plan, simplified_json=simplified_json, session_id=session_id)
+    )
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a single server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/preview")
 async def generate_preview(
     notes: list[UploadFile] = File(...), 
     questions: list[UploadFile] = File(None),  # Make questions optional
     study_duration_days: str = Form(...), 
-    study_hours_per_day: str = Form(...)
+    study_hours_per_day: str = Form(...),
+    session_id: str = Form(None),
+    single_pass: bool = Form(None),
+    include_plan_text: bool = Form(True),
+    draft: bool = Form(None),
+    refine: bool = Form(True)
 ):
     """
     Generate a preview of the study plan based on uploaded materials.
     
     This endpoint creates a preview version of the study plan without permanently storing
     the uploaded files or creating a study session. It's used for the plan preview page.
+    
+    With ``single_pass`` (default from SINGLE_PASS_PLAN) the full structured plan is generated
+    in one model call and returned as ``structured_plan``, so /plan/structure-plan is not needed.
+    
+    The preview is stored and its ``plan_id`` returned; /plan/structure-plan and the /plans
+    endpoints accept that id. Set ``include_plan_text`` to false to leave ``raw_plan`` and
+    ``simplified_json`` out of the response.
+    
+    With ``draft`` (default from DRAFT_PLAN) the full plan is built locally from the material's
+    headings and term statistics without any model call, in milliseconds. With ``refine`` the
+    model's plan is then generated in the background and replaces the stored draft when it
+    is ready (GET /plans/{plan_id} shows the new version).
     """
     try:
-        # Create a temporary directory for file uploads
-        TEMP_UPLOAD_DIR = Path("./temp_uploads")
-        TEMP_UPLOAD_DIR.mkdir(exist_ok=True)
-        
         logger.info(f"Generating preview for {study_duration_days} days, {study_hours_per_day} hours per day")
         logger.info(f"Received {len(notes)} note files")
         
         # Check input validation and convert to integers
-        try:
-            study_duration_days_int = int(study_duration_days)
-            study_hours_per_day_int = int(study_hours_per_day)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Study duration and hours per day must be valid integers")
-            
-        if study_duration_days_int < 1 or study_duration_days_int > 14:
-            raise HTTPException(status_code=400, detail="Study duration must be between 1 and 14 days")
-        
-        if study_hours_per_day_int < 1 or study_hours_per_day_int > 24:
-            raise HTTPException(status_code=400, detail="Hours per day must be between 1 and 24")
+        study_duration_days_int, study_hours_per_day_int = _validate_preview_constraints(
+            study_duration_days, study_hours_per_day
+        )
         
         # Extract text from the uploaded files
-        notes_text = ""
-        questions_text = ""
-        
-        # Process notes files
         logger.info(f"Processing {len(notes)} notes files")
-        for note_file in notes:
-            content = await note_file.read()
-            temp_path = TEMP_UPLOAD_DIR / note_file.filename
-            with open(temp_path, "wb") as f:
-                f.write(content)
-            
-            # Extract text from the file based on its type (simplified for now)
-            if temp_path.suffix.lower() in [".txt"]:
-                with open(temp_path, "r", encoding="utf-8", errors="ignore") as f:
-                    notes_text += f.read() + "\n\n"
-            else:
-                # For now, just include filename for non-text files
-                notes_text += f"Content from {note_file.filename}\n\n"
-            
-            # Clean up temporary file
-            temp_path.unlink(missing_ok=True)
-            
-        # Process question files if provided
+        notes_document = await _read_preview_files(notes, "Content from", "notes")
+        notes_text = notes_document.text
+        questions_text = ""
         if questions:
             logger.info(f"Processing {len(questions)} question files")
-            for question_file in questions:
-                content = await question_file.read()
-                temp_path = TEMP_UPLOAD_DIR / question_file.filename
-                with open(temp_path, "wb") as f:
-                    f.write(content)
-                
-                # Extract text from the file based on its type (simplified for now)
-                if temp_path.suffix.lower() in [".txt"]:
-                    with open(temp_path, "r", encoding="utf-8", errors="ignore") as f:
-                        questions_text += f.read() + "\n\n"
-                else:
-                    # For now, just include filename for non-text files
-                    questions_text += f"Questions from {question_file.filename}\n\n"
-                
-                # Clean up temporary file
-                temp_path.unlink(missing_ok=True)
+            questions_text = (await _read_preview_files(questions, "Questions from", "questions")).text
+        outline = _outline_dicts(notes_document)
+        materials_id = materials_store.save(notes_text, questions_text or None, session_id, outline=outline)
         
-        # Generate preview study plan
-        preview_result = await generate_preview_study_plan(
+        if _use_draft(draft):
+            preview_result = generate_draft_study_plan(
+                study_materials_text=notes_text,
+                study_duration_days=study_duration_days_int,
+                study_hours_per_day=study_hours_per_day_int,
+                questions_text=questions_text or None
+            )
+            if preview_result.get("status") == "success":
+                plan_id = _store_preview(preview_result, study_duration_days_int, study_hours_per_day_int,
+                                         session_id, materials_id)
+                if refine:
+                    _start_refinement(plan_id, notes_text, study_duration_days_int, study_hours_per_day_int,
+                                      questions_text or None, session_id, outline)
+                payload = _preview_payload(preview_result, plan_id, include_plan_text, materials_id)
+                payload["refining"] = refine
+                return payload
+            logger.warning(f"Draft plan unavailable, generating the preview with the model: {preview_result.get('details')}")
+        
+        # Generate preview study plan, or the finished plan in a single pass
+        generate = generate_single_pass_study_plan if _use_single_pass(single_pass) else generate_preview_study_plan
+        preview_result = await generate(
             study_materials_text=notes_text,
             study_duration_days=study_duration_days_int,
             study_hours_per_day=study_hours_per_day_int,
-            questions_text=questions_text if questions and questions_text.strip() else None
+            questions_text=questions_text if questions and questions_text.strip() else None,
+            session_id=session_id,
+            outline=outline
         )
         
         # Check for errors
@@ -275,13 +471,13 @@ async def generate_preview(
                 "warnings": preview_result.get("details", "Could not parse structured data")
             }
         
+        # Start structuring now so /plan/structure-plan can return the result right away
+        _speculate_structuring(preview_result, study_duration_days_int, study_hours_per_day_int, session_id)
+        
         # Return the preview plan, raw plan text, and simplified JSON if available
-        return {
-            "message": "Preview generated successfully", 
-            "preview_plan": preview_result.get("preview_plan"),
-            "raw_plan": preview_result.get("raw_plan"),
-            "simplified_json": preview_result.get("simplified_json")
-        }
+        plan_id = _store_preview(preview_result, study_duration_days_int, study_hours_per_day_int, session_id,
+                                 materials_id)
+        return _preview_payload(preview_result, plan_id, include_plan_text, materials_id)
     
     except HTTPException as http_exc:
         # Re-raise HTTP exceptions
@@ -290,11 +486,72 @@ async def generate_preview(
     except Exception as e:
         logger.error(f"Unexpected error in generate_preview: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+@router.post("/preview/stream")
+async def generate_preview_stream(
+    notes: list[UploadFile] = File(...), 
+    questions: list[UploadFile] = File(None),
+    study_duration_days: str = Form(...), 
+    study_hours_per_day: str = Form(...),
+    session_id: str = Form(None),
+    single_pass: bool = Form(None),
+    include_plan_text: bool = Form(True)
+):
+    """
+    Streaming variant of /preview using server-sent events.
     
-    finally:
-        # Clean up the temporary directory
-        if os.path.exists("./temp_uploads"):
-            try:
-                shutil.rmtree("./temp_uploads")
-            except Exception as e:
-                logger.error(f"Error cleaning up temp directory: {e}")
\ No newline at end of file
+    Sends ``overview`` events with markdown tokens as the planner writes them, then a
+    ``preview`` event carrying the same payload as /preview (including ``simplified_json``),
+    and finally a ``done`` event. Failures are reported as an ``error`` event. In single-pass
+    mode the locally rendered overview arrives as one ``overview`` event.
+    """
+    logger.info(f"Streaming preview for {study_duration_days} days, {study_hours_per_day} hours per day")
+    study_duration_days_int, study_hours_per_day_int = _validate_preview_constraints(
+        study_duration_days, study_hours_per_day
+    )
+    
+    # Read the uploads before the response starts, the files are closed afterwards
+    notes_document = await _read_preview_files(notes, "Content from", "notes")
+    notes_text = notes_document.text
+    questions_text = (await _read_preview_files(questions, "Questions from", "questions")).text if questions else ""
+    outline = _outline_dicts(notes_document)
+    materials_id = materials_store.save(notes_text, questions_text or None, session_id, outline=outline)
+    
+    stream_plan = stream_single_pass_study_plan if _use_single_pass(single_pass) else stream_preview_study_plan
+    
+    async def event_stream():
+        try:
+            async for event, payload in stream_plan(
+                study_materials_text=notes_text,
+                study_duration_days=study_duration_days_int,
+                study_hours_per_day=study_hours_per_day_int,
+                questions_text=questions_text if questions_text.strip() else None,
+                session_id=session_id,
+                outline=outline
+            ):
+                if event == "overview":
+                    yield _sse_event("overview", {"text": payload})
+                elif event == "error":
+                    logger.error(f"Error streaming preview: {payload.get('details')}")
+                    yield _sse_event("error", {"detail": f"Failed to generate preview: {payload.get('error')}"})
+                elif payload.get("status") == "partial_success":
+                    yield _sse_event("preview", {
+                        "message": "Preview generated with warnings",
+                        "preview_plan": payload.get("preview_plan"),
+                        "warnings": payload.get("details", "Could not parse structured data")
+                    })
+                else:
+                    _speculate_structuring(payload, study_duration_days_int, study_hours_per_day_int, session_id)
+                    plan_id = _store_preview(payload, study_duration_days_int, study_hours_per_day_int, session_id,
+                                             materials_id)
+                    yield _sse_event("preview", _preview_payload(payload, plan_id, include_plan_text, materials_id))
+        except Exception as e:
+            logger.error(f"Unexpected error in generate_preview_stream: {str(e)}", exc_info=True)
+            yield _sse_event("error", {"detail": f"An unexpected error occurred: {str(e)}"})
+        yield _sse_event("done", {})
+    
+    return StreamingResponse(
+        content=event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
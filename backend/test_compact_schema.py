@@ -0,0 +1,91 @@
+"""
+Round-trip tests and output size benchmark for the compact wire format in utils.compact_schema.
+
+Run the benchmark with: python test_compact_schema.py [days] [output tokens per second]
+"""
+import json
+import sys
+import time
+
+from models.study_plan_models import StructuredStudyPlan
+from utils.compact_schema import (
+    PLAN_KEYS, RECORD_FIELDS, compact_json_schema, compact_plan, expand_compact_plan, is_compact,
+)
+from utils.adapter_utils import transform_backend_to_frontend
+
+
+def test_round_trip_restores_full_plan(sample_plan):
+    plan = sample_plan()
+    wire = compact_plan(plan)
+    assert is_compact(wire) and not is_compact(plan)
+    assert expand_compact_plan(wire) == plan
+    # The expanded plan validates and adapts like one written with the full keys
+    StructuredStudyPlan(**expand_compact_plan(wire))
+    assert transform_backend_to_frontend(expand_compact_plan(wire)) == transform_backend_to_frontend(plan)
+
+
+def test_expansion_tolerates_short_and_object_records(sample_plan):
+    wire = {
+        "g": "Learn", "d": 2, "h": 1, "t": ["Rest"], "zz": "unknown key",
+        "c": [["Entropy", "Disorder"], {"name": "Enthalpy", "explanation": "Heat content"}],
+        "s": [[1, "Basics", "Intro", [["Units", "SI units", 30, None]]]],
+    }
+    plan = expand_compact_plan(wire)
+    assert "zz" not in plan
+    assert plan["core_concepts"] == [
+        {"name": "Entropy", "explanation": "Disorder"}, {"name": "Enthalpy", "explanation": "Heat content"}
+    ]
+    day = plan["daily_schedule"][0]
+    assert day["date"] is None and "learning_goals" not in day
+    assert day["study_item"] == [
+        {"topic": "Units", "description": "SI units", "duration_minutes": 30, "priority": None, "is_completed": False}
+    ]
+    # Plans written with the full field names pass through untouched
+    full = sample_plan(2)
+    assert expand_compact_plan(full) is full
+
+
+def test_schema_positions_match_record_fields():
+    properties = compact_json_schema()["properties"]
+    assert set(properties) == set(PLAN_KEYS)
+    for key, field in PLAN_KEYS.items():
+        if field in RECORD_FIELDS:
+            assert len(properties[key]["items"]["prefixItems"]) == len(RECORD_FIELDS[field])
+    day_items = properties["s"]["items"]["prefixItems"][RECORD_FIELDS["daily_schedule"].index("study_item")]
+    assert len(day_items["items"]["prefixItems"]) == len(RECORD_FIELDS["study_item"])
+
+
+def test_compact_output_is_much_smaller(sample_plan):
+    plan = sample_plan(14)
+    full = json.dumps(plan, separators=(",", ":"))
+    compact = json.dumps(compact_plan(plan), separators=(",", ":"))
+    assert len(compact) < 0.7 * len(full)
+
+
+def benchmark(days: int = 14, tokens_per_second: float = 40.0, repeat: int = 200) -> None:
+    """Estimate output tokens and generation time per plan for both formats, plus local expansion cost."""
+    from conftest import build_sample_plan
+
+    plan = build_sample_plan(days)
+    wire = compact_plan(plan)
+    outputs = {
+        "full, indented": json.dumps(plan, indent=2),
+        "full, minified": json.dumps(plan, separators=(",", ":")),
+        "compact": json.dumps(wire, separators=(",", ":")),
+    }
+    print(f"{days}-day plan at {tokens_per_second:g} output tokens/s (4 characters per token)")
+    for name, text in outputs.items():
+        tokens = len(text) // 4
+        print(f"  {name:<16}{len(text):8} chars {tokens:7} tokens {tokens / tokens_per_second:7.1f} s")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        expand_compact_plan(json.loads(outputs["compact"]))
+    print(f"  local expansion {(time.perf_counter() - started) / repeat * 1000:.3f} ms per plan")
+
+
+if __name__ == "__main__":
+    benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 14,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 40.0,
+    )
@@ -0,0 +1,50 @@
+"""
+Tests for the regex structurer fallback (utils.degraded_structuring) and scheduler saturation.
+"""
+import asyncio
+
+from utils.degraded_structuring import Deadline, structure_with_regex
+from utils.model_scheduler import BATCH, INTERACTIVE, ModelScheduler
+
+RAW_PLAN = """# Heat Transfer Plan
+## Goal
+Learn the three modes of heat transfer.
+## Day 1
+Focus Area: Conduction
+- Fourier's law (60 minutes): the rate equation
+- Composite walls (30 minutes): thermal resistances
+## Day 2
+Focus Area: Convection
+- Boundary layers
+- Newton's law of cooling
+## Study Tips
+- Practice daily
+"""
+
+
+def test_regex_structurer_fills_the_requested_grid():
+    plan = structure_with_regex(RAW_PLAN, days=3, hours_per_day=2)
+    assert plan["overallGoal"] == "Learn the three modes of heat transfer."
+    assert plan["totalStudyDays"] == 3 and len(plan["dailyBreakdown"]) == 3
+    for day in plan["dailyBreakdown"]:
+        assert sum(item["durationMinutes"] for item in day["items"] if item["topic"] != "Summary") == 120
+    topics = [item["topic"] for day in plan["dailyBreakdown"] for item in day["items"]]
+    assert "Fourier's law" in topics and any(topic.startswith("Newton's law of cooling") for topic in topics)
+
+    # Without constraints the plan keeps its own days and average day length
+    plan = structure_with_regex(RAW_PLAN)
+    assert plan["totalStudyDays"] == 2 and plan["hoursPerDay"] == 2.75
+
+
+def test_saturation_and_deadline():
+    async def run():
+        scheduler = ModelScheduler(max_concurrency=2, interactive_reserved=1)
+        assert not scheduler.saturated()
+        await scheduler.acquire(BATCH)
+        assert scheduler.saturated(BATCH) and not scheduler.saturated(INTERACTIVE)
+        scheduler.release(BATCH)
+        assert not scheduler.saturated()
+
+    asyncio.run(run())
+    assert not Deadline(60).nearly_spent
+    assert Deadline(1).nearly_spent
@@ -0,0 +1,88 @@
+"""
+Tests for document outlines and outline-seeded planner materials (utils.document_outline).
+"""
+import io
+
+from PyPDF2 import PdfWriter
+
+from utils.document_outline import combine_documents, document_from_pages, read_pdf, seed_materials
+
+PAGES = [
+    "Chapter 6\nIntroduction to Convection\nConvection is heat transfer between a surface and a moving fluid.",
+    "6.1 The Convection Boundary Layers\nThe velocity boundary layer grows along the plate. " * 12,
+    "6.1.1 The Velocity Boundary Layer\nShear stress at the wall depends on the velocity gradient. " * 12,
+    "more on the velocity boundary layer\n6.2 Local and Average Coefficients\nThe average h integrates h_x.",
+    "6.2 Local and Average Coefficients 312\nAn example of averaging over the plate length. " * 12,
+]
+
+
+def _bookmarked_pdf() -> bytes:
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=200, height=200)
+    chapter = writer.add_outline_item("Chapter 1", 0)
+    writer.add_outline_item("Section 1.1", 1, parent=chapter)
+    writer.add_outline_item("Chapter 2", 3)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_outline_from_bookmarks_and_headings_has_page_ranges():
+    document = read_pdf(_bookmarked_pdf())
+    assert document.outline_source == "bookmarks"
+    assert [(entry.title, entry.level, entry.start_page, entry.end_page) for entry in document.outline] == [
+        ("Chapter 1", 1, 1, 3), ("Section 1.1", 2, 2, 3), ("Chapter 2", 1, 4, 4)
+    ]
+
+    document = document_from_pages(PAGES)
+    assert document.outline_source == "headings"
+    # Repeated page headers ("6.2 ... 312") keep the first occurrence of a section
+    assert [(entry.title, entry.level, entry.start_page, entry.end_page) for entry in document.outline] == [
+        ("6.1 The Convection Boundary Layers", 1, 2, 4),
+        ("6.1.1 The Velocity Boundary Layer", 2, 3, 4),
+        ("6.2 Local and Average Coefficients", 1, 4, 5),
+    ]
+    assert document.text[document.outline[1].start:].startswith("6.1.1 The Velocity")
+
+    combined = combine_documents([document_from_pages(["Other notes"]), document])
+    assert combined.outline[0].start_page == 3
+    assert combined.text[combined.outline[0].start:].startswith("6.1 The Convection")
+
+
+def test_seed_materials_keeps_every_section_within_the_budget():
+    document = document_from_pages(PAGES)
+    outline = [entry.to_dict() for entry in document.outline]
+    seeded = seed_materials(document.text, outline, max_chars=1500)
+
+    assert seeded.startswith("Document outline:\n- 6.1 The Convection Boundary Layers (pages 2-4)\n"
+                             "  - 6.1.1 The Velocity Boundary Layer (pages 3-4)\n")
+    assert "### 6.1 The Convection Boundary Layers (pages 2-4)\nThe velocity boundary layer" in seeded
+    assert "#### 6.1.1 The Velocity Boundary Layer (pages 3-4)" in seeded
+    assert "### 6.2 Local and Average Coefficients (pages 4-5)" in seeded
+    assert "[...]" in seeded and len(seeded) <= 1500
+
+    assert seed_materials(document.text, None) == document.text
+    assert seed_materials(document.text, outline).count("[...]") == 0
+
+
+def test_seed_materials_counts_outline_and_floors_against_the_budget():
+    # A long textbook: the skeleton, headings and per-section floors alone exceed the budget
+    topics = ["conduction", "convection", "radiation", "boiling", "condensation", "exchangers"]
+    outline, text = [], ""
+    for number in range(360):
+        title = f"{number // 10 + 1}.{number % 10 + 1} Section on {topics[number % len(topics)]}"
+        body = f"The {topics[number % len(topics)]} section {number} covers heat transfer in detail. " * 38
+        outline.append({"title": title, "level": 1, "start_page": number + 1, "end_page": number + 1,
+                        "start": len(text), "end": len(text) + len(title) + 1 + len(body)})
+        text += f"{title}\n{body}\n"
+    assert len(text) > 800_000
+
+    seeded = seed_materials(text, outline, max_chars=60_000)
+    assert len(seeded) <= 60_000
+    # The whole outline is kept, the lowest-scored sections lose their text
+    assert seeded.startswith("Document outline:\n- 1.1 Section on conduction (page 1)\n")
+    assert "- 36.10 Section on exchangers (page 360)" in seeded
+    assert 0 < seeded.count("### ") < len(outline)
+
+    assert len(seed_materials(text, outline, max_chars=20_000)) <= 20_000
@@ -0,0 +1,53 @@
+"""
+Tests for the local draft plan built without a model (utils.draft_plan).
+"""
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.draft_plan import build_draft_plan, extract_sections, generate_draft_study_plan
+from utils.spaced_repetition import is_review_item
+
+NOTES = "\n".join([
+    "1.1 Conduction",
+    "Heat conduction is the transfer of energy through a solid by molecular activity. " * 20,
+    "1.1.1 Fourier's Law",
+    "Fourier's law relates the conduction heat flux to the temperature gradient in the solid. " * 30,
+    "q = -k dT/dx",
+    "1.1.2 Thermal Conductivity",
+    "Thermal conductivity is a transport property of the material that depends on temperature. " * 10,
+    "1.2 Convection",
+    "Convection combines conduction with the bulk motion of a fluid over a surface. " * 10,
+    "1.2.1 Newton's Law of Cooling",
+    "Newton's law of cooling gives the convection heat flux from the convection coefficient. " * 25,
+    "q = h(Ts - Tinf)",
+    "D = 20 mm",
+    "1.3 Radiation",
+    "Radiation is energy emitted by matter as electromagnetic waves, even through a vacuum. " * 15,
+    "1.4 Summary",
+    "Conduction, convection and radiation are the three modes of heat transfer.",
+])
+
+
+def test_sections_and_formulas_come_from_headings_and_equation_lines():
+    sections = extract_sections(NOTES)
+    assert [(section["number"], section["level"]) for section in sections] == [
+        ("1.1", 1), ("1.1.1", 2), ("1.1.2", 2), ("1.2", 1), ("1.2.1", 2), ("1.3", 1)
+    ]
+    plan = build_draft_plan(NOTES, days=3, hours_per_day=2)
+    assert [formula["formula"] for formula in plan["key_formulas"]] == ["q = -k dT/dx", "q = h(Ts - Tinf)"]
+
+
+def test_draft_plan_fills_the_requested_days_and_hours():
+    plan = build_draft_plan(NOTES, days=3, hours_per_day=1.5, questions_text="Use Fourier's law for a wall.")
+    schedule = plan["daily_schedule"]
+    assert plan["total_study_day"] == 3 and len(schedule) == 3
+    assert {sum(item["duration_minutes"] for item in day["study_item"]) for day in schedule} == {90}
+    topics = [item["topic"].split(" (part")[0] for day in schedule for item in day["study_item"] if not is_review_item(item)]
+    assert list(dict.fromkeys(topics)) == [
+        "1.1.1 Fourier's Law", "1.1.2 Thermal Conductivity", "1.2.1 Newton's Law of Cooling", "1.3 Radiation"
+    ]
+    assert [concept["name"] for concept in plan["core_concepts"]] == ["Conduction", "Convection", "Radiation"]
+    assert schedule[0]["focus_area"] == "Conduction"
+
+    result = generate_draft_study_plan(NOTES, 3, 2)
+    assert result["status"] == "success" and result["structuring_path"] == "draft"
+    assert result["structured_plan"] == transform_backend_to_frontend(build_draft_plan(NOTES, 3, 2))
+    assert generate_draft_study_plan("", 3, 2)["status"] == "error"
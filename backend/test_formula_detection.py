@@ -0,0 +1,61 @@
+"""
+Tests for the local formula detector (utils.formula_detection).
+"""
+from pathlib import Path
+
+from utils.document_outline import read_pdf
+from utils.formula_detection import detect_formulas, formula_key, merge_annotations
+
+NOTES_PDF = Path(__file__).resolve().parent.parent / "test" / "notes" / "notes_heat_transfer.pdf"
+
+TEXT = r"""## Key Formulas
+- Reynolds Number: Re = ρVL/μ - ratio of inertia to viscous forces
+- **Nusselt number** - $Nu = \frac{hL}{k_f}$
+Fourier's law gives q'' = −k dT/dx for conduction in a plane wall.
+The local friction coefficient is $$C_f = \frac{\tau_s}{\rho u_\infty^2/2}$$
+Given: D = 20 mm, and T∞ = 1150°C
+hm = 0.05 m/s
+q = h(Ts − T∞) (6.4)
+Later the same relation is written q = h (Ts - T∞) again.
+The value of this equals the sum of things = something
+hx = ax-0.1hhhhhx(x)ax 0.1
+"""
+
+
+def test_detects_normalizes_and_deduplicates_formulas():
+    formulas = detect_formulas(TEXT)
+    assert [formula.formula for formula in formulas] == [
+        "Re = ρVL/μ", "Nu = hL/k_f", "q'' = -k dT/dx", "C_f = (τ_s)/(ρ u_∞^2/2)", "q = h(Ts - T∞)"
+    ]
+    assert [formula.name for formula in formulas] == [
+        "Reynolds Number", "Nusselt number", "Relation for q''", "Relation for C_f", "Equation 6.4"
+    ]
+    assert formulas[0].description == "Ratio of inertia to viscous forces."
+    assert formula_key("q = h (Ts − T∞)") == formula_key("q=h(Ts-T∞)")
+    assert [formula.formula for formula in detect_formulas(TEXT, limit=2)] == ["Re = ρVL/μ", "C_f = (τ_s)/(ρ u_∞^2/2)"]
+
+
+def test_annotations_are_matched_back_to_detected_formulas():
+    detected = detect_formulas(TEXT)[:2]
+    merged = merge_annotations(detected, {"key_formulas": [
+        {"name": "Nusselt number", "formula": "Nu = h L / k_f", "description": "Dimensionless heat transfer",
+         "usage_context": "Convection correlations"},
+    ]})
+    assert merged[0] == detected[0].as_key_formula()
+    assert merged[1] == {"name": "Nusselt number", "formula": "Nu = hL/k_f", "description": "Dimensionless heat transfer",
+                         "usage_context": "Convection correlations"}
+    assert merge_annotations(detected, None) == [formula.as_key_formula() for formula in detected]
+
+
+def test_values_with_a_unit_glued_to_figure_labels_are_not_formulas():
+    # The notes' figure labels, as extracted: the font's spaces come out as \x03
+    text = read_pdf(str(NOTES_PDF)).text.replace("\x03", " ")
+    start = text.index("Case 1 Case 2")
+    figure = text[start:text.index("Original", start)]
+    assert 'Ts,1 = 700°Cq"1(x*) q"2(x*)Coolant' in figure and "q\"(x*) = 95,000 W/m2" in figure
+
+    assert detect_formulas(figure) == []
+    assert [formula.formula for formula in detect_formulas(figure + "\nq = h(Ts − T∞) (6.4)")] == ["q = h(Ts - T∞)"]
+    assert [formula.formula for formula in detect_formulas("Nu = 0.664 Re^0.5 Pr^(1/3)\nA = 2πrL")] == [
+        "Nu = 0.664 Re^0.5 Pr^(1/3)", "A = 2πrL"
+    ]
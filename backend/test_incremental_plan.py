@@ -0,0 +1,66 @@
+"""
+Tests for incremental regeneration of stored plans (utils.incremental_plan).
+"""
+import pytest
+
+from utils.incremental_plan import build_edit_request, build_plan_context, diff_plan_request, merge_generated_days
+from utils.spaced_repetition import is_review_item
+
+
+def lessons(days: list) -> list:
+    return [(day["focus_area"], [item["topic"] for item in day["study_item"] if not is_review_item(item)]) for day in days]
+
+
+def generated_day(day: int, topic: str) -> dict:
+    return {
+        "day": day, "focus_area": topic, "summary": f"Study {topic}",
+        "study_item": [{"topic": topic, "description": f"Work through {topic}", "duration_minutes": 120}],
+    }
+
+
+def test_extending_a_plan_only_generates_the_new_days(sample_plan):
+    plan = sample_plan(4)
+    edit = diff_plan_request(plan, days=6)
+    assert edit.generate_days == [5, 6] and not edit.reschedule
+
+    request = build_edit_request(plan, edit)
+    assert "days 5, 6 of a 6-day plan" in request and "Current version" not in request
+    assert build_plan_context(plan) == build_plan_context(sample_plan(4))
+
+    merged = merge_generated_days(plan, edit, {"daily_schedule": [generated_day(5, "Fins"), generated_day(6, "Review")]})
+    assert merged["total_study_day"] == 6
+    assert lessons(merged["daily_schedule"][:4]) == lessons(plan["daily_schedule"])
+    assert [day["focus_area"] for day in merged["daily_schedule"][4:]] == ["Fins", "Review"]
+    for section in ("core_concepts", "key_formulas", "general_tip"):
+        assert merged[section] == plan[section]
+
+
+def test_swapping_a_topic_regenerates_only_the_days_that_mention_it(sample_plan):
+    plan = sample_plan(4)
+    edit = diff_plan_request(plan, replace_topics={"Topic 3.1": "Radiation"})
+    assert edit.generate_days == [3] and not edit.reschedule
+    assert "Topic 3.1" in build_edit_request(plan, edit)
+
+    # Models that number the returned days from 1 are matched by position
+    merged = merge_generated_days(plan, edit, [generated_day(1, "Radiation")])
+    assert merged["daily_schedule"][2]["day"] == 3 and merged["daily_schedule"][2]["focus_area"] == "Radiation"
+    assert lessons(merged["daily_schedule"][3:]) == lessons(plan["daily_schedule"][3:])
+    assert "Radiation" in merged["daily_schedule"][3]["review_topics"]
+
+    with pytest.raises(ValueError):
+        merge_generated_days(plan, edit, {"daily_schedule": []})
+    with pytest.raises(ValueError):
+        diff_plan_request(plan, replace_topics={"Quantum optics": "Radiation"})
+    assert diff_plan_request(plan, days=3, hours_per_day=1.5).reschedule
+
+
+def test_topics_are_matched_as_whole_words(sample_plan):
+    plan = sample_plan(12)
+    assert diff_plan_request(plan, replace_topics={"Topic block 1": "Radiation"}).generate_days == [1]
+    assert diff_plan_request(plan, replace_topics={"topic 1.1": "Radiation"}).generate_days == [1]
+    with pytest.raises(ValueError):
+        # Not a prefix of "Topic 1.1" or "Topic 10.1"
+        diff_plan_request(plan, replace_topics={"Topic 1": "Radiation"})
+    # Zero is a request, not "unchanged"
+    with pytest.raises(ValueError):
+        diff_plan_request(plan, hours_per_day=0)
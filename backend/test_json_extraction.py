@@ -0,0 +1,232 @@
+"""
+Fuzz tests and benchmark for utils.json_extraction.
+
+Run the tests with pytest, or run this file directly to benchmark the shared
+extractor against the regexes it replaced:
+
+    python test_json_extraction.py
+"""
+import json
+import random
+import re
+import sys
+import time
+
+from utils.json_extraction import (
+    BALANCED_SCAN, DIRECT, FENCED, FIRST_BRACE, REPAIRED,
+    balanced_spans, extract_json, extract_json_value, extraction_stats,
+)
+from utils.json_repair import repair_json
+
+# Outputs shaped like what the planner and structurer models actually return
+PREVIEW_OUTPUT = """# Study Plan Overview
+
+## Overall Goal
+Master heat transfer fundamentals in 3 days, 2 hours per day.
+
+## Day 1: Conduction
+- Fourier's law {q = -k dT/dx}
+- Thermal resistance networks
+
+```
+{q = -k dT/dx}
+```
+
+```json
+{
+  "overall_goal": "Master heat transfer fundamentals",
+  "core_concepts": [
+    {"name": "Conduction", "explanation": "Heat flow through solids", "importance": "high"}
+  ],
+  "daily_focus": [
+    {"day": 1, "focus_area": "Conduction", "topics": ["Fourier's law"],
+     "time_allocation": {"Fourier's law": "120 minutes"}, "subtopics": {"Fourier's law": ["1D walls"]}}
+  ],
+  "key_formulas": [{"name": "Fourier", "formula": "q = -k dT/dx", "application": "walls"}]
+}
+```
+"""
+
+STRUCTURER_CHATTY = """Sure! Here is the structured plan you asked for:
+
+{"overall_goal": "Learn thermodynamics", "total_study_day": 2, "hour_per_day": 1.5,
+ "core_concepts": [{"name": "Entropy", "explanation": "Measure of disorder {S}"}],
+ "general_tip": ["Review daily"]}
+
+Let me know if you want any changes to the {format}.
+"""
+
+STRUCTURER_ARRAY = """```
+[{"day": 1, "focus_area": "Basics", "study_item": [{"topic": "Units", "description": "SI", "duration_minutes": 60}]},
+ {"day": 2, "focus_area": "Laws", "study_item": [{"topic": "First law", "description": "Energy", "duration_minutes": 60}]}]
+```"""
+
+
+def legacy_preview_json(text):
+    """The lazy fence regex previously used by parse_preview_output and structure_raw_plan."""
+    match = re.search(r'```(?:json)?\s*({[\s\S]*?})\s*```', text)
+    return json.loads(match.group(1)) if match else None
+
+
+def legacy_greedy_json(text):
+    """The greedy object regex previously used by StructurerAgent._extract_json."""
+    match = re.search(r'(\{[\s\S]*\})', text)
+    return json.loads(match.group(1)) if match else None
+
+
+def random_value(rng, depth=0):
+    """A random JSON value whose strings contain brackets, quotes and fences."""
+    kind = rng.randrange(6 if depth < 4 else 3)
+    if kind == 0:
+        return rng.randint(-1000, 1000)
+    if kind == 1:
+        return rng.choice(["plain", "brace } inside", "bracket ] [", 'quote " here', "fence ``` text", "back\\slash"])
+    if kind == 2:
+        return rng.choice([True, False, None, 1.5])
+    if kind in (3, 4):
+        return {f"key_{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+
+
+def random_object(rng):
+    return {"overall_goal": "goal", "nested": {"inner": random_value(rng, 1)}, "items": [random_value(rng, 2)]}
+
+
+def wrap(rng, payload):
+    """Surround serialized JSON with the kinds of noise models produce."""
+    prefix = rng.choice(["", "Here is the plan:\n", "# Overview\nUse {placeholders} freely.\n", "Note: the {curly brace\n"])
+    suffix = rng.choice(["", "\nHope this helps!", "\nSee {appendix}.", "\n] stray closer"])
+    body = json.dumps(payload, indent=rng.choice([None, 2]))
+    if rng.random() < 0.5:
+        body = f"```{rng.choice(['json', ''])}\n{body}\n```"
+    return prefix + body + suffix
+
+
+def test_preview_output_keeps_nested_objects():
+    extraction = extract_json(PREVIEW_OUTPUT, expect=dict, source="test")
+    assert extraction.strategy == FENCED
+    assert extraction.value["daily_focus"][0]["subtopics"] == {"Fourier's law": ["1D walls"]}
+    assert PREVIEW_OUTPUT[extraction.start:].startswith("```json")
+    assert PREVIEW_OUTPUT[extraction.end:].strip() == ""
+    # The old lazy regex latches onto the first fenced block and never reaches the JSON
+    try:
+        legacy_value = legacy_preview_json(PREVIEW_OUTPUT)
+    except json.JSONDecodeError:
+        legacy_value = None
+    assert legacy_value != extraction.value
+
+
+def test_chatty_structurer_output_with_trailing_braces():
+    extraction = extract_json(STRUCTURER_CHATTY, expect=dict, source="test")
+    assert extraction.strategy == FIRST_BRACE
+    assert extraction.value["core_concepts"][0]["name"] == "Entropy"
+    # The old greedy regex runs on to the last brace in the trailing prose
+    try:
+        legacy_greedy_json(STRUCTURER_CHATTY)
+        assert False, "greedy regex unexpectedly parsed"
+    except json.JSONDecodeError:
+        pass
+
+
+def test_array_output_and_type_filter():
+    assert len(extract_json_value(STRUCTURER_ARRAY, source="test")) == 2
+    assert extract_json_value(STRUCTURER_ARRAY, expect=list, source="test")[1]["day"] == 2
+    assert extract_json_value(STRUCTURER_ARRAY, expect=dict, source="test") is None
+    assert extract_json('  {"a": 1}  ', source="test").strategy == DIRECT
+
+
+def test_stray_braces_in_prose_do_not_hide_json():
+    text = 'Use {curly braces and "quotes for emphasis.\n{"day": 1, "topics": ["a"]} done'
+    extraction = extract_json(text, expect=dict, source="test")
+    assert extraction.strategy == BALANCED_SCAN
+    assert extraction.value == {"day": 1, "topics": ["a"]}
+
+
+def test_missing_or_truncated_json_returns_none():
+    assert extract_json_value("No JSON here at all.", source="test") is None
+    assert extract_json_value('```json\n{"a": [1, 2\n', source="test") is None
+    assert extract_json_value("", source="test") is None
+    # Complete inner objects of a truncated plan are not mistaken for the plan
+    assert extract_json_value('{"overall_goal": "x", "core_concepts": [{"name": "a"}, {"na', source="test") is None
+    assert extraction_stats()["strategies"]["test"]["failed"] >= 3
+
+
+def test_fuzz_wrapped_values_round_trip():
+    rng = random.Random(1234)
+    for _ in range(500):
+        payload = random_object(rng)
+        text = wrap(rng, payload)
+        assert extract_json_value(text, expect=dict, source="fuzz") == payload, text
+
+
+def test_balanced_spans_ignore_brackets_in_strings():
+    text = 'a {"k": "}]"} b [1, {"x": "["}] c'
+    assert [text[start:end] for start, end in balanced_spans(text)] == ['{"k": "}]"}', '[1, {"x": "["}]']
+
+
+def test_repair_fixes_common_slips():
+    assert repair_json('{"a": [1, 2,], "b": True,}')[0] == {"a": [1, 2], "b": True}
+    assert repair_json('{"a": 1 "b": [1, 2}')[0] == {"a": 1, "b": [1, 2]}
+    assert repair_json('{"note": "line one\nline two", bare: None}')[0] == {"note": "line one\nline two", "bare": None}
+
+
+def test_repair_truncated_plan_drops_incomplete_element():
+    text = ('```json\n{"overall_goal": "Learn", "daily_schedule": [{"day": 1, "focus_area": "Basics"}, '
+            '{"day": 2, "focus_area": "Adv')
+    assert extract_json_value(text, source="test") is None
+    extraction = extract_json(text, expect=dict, source="test_repair", repair=True)
+    assert extraction.strategy == REPAIRED
+    assert extraction.value == {"overall_goal": "Learn", "daily_schedule": [{"day": 1, "focus_area": "Basics"}]}
+    assert extraction_stats()["retries"]["test_repair"]["prevented"] == 1
+
+
+def test_repair_any_truncation_point():
+    rng = random.Random(99)
+    for _ in range(50):
+        payload = {"overall_goal": "goal", "daily_schedule": [random_object(rng) for _ in range(3)]}
+        text = json.dumps(payload, indent=rng.choice([None, 2]))
+        first_member = text.index(",") + 1
+        for cut in range(first_member, len(text), 7):
+            repaired = repair_json(text[:cut])
+            assert repaired is not None, text[:cut]
+            assert repaired[0]["overall_goal"] == "goal"
+
+
+def benchmark(repeat: int = 3) -> None:
+    """Compare the shared extractor with the regexes it replaced on long outputs."""
+    rng = random.Random(7)
+    plan = {"overall_goal": "goal", "daily_schedule": [random_object(rng) for _ in range(2000)]}
+    body = json.dumps(plan, indent=2)
+    cases = {
+        "fenced plan": "Intro\n```json\n" + body + "\n```\n",
+        "plan + trailing prose": body + "\n\nLet me know about the {format}." * 50,
+        # Formula code blocks before the JSON: the lazy regex latches onto the first one
+        "plan after formula blocks": "```\n{q = -k dT/dx}\n```\n" * 200 + "```json\n" + body + "\n```\n",
+    }
+
+    def best_of(func, text):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            try:
+                value = func(text)
+            except json.JSONDecodeError:
+                value = None
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000, "found plan" if value == plan else "no plan"
+
+    parsers = {
+        "extract_json": lambda t: extract_json_value(t, source="benchmark"),
+        "lazy fence regex": legacy_preview_json,
+        "greedy regex": legacy_greedy_json,
+    }
+    for name, text in cases.items():
+        extraction = extract_json(text, source="benchmark")
+        print(f"{name} ({len(text)} characters, strategy {extraction.strategy if extraction else None})")
+        for parser_name, parser in parsers.items():
+            elapsed, outcome = best_of(parser, text)
+            print(f"  {parser_name:<17}{elapsed:9.2f} ms  {outcome}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
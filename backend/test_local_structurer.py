@@ -0,0 +1,43 @@
+"""
+Tests for mapping malformed simplified JSON with the local structurer (utils.local_structurer).
+"""
+import copy
+
+import pytest
+
+from utils.local_structurer import structure_from_simplified_json
+from utils.plan_rendering import simplified_json_from_plan
+
+
+@pytest.fixture
+def simplified_plan(sample_plan):
+    return simplified_json_from_plan(sample_plan(2))
+
+
+def _with(simplified_plan, changes):
+    simplified = copy.deepcopy(simplified_plan)
+    changes(simplified)
+    return simplified
+
+
+@pytest.mark.parametrize("changes", [
+    lambda simplified: simplified["daily_focus"][0].update(subtopics=["Boundary layers", "Convection"]),
+    lambda simplified: simplified["daily_focus"][1].update(time_allocation=["40 minutes", "1 hour"]),
+    lambda simplified: simplified["daily_focus"].__setitem__(0, "Day 1: Topic 1.0"),
+    lambda simplified: simplified.update(study_tips={"tip": "Practice"}),
+])
+def test_malformed_shapes_raise_value_error(simplified_plan, changes):
+    # Callers fall back to the model on ValueError, anything else became a 500
+    with pytest.raises(ValueError):
+        structure_from_simplified_json(_with(simplified_plan, changes))
+
+
+def test_single_strings_are_taken_as_one_element_lists(simplified_plan):
+    topic = simplified_plan["daily_focus"][0]["topics"][0]
+    simplified = _with(simplified_plan, lambda simplified: (
+        simplified.update(study_tips="Practice"),
+        simplified["daily_focus"][0].update(subtopics={topic: "Fourier's law"}),
+    ))
+    plan = structure_from_simplified_json(simplified, hours_per_day=2.0)
+    assert plan["general_tip"] == ["Practice"]
+    assert plan["daily_schedule"][0]["study_item"][0]["learning_objectives"] == ["Fourier's law"]
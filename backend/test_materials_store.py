@@ -0,0 +1,24 @@
+"""
+Tests for the compressed materials store in utils.materials_store.
+"""
+from utils.materials_store import MaterialsStore
+
+
+def test_materials_are_stored_once_and_resolved_by_id_or_session():
+    store = MaterialsStore(":memory:")
+    notes = "Fourier's law: q = -k dT/dx. Conduction through plane walls.\n" * 200
+    first = store.save(notes, "Q1. Find the heat flux.", session_id="s1")
+    second = store.save(notes, "Q1. Find the heat flux.", session_id="s2")
+    other = store.save("Radiation notes", None, session_id="s1")
+
+    assert first == second and other != first
+    assert store.get(first) == {"notes": notes, "questions": "Q1. Find the heat flux."}
+    assert store.get("unknown") is None
+    assert store.latest_for_session("s1") == other and store.latest_for_session("s2") == first
+    assert store.resolve_text(session_id="s1") == "Radiation notes"
+    assert store.resolve_text(first).startswith("Class Notes:\nFourier's law")
+    assert store.resolve_text(session_id="nobody") is None
+
+    stats = store.stats()
+    assert stats["materials"] == 2 and stats["sessions"] == 2
+    assert stats["compression_ratio"] < 0.1
@@ -0,0 +1,112 @@
+"""
+Tests for priority admission control in utils.model_scheduler.
+"""
+import asyncio
+
+from utils.model_scheduler import BATCH, INTERACTIVE, ModelScheduler
+
+
+async def _waiter(scheduler, order, name, priority, session_id=None):
+    """Start waiting for a slot and record the name once admitted."""
+    async def wait():
+        await scheduler.acquire(priority, session_id)
+        order.append(name)
+
+    task = asyncio.ensure_future(wait())
+    await asyncio.sleep(0)
+    return task
+
+
+def test_interactive_waiters_are_admitted_before_batch():
+    async def scenario():
+        scheduler = ModelScheduler(max_concurrency=2, interactive_reserved=1)
+        await scheduler.acquire(BATCH, "a")
+        await scheduler.acquire(INTERACTIVE)
+        assert scheduler.saturated(BATCH) and scheduler.saturated(INTERACTIVE)
+
+        order = []
+        # The batch job queues first, the chat turn still goes first
+        tasks = [await _waiter(scheduler, order, "batch", BATCH, "b"),
+                 await _waiter(scheduler, order, "chat", INTERACTIVE)]
+        scheduler.release(BATCH)
+        await asyncio.sleep(0)
+        assert order == ["chat"]
+        scheduler.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["chat", "batch"]
+    assert stats["classes"][INTERACTIVE]["admitted"] == 2 and stats["classes"][BATCH]["admitted"] == 2
+
+
+def test_batch_work_never_takes_the_reserved_interactive_slot():
+    async def scenario():
+        scheduler = ModelScheduler(max_concurrency=3, interactive_reserved=1)
+        await scheduler.acquire(BATCH, "a")
+        await scheduler.acquire(BATCH, "b")
+        order = []
+        batch = await _waiter(scheduler, order, "batch", BATCH, "c")
+        assert order == [] and scheduler.saturated(BATCH) and not scheduler.saturated(INTERACTIVE)
+
+        # The free slot is kept for chat
+        await scheduler.acquire(INTERACTIVE)
+        scheduler.release(INTERACTIVE)
+        await asyncio.sleep(0)
+        assert order == []
+        scheduler.release(BATCH)
+        await batch
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["batch"]
+    assert stats["classes"][BATCH]["running"] == 2 and stats["classes"][INTERACTIVE]["running"] == 0
+    # The reserve never takes the last slot from batch work
+    assert ModelScheduler(max_concurrency=1, interactive_reserved=1).batch_limit == 1
+
+
+def test_batch_sessions_are_admitted_round_robin():
+    async def scenario():
+        scheduler = ModelScheduler(max_concurrency=1, interactive_reserved=0)
+        await scheduler.acquire(BATCH, "busy")
+        order = []
+        tasks = []
+        for name, session_id in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c"), ("b2", "b")]:
+            tasks.append(await _waiter(scheduler, order, name, BATCH, session_id))
+        assert scheduler.stats()["batch_sessions_waiting"] == 3
+
+        for _ in tasks:
+            scheduler.release(BATCH)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_cancelled_waiters_give_up_their_place_and_their_slot():
+    async def scenario():
+        scheduler = ModelScheduler(max_concurrency=1, interactive_reserved=0)
+        await scheduler.acquire(BATCH, "a")
+        order = []
+        cancelled = await _waiter(scheduler, order, "cancelled", BATCH, "b")
+        waiting = await _waiter(scheduler, order, "waiting", BATCH, "c")
+
+        # Cancelled while queued: removed from the queue
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert scheduler.stats()["classes"][BATCH]["waiting"] == 1
+
+        # Cancelled right after being granted the slot: the slot is passed on
+        scheduler.release(BATCH)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        stats = scheduler.stats()
+        async with scheduler.slot(BATCH, "d"):
+            order.append("next")
+        return order, stats, scheduler.stats()
+
+    order, after_cancel, final = asyncio.run(scenario())
+    assert order == ["next"]
+    assert after_cancel["classes"][BATCH]["running"] == 0 and after_cancel["batch_sessions_waiting"] == 0
+    assert final["classes"][BATCH]["running"] == 0
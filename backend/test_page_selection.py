@@ -0,0 +1,35 @@
+"""
+Tests for extractive passage selection (utils.page_selection).
+"""
+from utils.page_selection import GAP_MARKER, score_passages, select_passages, split_passages
+
+CONVECTION = "Convection heat transfer from the surface depends on the boundary layer and the fluid velocity. "
+CONDUCTION = "Conduction through the plane wall follows Fourier's law with the wall thermal conductivity. "
+REFERENCES = "Colburn, Trans. Am. Inst. Chem. Eng., 1933. Pearson Prentice Hall, Upper Saddle River, 2006. "
+
+PARAGRAPHS = [CONVECTION * 11, CONDUCTION * 11, CONVECTION * 10 + CONDUCTION, REFERENCES * 11, CONVECTION * 11]
+TEXT = "\n\n".join(PARAGRAPHS)
+
+
+def test_passages_follow_paragraphs_and_score_by_centrality():
+    spans = split_passages(TEXT)
+    assert [TEXT[start:end].strip() for start, end in spans] == [paragraph.strip() for paragraph in PARAGRAPHS]
+    assert split_passages(TEXT, boundaries=[100])[0] == (0, 100)
+
+    scores = score_passages(PARAGRAPHS)
+    assert scores.argmin() == 3 and scores.argmax() in (0, 2, 4)
+    # Questions pull passages on their topic up
+    with_questions = score_passages(PARAGRAPHS, "Use Fourier's law to find the conduction heat rate through the wall.")
+    assert with_questions[1] - with_questions[0] > scores[1] - scores[0]
+
+
+def test_selection_keeps_best_passages_in_order_within_the_budget():
+    assert select_passages(TEXT, max_chars=len(TEXT)) == TEXT
+    assert select_passages(TEXT, max_chars=0) == TEXT
+
+    selected = select_passages(TEXT, max_chars=2200)
+    assert selected == "\n".join([PARAGRAPHS[0].strip(), GAP_MARKER, PARAGRAPHS[2].strip(), GAP_MARKER])
+
+    focused = select_passages(TEXT, "Explain Fourier's law for conduction through a plane wall.", max_chars=2200)
+    assert "Colburn" not in focused and CONDUCTION * 2 in focused
+    assert focused.index(CONDUCTION * 2) < focused.index(CONVECTION * 10)
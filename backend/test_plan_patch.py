@@ -0,0 +1,74 @@
+"""
+Tests for JSON Patch updates of stored plans (utils.plan_patch and PlanStore.patch_structured_plan).
+"""
+import pytest
+
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.plan_patch import PatchError, PatchTestFailed
+from utils.plan_store import PlanStore, VersionConflict
+
+
+def stored_plan(sample_plan, days: int = 3):
+    store = PlanStore(":memory:")
+    frontend_plan = transform_backend_to_frontend(sample_plan(days))
+    return store, store.create(raw_plan="plan", structured_plan=frontend_plan), frontend_plan
+
+
+def test_progress_updates_touch_only_their_day(sample_plan):
+    store, plan_id, frontend_plan = stored_plan(sample_plan)
+    result = store.patch_structured_plan(plan_id, [
+        {"op": "test", "path": "/dailyBreakdown/1/items/0/isCompleted", "value": False},
+        {"op": "replace", "path": "/dailyBreakdown/1/items/0/isCompleted", "value": True},
+        {"op": "move", "from": "/dailyBreakdown/1/items/2", "path": "/dailyBreakdown/1/items/0"},
+        {"op": "replace", "path": "/dailyBreakdown/1/focusArea", "value": "Fins"},
+    ], expected_version=1)
+    assert result == {"version": 2, "changed": ["/dailyBreakdown/1"]}
+
+    day = store.get_day(plan_id, 2)
+    assert [item["topic"] for item in day["items"]][:3] == ["Topic 2.2", "Topic 2.0", "Topic 2.1"]
+    assert day["items"][1]["isCompleted"] and day["focusArea"] == "Fins"
+    assert store.get_day(plan_id, 1) == frontend_plan["dailyBreakdown"][0]
+    assert store.outline(plan_id)["days"][1] == {"day": 2, "focusArea": "Fins"}
+
+    with pytest.raises(VersionConflict):
+        store.patch_structured_plan(plan_id, [{"op": "remove", "path": "/generalTips/0"}], expected_version=1)
+    changes = store.changes_since(plan_id, 1)
+    assert changes["version"] == 2 and not changes["reset"] and len(changes["operations"]) == 4
+
+
+def test_invalid_patches_leave_the_plan_unchanged(sample_plan):
+    store, plan_id, frontend_plan = stored_plan(sample_plan)
+    bad_patches = [
+        [{"op": "replace", "path": "/dailyBreakdown/0/items/0/isCompleted", "value": "maybe"}],
+        # Values lax validation would coerce, but that are stored as sent
+        [{"op": "replace", "path": "/dailyBreakdown/0/items/0/isCompleted", "value": "0"}],
+        [{"op": "replace", "path": "/dailyBreakdown/0/items/0/isCompleted", "value": "yes"}],
+        [{"op": "replace", "path": "/dailyBreakdown/0/items/0/isCompleted", "value": 1}],
+        [{"op": "replace", "path": "/dailyBreakdown/1/day", "value": "7"}],
+        [{"op": "replace", "path": "/hoursPerDay", "value": "2"}],
+        [{"op": "remove", "path": "/dailyBreakdown/0/items/0/topic"}],
+        [{"op": "replace", "path": "/dailyBreakdown/7/focusArea", "value": "x"}],
+        [{"op": "replace", "path": "/dailyBreakdown/0/day", "value": 2}],
+        [{"op": "increment", "path": "/totalStudyDays"}],
+    ]
+    for operations in bad_patches:
+        with pytest.raises(PatchError):
+            store.patch_structured_plan(plan_id, operations)
+    with pytest.raises(PatchTestFailed):
+        store.patch_structured_plan(plan_id, [{"op": "test", "path": "/overallGoal", "value": "stale"}])
+    assert store.get_structured_plan(plan_id) == frontend_plan
+    assert store.get(plan_id)["version"] == 1
+
+
+def test_removing_a_day_rewrites_the_day_list(sample_plan):
+    store, plan_id, frontend_plan = stored_plan(sample_plan)
+    result = store.patch_structured_plan(plan_id, [
+        {"op": "remove", "path": "/dailyBreakdown/2"},
+        {"op": "replace", "path": "/totalStudyDays", "value": 2},
+    ])
+    assert result["changed"] == ["/totalStudyDays", "/dailyBreakdown"]
+    plan = store.get_structured_plan(plan_id)
+    assert plan["dailyBreakdown"] == frontend_plan["dailyBreakdown"][:2] and plan["totalStudyDays"] == 2
+
+    store.save_structured_plan(plan_id, frontend_plan)
+    assert store.changes_since(plan_id, 2) == {"version": 3, "operations": [], "reset": True}
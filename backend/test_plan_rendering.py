@@ -0,0 +1,35 @@
+"""
+Tests for rendering the preview locally from a structured plan (utils.plan_rendering).
+"""
+from utils.local_structurer import structure_from_simplified_json
+from utils.plan_rendering import render_overview_markdown, simplified_json_from_plan
+from utils.spaced_repetition import is_review_item
+from utils.structurer_utils import extract_daily_schedule, extract_overall_goal, parse_plan_sections
+
+
+def test_overview_has_a_section_per_day_that_the_section_parser_reads(sample_plan):
+    plan = sample_plan(3)
+    overview = render_overview_markdown(plan)
+    assert overview.startswith("# Study Plan Overview")
+    assert "## Day 2: Topic block 2" in overview and "- Topic 2.1 (40 minutes)" in overview
+    assert "`q = -k dT/dx`" in overview and "## Study Tips" in overview
+
+    document = parse_plan_sections(overview)
+    assert extract_overall_goal(document) == plan["overall_goal"]
+    schedule = extract_daily_schedule(document, 3)
+    assert [day["focus_area"] for day in schedule] == ["Topic block 1", "Topic block 2", "Topic block 3"]
+
+
+def test_simplified_json_maps_back_onto_the_plan_locally(sample_plan):
+    plan = sample_plan(4)
+    simplified = simplified_json_from_plan(plan)
+    assert simplified["daily_focus"][0]["time_allocation"]["Topic 1.0"] == "40 minutes"
+
+    rebuilt = structure_from_simplified_json(simplified, days=4, hours_per_day=2.0)
+    assert rebuilt["overall_goal"] == plan["overall_goal"]
+    assert [day["focus_area"] for day in rebuilt["daily_schedule"]] == [day["focus_area"] for day in plan["daily_schedule"]]
+    # Review items are added locally and take their minutes from the day's other items
+    assert [sum(item["duration_minutes"] for item in day["study_item"]) for day in rebuilt["daily_schedule"]] == [120] * 4
+    assert [[item["topic"] for item in day["study_item"] if not is_review_item(item)] for day in rebuilt["daily_schedule"]] == \
+        [[item["topic"] for item in day["study_item"]] for day in plan["daily_schedule"]]
+    assert rebuilt["key_formulas"][0]["usage_context"] == plan["key_formulas"][0]["usage_context"]
@@ -0,0 +1,59 @@
+"""
+Tests for the SQLite plan store in utils.plan_store.
+"""
+import pytest
+
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.plan_store import PlanStore, VersionConflict
+
+
+def test_structured_plan_is_stored_by_day_and_section(sample_plan):
+    store = PlanStore(":memory:")
+    plan_id = store.create(raw_plan="## Day 1: Conduction", simplified_json={"overall_goal": "Learn"},
+                           study_days=3, hours_per_day=2, session_id="s1")
+    stored = store.get(plan_id)
+    assert stored["raw_plan"] == "## Day 1: Conduction" and stored["simplified_json"] == {"overall_goal": "Learn"}
+    assert store.get_structured_plan(plan_id) is None and store.get_day(plan_id, 1) is None
+
+    frontend_plan = transform_backend_to_frontend(sample_plan(3))
+    assert store.save_structured_plan(plan_id, frontend_plan)
+    assert store.get_structured_plan(plan_id) == frontend_plan
+    assert store.get_day(plan_id, 2) == frontend_plan["dailyBreakdown"][1]
+    assert store.get_day(plan_id, 4) is None
+    assert store.get_section(plan_id, "keyConcepts") == frontend_plan["keyConcepts"]
+    outline = store.outline(plan_id)
+    assert "dailyBreakdown" in outline["sections"] and "keyConcepts" in outline["sections"]
+    assert outline["days"] == [{"day": day, "focusArea": f"Topic block {day}"} for day in (1, 2, 3)]
+
+    # Saving again replaces the days instead of accumulating them
+    shorter = dict(frontend_plan, dailyBreakdown=frontend_plan["dailyBreakdown"][:1])
+    store.save_structured_plan(plan_id, shorter)
+    assert store.get_structured_plan(plan_id) == shorter
+    assert not store.save_structured_plan("unknown", frontend_plan) and store.get("unknown") is None
+
+
+def test_days_sharing_a_number_are_kept_and_renumbered(sample_plan):
+    store = PlanStore(":memory:")
+    frontend_plan = transform_backend_to_frontend(sample_plan(3))
+    frontend_plan["dailyBreakdown"][2]["day"] = 2
+    plan_id = store.create(structured_plan=frontend_plan)
+
+    days = store.get_structured_plan(plan_id)["dailyBreakdown"]
+    assert [(day["day"], day["focusArea"]) for day in days] == [
+        (1, "Topic block 1"), (2, "Topic block 2"), (3, "Topic block 3")
+    ]
+    assert store.get_day(plan_id, 3)["items"] == frontend_plan["dailyBreakdown"][2]["items"]
+
+
+def test_saving_against_a_stale_version_is_rejected(sample_plan):
+    store = PlanStore(":memory:")
+    frontend_plan = transform_backend_to_frontend(sample_plan(2))
+    plan_id = store.create(structured_plan=frontend_plan)
+    version = store.get(plan_id)["version"]
+    store.patch_structured_plan(plan_id, [{"op": "replace", "path": "/overallGoal", "value": "Edited"}])
+
+    with pytest.raises(VersionConflict) as conflict:
+        store.save_structured_plan(plan_id, frontend_plan, expected_version=version)
+    assert conflict.value.current_version == version + 1
+    assert store.get_section(plan_id, "overallGoal") == "Edited"
+    assert store.save_structured_plan(plan_id, frontend_plan, expected_version=version + 1)
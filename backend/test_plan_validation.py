@@ -0,0 +1,68 @@
+"""
+Tests for per-element plan validation and repair (utils.plan_validation).
+"""
+import json
+
+from models.study_plan_models import CoreConcept, DailySchedule, StudyItem
+from utils.plan_validation import build_element_prompt, find_invalid_elements, splice_elements
+
+
+def broken_plan(sample_plan) -> dict:
+    """A three-day plan with a bad study item, a day with broken fields and a bad concept."""
+    plan = sample_plan(3)
+    plan["daily_schedule"][0]["study_item"][1]["duration_minutes"] = "about an hour"
+    del plan["daily_schedule"][1]["focus_area"]
+    # The day is broken, so its own (also broken) item is not reported separately
+    plan["daily_schedule"][1]["study_item"][0]["topic"] = None
+    plan["core_concepts"][2] = "Thermal resistance"
+    return plan
+
+
+def test_invalid_items_days_and_elements_are_found_in_plan_order(sample_plan):
+    plan = broken_plan(sample_plan)
+    invalid = find_invalid_elements(plan)
+    assert [(element.path, element.model) for element in invalid] == [
+        (("core_concepts", 2), CoreConcept),
+        (("daily_schedule", 0, "study_item", 1), StudyItem),
+        (("daily_schedule", 1), DailySchedule),
+    ]
+    concept, item, day = invalid
+    assert concept.errors == "expected an object, got str"
+    assert item.element is plan["daily_schedule"][0]["study_item"][1]
+    assert "duration_minutes" in item.errors and "focus area: Topic block 1" in item.context
+    assert "focus_area" in day.errors and day.context == "day 2 of a study plan"
+    assert find_invalid_elements(sample_plan(3)) == []
+
+
+def test_element_prompt_names_the_errors_fields_and_current_json(sample_plan):
+    item = find_invalid_elements(broken_plan(sample_plan))[1]
+    prompt = build_element_prompt(item)
+    assert prompt.startswith("Fix this StudyItem from day 1 of a study plan")
+    assert f"Validation errors: {item.errors}\n" in prompt
+    assert "topic (str, required)" in prompt and "duration_minutes (int, required)" in prompt
+    assert json.dumps(item.element, ensure_ascii=False) in prompt
+    # The prompt covers one element, not the plan
+    assert "Topic 2.0" not in prompt and len(prompt) < 2000
+
+
+def test_splicing_replaces_and_drops_elements_and_keeps_valid_siblings(sample_plan):
+    plan = broken_plan(sample_plan)
+    invalid = find_invalid_elements(plan)
+    fixed_item = dict(invalid[1].element, duration_minutes=60)
+    replacements = {
+        invalid[0].path: None,
+        invalid[1].path: fixed_item,
+        invalid[2].path: None,
+        ("daily_schedule", 2, "study_item", 0): None,
+    }
+    spliced = splice_elements(plan, replacements)
+
+    assert find_invalid_elements(spliced) == []
+    assert [concept["name"] for concept in spliced["core_concepts"]] == ["Concept 0", "Concept 1", "Concept 3", "Concept 4"]
+    assert [day["day"] for day in spliced["daily_schedule"]] == [1, 3]
+    first, third = spliced["daily_schedule"]
+    assert first["study_item"] == [plan["daily_schedule"][0]["study_item"][0], fixed_item,
+                                   plan["daily_schedule"][0]["study_item"][2]]
+    assert third["study_item"] == plan["daily_schedule"][2]["study_item"][1:]
+    # The original plan is left as it was
+    assert len(plan["daily_schedule"]) == 3 and plan["core_concepts"][2] == "Thermal resistance"
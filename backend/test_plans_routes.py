@@ -0,0 +1,83 @@
+"""
+Tests for the conditional requests of the stored plan routes (routers.plans_routes).
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import plans_routes
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.plan_store import PlanStore
+
+COMPLETE_FIRST_ITEM = {"op": "replace", "path": "/dailyBreakdown/0/items/0/isCompleted", "value": True}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = PlanStore(":memory:")
+    monkeypatch.setattr(plans_routes, "plan_store", store)
+    return store
+
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    app.include_router(plans_routes.router, prefix="/plans")
+    return TestClient(app)
+
+
+@pytest.fixture
+def plan_id(store, sample_plan):
+    return store.create(raw_plan="plan", structured_plan=transform_backend_to_frontend(sample_plan(3)))
+
+
+def test_patches_are_rejected_by_status(client, store, plan_id):
+    url = f"/plans/{plan_id}/structured"
+    response = client.patch(url, json=[COMPLETE_FIRST_ITEM], headers={"If-Match": '"1"'})
+    assert response.status_code == 200 and response.headers["ETag"] == '"2"'
+
+    stale = client.patch(url, json=[COMPLETE_FIRST_ITEM], headers={"If-Match": '"1"'})
+    assert stale.status_code == 412 and stale.headers["ETag"] == '"2"'
+    failed_test = client.patch(url, json=[{"op": "test", "path": "/overallGoal", "value": "stale"}])
+    assert failed_test.status_code == 409
+    invalid = client.patch(url, json=[dict(COMPLETE_FIRST_ITEM, value="maybe")])
+    assert invalid.status_code == 422
+    assert client.patch(url, json=[COMPLETE_FIRST_ITEM], headers={"If-Match": "not-an-etag"}).status_code == 422
+    assert store.get(plan_id)["version"] == 2
+
+
+def test_current_copies_are_not_sent_again(client, plan_id):
+    url = f"/plans/{plan_id}/structured"
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers["ETag"] == '"1"'
+    cached = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304 and cached.content == b""
+
+    client.patch(url, json=[COMPLETE_FIRST_ITEM])
+    assert client.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_changes_replay_the_patches_since_a_version(client, plan_id):
+    client.patch(f"/plans/{plan_id}/structured", json=[COMPLETE_FIRST_ITEM])
+    response = client.get(f"/plans/{plan_id}/changes", params={"since": 1})
+    assert response.status_code == 200 and response.headers["ETag"] == '"2"'
+    assert response.json() == {"plan_id": plan_id, "version": 2, "operations": [COMPLETE_FIRST_ITEM], "reset": False}
+    assert client.get("/plans/missing/changes", params={"since": 1}).status_code == 404
+
+
+def test_rescheduling_a_changed_plan_is_rejected(client, store, plan_id):
+    client.patch(f"/plans/{plan_id}/structured", json=[COMPLETE_FIRST_ITEM])
+    url = f"/plans/{plan_id}/reschedule"
+    stale = client.post(url, json={"total_days": 2, "hours_per_day": 2}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412 and stale.headers["ETag"] == '"2"'
+    assert len(store.get_structured_plan(plan_id)["dailyBreakdown"]) == 3
+
+    current = client.post(url, json={"total_days": 2, "hours_per_day": 2}, headers={"If-Match": '"2"'})
+    assert current.status_code == 200 and current.headers["ETag"] == '"3"'
+    assert len(store.get_structured_plan(plan_id)["dailyBreakdown"]) == 2
+
+
+def test_regenerating_a_changed_plan_is_rejected_before_the_model_call(client, plan_id):
+    client.patch(f"/plans/{plan_id}/structured", json=[COMPLETE_FIRST_ITEM])
+    response = client.post(f"/plans/{plan_id}/regenerate", json={"total_days": 5}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412 and response.headers["ETag"] == '"2"'
@@ -0,0 +1,53 @@
+"""
+Tests for the static prompt prefixes and cached-token accounting in utils.prompt_assembly.
+"""
+import json
+from types import SimpleNamespace
+
+from utils.prompt_assembly import (
+    assemble, load_plan_template, minify_json, prompt_cache_stats, record_prompt_cache, static_prefix,
+)
+
+INSTRUCTIONS = static_prefix("""
+    Convert the plan given at the end of this task.
+    
+    
+    Template:
+    ```json
+    {"a": 1}
+    ```
+""")
+
+
+def test_static_prefix_is_stable_and_first():
+    assert INSTRUCTIONS == 'Convert the plan given at the end of this task.\n\nTemplate:\n```json\n{"a": 1}\n```'
+    first = assemble(INSTRUCTIONS, "Study Duration: 3 days", "Plan A", None)
+    second = assemble(INSTRUCTIONS, "Study Duration: 5 days", "  ", "Plan B")
+    assert first.startswith(INSTRUCTIONS + "\n\n") and second.startswith(INSTRUCTIONS + "\n\n")
+    assert first.endswith("Study Duration: 3 days\n\nPlan A")
+    assert second.endswith("Study Duration: 5 days\n\nPlan B")
+
+
+def test_template_is_loaded_once_and_minifies():
+    assert load_plan_template() is load_plan_template()
+    template = minify_json(load_plan_template())
+    assert json.loads(template) == load_plan_template()
+    assert "\n" not in template and len(template) < 0.8 * len(json.dumps(load_plan_template(), indent=2))
+
+
+def test_cache_usage_from_langchain_and_crew_responses():
+    record_prompt_cache("test.usage_metadata", SimpleNamespace(
+        usage_metadata={"input_tokens": 1000, "output_tokens": 50, "input_token_details": {"cache_read": 768}}
+    ))
+    record_prompt_cache("test.token_usage", SimpleNamespace(
+        usage_metadata=None,
+        response_metadata={"token_usage": {"prompt_tokens": 400, "prompt_tokens_details": {"cached_tokens": 100}}}
+    ))
+    record_prompt_cache("test.token_usage", SimpleNamespace(prompt_tokens=600, cached_prompt_tokens=0))
+    record_prompt_cache("test.token_usage", None)
+
+    stats = prompt_cache_stats()
+    assert stats["test.usage_metadata"]["cached_ratio"] == 0.768
+    assert stats["test.token_usage"] == {
+        "calls": 3, "reported": 2, "prompt_tokens": 1000, "cached_tokens": 100, "cached_ratio": 0.1
+    }
@@ -0,0 +1,61 @@
+"""
+Tests for local rescheduling of structured plans (utils.rescheduler).
+"""
+import pytest
+
+from utils.adapter_utils import transform_backend_to_frontend, transform_frontend_to_backend
+from utils.rescheduler import MIN_ITEM_MINUTES, reschedule_plan
+from utils.spaced_repetition import is_review_item
+
+
+def topics(plan: dict) -> list:
+    return [item["topic"].split(" (part")[0] for day in plan["daily_schedule"] for item in day["study_item"]
+            if not is_review_item(item)]
+
+
+def test_every_day_fills_the_new_hours_in_topic_order(sample_plan):
+    plan = sample_plan(6)
+    for days, hours in [(10, 1.5), (3, 4.0), (6, 2.0), (1, 8.0)]:
+        rescheduled = reschedule_plan(plan, days, hours)
+        schedule = rescheduled["daily_schedule"]
+        assert len(schedule) == days and [day["day"] for day in schedule] == list(range(1, days + 1))
+        assert {sum(item["duration_minutes"] for item in day["study_item"]) for day in schedule} == {int(hours * 60)}
+        assert list(dict.fromkeys(topics(rescheduled))) == topics(plan)
+        assert rescheduled["total_study_day"] == days and rescheduled["hour_per_day"] == hours
+    assert len(plan["daily_schedule"]) == 6
+
+
+def test_low_priority_items_shrink_first_and_are_dropped_when_nothing_fits(sample_plan):
+    plan = sample_plan(2)
+    for day in plan["daily_schedule"]:
+        day["study_item"][-1]["priority"] = "low"
+    low_topics = {day["study_item"][-1]["topic"] for day in plan["daily_schedule"]}
+
+    shrunk = reschedule_plan(plan, 1, 3.0)
+    minutes = {item["topic"]: item["duration_minutes"] for item in shrunk["daily_schedule"][0]["study_item"]}
+    assert max(minutes[topic] for topic in low_topics) < min(
+        value for topic, value in minutes.items() if topic not in low_topics)
+
+    squeezed = reschedule_plan(plan, 1, 0.5)
+    kept = topics(squeezed)
+    assert len(kept) == 30 // MIN_ITEM_MINUTES and not low_topics & set(kept)
+
+    with pytest.raises(ValueError):
+        reschedule_plan(plan, 0, 2.0)
+
+
+def test_frontend_plans_round_trip_through_the_rescheduler(sample_plan):
+    frontend_plan = transform_backend_to_frontend(sample_plan(4))
+    rescheduled = transform_backend_to_frontend(reschedule_plan(transform_frontend_to_backend(frontend_plan), 5, 1.0))
+    assert rescheduled["totalStudyDays"] == 5 and len(rescheduled["dailyBreakdown"]) == 5
+    assert rescheduled["keyConcepts"] == frontend_plan["keyConcepts"]
+    assert rescheduled["overallGoal"] == frontend_plan["overallGoal"]
+
+
+def test_days_shorter_than_one_item_are_rejected(sample_plan):
+    # Used to loop forever once a day rounded to 0 minutes
+    with pytest.raises(ValueError):
+        reschedule_plan(sample_plan(3), 10, 0.005)
+    with pytest.raises(ValueError):
+        reschedule_plan(sample_plan(3), 2, (MIN_ITEM_MINUTES - 1) / 60)
+    assert len(reschedule_plan(sample_plan(3), 2, MIN_ITEM_MINUTES / 60)["daily_schedule"]) == 2
@@ -0,0 +1,31 @@
+"""
+Tests for the local spaced-repetition schedule (utils.spaced_repetition).
+"""
+import copy
+
+from utils.spaced_repetition import MAX_REVIEW_TOPICS, is_review_item, review_offsets, schedule_reviews
+
+
+def test_intervals_follow_sm2_and_shrink_for_high_priority_topics():
+    assert review_offsets(5, 40) == [1, 7, 23]
+    assert review_offsets(3, 40) == [1, 7, 20]
+    assert review_offsets(4, 6) == [1]
+    assert review_offsets(4, 0) == []
+
+
+def test_reviews_are_reproducible_and_keep_each_day_total(sample_plan):
+    plan = sample_plan(10)
+    for day in plan["daily_schedule"]:
+        day["review_topics"] = ["Made up by the model"]
+    scheduled = schedule_reviews(copy.deepcopy(plan))
+    assert schedule_reviews(copy.deepcopy(scheduled)) == scheduled
+    assert schedule_reviews(copy.deepcopy(plan)) == scheduled
+
+    days = scheduled["daily_schedule"]
+    assert days[0]["review_topics"] == [] and all(not is_review_item(item) for item in days[0]["study_item"])
+    assert days[1]["review_topics"] == ["Topic 1.0", "Topic 1.1", "Topic 1.2"]
+    assert all(len(day["review_topics"]) <= MAX_REVIEW_TOPICS for day in days)
+    for day in days[1:]:
+        review = day["study_item"][-1]
+        assert is_review_item(review) and review["duration_minutes"] == 5 * len(day["review_topics"])
+        assert sum(item["duration_minutes"] for item in day["study_item"]) == 120
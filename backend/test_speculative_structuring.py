@@ -0,0 +1,68 @@
+"""
+Tests for the background structuring store in utils.speculative_structuring.
+"""
+import asyncio
+
+from utils.speculative_structuring import SpeculativeStructurer
+
+
+def test_claim_returns_finished_result_and_joins_running_task():
+    async def scenario():
+        store = SpeculativeStructurer(ttl_seconds=60)
+        calls = []
+        release = asyncio.Event()
+
+        async def structure(result):
+            calls.append(result)
+            await release.wait()
+            return result
+
+        store.start("## Day 1\nplan A", lambda: structure({"overallGoal": "A"}))
+        # The same text again is the same plan, so no second model call
+        assert store.start("## Day 1\nplan A  ", lambda: structure({"overallGoal": "dup"})) is None
+        store.start("## Day 1\nplan B", lambda: structure({"overallGoal": "B"}))
+
+        joined = asyncio.ensure_future(store.claim("## Day 1\nplan A"))
+        await asyncio.sleep(0)
+        release.set()
+        assert await joined == {"overallGoal": "A"}
+        await asyncio.sleep(0)
+        assert await store.claim("## Day 1\nplan B") == {"overallGoal": "B"}
+        assert await store.claim("## Day 1\nplan B") is None
+        return store.stats(), len(calls)
+
+    stats, calls = asyncio.run(scenario())
+    assert calls == 2
+    assert (stats["started"], stats["duplicates"], stats["joined"], stats["hits"], stats["misses"]) == (2, 1, 1, 1, 1)
+    assert stats["pending"] == 0
+
+
+def test_unclaimed_tasks_are_cancelled_after_ttl_and_errors_fall_through():
+    async def scenario():
+        store = SpeculativeStructurer(ttl_seconds=0.01)
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def failing():
+            return {"error": "Failed to structure", "details": "bad JSON"}
+
+        store.start("never claimed", slow)
+        store.start("finished but unused", failing)
+        await asyncio.sleep(0.05)
+        assert await store.claim("never claimed") is None
+
+        store.ttl_seconds = 60
+        store.start("failed plan", failing)
+        failed = await store.claim("failed plan")
+        return store.stats(), cancelled, failed
+
+    stats, cancelled, failed = asyncio.run(scenario())
+    assert cancelled == [True] and failed is None
+    assert stats["expired_running"] == 1 and stats["expired_finished"] == 1
+    assert stats["failed"] == 1 and stats["misses"] == 1 and stats["pending"] == 0
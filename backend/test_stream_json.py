@@ -0,0 +1,77 @@
+"""
+Tests for incremental parsing of streamed plan JSON (utils.stream_json).
+"""
+import json
+
+import pytest
+
+from utils.stream_json import IncrementalJSONParser
+
+# Model output as written, with escapes and number forms json.dumps would not produce
+PLAN_JSON = (
+    '{"study_duration": "2 days", "daily_schedule": ['
+    '{"day": 1, "focus": "Say \\"hi\\" to conduction \\\\ walls", "minutes": 90.5}, '
+    '{"day": 2, "focus": "Convection {boundary} [layers] \\u00e9", "minutes": -1.25e2}], '
+    '"core_concepts": [{"concept": "Fourier\'s law", "related": ["k", "q\\""]}], '
+    '"general_tip": ["Review daily"]}'
+)
+PLAN = json.loads(PLAN_JSON)
+TEXT = "```json\n" + PLAN_JSON + "\n```\nTrailing notes {ignored}"
+
+
+def _feed(chunks):
+    parser = IncrementalJSONParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return parser, events
+
+
+def _split_inside(text, marker, offset):
+    """Two chunks split ``offset`` characters into the first ``marker``."""
+    cut = text.index(marker) + offset
+    return [text[:cut], text[cut:]]
+
+
+@pytest.mark.parametrize("chunks", [
+    [TEXT],
+    list(TEXT),
+    _split_inside(TEXT, "to conduction", 3),       # Mid-string
+    _split_inside(TEXT, '\\"hi', 1),               # Between a backslash and the escaped quote
+    _split_inside(TEXT, "\\\\ walls", 1),          # Between the two backslashes of an escaped backslash
+    _split_inside(TEXT, "\\u00e9", 3),             # Mid unicode escape
+    _split_inside(TEXT, "90.5", 2),                # Mid-number
+    _split_inside(TEXT, "-1.25e2", 5),             # Mid-exponent
+])
+def test_elements_are_emitted_whatever_the_chunk_boundaries(chunks):
+    parser, events = _feed(chunks)
+    assert events == [
+        ("daily_schedule", PLAN["daily_schedule"][0]),
+        ("daily_schedule", PLAN["daily_schedule"][1]),
+        ("core_concepts", PLAN["core_concepts"][0]),
+        ("complete", PLAN),
+    ]
+    assert parser.done and parser.result == PLAN and json.loads(parser.text) == PLAN
+    # Input after the top-level object is ignored
+    assert parser.feed('{"daily_schedule": [{"day": 3}]}') == []
+
+
+def test_braces_and_brackets_inside_strings_do_not_end_an_element():
+    plan = {"key_formulas": [{"formula": "q = -k [dT/dx] }", "notes": "{not an object}"}]}
+    chunks = _split_inside(json.dumps(plan), "dT/dx", 2)
+    _, events = _feed(chunks)
+    assert events == [("key_formulas", plan["key_formulas"][0]), ("complete", plan)]
+
+
+def test_only_watched_top_level_arrays_are_streamed():
+    plan = {"outer": {"daily_schedule": [{"day": 1}]}, "core_concepts": [[{"nested": True}]]}
+    _, events = _feed([json.dumps(plan)])
+    assert events == [("complete", plan)]
+
+    parser = IncrementalJSONParser(sections=("general_tip",))
+    events = parser.feed('{"daily_schedule": [{"day": 1}], "general_tip": [{"tip": "Rest"}]}')
+    assert events[0] == ("general_tip", {"tip": "Rest"}) and events[-1][0] == "complete"
+
+
+def test_unfinished_stream_has_no_result():
+    parser, events = _feed([TEXT[:TEXT.index('"core_concepts"')]])
+    assert [section for section, _ in events] == ["daily_schedule", "daily_schedule"]
+    assert not parser.done and parser.result is None
@@ -0,0 +1,72 @@
+"""
+Tests for structured output mode selection and its statistics (utils.structured_output).
+"""
+import pytest
+
+from utils.structured_output import (
+    JSON_OBJECT, JSON_SCHEMA, TEMPLATE, is_unsupported_error, mark_unsupported, record_single_pass,
+    record_structuring_call, record_structuring_output, record_structuring_retry, resolve_mode, structuring_stats
+)
+
+
+class FakeAPIError(Exception):
+    """Stands in for a provider client's bad-request error."""
+
+
+@pytest.fixture(autouse=True)
+def default_mode(monkeypatch):
+    monkeypatch.delenv("STRUCTURED_OUTPUT_MODE", raising=False)
+
+
+def test_unsupported_modes_fall_back_per_model(monkeypatch):
+    model = "test-fallback-model"
+    assert resolve_mode(model) == JSON_SCHEMA
+    fallbacks = structuring_stats().get(JSON_SCHEMA, {}).get("fallbacks", 0)
+
+    mark_unsupported(model, JSON_SCHEMA, FakeAPIError("response_format json_schema is not supported"))
+    assert resolve_mode(model) == JSON_OBJECT
+    mark_unsupported(model, JSON_OBJECT, FakeAPIError("json_object is not supported"))
+    assert resolve_mode(model) == TEMPLATE
+    # Other models are not affected
+    assert resolve_mode("test-other-model") == JSON_SCHEMA
+
+    stats = structuring_stats()
+    assert stats["unsupported"][model] == [JSON_OBJECT, JSON_SCHEMA]
+    assert stats[JSON_SCHEMA]["fallbacks"] == fallbacks + 1
+
+    monkeypatch.setenv("STRUCTURED_OUTPUT_MODE", "json_object")
+    assert resolve_mode("test-other-model") == JSON_OBJECT
+    monkeypatch.setenv("STRUCTURED_OUTPUT_MODE", "off")
+    assert resolve_mode("test-other-model") == TEMPLATE
+    monkeypatch.setenv("STRUCTURED_OUTPUT_MODE", "yaml")
+    assert resolve_mode("test-other-model") == JSON_SCHEMA
+
+
+def test_unsupported_errors_are_recognised_from_their_message():
+    assert is_unsupported_error(FakeAPIError("Error code: 400 - Invalid parameter: 'response_format' of type "
+                                             "'json_schema' is not supported with this model."))
+    assert is_unsupported_error(FakeAPIError("This model does not support Structured Outputs"))
+    assert not is_unsupported_error(FakeAPIError("Error code: 429 - Rate limit reached"))
+    assert not is_unsupported_error(TimeoutError("Request timed out"))
+
+
+def test_structuring_stats_report_rates_and_averages():
+    before = structuring_stats()
+    record_structuring_call(TEMPLATE, 3000)
+    record_structuring_call(TEMPLATE, 1000)
+    record_structuring_retry(TEMPLATE)
+    record_structuring_output("test-format", 400, 2.0)
+    record_structuring_output("test-format", 600, 3.0)
+    record_single_pass(fallback=False)
+    record_single_pass(fallback=True)
+
+    stats = structuring_stats()
+    template, earlier = stats[TEMPLATE], before.get(TEMPLATE, {"calls": 0, "retries": 0})
+    assert template["calls"] == earlier["calls"] + 2 and template["retries"] == earlier["retries"] + 1
+    assert template["retry_rate"] == round(template["retries"] / template["calls"], 3)
+    assert set(template) == {"calls", "retries", "retry_rate", "avg_prompt_tokens", "fallbacks"}
+    assert stats["output"]["test-format"] == {"plans": 2, "avg_output_tokens": 500, "avg_seconds": 2.5}
+    single_pass = stats["single_pass"]
+    assert single_pass["plans"] == before["single_pass"]["plans"] + 2
+    assert single_pass["fallbacks"] == before["single_pass"]["fallbacks"] + 1
+    assert single_pass["fallback_rate"] == round(single_pass["fallbacks"] / single_pass["plans"], 3)
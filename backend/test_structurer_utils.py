@@ -0,0 +1,412 @@
+"""
+Equivalence tests and benchmark for the single-pass section parser in utils.structurer_utils.
+
+The legacy_* functions below are the previous regex implementations, kept verbatim as the
+reference the tree-based extractors must agree with.
+
+Run the benchmark with: python test_structurer_utils.py [days]
+"""
+import random
+import re
+import sys
+import time
+from typing import Dict, Any, List
+
+from utils.structurer_utils import (
+    parse_plan_sections,
+    extract_overall_goal,
+    extract_core_concepts,
+    extract_daily_schedule,
+    extract_general_tips,
+    extract_key_formulas,
+)
+
+# --- Reference implementations (previous multi-scan regex versions) ---
+
+def legacy_extract_overall_goal(raw_plan: str) -> str:
+    """Reference copy of the previous regex implementation."""
+    # Try to find an explicit goal statement
+    goal_matches = re.search(r'(?:##\s*Goal|##\s*Overall\s*Goal)\s*(.+?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
+    if goal_matches:
+        return goal_matches.group(1).strip()
+    
+    # If no explicit goal, try to extract from introduction
+    intro_matches = re.search(r'(?:##\s*Introduction|##\s*Overview)\s*(.+?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
+    if intro_matches:
+        intro_text = intro_matches.group(1).strip()
+        # Take the first paragraph as the goal
+        paragraphs = intro_text.split('\n\n')
+        if paragraphs:
+            return paragraphs[0].strip()
+    
+    # Default goal if nothing is found
+    return f"Master the study materials over {days} days with {hours_per_day} hours per day."
+
+def legacy_extract_core_concepts(raw_plan: str) -> List[Dict[str, Any]]:
+    """Reference copy of the previous regex implementation."""
+    concepts = []
+    # Look for sections that might contain core concepts
+    concept_sections = re.findall(r'(?:##\s*Core\s*Concepts|##\s*Key\s*Concepts|##\s*Fundamental\s*Concepts).*?(?=##|$)', 
+                                 raw_plan, re.DOTALL | re.IGNORECASE)
+    
+    if not concept_sections:
+        # Try to find concepts in bullet points
+        bullets_match = re.findall(r'(?:Key|Core|Important)\s+Concepts[:\n](.*?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
+        if bullets_match:
+            for match in bullets_match:
+                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', match)
+                for point in bullet_points:
+                    concepts.append({
+                        "name": point.strip(),
+                        "explanation": f"Important concept: {point.strip()}"
+                    })
+    else:
+        # Process the sections that contain concepts
+        for section in concept_sections:
+            # Try to extract concepts with explanations (in format: Concept - Explanation)
+            concept_items = re.findall(r'[*\-+]\s*([^:\n]+)(?::\s*|\s*-\s*)([^\n]+)', section)
+            
+            # If we found structured concept items
+            if concept_items:
+                for name, explanation in concept_items:
+                    concepts.append({
+                        "name": name.strip(),
+                        "explanation": explanation.strip()
+                    })
+            else:
+                # Just extract bullet points as concept names
+                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
+                for point in bullet_points:
+                    concepts.append({
+                        "name": point.strip(),
+                        "explanation": f"Important concept in the study material."
+                    })
+    
+    # If we still don't have concepts, create some default ones
+    if not concepts:
+        concepts = [
+            {"name": "Core Concept 1", "explanation": "No specific concepts were identified in the study plan."}
+        ]
+    
+    return concepts
+
+def legacy_extract_daily_schedule(raw_plan: str, total_days: int) -> List[Dict[str, Any]]:
+    """Reference copy of the previous regex implementation."""
+    daily_schedule = []
+    
+    # Try to find day sections
+    day_sections = re.findall(r'##\s*Day\s*(\d+)[^#]*', raw_plan, re.DOTALL)
+    day_contents = re.split(r'##\s*Day\s*\d+', raw_plan)[1:] # Skip the text before first day
+    
+    # If we found day sections
+    if day_sections and len(day_sections) == len(day_contents):
+        for i, (day_num, day_content) in enumerate(zip(day_sections, day_contents)):
+            # Extract focus area if available
+            focus_area_match = re.search(r'Focus\s*(?:Area|Topic)s?[:\s]([^\n]+)', day_content, re.IGNORECASE)
+            focus_area = focus_area_match.group(1).strip() if focus_area_match else f"Day {day_num} Studies"
+            
+            # Extract summary if available
+            summary_match = re.search(r'Summary[:\s]([^\n]+)', day_content, re.IGNORECASE)
+            summary = summary_match.group(1).strip() if summary_match else None
+            
+            # Extract study items
+            study_items = []
+            
+            # First, look for structured time allocations
+            time_allocations = re.findall(r'[*\-+]\s*([^\n:]+)\s*(?:\(|:)\s*(\d+)\s*(?:hours|hour|hrs|hr|min|minutes)\s*(?:\)|,|;)\s*([^\n]*)', day_content, re.IGNORECASE)
+            
+            if time_allocations:
+                for topic, duration, details in time_allocations:
+                    # Convert hours to minutes if needed
+                    duration_value = int(duration)
+                    if 'hour' in details.lower() or 'hr' in details.lower():
+                        duration_value *= 60
+                        
+                    study_items.append({
+                        "topic": topic.strip(),
+                        "description": details.strip() if details.strip() else f"Study {topic.strip()}",
+                        "duration_minutes": duration_value,
+                        "resource": None,
+                        "is_completed": False
+                    })
+            else:
+                # If no structured time allocations, look for bullet points
+                topics = re.findall(r'[*\-+]\s*([^\n]+)', day_content)
+                
+                # Calculate approximate minutes per topic to match the day's total hours
+                total_minutes = 240  # Default to 4 hours if not specified
+                minutes_per_topic = total_minutes // len(topics) if topics else 60
+                
+                for topic in topics:
+                    study_items.append({
+                        "topic": topic.strip(),
+                        "description": f"Study {topic.strip()}",
+                        "duration_minutes": minutes_per_topic,
+                        "resource": None,
+                        "is_completed": False
+                    })
+            
+            # If no study items were found, create a default one
+            if not study_items:
+                study_items = [{
+                    "topic": f"Day {day_num} Studies",
+                    "description": f"Complete studies for day {day_num}",
+                    "duration_minutes": 240,  # Default to 4 hours
+                    "resource": None,
+                    "is_completed": False
+                }]
+            
+            # Add the day to the schedule
+            daily_schedule.append({
+                "day": int(day_num),
+                "date": None,
+                "focus_area": focus_area,
+                "study_items": study_items,
+                "summary": summary
+            })
+    
+    # If we couldn't extract the daily schedule, create a default one
+    if not daily_schedule:
+        for day in range(1, total_days + 1):
+            daily_schedule.append({
+                "day": day,
+                "date": None,
+                "focus_area": f"Day {day} Studies",
+                "study_items": [{
+                    "topic": f"Day {day} Studies",
+                    "description": f"Complete studies for day {day}",
+                    "duration_minutes": 240,  # Default to 4 hours
+                    "resource": None,
+                    "is_completed": False
+                }],
+                "summary": None
+            })
+    
+    return daily_schedule
+
+def legacy_extract_general_tips(raw_plan: str) -> List[str]:
+    """Reference copy of the previous regex implementation."""
+    tips = []
+    
+    # Look for sections that might contain general tips
+    tip_sections = re.findall(r'(?:##\s*General\s*Tips|##\s*Study\s*Tips|##\s*Tips).*?(?=##|$)', 
+                             raw_plan, re.DOTALL | re.IGNORECASE)
+    
+    if tip_sections:
+        for section in tip_sections:
+            # Extract bullet points as tips
+            bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
+            tips.extend([point.strip() for point in bullet_points])
+    
+    # If no tips were found, provide some default ones
+    if not tips:
+        tips = [
+            "Break your study sessions into 25-minute focused intervals with 5-minute breaks (Pomodoro Technique).",
+            "Review your notes and key concepts regularly to reinforce learning.",
+            "Get adequate sleep and exercise to optimize your learning capacity.",
+            "Connect new information to concepts you already understand.",
+            "Teach what you've learned to someone else to identify gaps in your understanding."
+        ]
+    
+    return tips
+
+def legacy_extract_key_formulas(raw_plan: str) -> List[Dict[str, Any]]:
+    """Reference copy of the previous regex implementation."""
+    formulas = []
+    
+    # Look for sections that might contain formulas
+    formula_sections = re.findall(r'(?:##\s*Key\s*Formulas|##\s*Formulas|##\s*Equations).*?(?=##|$)', 
+                                 raw_plan, re.DOTALL | re.IGNORECASE)
+    
+    if formula_sections:
+        for section in formula_sections:
+            # Try to extract structured formulas (Name: Formula - Description)
+            formula_items = re.findall(r'[*\-+]\s*([^:\n]+)\s*:\s*([^\n]+?)(?:\s*-\s*|\s*:\s*)([^\n]+)?', section)
+            
+            if formula_items:
+                for name, formula, description in formula_items:
+                    formulas.append({
+                        "name": name.strip(),
+                        "formula": formula.strip(),
+                        "description": description.strip() if description else f"Formula for {name.strip()}"
+                    })
+            else:
+                # Just extract bullet points as formula names
+                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
+                for point in bullet_points:
+                    # Try to split the point into formula and description
+                    parts = point.split(':', 1)
+                    if len(parts) == 2:
+                        name = parts[0].strip()
+                        formula_text = parts[1].strip()
+                        formulas.append({
+                            "name": name,
+                            "formula": formula_text,
+                            "description": f"Formula for {name}"
+                        })
+                    else:
+                        formulas.append({
+                            "name": f"Formula {len(formulas) + 1}",
+                            "formula": point.strip(),
+                            "description": "Important formula from the study material."
+                        })
+    
+    return formulas
+
+# --- Plan generator ---
+
+TOPICS = ["Conduction", "Convection", "Radiation", "Fourier's Law", "Heat Exchangers",
+          "Fins", "Boundary Layers", "Transient Conduction", "Black Body", "View Factors"]
+
+
+PROSE = "Heat moves from hot regions to cold regions at a rate set by the material and geometry. " * 6
+
+
+def generate_plan(days: int, seed: int = 0, goal_heading: bool = True, concept_heading: bool = True,
+                  paragraphs: int = 0) -> str:
+    """Generate a markdown plan shaped like the planner's preview output."""
+    rng = random.Random(seed)
+    hashes = lambda: "#" * rng.choice([2, 3])
+    parts = ["# Study Plan: Heat Transfer\n"]
+    if goal_heading:
+        parts.append(f"{hashes()} Overall Goal\nUnderstand {rng.choice(TOPICS)} and apply it to problems.\n")
+    parts.append(f"## Overview\nThis plan covers {days} days of study.\n\nIt balances theory and practice.\n")
+
+    if concept_heading:
+        parts.append(f"{hashes()} Core Concepts\n")
+    else:
+        parts.append("**Key Concepts:**\n")
+    for topic in rng.sample(TOPICS, 5):
+        style = rng.choice(["- **{0}**: {0} explained", "* {0} - short note", "+ {0}"])
+        parts.append(style.format(topic) + "\n")
+
+    parts.append("## Daily Breakdown\n")
+    for day in range(1, days + 1):
+        parts.append(f"### Day {day}: {rng.choice(TOPICS)}\n")
+        parts.append(f"Focus Area: {rng.choice(TOPICS)} basics\n")
+        for topic in rng.sample(TOPICS, 3):
+            if rng.random() < 0.7:
+                unit = rng.choice(["minutes", "min", "hours"])
+                parts.append(f"- {topic} ({rng.randint(1, 90)} {unit}): work through examples\n")
+            else:
+                parts.append(f"- {topic}\n")
+        parts.append(f"Summary: wrap up day {day}\n\n")
+        parts.append((PROSE + "\n\n") * paragraphs)
+
+    parts.append("## Key Formulas\n")
+    for topic in rng.sample(TOPICS, 4):
+        style = rng.choice(["- {0}: q = -k A dT/dx - rate of heat flow", "- {0}: Q = m c dT", "* E = sigma T^4"])
+        parts.append(style.format(topic) + "\n")
+
+    parts.append("## Study Tips\n- Practice daily\n- Review formulas\n* Teach someone else\n")
+    parts.append('\n```json\n{"overall_goal": "Heat transfer"}\n```\n')
+    return "".join(parts)
+
+
+# --- Equivalence tests ---
+
+def _plans():
+    for seed in range(40):
+        yield generate_plan(days=(seed % 14) + 1, seed=seed, goal_heading=seed % 3 != 0,
+                            concept_heading=seed % 4 != 0, paragraphs=seed % 2)
+
+
+def test_section_tree_partitions_document():
+    plan = generate_plan(days=5, seed=1)
+    document = parse_plan_sections(plan)
+    assert "".join(document.section_text(section) for section in document.sections) == plan
+    day_titles = [child.title for child in document.sections if child.title.startswith("Day")]
+    assert len(day_titles) == 5
+
+
+def test_overall_goal_matches_legacy():
+    for plan in _plans():
+        assert extract_overall_goal(plan) == legacy_extract_overall_goal(plan)
+
+
+def test_overall_goal_default_does_not_fail():
+    assert extract_overall_goal("No headings here", 7, 2) == "Master the study materials over 7 days with 2 hours per day."
+
+
+def test_core_concepts_match_legacy():
+    for plan in _plans():
+        assert extract_core_concepts(plan) == legacy_extract_core_concepts(plan)
+
+
+def _as_plan_days(legacy_days: List[Dict[str, Any]], summary: str = "Study {focus_area}.") -> List[Dict[str, Any]]:
+    """The legacy output with the model's "study_item" key and a summary on days that had none."""
+    return [
+        dict({key: value for key, value in day.items() if key != "study_items"}, study_item=day["study_items"],
+             summary=day["summary"] if day["summary"] is not None else summary.format(**day))
+        for day in legacy_days
+    ]
+
+
+def test_daily_schedule_matches_legacy():
+    for plan in _plans():
+        assert extract_daily_schedule(plan, 7) == _as_plan_days(legacy_extract_daily_schedule(plan, 7))
+    assert extract_daily_schedule("nothing", 3) == _as_plan_days(legacy_extract_daily_schedule("nothing", 3),
+                                                                 "Study the material planned for day {day}.")
+
+
+def test_general_tips_match_legacy():
+    for plan in _plans():
+        assert extract_general_tips(plan) == legacy_extract_general_tips(plan)
+    assert extract_general_tips("nothing") == legacy_extract_general_tips("nothing")
+
+
+def test_key_formulas_match_legacy():
+    for plan in _plans():
+        assert extract_key_formulas(plan) == legacy_extract_key_formulas(plan)
+
+
+# --- Benchmark ---
+
+def benchmark(days: int = 300, repeat: int = 5) -> None:
+    """Time all extractors on large plans, legacy scans against a single shared parse."""
+    def best_of(func) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    for paragraphs in (0, 3):
+        plan = generate_plan(days=days, seed=7, paragraphs=paragraphs)
+        print(f"Plan size: {len(plan)} characters, {days} days, {paragraphs} prose paragraphs per day")
+
+        def run_legacy():
+            legacy_extract_overall_goal(plan)
+            legacy_extract_core_concepts(plan)
+            legacy_extract_daily_schedule(plan, days)
+            legacy_extract_general_tips(plan)
+            legacy_extract_key_formulas(plan)
+
+        def run_tree():
+            document = parse_plan_sections(plan)
+            extract_overall_goal(document)
+            extract_core_concepts(document)
+            extract_daily_schedule(document, days)
+            extract_general_tips(document)
+            extract_key_formulas(document)
+
+        def run_tree_sections():
+            document = parse_plan_sections(plan)
+            extract_overall_goal(document)
+            extract_core_concepts(document)
+            extract_general_tips(document)
+            extract_key_formulas(document)
+
+        def run_legacy_sections():
+            legacy_extract_overall_goal(plan)
+            legacy_extract_core_concepts(plan)
+            legacy_extract_general_tips(plan)
+            legacy_extract_key_formulas(plan)
+
+        print(f"  all extractors      legacy {best_of(run_legacy):7.2f} ms   section tree {best_of(run_tree):7.2f} ms")
+        print(f"  excluding schedule  legacy {best_of(run_legacy_sections):7.2f} ms   section tree {best_of(run_tree_sections):7.2f} ms")
+
+
+if __name__ == "__main__":
+    benchmark(days=int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,61 @@
+"""
+Tests for boilerplate and near-duplicate removal (utils.text_cleaning).
+"""
+from utils.document_outline import combine_documents, document_from_pages
+from utils.text_cleaning import clean_document
+
+BANNER = "ME 341 Heat Transfer - Lecture Notes (Spring 2024)"
+SECTIONS = [
+    ("1.1 Conduction", "Conduction is the transfer of energy from the more energetic particles of a substance to "
+                       "the less energetic ones through interactions between the particles."),
+    ("1.2 Convection", "Convection comprises energy transfer due to random molecular motion and the bulk motion "
+                       "of the fluid, and it is described by Newton's law of cooling."),
+    ("1.3 Radiation", "Thermal radiation is energy emitted by matter at a nonzero temperature, transported by "
+                      "electromagnetic waves without any medium in between."),
+    ("1.4 Energy Balances", "The conservation of energy requirement is applied to a control volume at an instant "
+                            "and over a time interval to relate the heat rates."),
+    ("1.5 Units", "Heat rates are given in watts and heat fluxes in watts per square meter throughout these notes."),
+]
+
+
+def _notes_pages():
+    return [f"{BANNER}\n{title}\nSee the worked examples.\n{body}\nPage {number} of {len(SECTIONS)}"
+            for number, (title, body) in enumerate(SECTIONS, start=1)]
+
+
+def test_removes_page_furniture_and_keeps_outline_offsets():
+    document = document_from_pages(_notes_pages())
+    cleaned, report = clean_document(document)
+
+    assert BANNER not in cleaned.text and "Page 3 of" not in cleaned.text
+    # Repeated lines away from the page edges are content and stay
+    assert cleaned.text.count("See the worked examples.") == len(SECTIONS)
+    assert report.boilerplate_lines == 2 * len(SECTIONS) and report.duplicate_paragraphs == 0
+    assert report.bytes_removed == len(document.text.encode("utf-8")) - len(cleaned.text.encode("utf-8"))
+    assert report.tokens_removed == (len(document.text) - len(cleaned.text)) // 4
+    for entry in cleaned.outline:
+        assert cleaned.text[entry.start:].startswith(entry.title)
+    assert [cleaned.page_at(entry.start) for entry in cleaned.outline] == [1, 2, 3, 4, 5]
+
+
+def test_drops_near_duplicate_paragraphs_and_renumbered_questions():
+    first = document_from_pages(["\n\n".join(body for _, body in SECTIONS[:3])])
+    # An overlapping note set: one paragraph reworded slightly, one new
+    second = document_from_pages([
+        SECTIONS[1][1].replace("comprises", "consists of"),
+        SECTIONS[3][1],
+    ])
+    cleaned, report = clean_document(combine_documents([first, second]))
+    assert report.duplicate_paragraphs == 1
+    assert cleaned.text.count("Newton's law of cooling") == 1 and "consists of" not in cleaned.text
+    assert SECTIONS[3][1] in cleaned.text
+
+    questions = document_from_pages([
+        "1. Explain how the thermal boundary layer develops over a heated flat plate.\n"
+        "2. Calculate the heat flux through a 20 mm thick plane wall with k = 1.7 W/m.K.",
+        "Q4) Explain how the thermal boundary layer develops over a heated flat plate.\n"
+        "5. Derive the energy balance for a control volume with heat generation.",
+    ])
+    cleaned, report = clean_document(questions, "questions")
+    assert report.duplicate_paragraphs == 1
+    assert "Q4)" not in cleaned.text and "5. Derive" in cleaned.text
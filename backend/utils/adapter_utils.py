@@ -164,3 +164,69 @@ def transform_backend_to_frontend(structured_plan: Dict[str, Any]) -> Dict[str,
             "generalTips": ["Try regenerating your study plan"],
             "error": str(e)
         }
+
+def transform_frontend_to_backend(frontend_plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Transforms a frontend study plan back into the backend structured format.
+    
+    The inverse of transform_backend_to_frontend as far as the frontend keeps the data:
+    the "Summary" item appended to each day is folded back into the day's summary, and
+    fields the frontend does not carry (e.g. concept importance) are left out.
+    
+    Args:
+        frontend_plan: The study plan in frontend format
+        
+    Returns:
+        The plan in backend format
+    """
+    daily_schedule = []
+    for index, day in enumerate(frontend_plan.get("dailyBreakdown") or []):
+        items = list(day.get("items") or [])
+        if items and items[-1].get("topic") == "Summary" and items[-1].get("details") == day.get("daySummary"):
+            items.pop()
+        daily_schedule.append({
+            "day": day.get("day", index + 1),
+            "date": None,
+            "focus_area": day.get("focusArea") or f"Day {index + 1} Studies",
+            "study_item": [
+                {
+                    "topic": item.get("topic", "Study topic"),
+                    "description": item.get("details") or "",
+                    "duration_minutes": int(round(item.get("durationMinutes")
+                                                  or (item.get("estimatedTimeHours") or 1) * 60)),
+                    "resource": [resource for resource in item.get("resources") or [] if isinstance(resource, dict)] or None,
+                    "is_completed": bool(item.get("isCompleted", False)),
+                    "learning_objectives": item.get("learningObjectives") or None,
+                    "priority": item.get("priority"),
+                }
+                for item in items
+            ],
+            "summary": day.get("daySummary") or "",
+            "learning_goals": day.get("learningGoals"),
+            "review_topics": day.get("reviewTopics"),
+        })
+    
+    backend_plan = {
+        "overall_goal": frontend_plan.get("overallGoal", "Study effectively"),
+        "total_study_day": frontend_plan.get("totalStudyDays", len(daily_schedule) or 1),
+        "hour_per_day": frontend_plan.get("hoursPerDay", 2.0),
+        "core_concepts": [
+            {"name": concept.get("concept", ""), "explanation": concept.get("explanation", "")}
+            for concept in frontend_plan.get("keyConcepts") or []
+        ],
+        "daily_schedule": daily_schedule,
+        "general_tip": frontend_plan.get("generalTips") or [],
+    }
+    if frontend_plan.get("keyFormulas"):
+        backend_plan["key_formulas"] = [
+            {
+                "name": formula.get("formula_name", ""),
+                "formula": formula.get("formula", ""),
+                "description": formula.get("description", ""),
+                "usage_context": formula.get("usage_context") or None,
+                "variables": formula.get("variables") or None,
+                "examples": formula.get("examples") or None,
+            }
+            for formula in frontend_plan["keyFormulas"]
+        ]
+    return backend_plan
@@ -1,17 +1,35 @@
 from crewai import Agent, Task, Crew, Process
 from crewai.crews.crew_output import CrewOutput
 from langchain_openai import ChatOpenAI
+import asyncio
 import os
 import sys
 import json
 import logging
+import time
 import traceback
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 import json
 import logging
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
+from utils.model_scheduler import model_scheduler, BATCH
+from utils.json_extraction import extract_json, extract_json_value
+from utils.compact_schema import COMPACT_FORMAT, compact_json_schema, compact_output_enabled, expand_compact_plan
+from utils.prompt_assembly import assemble, load_plan_template, minify_json, record_prompt_cache, static_prefix
+from utils.plan_rendering import render_overview_markdown, simplified_json_from_plan
+from utils.plan_validation import find_invalid_elements, splice_elements
+from utils.spaced_repetition import schedule_reviews
+from utils.incremental_plan import INCREMENTAL_INSTRUCTIONS, PlanEdit, build_edit_request, build_plan_context
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.document_outline import seed_materials
+from utils.page_selection import select_passages
+from models.study_plan_models import StructuredStudyPlan
+from utils.structured_output import (
+    JSON_SCHEMA, TEMPLATE, is_unsupported_error, mark_unsupported, prompt_tokens, record_structuring_call,
+    record_single_pass, record_structuring_output, record_structuring_retry, resolve_mode, response_format
+)
 
 load_dotenv()
 
@@ -19,9 +37,12 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OpenRouter model id of the planner and structurer
+MODEL_NAME = os.getenv('DEEPSEEK_MODEL_NAME', 'deepseek/deepseek-coder')
+
 # Configure the LLM for DeepSeek V3 via OpenRouter
 llm = ChatOpenAI(
-    model_name=f"openrouter/{os.getenv('DEEPSEEK_MODEL_NAME', 'deepseek/deepseek-coder')}",
+    model_name=f"openrouter/{MODEL_NAME}",
     openai_api_key=os.getenv("OPENROUTER_API_KEY"),
     openai_api_base="https://openrouter.ai/api/v1",
     temperature=0.7,
@@ -30,7 +51,7 @@ llm = ChatOpenAI(
 )
 
 llm2 = ChatOpenAI(
-    model_name=f"openrouter/{os.getenv('DEEPSEEK_MODEL_NAME', 'deepseek/deepseek-coder')}",
+    model_name=f"openrouter/{MODEL_NAME}",
     openai_api_key=os.getenv("OPENROUTER_API_KEY"),
     openai_api_base="https://openrouter.ai/api/v1",
     temperature=0.1,
@@ -38,6 +59,26 @@ llm2 = ChatOpenAI(
     streaming=True
 )
 
+# The "openrouter/" prefix above is for the crew, which routes calls through litellm.
+# Calls made directly against the OpenRouter API need the bare model id.
+planner_llm = ChatOpenAI(
+    model_name=MODEL_NAME,
+    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
+    openai_api_base="https://openrouter.ai/api/v1",
+    temperature=0.7,
+    max_tokens=16000,
+    streaming=True
+)
+
+structurer_llm = ChatOpenAI(
+    model_name=MODEL_NAME,
+    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
+    openai_api_base="https://openrouter.ai/api/v1",
+    temperature=0.1,
+    max_tokens=16000,
+    streaming=True
+)
+
 # Chat Support Agent for interactive study sessions
 chat_support_agent = Agent(
     role='AI Study Tutor',
@@ -119,6 +160,97 @@ STUDY_PLAN_TEMPLATE = """# Study Plan: {subject}
 {study_tips}
 """
 
+# Static prompt segments, built once at import. Request-specific text always comes after them.
+OVERVIEW_TASK_INSTRUCTIONS = static_prefix(f"""
+    Create a detailed study plan overview based on the materials and constraints given at the end of this task.
+    
+    Provide a structured overview of a study plan with the following sections:
+    
+    1. OVERVIEW: A brief paragraph describing the overall goal and approach of the study plan.
+    
+    2. CORE CONCEPTS: List 5-10 core concepts that are essential to understand, with a brief explanation of each.
+    
+    3. DAILY BREAKDOWN: For each study day, provide:
+    - Day focus area/theme
+    - 3-5 main topics to study
+    - Estimated time allocation (the total must match the hours per day given below)
+    
+    4. KEY FORMULAS: If applicable, list 5-10 important formulas that should be memorized.
+    
+    5. STUDY TIPS: Provide 3-5 general tips for studying this material effectively.
+    
+    This overview will be shown to the user before generating the full structured plan.
+    
+    ALSO provide a simplified JSON structure with the key information that will help a structurer agent create a full plan:
+    ```json
+    {minify_json({
+        "overall_goal": "[concise goal statement]",
+        "core_concepts": [{"name": "[concept name]", "explanation": "[brief explanation]", "importance": "[high/medium/low]"}],
+        "daily_focus": [{
+            "day": 1, "focus_area": "[main focus]", "topics": ["[topic 1]", "[topic 2]"],
+            "subtopics": {"[topic 1]": ["[subtopic 1.1]", "[subtopic 1.2]"]}
+        }],
+        "key_formulas": [{"name": "[formula name]", "formula": "[formula]", "description": "[what it's used for]"}]
+    })}
+    ```
+    
+    Make the overview engaging, informative, and well-structured to help the user understand the learning journey. Extract as much relevant information as possible from the study materials including summaries of topics, subtopics, key formulas, key concepts, and any other information that would be helpful for creating a comprehensive study plan.
+""")
+
+STRUCTURING_TASK_INSTRUCTIONS = static_prefix("""
+    Convert the study plan given at the end of this task into a structured JSON format. Extract all key information including daily schedules, topics, and study items.
+    
+    Your response MUST be a valid JSON object with no additional text. Do not include markdown formatting in your response. The JSON should match the exact field names from the input: 'overall_goal', 'total_study_day', 'hour_per_day', 'core_concepts', 'daily_schedule', 'general_tips'.
+""")
+
+PREVIEW_TASK_INSTRUCTIONS = static_prefix(f"""
+    # Agent: Expert Study Planner
+    ## Task: Create a detailed study plan overview based on the materials and constraints given at the end of this task.
+    
+    Provide a structured overview of a study plan with the following sections:
+    
+    1. OVERVIEW: A detailed paragraph describing the overall goal and approach of the study plan.
+    
+    2. CORE CONCEPTS: List 5-10 core concepts that are essential to understand, with a brief explanation of each, their importance, and related concepts.
+    
+    3. DAILY BREAKDOWN: For each study day, provide:
+    - Day focus area/theme
+    - 3-5 main topics to study
+    - Important subtopics for each main topic
+    - Estimated time allocation (the total must match the hours per day given below)
+    
+    4. KEY FORMULAS: If applicable, list 5-10 important formulas that should be memorized, with explanations of their application.
+    
+    5. STUDY TIPS: Provide 3-5 general tips for studying this material effectively.
+    
+    EXTRACT as much relevant information as possible from the study materials including summaries of topics, subtopics, key formulas, key concepts, and any other information that would be helpful for creating a comprehensive study plan.
+    
+    This overview will be shown to the user before generating the full structured plan.
+    
+    ALSO provide a simplified JSON structure with the key information that will help a structurer agent create a full plan:
+    ```json
+    {minify_json({
+        "overall_goal": "[concise goal statement]",
+        "core_concepts": [{
+            "name": "[concept name]", "explanation": "[brief explanation]", "importance": "[high/medium/low]",
+            "related_concepts": ["[related concept 1]", "[related concept 2]"], "examples": ["[example 1]", "[example 2]"]
+        }],
+        "daily_focus": [{
+            "day": 1, "focus_area": "[main focus]", "topics": ["[topic 1]", "[topic 2]"],
+            "subtopics": {"[topic 1]": ["[subtopic 1.1]", "[subtopic 1.2]"], "[topic 2]": ["[subtopic 2.1]", "[subtopic 2.2]"]},
+            "time_allocation": {"[topic 1]": "[time in minutes]", "[topic 2]": "[time in minutes]"}
+        }],
+        "key_formulas": [{
+            "name": "[formula name]", "formula": "[formula]", "description": "[what it's used for]",
+            "application": "[example application]"
+        }],
+        "study_tips": ["[study tip 1]", "[study tip 2]", "[study tip 3]"]
+    })}
+    ```
+    
+    Make the overview engaging, informative, and well-structured to help the user understand the learning journey.
+""")
+
 def create_study_plan_agent() -> Agent:
     """Create the study plan agent."""
     return Agent(
@@ -149,58 +281,12 @@ def create_study_plan_task(agent: Agent, materials: str, days: int, hours_per_da
     Returns:
         Task: A CrewAI Task object for the study plan generation
     """
-    task_desc = (
-        f"Create a detailed study plan overview based on the following materials and constraints.\n"
-        f"Study Duration: {days} days, {hours_per_day} hours per day\n\n"
-        f"Study Materials (Notes):\n```\n{materials}\n```\n\n"
-    )
-    
-    if questions:
-        task_desc += f"Study Questions:\n```\n{questions}\n```\n\n"
-    
-    task_desc += (
-        f"Provide a structured overview of a study plan with the following sections:\n\n"
-        f"1. OVERVIEW: A brief paragraph describing the overall goal and approach of the study plan.\n\n"
-        f"2. CORE CONCEPTS: List 5-10 core concepts that are essential to understand, with a brief explanation of each.\n\n"
-        f"3. DAILY BREAKDOWN: For each of the {days} days, provide:\n"
-        f"   - Day focus area/theme\n"
-        f"   - 3-5 main topics to study\n"
-        f"   - Estimated time allocation (total should be {hours_per_day} hours per day)\n\n"
-        f"4. KEY FORMULAS: If applicable, list 5-10 important formulas that should be memorized.\n\n"
-        f"5. STUDY TIPS: Provide 3-5 general tips for studying this material effectively.\n\n"
-        f"This overview will be shown to the user before generating the full structured plan.\n\n"
-        f"ALSO provide a simplified JSON structure with the key information that will help a structurer agent create a full plan:\n"
-        f"```json\n"
-        f"{{\n"
-        f"  \"overall_goal\": \"[concise goal statement]\",\n"
-        f"  \"core_concepts\": [\n"
-        f"    {{\n"
-        f"      \"name\": \"[concept name]\",\n"
-        f"      \"explanation\": \"[brief explanation]\",\n"
-        f"      \"importance\": \"[high/medium/low]\"\n"
-        f"    }}\n"
-        f"  ],\n"
-        f"  \"daily_focus\": [\n"
-        f"    {{\n"
-        f"      \"day\": 1,\n"
-        f"      \"focus_area\": \"[main focus]\",\n"
-        f"      \"topics\": [\"[topic 1]\", \"[topic 2]\"],\n"
-        f"      \"subtopics\": {{\"[topic 1]\": [\"[subtopic 1.1]\", \"[subtopic 1.2]\"]}}\n"
-        f"    }}\n"
-        f"  ],\n"
-        f"  \"key_formulas\": [\n"
-        f"    {{\n"
-        f"      \"name\": \"[formula name]\",\n"
-        f"      \"formula\": \"[formula]\",\n"
-        f"      \"description\": \"[what it's used for]\"\n"
-        f"    }}\n"
-        f"  ]\n"
-        f"}}\n"
-        f"```\n\n"
-        f"Make the overview engaging, informative, and well-structured to help the user understand the learning journey. "
-        f"Extract as much relevant information as possible from the study materials including summaries of topics, "
-        f"subtopics, key formulas, key concepts, and any other information that would be helpful for creating a "
-        f"comprehensive study plan."
+    # Fixed instructions first so the provider can reuse its cached prefix across requests
+    task_desc = assemble(
+        OVERVIEW_TASK_INSTRUCTIONS,
+        f"Study Duration: {days} days, {hours_per_day} hours per day",
+        f"Study Materials (Notes):\n```\n{select_passages(materials, questions)}\n```",
+        f"Study Questions:\n```\n{questions}\n```" if questions else None
     )
     
     return Task(
@@ -228,15 +314,7 @@ def create_study_plan_structurer_agent() -> Agent:
 def create_structuring_task(agent: Agent, study_plan_text: str) -> Task:
     """Create a task for structuring the study plan."""
     return Task(
-        description=(
-            f"Convert the following study plan into a structured JSON format. "
-            f"Extract all key information including daily schedules, topics, and study items.\n\n"
-            f"Study Plan:\n```\n{study_plan_text}\n```\n\n"
-            f"Your response MUST be a valid JSON object with no additional text. "
-            f"Do not include markdown formatting in your response. "
-            f"The JSON should match the exact field names from the input: "
-            f"'overall_goal', 'total_study_day', 'hour_per_day', 'core_concepts', 'daily_schedule', 'general_tips'."
-        ),
+        description=assemble(STRUCTURING_TASK_INSTRUCTIONS, f"Study Plan:\n```\n{study_plan_text}\n```"),
         agent=agent,
         expected_output=(
             "A structured JSON object containing all the study plan details, "
@@ -245,11 +323,131 @@ def create_structuring_task(agent: Agent, study_plan_text: str) -> Task:
         output_pydantic=StructuredStudyPlanOutput
     )
 
+def build_preview_task_description(
+    study_materials_text: str,
+    study_duration_days: int,
+    study_hours_per_day: int,
+    questions_text: str = None,
+    outline: List[Dict[str, Any]] = None
+) -> str:
+    """
+    Build the prompt for the preview study plan (markdown overview plus simplified JSON).
+    
+    Args:
+        study_materials_text: The study materials to base the plan on
+        study_duration_days: Number of days for the study plan
+        study_hours_per_day: Number of hours per day for studying
+        questions_text: Optional questions to include in the study plan
+        outline: Optional outline of the notes (utils.document_outline), sent as a skeleton with per-section text;
+            notes over MATERIALS_TOKEN_BUDGET are cut to their best passages either way
+        
+    Returns:
+        str: The task description sent to the study planner
+    """
+    # Prepare materials section with both notes and questions if available
+    materials_section = f"Study Materials (Notes):\n```\n{seed_materials(study_materials_text, outline, questions_text=questions_text)}\n```\n"
+    
+    # Add questions section if questions are provided
+    if questions_text and len(questions_text.strip()) > 0:
+        materials_section += f"\nStudy Questions:\n```\n{questions_text}\n```\n"
+        logger.info("Including questions text in study plan generation")
+    
+    # The fixed instructions go first and are identical for every request, so the provider
+    # can serve them from its prefix cache; the duration and materials follow
+    task_description = assemble(
+        PREVIEW_TASK_INSTRUCTIONS,
+        f"Study Duration: {study_duration_days} days, {study_hours_per_day} hours per day",
+        materials_section
+    )
+    return task_description
+
+def parse_preview_output(full_output: str, study_duration_days: int, study_hours_per_day: int) -> Dict[str, Any]:
+    """
+    Split the planner output into the markdown overview and the simplified JSON block.
+    
+    Args:
+        full_output: The complete text written by the study planner
+        study_duration_days: Number of days for the study plan
+        study_hours_per_day: Number of hours per day for studying
+        
+    Returns:
+        dict: A preview result with status "success", or "partial_success" if the JSON could not be parsed
+    """
+    # Extract the overview text and JSON part
+    try:
+        # Extract the simplified JSON block (nested objects are decoded in full)
+        extraction = extract_json(full_output, expect=dict, source="preview")
+        if extraction is None and PREVIEW_JSON_FENCE in full_output:
+            raise ValueError("The ```json block in the planner output is not a valid JSON object")
+        
+        # Human-readable overview - everything except the JSON block
+        simplified_json = {}
+        overview_text = full_output.strip()
+        if extraction:
+            simplified_json = extraction.value
+            overview_text = (full_output[:extraction.start] + full_output[extraction.end:]).strip()
+            logger.info(f"Successfully extracted JSON data from agent output ({extraction.strategy})")
+        
+        # Save the full output and extracted data for debugging
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        os.makedirs('test_data', exist_ok=True)
+        
+        # Save the full output
+        with open(f'test_data/preview_full_output_{timestamp}.txt', 'w') as f:
+            f.write(full_output)
+        
+        # Save the extracted JSON
+        if simplified_json:
+            with open(f'test_data/preview_simplified_json_{timestamp}.json', 'w') as f:
+                json.dump(simplified_json, f, indent=2)
+        
+        # Create a plan object that contains both the overview and the simplified JSON
+        # This will be displayed to the user in the preview page
+        preview_plan = {
+            "overview": overview_text,
+            "overall_goal": simplified_json.get("overall_goal", "Master the subject material"),
+            "core_concepts": simplified_json.get("core_concepts", []),
+            "daily_focus": simplified_json.get("daily_focus", []),
+            "key_formulas": simplified_json.get("key_formulas", []),
+            "study_days": study_duration_days,
+            "hours_per_day": study_hours_per_day
+        }
+        
+        return {
+            "status": "success",
+            "preview_plan": preview_plan,
+            "raw_plan": full_output,  # Pass the full output for structuring later
+            "simplified_json": simplified_json  # Pass the simplified JSON for the structurer
+        }
+    except (json.JSONDecodeError, Exception) as e:
+        logger.error(f"Failed to parse data from crew output: {e}")
+        # Return the raw text for troubleshooting, but still provide the overview text if available
+        overview_text = full_output
+        
+        # Try to clean up the overview by removing any partial JSON
+        json_start = overview_text.find('```json')
+        if json_start > 0:
+            overview_text = overview_text[:json_start].strip()
+        
+        return {
+            "status": "partial_success",
+            "error": "Failed to parse JSON data",
+            "details": str(e),
+            "preview_plan": {
+                "overview": overview_text,
+                "study_days": study_duration_days,
+                "hours_per_day": study_hours_per_day
+            },
+            "raw_plan": full_output
+        }
+
 async def generate_preview_study_plan(
     study_materials_text: str,
     study_duration_days: int,
     study_hours_per_day: int,
-    questions_text: str = None
+    questions_text: str = None,
+    session_id: str = None,
+    outline: List[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Generate a preview study plan using the AI agent.
@@ -259,6 +457,8 @@ async def generate_preview_study_plan(
         study_duration_days: Number of days for the study plan
         study_hours_per_day: Number of hours per day for studying
         questions_text: Optional questions to include in the study plan
+        session_id: Optional session identifier used for fair-share scheduling
+        outline: Optional outline of the notes, see build_preview_task_description
         
     Returns:
         dict: A structured preview study plan following the PreviewStudyPlan format
@@ -268,91 +468,9 @@ async def generate_preview_study_plan(
         
         # Create the study plan agent and task
         study_plan_agent = create_study_plan_agent()
-        
-        # Prepare materials section with both notes and questions if available
-        materials_section = f"Study Materials (Notes):\n```\n{study_materials_text}\n```\n"
-        
-        # Add questions section if questions are provided
-        if questions_text and len(questions_text.strip()) > 0:
-            materials_section += f"\nStudy Questions:\n```\n{questions_text}\n```\n"
-            logger.info("Including questions text in study plan generation")
-        
-        # Build a task description that focuses on generating a human-readable overview
-        # and extracting comprehensive information for the structurer agent
-        task_description = f"""# Agent: Expert Study Planner
-## Task: Create a detailed study plan overview based on the following materials and constraints.
-Study Duration: {study_duration_days} days, {study_hours_per_day} hours per day
-
-{materials_section}
-
-Provide a structured overview of a study plan with the following sections:
-
-1. OVERVIEW: A detailed paragraph describing the overall goal and approach of the study plan.
-
-2. CORE CONCEPTS: List 5-10 core concepts that are essential to understand, with a brief explanation of each, their importance, and related concepts.
-
-3. DAILY BREAKDOWN: For each of the {study_duration_days} days, provide:
-   - Day focus area/theme
-   - 3-5 main topics to study
-   - Important subtopics for each main topic
-   - Estimated time allocation (total should be {study_hours_per_day} hours per day)
-
-4. KEY FORMULAS: If applicable, list 5-10 important formulas that should be memorized, with explanations of their application.
-
-5. STUDY TIPS: Provide 3-5 general tips for studying this material effectively.
-
-This overview will be shown to the user before generating the full structured plan.
-
-EXTRACT as much relevant information as possible from the study materials including summaries of topics, subtopics, key formulas, key concepts, and any other information that would be helpful for creating a comprehensive study plan.
-
-This overview will be shown to the user before generating the full structured plan.
-
-ALSO provide a simplified JSON structure with the key information that will help a structurer agent create a full plan:
-```json
-{{
-  "overall_goal": "[concise goal statement]",
-  "core_concepts": [
-    {{
-      "name": "[concept name]",
-      "explanation": "[brief explanation]",
-      "importance": "[high/medium/low]",
-      "related_concepts": ["[related concept 1]", "[related concept 2]"],
-      "examples": ["[example 1]", "[example 2]"]
-    }}
-  ],
-  "daily_focus": [
-    {{
-      "day": 1,
-      "focus_area": "[main focus]",
-      "topics": ["[topic 1]", "[topic 2]"],
-      "subtopics": {{
-        "[topic 1]": ["[subtopic 1.1]", "[subtopic 1.2]"],
-        "[topic 2]": ["[subtopic 2.1]", "[subtopic 2.2]"]
-      }},
-      "time_allocation": {{
-        "[topic 1]": "[time in minutes]",
-        "[topic 2]": "[time in minutes]"
-      }}
-    }}
-  ],
-  "key_formulas": [
-    {{
-      "name": "[formula name]",
-      "formula": "[formula]",
-      "description": "[what it's used for]",
-      "application": "[example application]"
-    }}
-  ],
-  "study_tips": [
-    "[study tip 1]",
-    "[study tip 2]",
-    "[study tip 3]"
-  ]
-}}
-```
-
-Make the overview engaging, informative, and well-structured to help the user understand the learning journey.
-"""
+        task_description = build_preview_task_description(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, outline
+        )
         
         study_plan_task = Task(
             description=task_description,
@@ -370,82 +488,15 @@ Make the overview engaging, informative, and well-structured to help the user un
             process=Process.sequential
         )
         
-        # Run the crew and get the result
-        crew_output = study_plan_crew.kickoff()
+        # Run the crew in a worker thread once the scheduler grants a batch slot
+        crew_output = await model_scheduler.run_blocking(study_plan_crew.kickoff, priority=BATCH, session_id=session_id)
         
         if isinstance(crew_output, CrewOutput):
             # If we got a valid crew output, process it
             full_output = crew_output.raw
+            record_prompt_cache("preview", getattr(crew_output, "token_usage", None))
             logger.info(f"Successfully generated preview study plan, output length: {len(full_output)}")
-            
-            # Extract the overview text and JSON part
-            try:
-                # Extract human-readable overview - everything before the JSON block
-                import re
-                overview_text = re.sub(r'```json\s*\{[\s\S]*?\}\s*```\s*$', '', full_output).strip()
-                
-                # Extract JSON content between triple backticks
-                json_match = re.search(r'```(?:json)?\s*({[\s\S]*?})\s*```', full_output)
-                
-                # If we found JSON content, parse it
-                simplified_json = {}
-                if json_match:
-                    json_text = json_match.group(1)
-                    simplified_json = json.loads(json_text.strip())
-                    logger.info("Successfully extracted JSON data from agent output")
-                
-                # Save the full output and extracted data for debugging
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                os.makedirs('test_data', exist_ok=True)
-                
-                # Save the full output
-                with open(f'test_data/preview_full_output_{timestamp}.txt', 'w') as f:
-                    f.write(full_output)
-                
-                # Save the extracted JSON
-                if simplified_json:
-                    with open(f'test_data/preview_simplified_json_{timestamp}.json', 'w') as f:
-                        json.dump(simplified_json, f, indent=2)
-                
-                # Create a plan object that contains both the overview and the simplified JSON
-                # This will be displayed to the user in the preview page
-                preview_plan = {
-                    "overview": overview_text,
-                    "overall_goal": simplified_json.get("overall_goal", "Master the subject material"),
-                    "core_concepts": simplified_json.get("core_concepts", []),
-                    "daily_focus": simplified_json.get("daily_focus", []),
-                    "key_formulas": simplified_json.get("key_formulas", []),
-                    "study_days": study_duration_days,
-                    "hours_per_day": study_hours_per_day
-                }
-                
-                return {
-                    "status": "success",
-                    "preview_plan": preview_plan,
-                    "raw_plan": full_output,  # Pass the full output for structuring later
-                    "simplified_json": simplified_json  # Pass the simplified JSON for the structurer
-                }
-            except (json.JSONDecodeError, Exception) as e:
-                logger.error(f"Failed to parse data from crew output: {e}")
-                # Return the raw text for troubleshooting, but still provide the overview text if available
-                overview_text = full_output
-                
-                # Try to clean up the overview by removing any partial JSON
-                json_start = overview_text.find('```json')
-                if json_start > 0:
-                    overview_text = overview_text[:json_start].strip()
-                
-                return {
-                    "status": "partial_success",
-                    "error": "Failed to parse JSON data",
-                    "details": str(e),
-                    "preview_plan": {
-                        "overview": overview_text,
-                        "study_days": study_duration_days,
-                        "hours_per_day": study_hours_per_day
-                    },
-                    "raw_plan": full_output
-                }
+            return parse_preview_output(full_output, study_duration_days, study_hours_per_day)
         else:
             logger.error(f"Unexpected crew output type: {type(crew_output)}")
             return {
@@ -463,6 +514,302 @@ Make the overview engaging, informative, and well-structured to help the user un
             "details": error_msg
         }
 
+_SINGLE_PASS_TASK = """
+    Create a complete, structured study plan directly from the study materials and constraints given at the end of this message.
+    Include an overall goal, 5-10 core concepts with explanations and importance, one daily schedule entry for every study day whose study items add up to the hours per day, key formulas if the material has any, and 3-5 general study tips.
+    Extract as much relevant information as possible from the materials: topics, subtopics as learning objectives, formulas and key concepts.
+"""
+
+# Keyed by whether the compact wire format is requested
+SINGLE_PASS_INSTRUCTIONS = {
+    False: static_prefix(_SINGLE_PASS_TASK),
+    True: static_prefix(_SINGLE_PASS_TASK + "\n" + COMPACT_FORMAT),
+}
+
+def single_pass_enabled() -> bool:
+    """Whether /preview generates the structured plan in one pass by default (SINGLE_PASS_PLAN, off by default)."""
+    return os.getenv("SINGLE_PASS_PLAN", "false").strip().lower() in ("1", "true", "yes", "on")
+
+def _fit_single_pass_plan(plan_data: Any, study_duration_days: int, study_hours_per_day: int) -> Dict[str, Any]:
+    """
+    Apply the requested days and hours to a single-pass plan and drop elements that do not validate.
+    
+    Raises:
+        ValueError: If the plan has too few days or still fails validation
+    """
+    if not isinstance(plan_data, dict):
+        raise ValueError("Single-pass output is not a JSON object")
+    plan_data = expand_compact_plan(plan_data)
+    invalid = find_invalid_elements(plan_data)
+    if invalid:
+        logger.warning(f"Dropping {len(invalid)} invalid elements from the single-pass plan")
+        plan_data = splice_elements(plan_data, {element.path: None for element in invalid})
+    
+    schedule = plan_data.get("daily_schedule") or []
+    if len(schedule) < study_duration_days:
+        raise ValueError(f"Single-pass plan covers {len(schedule)} of {study_duration_days} days")
+    plan_data["daily_schedule"] = schedule[:study_duration_days]
+    plan_data["total_study_day"] = study_duration_days
+    plan_data["hour_per_day"] = study_hours_per_day
+    return StructuredStudyPlan(**schedule_reviews(plan_data)).dict()
+
+async def _single_pass_result(
+    study_materials_text: str,
+    study_duration_days: int,
+    study_hours_per_day: int,
+    questions_text: str = None,
+    session_id: str = None,
+    outline: List[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    One single-pass model call and the preview result rendered from it.
+    
+    Raises:
+        Exception: If the call fails or its output is not a usable plan
+    """
+    logger.info(f"Generating single-pass study plan for {study_duration_days} days, {study_hours_per_day} hours/day")
+    compact = compact_output_enabled()
+    context = assemble(
+        f"Study Duration: {study_duration_days} days, {study_hours_per_day} hours per day",
+        f"Study Materials (Notes):\n```\n{seed_materials(study_materials_text, outline, questions_text=questions_text)}\n```",
+        f"Study Questions:\n```\n{questions_text}\n```" if questions_text and questions_text.strip() else None
+    )
+    instructions = SINGLE_PASS_INSTRUCTIONS[compact]
+    
+    started = time.perf_counter()
+    constrained = await structure_with_schema(context, session_id, compact, instructions=instructions,
+                                              model=planner_llm, source="single_pass.schema")
+    output = constrained[1] if constrained else None
+    if output is None:
+        async with model_scheduler.slot(BATCH, session_id):
+            response = await planner_llm.ainvoke(assemble(instructions, context))
+        record_structuring_call(TEMPLATE, prompt_tokens(response, [instructions, context]))
+        record_prompt_cache("single_pass", response)
+        output = response.content
+    record_structuring_output("compact" if compact else "full", len(output) // 4, time.perf_counter() - started)
+    
+    plan_data = extract_json_value(output, expect=dict, source="single_pass", repair=True)
+    structured_plan = _fit_single_pass_plan(plan_data, study_duration_days, study_hours_per_day)
+    
+    overview_text = render_overview_markdown(structured_plan)
+    simplified_json = simplified_json_from_plan(structured_plan)
+    logger.info(f"Generated single-pass plan with {len(structured_plan['daily_schedule'])} days")
+    return {
+        "status": "success",
+        "preview_plan": {
+            "overview": overview_text,
+            "overall_goal": simplified_json["overall_goal"],
+            "core_concepts": simplified_json["core_concepts"],
+            "daily_focus": simplified_json["daily_focus"],
+            "key_formulas": simplified_json["key_formulas"],
+            "study_days": study_duration_days,
+            "hours_per_day": study_hours_per_day
+        },
+        "raw_plan": overview_text,
+        "simplified_json": simplified_json,
+        "structured_plan": transform_backend_to_frontend(structured_plan),
+        "structuring_path": "single_pass"
+    }
+
+def _record_single_pass_fallback(error: Exception) -> None:
+    """Log and count a failed single pass; the two-pass preview that follows is a second full planner call."""
+    record_single_pass(fallback=True)
+    logger.warning(f"Single-pass generation failed, falling back to the two-pass preview "
+                   f"(a second planner call on top of the failed one): {error}")
+
+async def generate_single_pass_study_plan(
+    study_materials_text: str,
+    study_duration_days: int,
+    study_hours_per_day: int,
+    questions_text: str = None,
+    session_id: str = None,
+    outline: List[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Generate the full structured plan in one model pass and render the preview from it locally.
+    
+    Replaces the preview call plus the later /plan/structure-plan call. The overview markdown
+    and simplified JSON are derived from the structured plan, so the response has the same
+    shape as generate_preview_study_plan plus the finished ``structured_plan``. If the
+    single pass does not produce a usable plan, the two-pass preview is generated instead,
+    so that request pays for both calls; fallbacks are counted under ``"single_pass"`` in
+    structuring_stats (/metrics/structuring).
+    
+    Args:
+        study_materials_text: The study materials to base the plan on
+        study_duration_days: Number of days for the study plan
+        study_hours_per_day: Number of hours per day for studying
+        questions_text: Optional questions to include in the study plan
+        session_id: Optional session identifier used for fair-share scheduling
+        outline: Optional outline of the notes, see build_preview_task_description
+        
+    Returns:
+        dict: A preview result with ``status``, ``preview_plan``, ``raw_plan``, ``simplified_json``,
+              ``structured_plan`` (frontend format) and ``structuring_path``
+    """
+    try:
+        result = await _single_pass_result(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, session_id, outline
+        )
+    except Exception as e:
+        _record_single_pass_fallback(e)
+        return await generate_preview_study_plan(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, session_id, outline
+        )
+    record_single_pass(fallback=False)
+    return result
+
+async def stream_single_pass_study_plan(
+    study_materials_text: str,
+    study_duration_days: int,
+    study_hours_per_day: int,
+    questions_text: str = None,
+    session_id: str = None,
+    outline: List[Dict[str, Any]] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Single-pass counterpart of stream_preview_study_plan, with the same events.
+    
+    The overview is rendered from the finished plan, so nothing is sent until the single
+    pass completes. If it fails, the two-pass preview is streamed instead with
+    stream_preview_study_plan; as in generate_single_pass_study_plan, that request pays for
+    both calls and the fallback is logged and counted.
+    
+    Yields:
+        ``("overview", text)`` with the rendered overview, then ``("result", preview_result)``,
+        or ``("error", details)`` on failure
+    """
+    try:
+        result = await _single_pass_result(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, session_id, outline
+        )
+    except Exception as e:
+        _record_single_pass_fallback(e)
+        async for event in stream_preview_study_plan(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, session_id, outline
+        ):
+            yield event
+        return
+    record_single_pass(fallback=False)
+    overview = result["preview_plan"].get("overview")
+    if overview:
+        yield "overview", overview
+    yield "result", result
+
+# Marker that ends the markdown overview in the planner output
+PREVIEW_JSON_FENCE = "```json"
+
+async def stream_preview_study_plan(
+    study_materials_text: str,
+    study_duration_days: int,
+    study_hours_per_day: int,
+    questions_text: str = None,
+    session_id: str = None,
+    outline: List[Dict[str, Any]] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Stream a preview study plan: overview tokens first, then the parsed result.
+    
+    The planner model is called directly with token streaming. Everything before the
+    ```json fence is forwarded as it is generated; the simplified JSON that follows is
+    parsed once the stream ends. The batch scheduler slot is held only while the model
+    is generating, not while the client reads the chunks or the output is parsed. If the
+    stream fails before any overview text was sent, the preview is generated with
+    generate_preview_study_plan instead and sent in one piece.
+    
+    Args:
+        study_materials_text: The study materials to base the plan on
+        study_duration_days: Number of days for the study plan
+        study_hours_per_day: Number of hours per day for studying
+        questions_text: Optional questions to include in the study plan
+        session_id: Optional session identifier used for fair-share scheduling
+        outline: Optional outline of the notes, see build_preview_task_description
+        
+    Yields:
+        ``("overview", text)`` chunks, then ``("result", preview_result)`` with the same
+        shape as generate_preview_study_plan, or ``("error", details)`` on failure
+    """
+    sent_upto = 0
+    try:
+        logger.info(f"Streaming preview study plan for {study_duration_days} days, {study_hours_per_day} hours/day")
+        task_description = build_preview_task_description(
+            study_materials_text, study_duration_days, study_hours_per_day, questions_text, outline
+        )
+        
+        # The model is read in its own task, so the scheduler slot is released as soon as the
+        # model finishes rather than when a slow client has read every chunk
+        received: asyncio.Queue = asyncio.Queue()
+        
+        async def read_model() -> None:
+            try:
+                async with model_scheduler.slot(BATCH, session_id):
+                    async for message_chunk in planner_llm.astream(task_description):
+                        received.put_nowait(message_chunk)
+            finally:
+                received.put_nowait(None)
+        
+        chunks = []
+        generated = ""
+        overview_closed = False
+        usage_chunk = None
+        reader = asyncio.create_task(read_model())
+        try:
+            while (message_chunk := await received.get()) is not None:
+                if getattr(message_chunk, "usage_metadata", None):
+                    # Providers that report usage while streaming send it with the last chunk
+                    usage_chunk = message_chunk
+                content = message_chunk.content or ""
+                chunks.append(content)
+                if overview_closed:
+                    continue
+                generated += content
+                fence_at = generated.find(PREVIEW_JSON_FENCE, max(0, sent_upto - len(PREVIEW_JSON_FENCE)))
+                if fence_at >= 0:
+                    overview_closed = True
+                    safe_end = fence_at
+                else:
+                    # Hold back a possible partial fence at the end of the buffer
+                    safe_end = max(sent_upto, len(generated) - len(PREVIEW_JSON_FENCE) + 1)
+                if safe_end > sent_upto:
+                    yield "overview", generated[sent_upto:safe_end]
+                    sent_upto = safe_end
+            # Raises the model's error, if any
+            await reader
+        finally:
+            # A client that disconnects mid-stream stops the model call and frees the slot
+            reader.cancel()
+        
+        full_output = "".join(chunks)
+        record_prompt_cache("preview.stream", usage_chunk)
+        if not overview_closed and len(full_output) > sent_upto:
+            yield "overview", full_output[sent_upto:]
+        logger.info(f"Finished streaming preview study plan, output length: {len(full_output)}")
+        yield "result", parse_preview_output(full_output, study_duration_days, study_hours_per_day)
+    except Exception as e:
+        if not sent_upto:
+            # Nothing has reached the client yet, so the preview can still be generated with the crew
+            logger.warning(f"Streaming the preview failed before any overview was sent, "
+                           f"generating it without streaming: {e}")
+            result = await generate_preview_study_plan(
+                study_materials_text, study_duration_days, study_hours_per_day, questions_text, session_id, outline
+            )
+            if result.get("status") == "error":
+                yield "error", result
+                return
+            overview = (result.get("preview_plan") or {}).get("overview")
+            if overview:
+                yield "overview", overview
+            yield "result", result
+            return
+        error_traceback = traceback.format_exc()
+        error_msg = f"Error in stream_preview_study_plan: {str(e)}\n\nTraceback:\n{error_traceback}"
+        logger.error(error_msg)
+        yield "error", {
+            "status": "error",
+            "error": "An unexpected error occurred",
+            "details": error_msg
+        }
+
 def run_study_plan_crew(
     materials_text: str,
     study_duration_days: str,
@@ -656,19 +1003,17 @@ def run_study_plan_crew(
             if hasattr(structured_plan_output_obj, 'pydantic_output') and structured_plan_output_obj.pydantic_output is not None:
                 structured_plan = json.loads(structured_plan_output_obj.pydantic_output.model_dump_json())
             elif hasattr(structured_plan_output_obj, 'raw') and isinstance(structured_plan_output_obj.raw, str):
-                try:
-                    structured_plan = json.loads(structured_plan_output_obj.raw)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse structured plan JSON: {e}. Raw: {structured_plan_output_obj.raw[:200]}...")
-                    return {"error": "Invalid JSON in structured plan", "details": f"Failed to parse JSON: {e}"}
+                structured_plan = extract_json_value(structured_plan_output_obj.raw, expect=dict, source="crew_part2")
+                if structured_plan is None:
+                    logger.error(f"Failed to parse structured plan JSON. Raw: {structured_plan_output_obj.raw[:200]}...")
+                    return {"error": "Invalid JSON in structured plan", "details": "Failed to parse JSON: no JSON object found"}
         elif hasattr(structured_plan_output_obj, 'model_dump_json'):
             structured_plan = json.loads(structured_plan_output_obj.model_dump_json())
         elif isinstance(structured_plan_output_obj, str):
-            try:
-                structured_plan = json.loads(structured_plan_output_obj)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse structured plan string as JSON: {e}")
-                return {"error": "Invalid JSON in structured plan", "details": f"Failed to parse string as JSON: {e}"}
+            structured_plan = extract_json_value(structured_plan_output_obj, expect=dict, source="crew_part2")
+            if structured_plan is None:
+                logger.error("Failed to parse structured plan string as JSON")
+                return {"error": "Invalid JSON in structured plan", "details": "Failed to parse string as JSON: no JSON object found"}
     
     if not structured_plan:
         logger.error(f"Failed to extract structured plan from output: {structured_plan_output_obj}")
@@ -778,13 +1123,113 @@ def run_study_plan_crew(
             "details": error_msg,
             "type": type(e).__name__
         }
-async def structure_raw_plan(raw_plan_text: str, simplified_json: Dict[str, Any] = None) -> Dict[str, Any]:
+SCHEMA_STRUCTURING_SYSTEM = (
+    "You are an expert at converting natural language study plans into structured data "
+    "while maintaining all important information."
+)
+
+_SCHEMA_STRUCTURING_TASK = """
+    Create a detailed, structured study plan from the overview and simplified data given at the end of this message.
+    Include at least 3 core concepts, a daily schedule whose study items fit the days and hours, and general tips for effective studying.
+"""
+
+# Keyed by whether the compact wire format is requested
+SCHEMA_STRUCTURING_INSTRUCTIONS = {
+    False: static_prefix(_SCHEMA_STRUCTURING_TASK),
+    True: static_prefix(_SCHEMA_STRUCTURING_TASK + "\n" + COMPACT_FORMAT),
+}
+
+_TEMPLATE_STRUCTURING_TASK = """
+    You are an AI study plan structurer. Your task is to create a detailed, structured study plan in JSON format based on the overview and simplified data given at the end of this task. The final output must strictly follow the format provided.
+    
+    {format_instructions}
+    
+    Make sure your response is ONLY the valid JSON with no additional text.
+    The JSON must include:
+    1. An overall goal
+    2. The number of study days and hours per day
+    3. At least 3 core concepts with explanations, importance levels, and related concepts
+    4. A daily schedule with focus areas, study items, and timing that matches the days and hours
+    5. General tips for effective studying
+"""
+
+# Keyed by whether the compact wire format is requested. The template is read from disk once.
+TEMPLATE_STRUCTURING_INSTRUCTIONS = {
+    False: static_prefix(_TEMPLATE_STRUCTURING_TASK.format(format_instructions=(
+        "Use this template format for your response (fill in the placeholders with actual content):\n"
+        f"```json\n{minify_json(load_plan_template() or {})}\n```"
+    ))),
+    # The compact format description replaces the much longer template
+    True: static_prefix(_TEMPLATE_STRUCTURING_TASK.format(format_instructions=COMPACT_FORMAT)),
+}
+
+# json_object output is only guaranteed to be JSON, so the full plan format is described in the prompt
+JSON_OBJECT_FORMAT = static_prefix(
+    "Return the plan as JSON in this template format (fill in the placeholders with actual content):\n"
+    f"```json\n{minify_json(load_plan_template() or {})}\n```"
+)
+
+async def structure_with_schema(context: str, session_id: str = None, compact: bool = False,
+                                instructions: str = None, model: ChatOpenAI = None,
+                                source: str = "structure_raw_plan.schema") -> Optional[Tuple[str, str]]:
+    """
+    Ask the structurer model for the plan with JSON output enforced by the provider.
+    
+    Uses the most constrained mode the model has not rejected (see resolve_mode): with
+    json_schema the StructuredStudyPlan (or compact) schema is enforced, so no template is
+    pasted into the prompt; with json_object only valid JSON is, so the format is described.
+    A mode the provider rejects is remembered and the next one is tried. Any other provider
+    error returns None, so the caller falls back to the template prompt.
+    
+    Args:
+        context: The plan overview and simplified data to structure
+        session_id: Optional session identifier used for fair-share scheduling
+        compact: Enforce the compact short-key wire schema instead of the full one
+        instructions: Static instructions placed before the context (defaults to the structuring ones)
+        model: The model to call directly (defaults to structurer_llm)
+        source: Name the prompt cache usage is recorded under
+        
+    Returns:
+        tuple: ``(mode, output)``, or None if constrained output is disabled, unsupported or failed
+    """
+    model = model or structurer_llm
+    model_name = model.model_name
+    mode = resolve_mode(model_name)
+    if mode == TEMPLATE:
+        return None
+    
+    instructions = instructions or SCHEMA_STRUCTURING_INSTRUCTIONS[compact]
+    if mode == JSON_SCHEMA:
+        schema = compact_json_schema() if compact else None
+        schema_format = response_format(JSON_SCHEMA, "CompactStudyPlan" if compact else "StructuredStudyPlan",
+                                        schema=schema)
+        prompt = assemble(instructions, context)
+    else:
+        # The compact instructions already describe the compact format
+        schema_format = response_format(mode, "StructuredStudyPlan")
+        prompt = assemble(instructions, context) if compact else assemble(instructions, JSON_OBJECT_FORMAT, context)
+    messages = [("system", SCHEMA_STRUCTURING_SYSTEM), ("human", prompt)]
+    try:
+        async with model_scheduler.slot(BATCH, session_id):
+            response = await model.bind(response_format=schema_format).ainvoke(messages)
+    except Exception as e:
+        if is_unsupported_error(e):
+            mark_unsupported(model_name, mode, e)
+            return await structure_with_schema(context, session_id, compact, instructions, model, source)
+        logger.warning(f"Constrained {mode} structuring failed, falling back to the template prompt: {e}")
+        return None
+    record_structuring_call(mode, prompt_tokens(response, [content for _, content in messages]))
+    record_prompt_cache(source, response)
+    return mode, response.content
+
+async def structure_raw_plan(raw_plan_text: str, simplified_json: Dict[str, Any] = None, session_id: str = None) -> Dict[str, Any]:
     """
     Process a raw text study plan into a structured format for the frontend.
     
     Args:
         raw_plan_text: The raw study plan text to structure
         simplified_json: Optional simplified JSON data to help with structuring
+        session_id: Optional session identifier used for fair-share scheduling
         
     Returns:
         dict: A structured study plan in the format expected by the frontend,
@@ -793,19 +1238,6 @@ async def structure_raw_plan(raw_plan_text: str, simplified_json: Dict[str, Any]
     try:
         logger.info(f"Structuring raw plan of length {len(raw_plan_text)} characters")
         
-        # Create the study plan structurer agent and task
-        structurer_agent = create_study_plan_structurer_agent()
-        
-        # Create a template for the full study plan structure
-        template_path = os.path.join(os.path.dirname(__file__), '../templates/study_plan_template.json')
-        template_content = "{}"
-        
-        try:
-            with open(template_path, 'r') as f:
-                template_content = f.read()
-        except Exception as e:
-            logger.warning(f"Could not read template file: {e}")
-        
         # Extract information from simplified_json if available
         context = """Here's the overview of the study plan:
 
@@ -814,88 +1246,62 @@ async def structure_raw_plan(raw_plan_text: str, simplified_json: Dict[str, Any]
         if simplified_json:
             # Add the simplified JSON to provide additional context
             context += "\n\nHere's the simplified data extracted from the overview:\n"
-            context += json.dumps(simplified_json, indent=2)
-
-        # Create a task description that instructs the agent to create a structured plan
-        structuring_task = Task(
-            description=(
-                f"You are an AI study plan structurer. Your task is to create a detailed, structured study plan in JSON format "
-                f"based on the following overview and simplified data. The final output must strictly follow the JSON template provided.\n\n"
-                f"{context}\n\n"
-                f"Use this template format for your response (fill in the placeholders with actual content):\n"
-                f"```json\n{template_content}\n```\n\n"
-                f"Make sure your response is ONLY the valid JSON with no additional text.\n"
-                f"The JSON must include:\n"
-                f"1. An overall goal\n"
-                f"2. The number of study days and hours per day\n"
-                f"3. At least 3 core concepts with explanations, importance levels, and related concepts\n"
-                f"4. A daily schedule with focus areas, study items, and timing that matches the days and hours\n"
-                f"5. General tips for effective studying\n"
-            ),
-            expected_output=(
-                "A valid JSON document that strictly follows the template structure. "
-                "It should include all required fields populated with relevant content extracted from the study materials."
-            ),
-            agent=structurer_agent
-        )
+            context += minify_json(simplified_json)
         
-        # Create and run the structuring crew
-        structuring_crew = Crew(
-            agents=[structurer_agent],
-            tasks=[structuring_task],
-            verbose=True,
-            process=Process.sequential
-        )
+        # Prefer provider-enforced JSON schema output; the template prompt is the fallback.
+        # Short keys and positional records keep the (slow) output tokens down.
+        compact = compact_output_enabled()
+        started = time.perf_counter()
+        constrained = await structure_with_schema(context, session_id, compact)
+        if constrained:
+            plan_mode, structured_text = constrained
+        else:
+            plan_mode = TEMPLATE
+            structured_text = await _structure_with_template(context, session_id, compact)
+            if isinstance(structured_text, dict):
+                return structured_text
+        record_structuring_output("compact" if compact else "full", len(structured_text) // 4,
+                                  time.perf_counter() - started)
+        logger.info(f"Successfully generated structured plan ({plan_mode}), output length: {len(structured_text)}")
         
-        # Run the crew and get the result
-        crew_output = structuring_crew.kickoff()
+        # Extract JSON from the agent's response, fenced or surrounded by prose
+        extraction = extract_json(structured_text, expect=dict, source="structure_raw_plan", repair=True)
         
-        if isinstance(crew_output, CrewOutput):
-            # If we got a valid crew output, parse it to get the structured plan
-            structured_text = crew_output.raw
-            logger.info(f"Successfully generated structured plan, output length: {len(structured_text)}")
+        try:
+            # Import the adapter utility for proper transformation
+            from utils.adapter_utils import transform_backend_to_frontend
             
-            # Extract JSON from the agent's response if it's wrapped in markdown code blocks
-            import re
-            json_match = re.search(r'```(?:json)?\s*({[\s\S]*?})\s*```', structured_text)
-            if json_match:
-                structured_text = json_match.group(1)
+            # Parse the structured output as JSON (raises JSONDecodeError if nothing was found)
+            plan_data = extraction.value if extraction else json.loads(structured_text)
+            # Restore the full field names if the model answered in the compact wire format
+            plan_data = expand_compact_plan(plan_data)
+            # Review topics and items come from the local spaced-repetition schedule
+            if isinstance(plan_data, dict):
+                plan_data = schedule_reviews(plan_data)
             
-            try:
-                # Import the adapter utility for proper transformation
-                from utils.adapter_utils import transform_backend_to_frontend
-                
-                # Parse the structured output as JSON
-                plan_data = json.loads(structured_text)
-                
-                # Save the structured data for debugging
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                os.makedirs('test_data', exist_ok=True)
-                with open(f'test_data/structured_input_{timestamp}.json', 'w') as f:
-                    json.dump(plan_data, f, indent=2)
-                
-                # Use the adapter utils to transform the data to frontend format
-                transformed_plan = transform_backend_to_frontend(plan_data)
-                
-                # Save the transformed data for debugging
-                with open(f'test_data/structured_output_{timestamp}.json', 'w') as f:
-                    json.dump(transformed_plan, f, indent=2)
-                
-                logger.info("Successfully transformed plan to frontend format")
-                return transformed_plan
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse structured plan as JSON: {e}")
-                return {
-                    "error": "Could not parse structured plan",
-                    "details": f"JSON parsing error: {str(e)}",
-                    "raw_output": structured_text
-                }
-        else:
-            # Handle the case where we didn't get a valid crew output
-            logger.error(f"Unexpected crew output type: {type(crew_output)}")
+            # Save the structured data for debugging
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            os.makedirs('test_data', exist_ok=True)
+            with open(f'test_data/structured_input_{timestamp}.json', 'w') as f:
+                json.dump(plan_data, f, indent=2)
+            
+            # Use the adapter utils to transform the data to frontend format
+            transformed_plan = transform_backend_to_frontend(plan_data)
+            
+            # Save the transformed data for debugging
+            with open(f'test_data/structured_output_{timestamp}.json', 'w') as f:
+                json.dump(transformed_plan, f, indent=2)
+            
+            logger.info("Successfully transformed plan to frontend format")
+            return transformed_plan
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse structured plan as JSON: {e}")
+            # The client has to request the plan again
+            record_structuring_retry(plan_mode)
             return {
-                "error": "Unexpected output from structuring agent",
-                "details": f"Got {type(crew_output)} instead of CrewOutput"
+                "error": "Could not parse structured plan",
+                "details": f"JSON parsing error: {str(e)}",
+                "raw_output": structured_text
             }
     except Exception as e:
         logger.error(f"Error in structuring raw plan: {e}")
@@ -904,6 +1310,92 @@ async def structure_raw_plan(raw_plan_text: str, simplified_json: Dict[str, Any]
             "details": str(e)
         }
 
+
+async def regenerate_plan_days(plan: Dict[str, Any], edit: PlanEdit, session_id: str = None) -> Any:
+    """
+    Ask the structurer model for only the days an edit adds or changes.
+    
+    The prompt is the fixed instructions, then the stored plan's outline (the same for every
+    edit of that plan, so the provider can cache it), then the change itself. Nothing else
+    of the plan is sent or regenerated.
+    
+    Args:
+        plan: The stored structured plan in backend format
+        edit: The edit from diff_plan_request
+        session_id: Optional session identifier used for fair-share scheduling
+        
+    Returns:
+        The parsed model output (normally ``{"daily_schedule": [...]}``), or None if it held no JSON
+    """
+    messages = [
+        ("system", SCHEMA_STRUCTURING_SYSTEM),
+        ("human", assemble(INCREMENTAL_INSTRUCTIONS, build_plan_context(plan), build_edit_request(plan, edit)))
+    ]
+    model_name = structurer_llm.model_name
+    mode = resolve_mode(model_name)
+    schema_format = response_format(mode, "study_plan_daily_schedule", ("daily_schedule",))
+    model = structurer_llm.bind(response_format=schema_format) if schema_format else structurer_llm
+    try:
+        async with model_scheduler.slot(BATCH, session_id):
+            response = await model.ainvoke(messages)
+    except Exception as e:
+        if mode == TEMPLATE or not is_unsupported_error(e):
+            raise
+        mark_unsupported(model_name, mode, e)
+        return await regenerate_plan_days(plan, edit, session_id)
+    record_structuring_call(mode, prompt_tokens(response, [content for _, content in messages]))
+    record_prompt_cache("incremental", response)
+    logger.info(f"Regenerated days {edit.generate_days} ({mode}), output length: {len(response.content)}")
+    return extract_json_value(response.content, source="incremental", repair=True)
+
+
+async def _structure_with_template(context: str, session_id: str = None, compact: bool = False) -> Any:
+    """
+    Structure the plan with the crew, pasting the JSON template into the task description.
+    
+    Args:
+        context: The plan overview and simplified data to structure
+        session_id: Optional session identifier used for fair-share scheduling
+        compact: Describe the compact short-key wire format instead of pasting the full template
+        
+    Returns:
+        str: The raw crew output, or an error dict if the crew returned something unexpected
+    """
+    # Create the study plan structurer agent and task
+    structurer_agent = create_study_plan_structurer_agent()
+    
+    # Create a task description with the fixed instructions first and the plan last
+    structuring_task = Task(
+        description=assemble(TEMPLATE_STRUCTURING_INSTRUCTIONS[compact], context),
+        expected_output=(
+            "A valid JSON document that strictly follows the template structure. "
+            "It should include all required fields populated with relevant content extracted from the study materials."
+        ),
+        agent=structurer_agent
+    )
+    
+    # Create and run the structuring crew
+    structuring_crew = Crew(
+        agents=[structurer_agent],
+        tasks=[structuring_task],
+        verbose=True,
+        process=Process.sequential
+    )
+    
+    # Run the crew in a worker thread once the scheduler grants a batch slot
+    crew_output = await model_scheduler.run_blocking(structuring_crew.kickoff, priority=BATCH, session_id=session_id)
+    
+    if not isinstance(crew_output, CrewOutput):
+        # Handle the case where we didn't get a valid crew output
+        logger.error(f"Unexpected crew output type: {type(crew_output)}")
+        return {
+            "error": "Unexpected output from structuring agent",
+            "details": f"Got {type(crew_output)} instead of CrewOutput"
+        }
+    record_structuring_call(TEMPLATE, len(structuring_task.description) // 4)
+    record_prompt_cache("structure_raw_plan.template", getattr(crew_output, "token_usage", None))
+    return crew_output.raw
+
 if __name__ == '__main__':
     if not os.getenv("OPENROUTER_API_KEY") or not os.getenv("DEEPSEEK_MODEL_NAME"):
         print("Error: Please set OPENROUTER_API_KEY and DEEPSEEK_MODEL_NAME environment variables")
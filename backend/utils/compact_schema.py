@@ -0,0 +1,194 @@
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Short wire keys for the top-level fields of a StructuredStudyPlan
+PLAN_KEYS: Dict[str, str] = {
+    "g": "overall_goal",
+    "d": "total_study_day",
+    "h": "hour_per_day",
+    "c": "core_concepts",
+    "s": "daily_schedule",
+    "t": "general_tip",
+    "f": "key_formulas",
+    "r": "resources",
+    "a": "assessments",
+    "p": "prerequisites",
+    "l": "difficulty_level",
+    "e": "estimated_completion_time",
+}
+LONG_KEYS: Dict[str, str] = {long: short for short, long in PLAN_KEYS.items()}
+
+# Field order of the positional arrays the model emits instead of objects
+RECORD_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "core_concepts": ("name", "explanation", "importance", "related_concepts", "examples", "difficulty_level"),
+    "daily_schedule": ("day", "focus_area", "summary", "study_item", "learning_goals", "review_topics"),
+    "study_item": ("topic", "description", "duration_minutes", "priority", "learning_objectives", "resource"),
+    "key_formulas": ("name", "formula", "description", "usage_context", "variables", "examples"),
+    "resources": ("title", "type", "url", "description", "relevance"),
+    "assessments": ("name", "description", "type", "topics_covered"),
+}
+
+# Prompt text describing the wire format; positions must match RECORD_FIELDS
+COMPACT_FORMAT = """Respond with ONE JSON object that uses these short keys. Records are positional arrays; use null for an unknown value and omit trailing nulls.
+{"g": overall goal, "d": total study days (integer), "h": hours per day (number),
+ "c": [[name, explanation, importance, [related concepts], [examples], difficulty]],
+ "s": [[day number, focus area, summary, [[topic, description, minutes (integer), priority, [learning objectives], [resource titles]]], [learning goals]]],
+ "t": [general tips],
+ "f": [[name, formula, description, usage context, {variable: meaning}, [examples]]],
+ "r": [[title, type, url, description, relevance]],
+ "a": [[name, description, type, [topics covered]]],
+ "p": [prerequisites], "l": overall difficulty, "e": estimated total hours}"""
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+_NULLABLE_STRING = {"type": ["string", "null"]}
+
+
+def compact_output_enabled() -> bool:
+    """Whether the structurer asks for the compact wire format (COMPACT_PLAN_OUTPUT, on by default)."""
+    return os.getenv("COMPACT_PLAN_OUTPUT", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _record_schema(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"type": "array", "items": {"type": "array", "prefixItems": items, "minItems": 2}}
+
+
+def compact_json_schema() -> Dict[str, Any]:
+    """JSON schema of the compact wire format, for providers that enforce a response schema."""
+    study_item = [
+        {"type": "string"}, {"type": "string"}, {"type": "integer"}, _NULLABLE_STRING, _STRINGS, _STRINGS
+    ]
+    return {
+        "title": "CompactStudyPlan",
+        "type": "object",
+        "properties": {
+            "g": {"type": "string"},
+            "d": {"type": "integer"},
+            "h": {"type": "number"},
+            "c": _record_schema([
+                {"type": "string"}, {"type": "string"}, _NULLABLE_STRING, _STRINGS, _STRINGS, _NULLABLE_STRING
+            ]),
+            "s": _record_schema([
+                {"type": "integer"}, {"type": "string"}, {"type": "string"},
+                _record_schema(study_item), _STRINGS, _STRINGS
+            ]),
+            "t": _STRINGS,
+            "f": _record_schema([
+                {"type": "string"}, {"type": "string"}, {"type": "string"}, _NULLABLE_STRING,
+                {"type": ["object", "null"], "additionalProperties": {"type": "string"}}, _STRINGS
+            ]),
+            "r": _record_schema([{"type": "string"}, {"type": "string"}, _NULLABLE_STRING, {"type": "string"},
+                                 _NULLABLE_STRING]),
+            "a": _record_schema([{"type": "string"}, {"type": "string"}, {"type": "string"}, _STRINGS]),
+            "p": _STRINGS,
+            "l": _NULLABLE_STRING,
+            "e": {"type": ["number", "null"]},
+        },
+        "required": ["g", "d", "h", "c", "s", "t"],
+    }
+
+
+def is_compact(plan: Any) -> bool:
+    """Whether a decoded plan uses the short wire keys rather than the StructuredStudyPlan field names."""
+    if not isinstance(plan, dict) or not plan:
+        return False
+    return not any(key in LONG_KEYS for key in plan) and any(key in PLAN_KEYS for key in plan)
+
+
+def _expand_record(section: str, record: Any) -> Any:
+    """Turn one positional record (or an object the model wrote anyway) into a full object."""
+    fields = RECORD_FIELDS[section]
+    if isinstance(record, list):
+        expanded = dict(zip(fields, record))
+        if len(record) > len(fields):
+            logger.debug(f"Ignoring {len(record) - len(fields)} extra values in a {section} record")
+    elif isinstance(record, dict):
+        expanded = dict(record)
+    else:
+        # Bare strings for records with a leading name, e.g. a resource title
+        return {fields[0]: record} if isinstance(record, str) else record
+
+    if section == "daily_schedule" and isinstance(expanded.get("study_item"), list):
+        expanded["study_item"] = [_expand_record("study_item", item) for item in expanded["study_item"]]
+    if section == "study_item":
+        expanded.setdefault("is_completed", False)
+    return expanded
+
+
+def expand_compact_plan(wire: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Expand a plan in the compact wire format into a StructuredStudyPlan-shaped dict.
+
+    Plans that already use the full field names are returned unchanged, so the
+    caller does not need to know which format the model followed.
+
+    Args:
+        wire: The decoded model output
+
+    Returns:
+        dict: The plan with full field names and objects instead of positional records
+    """
+    if not is_compact(wire):
+        return wire
+
+    plan: Dict[str, Any] = {}
+    for key, value in wire.items():
+        field = PLAN_KEYS.get(key)
+        if field is None:
+            logger.debug(f"Dropping unknown compact plan key {key!r}")
+            continue
+        if field in RECORD_FIELDS and isinstance(value, list):
+            value = [_expand_record(field, record) for record in value]
+        plan[field] = value
+
+    for index, day in enumerate(plan.get("daily_schedule") or []):
+        if isinstance(day, dict):
+            if day.get("day") is None:
+                day["day"] = index + 1
+            day.setdefault("date", None)
+    return plan
+
+
+def _compact_record(section: str, record: Any) -> Any:
+    if not isinstance(record, dict):
+        return record
+    values = []
+    for name in RECORD_FIELDS[section]:
+        value = record.get(name)
+        if name == "study_item" and isinstance(value, list):
+            value = [_compact_record("study_item", item) for item in value]
+        elif name == "resource" and isinstance(value, list):
+            value = [r.get("title") if isinstance(r, dict) else r for r in value]
+        values.append(value)
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def compact_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a StructuredStudyPlan-shaped dict to the compact wire format.
+
+    The inverse of expand_compact_plan, except that study item resources keep
+    only their titles. Used for prompt examples and the output size benchmark.
+
+    Args:
+        plan: A plan with full field names
+
+    Returns:
+        dict: The same plan with short keys and positional records
+    """
+    wire: Dict[str, Any] = {}
+    for field, value in plan.items():
+        key = LONG_KEYS.get(field)
+        if key is None or value is None:
+            continue
+        if field in RECORD_FIELDS and isinstance(value, list):
+            value = [_compact_record(field, record) for record in value]
+        wire[key] = value
+    return wire
+
@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.rescheduler import reschedule_plan
+from utils.structurer_utils import generate_structured_study_plan
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Why a response was built by the regex structurer instead of the model
+SATURATED = "saturated"      # The model scheduler has no free batch slot
+DEADLINE = "deadline"        # The structuring deadline is (nearly) spent
+UNPARSEABLE = "unparseable"  # The model answered, but not with a usable plan
+
+# Time kept back from the deadline for the regex structurer and the response
+DEADLINE_MARGIN_SECONDS = 2.0
+
+
+def degradation_enabled() -> bool:
+    """Whether structuring falls back to the regex structurer under pressure (DEGRADED_STRUCTURING, on by default)."""
+    return os.getenv("DEGRADED_STRUCTURING", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def structuring_deadline_seconds() -> float:
+    """Time a structuring request may take before it is answered degraded (STRUCTURING_DEADLINE_SECONDS, 60 by default)."""
+    return float(os.getenv("STRUCTURING_DEADLINE_SECONDS", "60"))
+
+
+@dataclass
+class Deadline:
+    """The time budget of one request, counted from its creation."""
+    seconds: float
+    started: float = field(default_factory=time.monotonic)
+
+    def remaining(self) -> float:
+        return self.seconds - (time.monotonic() - self.started)
+
+    def model_budget(self) -> float:
+        """Seconds a model call may still take, leaving DEADLINE_MARGIN_SECONDS for the fallback."""
+        return self.remaining() - DEADLINE_MARGIN_SECONDS
+
+    @property
+    def nearly_spent(self) -> bool:
+        return self.model_budget() <= 0
+
+
+def structure_with_regex(raw_plan: str, days: Optional[int] = None, hours_per_day: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Structure a raw markdown plan without a model call, for degraded responses.
+
+    The sections are read by utils.structurer_utils and the study items are then packed
+    into the requested days and hours by the local rescheduler, which also adds the
+    spaced-repetition reviews. Missing constraints are taken from the raw plan.
+
+    Args:
+        raw_plan: The raw study plan text
+        days: Total number of study days (default: the days found in the plan)
+        hours_per_day: Hours per day (default: the plan's average day)
+
+    Returns:
+        dict: The structured plan in frontend format
+    """
+    started = time.perf_counter()
+    plan = generate_structured_study_plan(raw_plan, days or 1, hours_per_day or 1).dict()
+    schedule = plan["daily_schedule"]
+    days = days or len(schedule)
+    if not hours_per_day:
+        minutes = sum(item["duration_minutes"] for day in schedule for item in day["study_item"])
+        hours_per_day = max(round(minutes / len(schedule) / 60 * 4) / 4, 0.25)
+    plan = reschedule_plan(plan, days, hours_per_day)
+    logger.info(f"Structured plan with the regex structurer in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return transform_backend_to_frontend(plan)
@@ -0,0 +1,319 @@
+import io
+import logging
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PyPDF2 import PdfReader
+
+from utils.page_selection import keep_passages, materials_char_budget, score_passages, select_passages, split_passages
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Numbered headings such as "6.1 The Convection Boundary Layers" or "6.1.1The Velocity Boundary Layer",
+# optionally followed by a page number when they are repeated in page headers
+NUMBERED_HEADING = re.compile(r"^(\d{1,2}(?:\.\d{1,2}){1,3})\s*([A-Z][^\n]{2,80}?)(?:\s+\d{1,4})?\s*$", re.MULTILINE)
+MARKDOWN_HEADING = re.compile(r"^(#{1,3})\s+(.{3,80}?)\s*#*\s*$", re.MULTILINE)
+
+# Shortest section text kept when the materials are cut down to the prompt budget
+MIN_SECTION_CHARS = 300
+
+
+@dataclass
+class OutlineEntry:
+    """A section of an extracted document."""
+    title: str
+    level: int              # 1 for top-level sections
+    start_page: int         # 1-based, inclusive
+    end_page: int           # Last page of the section and its subsections
+    start: int              # Offset of the section in the document text
+    end: int                # Offset where the next section of the same or a higher level starts
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class ExtractedDocument:
+    """Text extracted from a file, with the offset of each page and the document outline."""
+    text: str
+    page_offsets: List[int] = field(default_factory=lambda: [0])
+    outline: List[OutlineEntry] = field(default_factory=list)
+    outline_source: Optional[str] = None    # "bookmarks", "headings" or None without an outline
+
+    def page_at(self, offset: int) -> int:
+        """1-based page number of a text offset."""
+        page = 1
+        for index, page_offset in enumerate(self.page_offsets):
+            if page_offset > offset:
+                break
+            page = index + 1
+        return page
+
+
+def _bookmarks(reader: PdfReader) -> List[Tuple[str, int, int]]:
+    """``(title, level, page_index)`` for every bookmark of a PDF, in document order."""
+    entries: List[Tuple[str, int, int]] = []
+
+    def walk(items: List[Any], level: int) -> None:
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                page_index = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            title = " ".join(str(getattr(item, "title", "") or "").split())
+            if title and page_index is not None and page_index >= 0:
+                entries.append((title, level, page_index))
+
+    try:
+        walk(reader.outline, 1)
+    except Exception as e:
+        logger.warning(f"Could not read the PDF outline: {e}")
+        return []
+    return entries
+
+
+def _close_sections(entries: List[OutlineEntry], document: ExtractedDocument) -> List[OutlineEntry]:
+    """Set each section's end offset and end page from the next section of the same or a higher level."""
+    for index, entry in enumerate(entries):
+        entry.end = len(document.text)
+        for following in entries[index + 1:]:
+            if following.level <= entry.level:
+                entry.end = following.start
+                break
+        entry.end_page = max(entry.start_page, document.page_at(max(entry.end - 1, entry.start)))
+    return entries
+
+
+def _bookmark_outline(document: ExtractedDocument, bookmarks: List[Tuple[str, int, int]]) -> List[OutlineEntry]:
+    entries = []
+    for title, level, page_index in bookmarks:
+        if page_index >= len(document.page_offsets):
+            continue
+        page_start = document.page_offsets[page_index]
+        page_end = document.page_offsets[page_index + 1] if page_index + 1 < len(document.page_offsets) else len(document.text)
+        # Start at the heading line when the page shows the title, otherwise at the top of the page
+        found = document.text.lower().find(title[:40].lower(), page_start, page_end)
+        start = found if found >= 0 else page_start
+        entries.append(OutlineEntry(title=title, level=level, start_page=page_index + 1, end_page=page_index + 1,
+                                    start=start, end=start))
+    entries.sort(key=lambda entry: entry.start)
+    return entries
+
+
+def _heading_outline(document: ExtractedDocument) -> List[OutlineEntry]:
+    """Sections from numbered heading lines (first occurrence of each number), else markdown headings."""
+    matches: List[Tuple[int, str, int]] = []
+    seen = set()
+    for match in NUMBERED_HEADING.finditer(document.text):
+        number = match.group(1)
+        if number not in seen:
+            seen.add(number)
+            matches.append((match.start(), f"{number} {match.group(2).strip()}", number.count(".")))
+    if len(matches) < 2:
+        matches = [(match.start(), match.group(2).strip(), len(match.group(1)))
+                   for match in MARKDOWN_HEADING.finditer(document.text)]
+    if len(matches) < 2:
+        return []
+    top_level = min(level for _, _, level in matches)
+    return [
+        OutlineEntry(title=title, level=level - top_level + 1, start_page=document.page_at(start),
+                     end_page=document.page_at(start), start=start, end=start)
+        for start, title, level in matches
+    ]
+
+
+def document_from_pages(pages: List[str], bookmarks: Optional[List[Tuple[str, int, int]]] = None) -> ExtractedDocument:
+    """
+    Join page texts into one document and find its outline.
+
+    Bookmarks are used when there are any; otherwise sections come from heading lines.
+
+    Args:
+        pages: Text of each page, in order
+        bookmarks: ``(title, level, page_index)`` entries from the PDF outline
+
+    Returns:
+        ExtractedDocument: The text (pages separated by newlines), page offsets and outline
+    """
+    offsets, position = [], 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1
+    document = ExtractedDocument(text="\n".join(pages), page_offsets=offsets or [0])
+
+    outline = _bookmark_outline(document, bookmarks) if bookmarks else []
+    source = "bookmarks" if outline else None
+    if not outline:
+        outline = _heading_outline(document)
+        source = "headings" if outline else None
+    document.outline = _close_sections(outline, document)
+    document.outline_source = source
+    return document
+
+
+def read_pdf(source: Union[str, bytes]) -> ExtractedDocument:
+    """
+    Extract a PDF's text page by page, with its outline.
+
+    Args:
+        source: Path of the PDF file or its content
+
+    Returns:
+        ExtractedDocument: The text and the outline from the PDF bookmarks or heading lines
+    """
+    reader = PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    document = document_from_pages(pages, _bookmarks(reader))
+    logger.info(f"Extracted {len(pages)} pages with {len(document.outline)} outline entries ({document.outline_source})")
+    return document
+
+
+def combine_documents(documents: List[ExtractedDocument], separator: str = "\n\n") -> ExtractedDocument:
+    """Concatenate documents (e.g. several uploaded files), shifting their pages and outlines."""
+    combined = ExtractedDocument(text="", page_offsets=[], outline=[])
+    sources = set()
+    for document in documents:
+        if combined.text:
+            combined.text += separator
+        shift, page_shift = len(combined.text), len(combined.page_offsets)
+        combined.text += document.text
+        combined.page_offsets.extend(offset + shift for offset in document.page_offsets)
+        combined.outline.extend(
+            OutlineEntry(title=entry.title, level=entry.level, start_page=entry.start_page + page_shift,
+                         end_page=entry.end_page + page_shift, start=entry.start + shift, end=entry.end + shift)
+            for entry in document.outline
+        )
+        if document.outline_source:
+            sources.add(document.outline_source)
+    combined.page_offsets = combined.page_offsets or [0]
+    combined.outline_source = "bookmarks" if "bookmarks" in sources else next(iter(sources), None)
+    return combined
+
+
+def outline_skeleton(outline: List[Dict[str, Any]]) -> str:
+    """The outline as an indented list with page ranges, e.g. "- 6.1 Boundary Layers (pages 3-5)"."""
+    lines = []
+    for entry in outline:
+        pages = (f"page {entry['start_page']}" if entry["start_page"] == entry["end_page"]
+                 else f"pages {entry['start_page']}-{entry['end_page']}")
+        lines.append(f"{'  ' * (entry['level'] - 1)}- {entry['title']} ({pages})")
+    return "\n".join(lines)
+
+
+def _section_allowances(lengths: np.ndarray, costs: np.ndarray, scores: np.ndarray, budget: int) -> np.ndarray:
+    """
+    Characters of text kept per section, with -1 for sections left out.
+
+    Sections are taken by descending score while their heading cost and floor (MIN_SECTION_CHARS,
+    or the whole text if shorter) still fit in ``budget``. The kept sections then share the
+    rest in proportion to their length, the share found by bisection so the total stays within it.
+    """
+    floors = np.minimum(lengths, MIN_SECTION_CHARS)
+    kept = np.zeros(len(lengths), dtype=bool)
+    remaining = budget
+    for index in np.lexsort((np.arange(len(lengths)), -scores)):
+        if costs[index] + floors[index] <= remaining:
+            kept[index] = True
+            remaining -= costs[index] + floors[index]
+
+    def allowances(share: float) -> np.ndarray:
+        return np.minimum(lengths, np.maximum((lengths * share).astype(int), floors))
+
+    available = budget - costs[kept].sum()
+    low, high = 0.0, 1.0
+    for _ in range(30):
+        middle = (low + high) / 2
+        if allowances(middle)[kept].sum() <= available:
+            low = middle
+        else:
+            high = middle
+    return np.where(kept, allowances(low), -1)
+
+
+def seed_materials(text: str, outline: Optional[List[Dict[str, Any]]], max_chars: Optional[int] = None,
+                   questions_text: Optional[str] = None) -> str:
+    """
+    Notes text for the planner prompt, seeded with the document outline.
+
+    The outline skeleton comes first, then each section's own text under its title and
+    pages. When this is longer than ``max_chars``, what is left of the budget after the
+    skeleton and headings is shared between the sections in proportion to their length
+    (at least MIN_SECTION_CHARS each), filled with their best passages by
+    utils.page_selection. If the floors do not all fit, the lowest-scored sections are
+    left out (they stay in the skeleton). Without an outline, or with one too long for the
+    budget, the best passages of the whole text are kept instead.
+
+    Args:
+        text: The extracted notes text the outline refers to
+        outline: OutlineEntry dicts, as stored with the materials
+        max_chars: Character budget for the seeded text (default: MATERIALS_TOKEN_BUDGET tokens, 0 for no limit)
+        questions_text: Text of the uploaded practice questions, used to rank passages
+
+    Returns:
+        str: The seeded materials text
+    """
+    max_chars = materials_char_budget() if max_chars is None else max_chars
+    if not outline:
+        return select_passages(text, questions_text, max_chars)
+    starts = [min(max(int(entry["start"]), 0), len(text)) for entry in outline] + [len(text)]
+    sections = [(None, 0, starts[0])]
+    for entry, start, end in zip(outline, starts, starts[1:]):
+        # The heading line is already in the title
+        line_end = text.find("\n", start, end)
+        if line_end >= 0 and text[start:end].lstrip().lower().startswith(entry["title"][:20].lower()):
+            start = line_end + 1
+        sections.append((entry, start, end))
+    skeleton = f"Document outline:\n{outline_skeleton(outline)}"
+    headings = [""]
+    for entry, _, _ in sections[1:]:
+        pages = (f"page {entry['start_page']}" if entry["start_page"] == entry["end_page"]
+                 else f"pages {entry['start_page']}-{entry['end_page']}")
+        headings.append(f"{'#' * min(entry['level'] + 2, 6)} {entry['title']} ({pages})\n")
+    bodies = [text[start:end].strip() for _, start, end in sections]
+
+    def seeded_text(texts: List[Optional[str]]) -> str:
+        parts = [skeleton] + [f"{heading}{body}".rstrip() for heading, body in zip(headings, texts)
+                              if body is not None and (heading or body)]
+        return "\n\n".join(parts)
+
+    seeded = seeded_text(bodies)
+    if max_chars <= 0 or len(seeded) <= max_chars:
+        return seeded
+
+    # Each section costs its heading and the blank line before it; the preamble only if it has text
+    costs = np.array([len(heading) + 2 if heading else 2 for heading in headings])
+    budget = max_chars - len(skeleton)
+    if budget < MIN_SECTION_CHARS:
+        logger.info(f"Outline of {len(outline)} sections leaves no room in {max_chars} characters, "
+                    f"selecting passages without it")
+        return select_passages(text, questions_text, max_chars)
+
+    spans = split_passages(text, [offset for _, start, end in sections for offset in (start, end)])
+    passage_scores = score_passages([text[start:end] for start, end in spans], questions_text)
+    span_starts = np.array([start for start, _ in spans])
+    members = [np.flatnonzero((span_starts >= start) & (span_starts < end)) for _, start, end in sections]
+    scores = np.array([passage_scores[section].max() if len(section) else 0.0 for section in members])
+    lengths = np.array([len(body) for body in bodies])
+    allowances = _section_allowances(lengths, costs, scores, budget)
+
+    texts: List[Optional[str]] = []
+    for body, section, allowance in zip(bodies, members, allowances):
+        if allowance < 0:
+            texts.append(None)
+        elif allowance >= len(body):
+            texts.append(body)
+        else:
+            texts.append(keep_passages(text, [spans[index] for index in section], passage_scores[section],
+                                       int(allowance)))
+    seeded = seeded_text(texts)
+    dropped = int((allowances[1:] < 0).sum())
+    logger.info(f"Seeded notes with {len(outline)} outline sections ({dropped} left out), "
+                f"{len(text)} characters cut to {len(seeded)}")
+    return seeded
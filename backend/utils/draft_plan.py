@@ -0,0 +1,272 @@
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.study_plan_models import StructuredStudyPlan
+from utils.adapter_utils import transform_backend_to_frontend
+from utils.formula_detection import detect_formulas
+from utils.plan_rendering import render_overview_markdown, simplified_json_from_plan
+from utils.rescheduler import reschedule_plan
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Numbered headings such as "6.1 The Convection Boundary Layers" or "6.1.1The Velocity Boundary Layer",
+# optionally followed by a page number when they are repeated in page headers
+NUMBERED_HEADING = re.compile(r"^(\d{1,2}(?:\.\d{1,2}){1,3})\s*([A-Z][^\n]{2,80}?)(?:\s+\d{1,4})?\s*$", re.MULTILINE)
+MARKDOWN_HEADING = re.compile(r"^(#{1,3})\s+(.{3,80}?)\s*#*\s*$", re.MULTILINE)
+
+# Headings that are not study topics
+SKIPPED_HEADINGS = {"summary", "references", "problems", "exercises", "bibliography", "index", "contents"}
+
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x08\x0b-\x1f]")
+
+WORD = re.compile(r"[a-z][a-z\-]{3,}")
+STOPWORDS = frozenset("""
+    about above after again also among another because been before being below between both cannot could each
+    either from further have having here however into itself just less many more most much must near only other
+    over same shall should since some such than that their them then there these they this those through thus
+    under until upon very what when where whether which while will with within without would your first second
+    used using given shown figure section chapter equation example problem table case value values note hence
+    therefore consider follows following obtain obtained known form general simply also note results result
+""".split())
+
+MAX_DRAFT_TOPICS = 24
+MAX_DRAFT_CONCEPTS = 8
+MAX_DRAFT_FORMULAS = 6
+KEY_TERMS_PER_TOPIC = 3
+
+DRAFT_TIPS = [
+    "Skim each section's headings before reading it in full.",
+    "Close your notes after each study item and write down what you remember.",
+    "Work at least one practice problem for every topic before moving on.",
+    "Use the review items to revisit earlier topics from memory.",
+]
+
+
+def draft_enabled() -> bool:
+    """Whether /preview builds the local draft plan by default (DRAFT_PLAN, off by default)."""
+    return os.getenv("DRAFT_PLAN", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _normalize(text: str) -> str:
+    """NFKC-normalize extracted text so ligatures such as "ﬁ" become plain letters, and drop control characters."""
+    return CONTROL_CHARACTERS.sub(" ", unicodedata.normalize("NFKC", text))
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def extract_sections(text: str) -> List[Dict[str, Any]]:
+    """
+    Split study material into headed sections, in document order.
+
+    Numbered headings are preferred, then markdown headings. Repeated headings (page headers)
+    keep their first position. Without usable headings the text is split into even chunks.
+
+    Returns:
+        list: ``{"number", "title", "level", "text"}`` dicts; ``level`` is 1 for top-level sections
+    """
+    matches: List[Tuple[int, str, str, int]] = []
+    seen = set()
+    for match in NUMBERED_HEADING.finditer(text):
+        number, title = match.group(1), match.group(2).strip()
+        if number not in seen:
+            seen.add(number)
+            matches.append((match.start(), number, title, number.count(".")))
+    if len(matches) < 2:
+        matches = [(match.start(), "", match.group(2).strip(), len(match.group(1)))
+                   for match in MARKDOWN_HEADING.finditer(text)]
+
+    if len(matches) < 2:
+        paragraphs = [part.strip() for part in re.split(r"\n\s*\n", text) if part.strip()]
+        chunk = max(1, len(paragraphs) // 6)
+        sections = []
+        for start in range(0, len(paragraphs), chunk):
+            body = "\n\n".join(paragraphs[start:start + chunk])
+            terms = [term for term, _ in Counter(_terms(body)).most_common(2)]
+            title = " and ".join(term.capitalize() for term in terms) or f"Part {len(sections) + 1}"
+            sections.append({"number": "", "title": title, "level": 1, "text": body})
+        return sections
+
+    top_level = min(level for _, _, _, level in matches)
+    sections = []
+    for index, (start, number, title, level) in enumerate(matches):
+        end = matches[index + 1][0] if index + 1 < len(matches) else len(text)
+        if title.strip(" :").lower() in SKIPPED_HEADINGS:
+            continue
+        sections.append({"number": number, "title": title.strip(" :"), "level": level - top_level + 1,
+                         "text": text[start:end]})
+    return sections
+
+
+def _first_sentence(text: str, terms: List[str]) -> Optional[str]:
+    """The first readable sentence of a section that mentions one of its key terms."""
+    body = text.split("\n", 1)[1] if "\n" in text else text
+    for sentence in re.split(r"(?<=[.!?])\s+", " ".join(body.split()))[:40]:
+        if 40 <= len(sentence) <= 300 and any(term in sentence.lower() for term in terms):
+            return sentence.strip()
+    return None
+
+
+def build_draft_plan(notes_text: str, days: int, hours_per_day: float,
+                     questions_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a complete structured plan from the study material without a model.
+
+    Topics come from the material's headings (the most detailed level that gives at most
+    MAX_DRAFT_TOPICS), weighted by how much text they cover and how often the practice
+    questions use their key terms. The local rescheduler packs them into the requested
+    days and hours; formulas come from utils.formula_detection.
+
+    Args:
+        notes_text: Text extracted from the notes
+        days: Number of study days
+        hours_per_day: Hours per day
+        questions_text: Text extracted from the practice questions
+
+    Returns:
+        dict: A validated StructuredStudyPlan in backend format
+
+    Raises:
+        ValueError: If no topics can be found in the material
+    """
+    text = _normalize(notes_text or "")
+    sections = extract_sections(text)
+    if not sections:
+        raise ValueError("No topics found in the study material")
+
+    # The deepest heading level that still keeps the plan readable
+    depth = 1
+    while depth < 3 and sum(1 for section in sections if section["level"] <= depth + 1) <= MAX_DRAFT_TOPICS:
+        depth += 1
+    topics: List[Dict[str, Any]] = []
+    for section in sections:
+        if section["level"] <= depth or not topics:
+            topics.append(section)
+        else:
+            # Text under deeper headings belongs to the topic above it
+            topics[-1]["text"] += section["text"]
+    # A section's introduction is studied with its first subsection; the section itself becomes the day's focus
+    for topic, following in zip(topics, topics[1:]):
+        if topic["number"] and following["number"].startswith(topic["number"] + "."):
+            following["parent"] = topic
+            following["text"] = topic["text"] + following["text"]
+            topic["intro"] = True
+
+    document_terms = Counter(_terms(text))
+    question_terms = Counter(_terms(_normalize(questions_text or "")))
+    items: List[Dict[str, Any]] = []
+    weights: List[float] = []
+    schedule: List[Dict[str, Any]] = []
+    concepts: List[Dict[str, Any]] = []
+    block = None
+    for topic in topics:
+        # Each top-level section starts a new source day, the rescheduler regroups them
+        if topic["level"] == 1 or block is None:
+            block = topic
+            schedule.append({"day": len(schedule) + 1, "date": None, "focus_area": topic["title"], "study_item": [],
+                             "summary": f"Study {topic['title']}", "learning_goals": [], "review_topics": []})
+            concepts.append({"name": topic["title"], "explanation": None, "importance": None,
+                             "related_concepts": None, "examples": None, "difficulty_level": None})
+        if topic.get("intro"):
+            continue
+
+        counts = Counter(_terms(topic["text"]))
+        # Terms this topic uses more than the material does on average
+        key_terms = [term for term, _ in sorted(
+            counts.items(), key=lambda pair: pair[1] * pair[1] / document_terms[pair[0]], reverse=True
+        )[:KEY_TERMS_PER_TOPIC]]
+        name = f"{topic['number']} {topic['title']}".strip()
+        children = [section["title"] for section in sections
+                    if section["level"] == topic["level"] + 1 and section["number"].startswith(topic["number"] + ".")]
+        item = {
+            "topic": name,
+            "description": f"Read {name} and work through its examples." + (
+                f" Key terms: {', '.join(key_terms)}." if key_terms else ""),
+            "duration_minutes": 1,
+            "resource": None,
+            "is_completed": False,
+            "learning_objectives": children or [f"Explain {term}" for term in key_terms] or None,
+            "priority": None,
+        }
+        items.append(item)
+        weights.append(len(topic["text"]) * (1 + sum(question_terms[term] for term in key_terms) / 10))
+        schedule[-1]["study_item"].append(item)
+        schedule[-1]["learning_goals"].append(topic["title"])
+        concept = concepts[-1]
+        if concept["explanation"] is None:
+            concept["explanation"] = _first_sentence(topic["text"], key_terms) or f"Covers {', '.join(key_terms) or name}."
+            concept["related_concepts"] = key_terms or None
+
+    # Weights set the starting durations and priorities: top third high, bottom third low
+    total_weight = sum(weights)
+    ranks = sorted(range(len(items)), key=lambda index: weights[index], reverse=True)
+    for rank, index in enumerate(ranks):
+        items[index]["duration_minutes"] = max(1, int(round(days * hours_per_day * 60 * weights[index] / total_weight)))
+        items[index]["priority"] = "high" if rank < len(ranks) / 3 else "medium" if rank < 2 * len(ranks) / 3 else "low"
+    order = {"high": 0, "medium": 1, "low": 2}
+    for day, concept in zip(schedule, concepts):
+        priorities = [item["priority"] for item in day["study_item"]]
+        concept["importance"] = min(priorities, key=order.get) if priorities else None
+    schedule = [day for day in schedule if day["study_item"]]
+    concepts = [concept for concept in concepts if concept["explanation"]]
+
+    titles = [concept["name"] for concept in concepts]
+    plan = {
+        "overall_goal": f"Work through {', '.join(titles[:3])}{' and the remaining sections' if len(titles) > 3 else ''} "
+                        f"in {days} days and practice each topic.",
+        "total_study_day": len(schedule),
+        "hour_per_day": hours_per_day,
+        "core_concepts": concepts[:MAX_DRAFT_CONCEPTS],
+        "daily_schedule": schedule,
+        "general_tip": DRAFT_TIPS,
+        "key_formulas": [formula.as_key_formula() for formula in detect_formulas(text, MAX_DRAFT_FORMULAS)] or None,
+    }
+    return StructuredStudyPlan(**reschedule_plan(plan, days, hours_per_day)).dict()
+
+
+def generate_draft_study_plan(study_materials_text: str, study_duration_days: int, study_hours_per_day: int,
+                              questions_text: str = None) -> Dict[str, Any]:
+    """
+    Build an instant draft plan locally, in the shape of generate_single_pass_study_plan's result.
+
+    Returns:
+        dict: A preview result with ``status``, ``preview_plan``, ``raw_plan``, ``simplified_json``,
+              ``structured_plan`` (frontend format) and ``structuring_path`` ("draft"),
+              or ``status`` "error" if the material has no usable text
+    """
+    started = time.perf_counter()
+    try:
+        structured_plan = build_draft_plan(study_materials_text, study_duration_days, study_hours_per_day,
+                                           questions_text)
+    except ValueError as e:
+        logger.warning(f"Could not build a draft plan: {e}")
+        return {"status": "error", "error": "Could not build a draft plan", "details": str(e)}
+
+    overview_text = render_overview_markdown(structured_plan)
+    simplified_json = simplified_json_from_plan(structured_plan)
+    logger.info(f"Built draft plan with {len(structured_plan['daily_schedule'])} days "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return {
+        "status": "success",
+        "preview_plan": {
+            "overview": overview_text,
+            "overall_goal": simplified_json["overall_goal"],
+            "core_concepts": simplified_json["core_concepts"],
+            "daily_focus": simplified_json["daily_focus"],
+            "key_formulas": simplified_json["key_formulas"],
+            "study_days": study_duration_days,
+            "hours_per_day": study_hours_per_day
+        },
+        "raw_plan": overview_text,
+        "simplified_json": simplified_json,
+        "structured_plan": transform_backend_to_frontend(structured_plan),
+        "structuring_path": "draft"
+    }
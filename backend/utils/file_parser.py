@@ -1,25 +1,30 @@
 import os
 # import textract
-from PyPDF2 import PdfReader
 from fastapi import HTTPException
+from utils.document_outline import ExtractedDocument, document_from_pages, read_pdf
 
 def extract_text_from_file(file_path: str) -> str:
     """
     Extracts text from a given file (PDF, TXT, DOCX).
     """
+    return extract_document_from_file(file_path).text
+
+def extract_document_from_file(file_path: str) -> ExtractedDocument:
+    """
+    Extracts text from a given file (PDF, TXT, DOCX) together with its outline.
+    
+    The outline comes from the PDF bookmarks, or from heading lines in the text,
+    with the page range and text offsets of each section.
+    """
     try:
         _, extension = os.path.splitext(file_path)
         extension = extension.lower()
 
         if extension == ".pdf":
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            return text
+            return read_pdf(file_path)
         elif extension == ".txt":
             with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
+                return document_from_pages([f.read()])
         elif extension == ".docx":
             # textract handles .docx and other formats
             # It might require external dependencies like antiword for .doc or tesseract for images
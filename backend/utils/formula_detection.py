@@ -0,0 +1,266 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Most formulas the detector returns, best scored first
+MAX_FORMULAS = 12
+
+# Minimum score for a span to count as a formula, see _score
+MIN_SCORE = 0.3
+
+# Longest formula kept, in characters; longer spans are prose with an "=" in it
+MAX_FORMULA_LENGTH = 80
+
+GREEK = re.compile(r"[α-ωΑ-Ω]")
+OPERATORS = frozenset("=+-*/^_√∑∫∂∇·×±≈≤≥<>")
+
+# Math delimited as LaTeX: $...$, $$...$$, \(...\) and \[...\]
+LATEX_SPAN = re.compile(r"\$\$(.+?)\$\$|\$([^$\n]+?)\$|\\\((.+?)\\\)|\\\[(.+?)\\\]", re.DOTALL)
+LATEX_COMMAND = re.compile(r"\\([A-Za-z]+)")
+LATEX_FRACTION = re.compile(r"\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}")
+LATEX_SQRT = re.compile(r"\\sqrt\s*\{([^{}]*)\}")
+
+LATEX_SYMBOLS = {
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "epsilon": "ε", "varepsilon": "ε", "zeta": "ζ",
+    "eta": "η", "theta": "θ", "kappa": "κ", "lambda": "λ", "mu": "μ", "nu": "ν", "xi": "ξ", "pi": "π",
+    "rho": "ρ", "sigma": "σ", "tau": "τ", "phi": "φ", "chi": "χ", "psi": "ψ", "omega": "ω",
+    "Gamma": "Γ", "Delta": "Δ", "Theta": "Θ", "Lambda": "Λ", "Pi": "Π", "Sigma": "Σ", "Phi": "Φ", "Omega": "Ω",
+    "cdot": "·", "times": "×", "pm": "±", "approx": "≈", "le": "≤", "leq": "≤", "ge": "≥", "geq": "≥",
+    "infty": "∞", "partial": "∂", "nabla": "∇", "sum": "∑", "int": "∫", "sqrt": "√",
+}
+
+# Dash and multiplication variants that PDF extraction and models use for the same operator
+OPERATOR_VARIANTS = str.maketrans({"−": "-", "–": "-", "∗": "*", "⋅": "·", "∙": "·"})
+
+# A given value rather than a relation: "D = 20 mm", "p = 1 atm", "Ts = 800°C" (but not "2πrL" or "2(a + b)").
+# A number and a unit is a value whatever follows, as PDF extraction glues it to the next word: "700°Cq"1(x*)"
+GIVEN_VALUE = re.compile(
+    r"[-+]?\d[^α-ωΑ-Ω(]*$"
+    r"|[-+]?\d[\d.,]*(?:\s*[×x·*]\s*10\^?[-+]?\d+)?\s*(?:°|%|(?:[kMmμc]?(?:m|g|s|W|J|N|Pa|mol)|K|atm|bar)(?![a-z]))"
+)
+# Text mangled by PDF extraction: "hhhhh", "0.11.5"
+GARBLED = re.compile(r"(\w)\1{2,}|\d\.\d+\.\d")
+# Equation number after the formula: "(6.4)"
+EQUATION_NUMBER = re.compile(r"\s*\((\d+(?:\.\d+)+[a-z]?)\)\s*$")
+# Left-hand side: a symbol such as "q", "Re_x", "h̄", "dT/dx" or "q''"
+LEFT_SIDE = re.compile(r"[A-Za-zα-ωΑ-Ω∂∇Δ][\w,'\"∞/()∂]{0,11}$")
+# Words of prose that end the right-hand side of a formula
+PROSE_WORD = re.compile(r"(?:[A-Za-z]{4,}|for|and|the|is|in|of|at|to|on|as|by|or|are|its|if)[.,;:]?$")
+# Operators left dangling at the end of a span: "Re = ρVL/μ - ratio of ..."
+TRAILING_OPERATOR = re.compile(r"[\s\-–+*/=:,]+$")
+# Text before a formula that names it: "- Reynolds number:" or "**Fourier's law** -"
+NAME_LABEL = re.compile(r"^[\s*\-+•#>]*(?:\*\*)?([A-Za-z][\w'’ ()\-]{2,50}?)(?:\*\*)?\s*[:\-–]\s*$")
+
+
+def formula_annotation_enabled() -> bool:
+    """Whether detected formulas are sent to the model for names and descriptions (ANNOTATE_FORMULAS, on by default)."""
+    return os.getenv("ANNOTATE_FORMULAS", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+@dataclass
+class DetectedFormula:
+    """An equation-like span found in text."""
+    formula: str                    # Normalized formula, e.g. "Re = ρVL/μ"
+    name: str
+    description: str
+    score: float
+    position: int                   # Offset in the text, for document order
+    label: Optional[str] = None     # Name written next to the formula in the text, if any
+
+    def as_key_formula(self) -> Dict[str, Any]:
+        """The formula as a KeyFormula dict."""
+        return {"name": self.name, "formula": self.formula, "description": self.description, "usage_context": None}
+
+
+def _group(term: str) -> str:
+    """A LaTeX argument as a term: parenthesized unless it is a single symbol or number."""
+    term = term.strip()
+    return term if re.fullmatch(r"[\w∞]+", term) else f"({term})"
+
+
+def _latex_to_text(latex: str) -> str:
+    """Plain-text form of a LaTeX fragment: fractions as a/b, commands as their symbols, braces dropped."""
+    previous = None
+    while previous != latex:
+        previous = latex
+        latex = LATEX_FRACTION.sub(lambda match: f"{_group(match.group(1))}/{_group(match.group(2))}", latex)
+        latex = LATEX_SQRT.sub(lambda match: f"√{_group(match.group(1))}", latex)
+    latex = LATEX_COMMAND.sub(lambda match: LATEX_SYMBOLS.get(match.group(1), ""), latex)
+    return latex.replace("{", "").replace("}", "")
+
+
+def normalize_formula(formula: str) -> str:
+    """Canonical spacing and operators: one space around "=", no space inside products and powers."""
+    formula = formula.translate(OPERATOR_VARIANTS)
+    formula = " ".join(formula.split()).strip(" .,;:")
+    formula = re.sub(r"\s*=\s*", " = ", formula)
+    formula = re.sub(r"\s*([\^_/·])\s*", r"\1", formula)
+    return formula
+
+
+def formula_key(formula: str) -> str:
+    """Key under which two spellings of one formula are the same: no spaces or multiplication signs."""
+    return re.sub(r"[\s*·×]", "", normalize_formula(formula))
+
+
+def _score(formula: str, latex: bool) -> float:
+    """
+    How formula-like a span is.
+
+    Operator density (operators per non-space character) plus bonuses for Greek letters
+    and LaTeX, and for a right-hand side that relates symbols instead of giving a value.
+    """
+    characters = formula.replace(" ", "")
+    if not characters:
+        return 0.0
+    density = sum(character in OPERATORS for character in characters) / len(characters)
+    score = density + 0.2 * min(len(GREEK.findall(formula)), 3) + (0.3 if latex else 0.0)
+    left, _, right = formula.partition("=")
+    if right and re.search(r"[A-Za-zα-ωΑ-Ω]", right) and not GIVEN_VALUE.match(right.strip()):
+        score += 0.3
+    return score
+
+
+def _equation_span(line: str):
+    """
+    The equation around the first "=" of a line as ``(start, end)``, or None.
+
+    The left-hand side is the symbol right before "="; the right-hand side runs until a
+    word of prose, a sentence end or a second "=".
+    """
+    equals = line.find("=")
+    if equals <= 0 or line.count("=") > 2:
+        return None
+    left = line[:equals].rstrip()
+    left_match = LEFT_SIDE.search(left)
+    if not left_match or PROSE_WORD.fullmatch(left_match.group()):
+        return None
+    start = left_match.start()
+
+    end = equals + 1
+    tokens = list(re.finditer(r"\S+", line[equals + 1:]))
+    for index, token in enumerate(tokens):
+        word = token.group()
+        if "=" in word or (PROSE_WORD.fullmatch(word) and not GREEK.search(word) and index > 0):
+            break
+        end = equals + 1 + token.end()
+        if word.endswith((".", ";")) and index > 0:
+            break
+    end = start + len(TRAILING_OPERATOR.sub("", line[start:end]))
+    return start, end
+
+
+def _candidates(text: str):
+    """``(position, formula, latex, label, rest)`` for every LaTeX span and equation line."""
+    for match in LATEX_SPAN.finditer(text):
+        body = next(group for group in match.groups() if group is not None)
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        line_end = text.find("\n", match.end())
+        line_end = len(text) if line_end < 0 else line_end
+        yield (match.start(), _latex_to_text(body), True, text[line_start:match.start()],
+               text[match.end():line_end])
+
+    plain = LATEX_SPAN.sub(lambda match: " " * len(match.group()), text)
+    position = 0
+    for line in plain.split("\n"):
+        span = _equation_span(line)
+        if span:
+            yield position + span[0], line[span[0]:span[1]], False, line[:span[0]], line[span[1]:]
+        position += len(line) + 1
+
+
+def _describe(left: str, label: Optional[str], rest: str) -> str:
+    rest = rest.strip(" -–:;,.()")
+    if len(rest.split()) >= 2 and not re.search(r"[=]", rest):
+        return rest[0].upper() + rest[1:] + ("" if rest.endswith(".") else ".")
+    if label:
+        return f"{label}, giving {left}."
+    return f"Relation giving {left}."
+
+
+def detect_formulas(text: str, limit: int = MAX_FORMULAS) -> List[DetectedFormula]:
+    """
+    Find equation-like spans in study material or a raw plan, without a model.
+
+    Candidates are LaTeX fragments and lines with "=" between a symbol and an expression.
+    Each is normalized, scored by operator density, Greek letters and LaTeX, and kept if
+    the score reaches MIN_SCORE and it is not a given value ("D = 20 mm"). Spellings of
+    the same formula are merged, keeping the first one that carries a name.
+
+    Args:
+        text: The text to search
+        limit: Most formulas to return
+
+    Returns:
+        list: DetectedFormula entries in document order, the ``limit`` best scored
+    """
+    found: Dict[str, DetectedFormula] = {}
+    for position, span, latex, before, rest in _candidates(text):
+        number = EQUATION_NUMBER.search(span)
+        formula = normalize_formula(EQUATION_NUMBER.sub("", span))
+        left, equals, right = formula.partition(" = ")
+        if (not equals or not right or len(formula) > MAX_FORMULA_LENGTH or GIVEN_VALUE.match(right)
+                or GARBLED.search(formula)):
+            continue
+        score = _score(formula, latex)
+        if score < MIN_SCORE:
+            continue
+
+        label_match = NAME_LABEL.match(before)
+        label = label_match.group(1).strip() if label_match else None
+        if label:
+            name = label
+        elif number:
+            name = f"Equation {number.group(1)}"
+        else:
+            name = f"Relation for {left}"
+        key = formula_key(formula)
+        existing = found.get(key)
+        if existing is not None and (existing.label or not label):
+            continue
+        found[key] = DetectedFormula(
+            formula=formula, name=name, description=_describe(left, label, rest), score=round(score, 3),
+            position=existing.position if existing else position, label=label
+        )
+
+    best = sorted(found.values(), key=lambda formula: -formula.score)[:limit]
+    return sorted(best, key=lambda formula: formula.position)
+
+
+def merge_annotations(detected: List[DetectedFormula], annotated: Any) -> List[Dict[str, Any]]:
+    """
+    Combine the model's names and descriptions for detected formulas with the formulas themselves.
+
+    Annotations are matched to candidates by formula, then by position. The formula text
+    always comes from the detector; candidates the model left out keep their local name.
+
+    Args:
+        detected: The candidates sent to the model
+        annotated: The model's ``key_formulas`` list (or an object holding it)
+
+    Returns:
+        list: KeyFormula dicts, one per detected formula
+    """
+    if isinstance(annotated, dict):
+        annotated = annotated.get("key_formulas")
+    entries = [entry for entry in annotated or [] if isinstance(entry, dict)]
+    by_key = {formula_key(str(entry.get("formula") or "")): entry for entry in entries}
+
+    merged = []
+    for index, formula in enumerate(detected):
+        entry = by_key.get(formula_key(formula.formula))
+        if entry is None and len(entries) == len(detected):
+            entry = entries[index]
+        key_formula = formula.as_key_formula()
+        if entry:
+            for field in ("name", "description", "usage_context"):
+                if isinstance(entry.get(field), str) and entry[field].strip():
+                    key_formula[field] = entry[field].strip()
+        merged.append(key_formula)
+    return merged
@@ -0,0 +1,175 @@
+import copy
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.plan_validation import find_invalid_elements, splice_elements
+from utils.prompt_assembly import minify_json, static_prefix
+from utils.spaced_repetition import is_review_item, schedule_reviews
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Top-level sections an edit never sends back to the model
+REUSED_SECTIONS = ("overall_goal", "core_concepts", "key_formulas", "general_tip")
+
+INCREMENTAL_INSTRUCTIONS = static_prefix("""You are updating an existing structured study plan. The plan outline comes first, then the change to make.
+    Write ONLY the days listed in the change, as daily_schedule entries with day, focus_area, study_item, summary and learning_goals.
+    Each day's study items must add up to the hours per day given in the change. Build on the topics of the surrounding days and do not repeat days that are not listed.
+    Return a valid JSON object with a single daily_schedule field containing the new days.""")
+
+
+@dataclass
+class PlanEdit:
+    """What changes between a stored plan and a new request for it."""
+    days: int
+    hours_per_day: float
+    # Day numbers (1-based, in the new plan) the model has to write
+    generate_days: List[int] = field(default_factory=list)
+    # Old topic -> new topic, for swapped topics
+    replace_topics: Dict[str, str] = field(default_factory=dict)
+    # True when durations or the day count change without new content, handled by the local rescheduler
+    reschedule: bool = False
+
+    @property
+    def needs_model(self) -> bool:
+        return bool(self.generate_days)
+
+
+def _mentions(day: Dict[str, Any], topic: str) -> bool:
+    """Whether the day's focus area or a study item names the topic as whole words, so "Topic 1" is not "Topic 10"."""
+    pattern = re.compile(rf"(?<!\w){re.escape(topic.strip())}(?!\w|\.\w)", re.IGNORECASE)
+    texts = [day.get("focus_area") or ""] + [item.get("topic") or "" for item in day.get("study_item") or []]
+    return any(pattern.search(text) for text in texts)
+
+
+def diff_plan_request(plan: Dict[str, Any], days: Optional[int] = None, hours_per_day: Optional[float] = None,
+                      replace_topics: Optional[Dict[str, str]] = None) -> PlanEdit:
+    """
+    Work out which days of a stored plan a new request leaves valid.
+
+    Added days and days that mention a swapped topic are regenerated; every other day and
+    the core concepts, formulas and tips are kept. Fewer days or other hours are handled
+    by rescheduling the kept items locally.
+
+    Args:
+        plan: The stored structured plan in backend format
+        days: Requested number of days (default: unchanged)
+        hours_per_day: Requested hours per day (default: unchanged)
+        replace_topics: Old topic -> new topic
+
+    Returns:
+        PlanEdit: The days to generate and whether to reschedule
+
+    Raises:
+        ValueError: If the request is invalid or a swapped topic does not appear in the plan
+    """
+    schedule = plan.get("daily_schedule") or []
+    old_days = len(schedule)
+    old_hours = float(plan.get("hour_per_day") or 0)
+    days = old_days if days is None else days
+    hours_per_day = old_hours if hours_per_day is None else float(hours_per_day)
+    if days < 1 or hours_per_day <= 0:
+        raise ValueError(f"Days and hours per day must be positive, got {days} and {hours_per_day}")
+
+    replace_topics = {old: new for old, new in (replace_topics or {}).items() if old.strip() and new.strip()}
+    edit = PlanEdit(days=days, hours_per_day=hours_per_day, replace_topics=replace_topics)
+    for old_topic in replace_topics:
+        affected = [day_index + 1 for day_index, day in enumerate(schedule[:days]) if _mentions(day, old_topic)]
+        if not affected:
+            raise ValueError(f"Topic '{old_topic}' does not appear in the plan")
+        edit.generate_days.extend(affected)
+    edit.generate_days.extend(range(old_days + 1, days + 1))
+    edit.generate_days = sorted(set(edit.generate_days))
+    edit.reschedule = days < old_days or abs(hours_per_day - old_hours) > 1e-9
+    return edit
+
+
+def build_plan_context(plan: Dict[str, Any]) -> str:
+    """
+    Compact outline of a stored plan for the edit prompt.
+
+    It depends only on the stored plan, so consecutive edits of the same plan send the same
+    prefix and the provider can serve it from its prompt cache.
+    """
+    outline = {
+        "overall_goal": plan.get("overall_goal"),
+        "core_concepts": [concept.get("name") for concept in plan.get("core_concepts") or []],
+        "key_formulas": [formula.get("name") for formula in plan.get("key_formulas") or []],
+        "days": [
+            {"day": day.get("day"), "focus_area": day.get("focus_area"),
+             "topics": [item.get("topic") for item in day.get("study_item") or [] if not is_review_item(item)]}
+            for day in plan.get("daily_schedule") or []
+        ],
+    }
+    return f"Current plan outline:\n{minify_json(outline)}"
+
+
+def build_edit_request(plan: Dict[str, Any], edit: PlanEdit) -> str:
+    """The change to make: which days to write, the swapped topics and the current version of swapped days."""
+    schedule = plan.get("daily_schedule") or []
+    lines = [
+        f"Change: write days {', '.join(str(day) for day in edit.generate_days)} of a {edit.days}-day plan "
+        f"with {edit.hours_per_day:g} hours per day ({int(round(edit.hours_per_day * 60))} minutes of study items per day)."
+    ]
+    for old_topic, new_topic in edit.replace_topics.items():
+        lines.append(f"Replace the topic '{old_topic}' with '{new_topic}' and keep the rest of each day's content.")
+    # Reviews are recomputed locally after the merge, so they are left out
+    rewritten = [
+        dict({key: value for key, value in schedule[day - 1].items() if key != "review_topics"},
+             study_item=[item for item in schedule[day - 1].get("study_item") or [] if not is_review_item(item)])
+        for day in edit.generate_days if day <= len(schedule)
+    ]
+    if rewritten:
+        lines.append(f"Current version of the days to rewrite:\n{minify_json(rewritten)}")
+    return "\n".join(lines)
+
+
+def merge_generated_days(plan: Dict[str, Any], edit: PlanEdit, generated: Any) -> Dict[str, Any]:
+    """
+    Put the regenerated days into a copy of the plan, keeping every other day and section.
+
+    Args:
+        plan: The stored structured plan in backend format
+        edit: The edit the days were generated for
+        generated: The model's ``daily_schedule`` list (or an object holding it)
+
+    Returns:
+        dict: The updated plan with ``total_study_day`` and ``hour_per_day`` set and the reviews recomputed
+
+    Raises:
+        ValueError: If a requested day is missing or invalid in the model output
+    """
+    if isinstance(generated, dict):
+        generated = generated.get("daily_schedule")
+    if not isinstance(generated, list):
+        raise ValueError("The model did not return a daily_schedule list")
+
+    # Study items that fail validation are dropped, a day whose own fields fail is discarded
+    invalid = find_invalid_elements({"daily_schedule": generated})
+    if invalid:
+        logger.warning(f"Dropping {len(invalid)} invalid elements from the regenerated days")
+        generated = splice_elements({"daily_schedule": generated}, {element.path: None for element in invalid})["daily_schedule"]
+
+    # Match by day number, falling back to position for models that renumber from 1
+    by_number = {day.get("day"): day for day in generated if isinstance(day, dict)}
+    if not set(edit.generate_days) <= set(by_number):
+        by_number = dict(zip(edit.generate_days, generated))
+    missing = [day for day in edit.generate_days if not by_number.get(day, {}).get("study_item")]
+    if missing:
+        raise ValueError(f"The model did not return usable entries for days {missing}")
+
+    merged = copy.deepcopy(plan)
+    schedule = merged.get("daily_schedule") or []
+    for day_number in edit.generate_days:
+        day = dict(by_number[day_number], day=day_number)
+        if day_number <= len(schedule):
+            schedule[day_number - 1] = day
+        else:
+            schedule.append(day)
+    merged["daily_schedule"] = schedule
+    merged["total_study_day"] = len(schedule)
+    merged["hour_per_day"] = edit.hours_per_day
+    return schedule_reviews(merged)
@@ -0,0 +1,282 @@
+import json
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.json_repair import repair_json
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extraction strategies, in the order they are tried
+DIRECT = "direct"                # The whole text is JSON
+FENCED = "fenced"                # JSON inside a ``` or ```json code fence
+FIRST_BRACE = "first_brace"      # JSON starting at the first brace, followed by trailing text
+BALANCED_SCAN = "balanced_scan"  # A balanced {...} or [...] span anywhere in the text
+REPAIRED = "repaired"            # Truncated or malformed JSON fixed locally
+
+STRATEGIES = (DIRECT, FENCED, FIRST_BRACE, BALANCED_SCAN, REPAIRED)
+
+FENCE = "```"
+OPENERS = "{["
+CLOSERS = {"{": "}", "[": "]"}
+
+# A JSON string (which cannot contain a raw newline) or a single bracket
+STRUCTURE_TOKEN = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[{}\[\]]')
+
+# What follows the opener of an unclosed bracket that is truncated JSON rather than prose
+TRUNCATED_JSON_STARTS = ('"', "{", "[")
+
+_decoder = json.JSONDecoder()
+
+# (source, strategy) -> number of successful extractions; strategy is None on failure
+_extraction_counts: Counter = Counter()
+# (source, "sent" | "prevented") -> model retries sent, or avoided by local repair
+_retry_counts: Counter = Counter()
+
+
+@dataclass
+class JSONExtraction:
+    """A JSON value found in model output and where it came from."""
+    value: Any
+    strategy: str
+    # Span of the raw text the value was taken from, including any code fence
+    start: int
+    end: int
+    # Repairs applied when strategy is REPAIRED
+    fixes: List[str] = field(default_factory=list)
+
+
+def _expected(value: Any, expect: Optional[type]) -> bool:
+    return expect is None or isinstance(value, expect)
+
+
+def _decode_at(text: str, index: int, expect: Optional[type]) -> Optional[Tuple[Any, int]]:
+    """raw_decode the value starting at ``index``, returning it with its end offset."""
+    try:
+        value, end = _decoder.raw_decode(text, index)
+    except json.JSONDecodeError:
+        return None
+    if not _expected(value, expect):
+        return None
+    return value, end
+
+
+def _first_opener(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    """Index of the first ``{`` or ``[`` in ``text[start:end]``, or -1."""
+    end = len(text) if end is None else end
+    positions = [p for p in (text.find("{", start, end), text.find("[", start, end)) if p != -1]
+    return min(positions) if positions else -1
+
+
+def _find_fence(text: str, start: int) -> int:
+    """Index of the next ``` that starts a line, or -1. JSON strings cannot span lines."""
+    position = text.find(FENCE, start)
+    while position != -1:
+        line_start = text.rfind("\n", 0, position) + 1
+        if not text[line_start:position].strip():
+            return position
+        position = text.find(FENCE, position + len(FENCE))
+    return -1
+
+
+def _try_fenced(text: str, expect: Optional[type]) -> Optional[JSONExtraction]:
+    """Decode the first fenced block whose body starts with a JSON value."""
+    position = _find_fence(text, 0)
+    while position != -1:
+        body_start = text.find("\n", position + len(FENCE))
+        if body_start == -1:
+            return None
+        # Anything between the fence and the newline is the language tag
+        fence_close = _find_fence(text, body_start)
+        body_end = fence_close if fence_close != -1 else len(text)
+        opener = _first_opener(text, body_start, body_end)
+        if opener != -1 and not text[body_start:opener].strip():
+            decoded = _decode_at(text, opener, expect)
+            if decoded:
+                value, value_end = decoded
+                closing = _find_fence(text, value_end)
+                end = closing + len(FENCE) if closing != -1 else len(text)
+                return JSONExtraction(value, FENCED, position, end)
+        if fence_close == -1:
+            return None
+        position = _find_fence(text, fence_close + len(FENCE))
+    return None
+
+
+def balanced_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Find the outermost balanced ``{...}`` and ``[...]`` spans in a single pass.
+
+    Brackets inside JSON strings are ignored. A mismatched closer drops the frames
+    it does not match, and brackets that are never closed (stray braces in prose)
+    do not hide the complete spans nested inside them. Unclosed brackets that
+    open like JSON (followed by a quote or another bracket) are treated as
+    truncated output and their fragments are not returned.
+
+    Args:
+        text: Model output to scan
+
+    Returns:
+        list: ``(start, end)`` offsets of candidate JSON spans, in order of appearance
+    """
+    spans: List[Tuple[int, int]] = []
+    # Each frame is (opener_index, closer_char, complete child spans)
+    stack: List[Tuple[int, str, List[Tuple[int, int]]]] = []
+    open_counts = {"}": 0, "]": 0}
+
+    for token in STRUCTURE_TOKEN.finditer(text):
+        char = token.group()
+        if char in OPENERS:
+            stack.append((token.start(), CLOSERS[char], []))
+            open_counts[CLOSERS[char]] += 1
+        elif char in CLOSERS.values():
+            if not open_counts[char]:
+                continue
+            # Unwind to the frame this closer belongs to, keeping the children of abandoned frames
+            while stack[-1][1] != char:
+                _, closer, orphans = stack.pop()
+                open_counts[closer] -= 1
+                stack[-1][2].extend(orphans)
+            opener, _, _ = stack.pop()
+            open_counts[char] -= 1
+            span = (opener, token.end())
+            if stack:
+                stack[-1][2].append(span)
+            else:
+                spans.append(span)
+
+    # Frames that never closed are either stray braces in prose, whose complete children
+    # are still candidates, or truncated JSON, whose children are fragments of a larger value
+    for opener, _, children in stack:
+        if text[opener + 1:opener + 64].lstrip()[:1] not in TRUNCATED_JSON_STARTS:
+            spans.extend(children)
+    spans.sort()
+    return spans
+
+
+def _try_balanced_scan(text: str, expect: Optional[type]) -> Optional[JSONExtraction]:
+    for start, end in balanced_spans(text):
+        try:
+            value = json.loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+        if _expected(value, expect):
+            return JSONExtraction(value, BALANCED_SCAN, start, end)
+    return None
+
+
+def _try_repair(text: str, expect: Optional[type]) -> Optional[JSONExtraction]:
+    start = _first_opener(text)
+    if start == -1:
+        return None
+    repaired = repair_json(text[start:])
+    if repaired is None or not _expected(repaired[0], expect):
+        return None
+    return JSONExtraction(repaired[0], REPAIRED, start, len(text), repaired[1])
+
+
+def extract_json(text: str, expect: Optional[type] = None, source: str = "unknown",
+                 repair: bool = False) -> Optional[JSONExtraction]:
+    """
+    Extract the first JSON value from model output.
+
+    Strategies are tried from cheapest to most forgiving: the whole text, a code
+    fence, the value starting at the first brace, then a balanced-bracket scan.
+    Every strategy is linear in the length of the text; values are decoded with
+    ``json.JSONDecoder.raw_decode`` so nested objects are never cut short. With
+    ``repair`` set, truncated or malformed JSON is finally repaired locally.
+
+    Args:
+        text: Raw model output
+        expect: Required type of the value (``dict`` or ``list``), or None for either
+        source: Name of the caller, used to attribute extraction metrics
+        repair: Whether to fall back to local repair, for callers that would otherwise retry
+
+    Returns:
+        JSONExtraction: The value, the strategy that found it and its span, or None
+    """
+    if not isinstance(text, str) or not text:
+        _extraction_counts[(source, None)] += 1
+        return None
+
+    extraction = None
+    start = len(text) - len(text.lstrip())
+    tried = -1
+    if start < len(text) and text[start] in OPENERS:
+        # Whole text is JSON, or JSON followed by trailing commentary
+        tried = start
+        decoded = _decode_at(text, start, expect)
+        if decoded:
+            value, end = decoded
+            strategy = DIRECT if not text[end:].strip() else FIRST_BRACE
+            extraction = JSONExtraction(value, strategy, start, end)
+
+    if extraction is None:
+        extraction = _try_fenced(text, expect)
+
+    if extraction is None:
+        opener = _first_opener(text)
+        if opener not in (-1, tried):
+            decoded = _decode_at(text, opener, expect)
+            if decoded:
+                extraction = JSONExtraction(decoded[0], FIRST_BRACE, opener, decoded[1])
+
+    if extraction is None:
+        extraction = _try_balanced_scan(text, expect)
+
+    if extraction is None and repair:
+        extraction = _try_repair(text, expect)
+        if extraction is not None:
+            _retry_counts[(source, "prevented")] += 1
+            logger.info(f"Repaired JSON for {source} locally: {', '.join(sorted(set(extraction.fixes)))}")
+
+    _extraction_counts[(source, extraction.strategy if extraction else None)] += 1
+    if extraction is None:
+        logger.warning(f"No JSON value found for {source} in {len(text)} characters of output")
+    elif extraction.strategy != DIRECT:
+        logger.info(f"Extracted JSON for {source} using the {extraction.strategy} strategy")
+    return extraction
+
+
+def extract_json_value(text: str, expect: Optional[type] = None, source: str = "unknown",
+                       repair: bool = False) -> Any:
+    """
+    Extract the first JSON value from model output.
+
+    Args:
+        text: Raw model output
+        expect: Required type of the value (``dict`` or ``list``), or None for either
+        source: Name of the caller, used to attribute extraction metrics
+        repair: Whether to fall back to local repair, for callers that would otherwise retry
+
+    Returns:
+        The decoded value, or None if no JSON could be found
+    """
+    extraction = extract_json(text, expect=expect, source=source, repair=repair)
+    return extraction.value if extraction else None
+
+
+def record_retry(source: str) -> None:
+    """Count a retry prompt sent to the model because its output could not be used."""
+    _retry_counts[(source, "sent")] += 1
+
+
+def extraction_stats() -> Dict[str, Any]:
+    """
+    Successful extraction strategies and model retries per caller.
+
+    Returns:
+        dict: ``{"strategies": {source: {strategy: count, ..., "failed": count}},
+              "retries": {source: {"sent": count, "prevented": count}}}``
+    """
+    strategies: Dict[str, Dict[str, int]] = {}
+    for (source, strategy), count in sorted(_extraction_counts.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        strategies.setdefault(source, {})[strategy or "failed"] = count
+    retries: Dict[str, Dict[str, int]] = {}
+    for (source, outcome), count in sorted(_retry_counts.items()):
+        retries.setdefault(source, {"sent": 0, "prevented": 0})[outcome] = count
+    return {"strategies": strategies, "retries": retries}
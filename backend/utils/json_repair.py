@@ -0,0 +1,245 @@
+import json
+import logging
+import re
+from typing import Any, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Parser states for the container on top of the stack
+KEY = "key"        # Object expects a key or "}"
+COLON = "colon"    # Object expects ":" after a key
+VALUE = "value"    # Expects a value (or "]" in an empty array)
+AFTER = "after"    # A value just finished, expects "," or the closer
+
+# Python literals models sometimes emit instead of JSON ones
+LITERAL_FIXES = {"True": "true", "False": "false", "None": "null"}
+TOKEN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.+-")
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+# Characters inside a string that need no attention, copied in one step
+STRING_RUN = re.compile(r'[^"\\\x00-\x1f]+')
+WHITESPACE_RUN = re.compile(r'[ \t\r\n]+')
+
+
+class _Frame:
+    """An open object or array while repairing."""
+    __slots__ = ("closer", "state", "last_complete")
+
+    def __init__(self, closer: str, state: str, last_complete: int):
+        self.closer = closer
+        self.state = state
+        # Output length right after the last complete member; rolling back to it drops a partial one
+        self.last_complete = last_complete
+
+
+def _rollback(out: List[str], frame: _Frame, fixes: List[str], reason: str) -> None:
+    removed = "".join(out[frame.last_complete:])
+    del out[frame.last_complete:]
+    if removed.strip():
+        fixes.append(reason)
+
+
+def _prepare_value(out: List[str], frame: _Frame, fixes: List[str]) -> bool:
+    """Make room for a value in ``frame``, inserting a missing comma or colon. False if a key is needed."""
+    if frame.state == AFTER:
+        out.append(",")
+        fixes.append("inserted missing comma")
+        frame.state = KEY if frame.closer == "}" else VALUE
+    if frame.state == COLON:
+        out.append(":")
+        fixes.append("inserted missing colon")
+        frame.state = VALUE
+    return frame.state == VALUE
+
+
+def _finish_value(out: List[str], stack: List[_Frame]) -> None:
+    if stack:
+        stack[-1].state = AFTER
+        stack[-1].last_complete = len(out)
+
+
+def repair_json(text: str) -> Optional[Tuple[Any, List[str]]]:
+    """
+    Repair truncated or slightly malformed JSON from model output.
+
+    Starting at the first ``{`` or ``[``, the text is re-emitted in a single pass
+    with common slips fixed: trailing and doubled commas, missing commas and
+    colons, mismatched closing brackets, raw newlines inside strings and Python
+    ``True``/``False``/``None``. If the output stops early, an unterminated value
+    string is closed, a dangling key or partial number is dropped, the element
+    being written in the innermost array is dropped, and all open containers
+    are closed.
+
+    Args:
+        text: Raw model output containing a JSON object or array
+
+    Returns:
+        tuple: ``(value, fixes)`` with the decoded value and a list of the repairs
+               applied, or None if the text could not be repaired
+    """
+    starts = [p for p in (text.find("{"), text.find("[")) if p != -1]
+    if not starts:
+        return None
+
+    out: List[str] = []
+    fixes: List[str] = []
+    stack: List[_Frame] = []
+    length = len(text)
+    index = min(starts)
+    # Role of the string currently open: KEY or VALUE, or None outside strings
+    string_role = None
+
+    while index < length:
+        char = text[index]
+
+        if string_role is not None:
+            run = STRING_RUN.match(text, index)
+            if run:
+                out.append(run.group())
+                index = run.end()
+                continue
+            if char == "\\":
+                # Keep escape pairs intact; a lone backslash at the very end is dropped
+                if index + 1 < length:
+                    out.append(text[index:index + 2])
+                index += 2
+                continue
+            if char == '"':
+                out.append(char)
+                if string_role == KEY:
+                    stack[-1].state = COLON
+                else:
+                    _finish_value(out, stack)
+                string_role = None
+            elif char in CONTROL_ESCAPES or ord(char) < 0x20:
+                out.append(CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+                fixes.append("escaped control character in string")
+            else:
+                out.append(char)
+            index += 1
+            continue
+
+        frame = stack[-1] if stack else None
+
+        if char in " \t\r\n":
+            run = WHITESPACE_RUN.match(text, index)
+            out.append(run.group())
+            index = run.end()
+            continue
+        elif char == '"':
+            if frame is None:
+                return None
+            if frame.closer == "}" and frame.state in (KEY, AFTER):
+                if frame.state == AFTER:
+                    out.append(",")
+                    fixes.append("inserted missing comma")
+                string_role = KEY
+            elif _prepare_value(out, frame, fixes):
+                string_role = VALUE
+            else:
+                return None
+            out.append(char)
+        elif char in "{[":
+            if frame is not None and not _prepare_value(out, frame, fixes):
+                return None
+            out.append(char)
+            stack.append(_Frame("}" if char == "{" else "]", KEY if char == "{" else VALUE, len(out)))
+        elif char in "}]":
+            if frame is None:
+                return None
+            if not any(open_frame.closer == char for open_frame in stack):
+                fixes.append(f"dropped unmatched {char}")
+            else:
+                while stack[-1].closer != char:
+                    # A closer for an outer container also closes the inner ones
+                    inner = stack.pop()
+                    if inner.state != AFTER:
+                        _rollback(out, inner, fixes, "dropped incomplete member")
+                    out.append(inner.closer)
+                    fixes.append(f"closed {inner.closer} before {char}")
+                    _finish_value(out, stack)
+                frame = stack.pop()
+                if frame.state != AFTER:
+                    _rollback(out, frame, fixes, "removed trailing comma or dangling key")
+                out.append(char)
+                _finish_value(out, stack)
+                if not stack:
+                    break
+        elif char == ":":
+            if frame is not None and frame.state == COLON:
+                frame.state = VALUE
+                out.append(char)
+            else:
+                fixes.append("dropped stray colon")
+        elif char == ",":
+            if frame is not None and frame.state == AFTER:
+                frame.state = KEY if frame.closer == "}" else VALUE
+                out.append(char)
+            else:
+                fixes.append("dropped extra comma")
+        elif char in TOKEN_CHARS:
+            end = index
+            while end < length and text[end] in TOKEN_CHARS:
+                end += 1
+            token = text[index:end]
+            if frame is None:
+                return None
+            if end == length:
+                # Output stopped inside a number or literal, leave it for the truncation handling
+                break
+            if token in LITERAL_FIXES:
+                token = LITERAL_FIXES[token]
+                fixes.append("replaced Python literal")
+            if frame.closer == "}" and frame.state in (KEY, AFTER):
+                if frame.state == AFTER:
+                    out.append(",")
+                    fixes.append("inserted missing comma")
+                out.append(json.dumps(token))
+                fixes.append("quoted bare key")
+                frame.state = COLON
+            elif _prepare_value(out, frame, fixes):
+                try:
+                    json.loads(token)
+                except json.JSONDecodeError:
+                    token = json.dumps(token)
+                    fixes.append("quoted bare value")
+                out.append(token)
+                _finish_value(out, stack)
+            else:
+                return None
+            index = end
+            continue
+        else:
+            fixes.append(f"dropped stray {char!r}")
+        index += 1
+
+    if stack:
+        fixes.append("output was truncated")
+        if string_role == VALUE:
+            out.append('"')
+            fixes.append("closed unterminated string")
+            _finish_value(out, stack)
+        elif string_role == KEY:
+            _rollback(out, stack[-1], fixes, "dropped dangling key")
+
+        # The innermost object that is an array element was cut off part way through
+        for depth in range(len(stack) - 1, 0, -1):
+            if stack[depth].closer == "}" and stack[depth - 1].closer == "]":
+                del stack[depth:]
+                _rollback(out, stack[-1], fixes, "dropped incomplete trailing element")
+                break
+
+        while stack:
+            frame = stack.pop()
+            if frame.state != AFTER:
+                _rollback(out, frame, fixes, "dropped incomplete member")
+            out.append(frame.closer)
+            _finish_value(out, stack)
+
+    try:
+        value = json.loads("".join(out))
+    except json.JSONDecodeError as e:
+        logger.debug(f"JSON repair produced invalid output: {e}")
+        return None
+    return value, fixes
@@ -0,0 +1,197 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from models.study_plan_models import StructuredStudyPlan
+from utils.spaced_repetition import schedule_reviews
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Matches "45", "45 min", "1.5 hours", "2h" and similar time allocation values
+TIME_ALLOCATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes)?\b', re.IGNORECASE)
+
+
+def parse_duration_minutes(value: Any) -> Optional[int]:
+    """
+    Parse a time allocation value from the simplified JSON into minutes.
+
+    Args:
+        value: A number (minutes) or a string such as "45 minutes" or "1.5 hours"
+
+    Returns:
+        The duration in whole minutes, or None if it cannot be parsed
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value)) if value > 0 else None
+    if not isinstance(value, str):
+        return None
+
+    match = TIME_ALLOCATION_PATTERN.search(value)
+    if not match:
+        return None
+    amount = float(match.group(1))
+    unit = (match.group(2) or "min").lower()
+    minutes = amount * 60 if unit.startswith("h") else amount
+    return int(round(minutes)) if minutes > 0 else None
+
+
+def _mapping(value: Any, field: str, day: int) -> Dict[str, Any]:
+    """A per-topic object of a daily_focus entry, or an empty one when it is missing."""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError(f"Day {day} {field} must be an object keyed by topic, got {type(value).__name__}")
+    return value
+
+
+def _allocate_minutes(topics: List[str], time_allocation: Dict[str, Any], day_minutes: Optional[int]) -> List[int]:
+    """Minutes for each topic, spreading any unallocated time evenly."""
+    parsed = [parse_duration_minutes(time_allocation.get(topic)) for topic in topics]
+    known = sum(minutes for minutes in parsed if minutes)
+    missing = [index for index, minutes in enumerate(parsed) if not minutes]
+    if missing:
+        if day_minutes is None:
+            raise ValueError("time_allocation is incomplete and hours per day is unknown")
+        remaining = max(day_minutes - known, 15 * len(missing))
+        share, extra = divmod(remaining, len(missing))
+        for position, index in enumerate(missing):
+            parsed[index] = share + (1 if position < extra else 0)
+    return parsed
+
+
+def structure_from_simplified_json(simplified_json: Dict[str, Any], days: Optional[int] = None,
+                                   hours_per_day: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Map the simplified JSON produced by /preview directly onto a StructuredStudyPlan.
+
+    No model call is made. The mapping is deterministic: each topic in ``daily_focus``
+    becomes a study item whose duration comes from ``time_allocation``, subtopics become
+    learning objectives, and formulas and tips are copied across.
+
+    Args:
+        simplified_json: The simplified JSON block from the preview output
+        days: Requested number of study days (defaults to the number of days in daily_focus)
+        hours_per_day: Requested hours per day (defaults to the allocated time of the first day)
+
+    Returns:
+        dict: The validated structured plan in backend format
+
+    Raises:
+        ValueError: If the simplified JSON is missing required data or fails validation
+    """
+    if not isinstance(simplified_json, dict):
+        raise ValueError("simplified_json must be an object")
+
+    overall_goal = simplified_json.get("overall_goal")
+    daily_focus = simplified_json.get("daily_focus")
+    if not overall_goal or not isinstance(overall_goal, str):
+        raise ValueError("simplified_json has no overall_goal")
+    if not daily_focus or not isinstance(daily_focus, list):
+        raise ValueError("simplified_json has no daily_focus")
+
+    days = days or len(daily_focus)
+    if len(daily_focus) != days:
+        raise ValueError(f"simplified_json covers {len(daily_focus)} days but {days} were requested")
+
+    if hours_per_day is None:
+        if not isinstance(daily_focus[0], dict):
+            raise ValueError("daily_focus entries must be objects")
+        first_allocation = _mapping(daily_focus[0].get("time_allocation"), "time_allocation", 1)
+        allocated = [parse_duration_minutes(value) for value in first_allocation.values()]
+        if not allocated or not all(allocated):
+            raise ValueError("hours per day is unknown and cannot be derived from time_allocation")
+        hours_per_day = round(sum(allocated) / 60, 2)
+    day_minutes = int(round(hours_per_day * 60))
+
+    concept_importance = {}
+    core_concepts = []
+    for concept in simplified_json.get("core_concepts") or []:
+        if not isinstance(concept, dict):
+            raise ValueError("core_concepts entries must be objects")
+        core_concepts.append({
+            "name": concept.get("name"),
+            "explanation": concept.get("explanation"),
+            "importance": concept.get("importance"),
+            "related_concepts": concept.get("related_concepts"),
+            "examples": concept.get("examples"),
+            "difficulty_level": concept.get("difficulty_level"),
+        })
+        if isinstance(concept.get("name"), str) and isinstance(concept.get("importance"), str):
+            concept_importance[concept["name"].lower()] = concept["importance"].lower()
+
+    daily_schedule = []
+    for index, day_focus in enumerate(daily_focus):
+        if not isinstance(day_focus, dict):
+            raise ValueError("daily_focus entries must be objects")
+        focus_area = day_focus.get("focus_area")
+        topics = [topic for topic in day_focus.get("topics") or [] if isinstance(topic, str) and topic.strip()]
+        if not focus_area or not topics:
+            raise ValueError(f"Day {index + 1} has no focus_area or topics")
+
+        subtopics = _mapping(day_focus.get("subtopics"), "subtopics", index + 1)
+        time_allocation = _mapping(day_focus.get("time_allocation"), "time_allocation", index + 1)
+        durations = _allocate_minutes(topics, time_allocation, day_minutes)
+        study_items = []
+        for topic, minutes in zip(topics, durations):
+            topic_subtopics = subtopics.get(topic) or []
+            # A single subtopic is sometimes given as a plain string
+            if isinstance(topic_subtopics, str):
+                topic_subtopics = [topic_subtopics]
+            elif not isinstance(topic_subtopics, list):
+                raise ValueError(f"Subtopics of {topic!r} must be a list")
+            topic_subtopics = [str(subtopic) for subtopic in topic_subtopics]
+            study_items.append({
+                "topic": topic,
+                "description": f"Cover {', '.join(topic_subtopics)}" if topic_subtopics else f"Study {topic}",
+                "duration_minutes": minutes,
+                "resource": None,
+                "is_completed": False,
+                "learning_objectives": topic_subtopics or None,
+                "priority": concept_importance.get(topic.lower()),
+            })
+
+        daily_schedule.append({
+            "day": day_focus.get("day") or index + 1,
+            "date": None,
+            "focus_area": focus_area,
+            "study_item": study_items,
+            "summary": f"{focus_area}: {', '.join(topics)}",
+            "learning_goals": topics,
+            "review_topics": [],
+        })
+
+    study_tips = simplified_json.get("study_tips") or []
+    if isinstance(study_tips, str):
+        study_tips = [study_tips]
+    elif not isinstance(study_tips, list):
+        raise ValueError("study_tips must be a list")
+
+    key_formulas = []
+    for formula in simplified_json.get("key_formulas") or []:
+        if not isinstance(formula, dict):
+            raise ValueError("key_formulas entries must be objects")
+        key_formulas.append({
+            "name": formula.get("name"),
+            "formula": formula.get("formula"),
+            "description": formula.get("description") or formula.get("application"),
+            "usage_context": formula.get("application"),
+        })
+
+    structured_plan = {
+        "overall_goal": overall_goal,
+        "total_study_day": days,
+        "hour_per_day": hours_per_day,
+        "core_concepts": core_concepts,
+        "daily_schedule": daily_schedule,
+        "general_tip": [str(tip) for tip in study_tips],
+        "key_formulas": key_formulas or None,
+    }
+
+    try:
+        return StructuredStudyPlan(**schedule_reviews(structured_plan)).dict()
+    except Exception as validation_error:
+        raise ValueError(f"Local structuring failed validation: {validation_error}") from validation_error
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MATERIALS_STORE_PATH = os.getenv("MATERIALS_STORE_PATH", os.getenv("PLAN_STORE_PATH", "./data/plans.db"))
+
+# zlib level: 6 is the library default, a good ratio at well under a millisecond per 100 KB of notes
+COMPRESSION_LEVEL = 6
+
+# Columns added after the first release, with their definitions, for older database files
+ADDED_COLUMNS = {
+    "outline": "TEXT",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS materials (
+    id TEXT PRIMARY KEY,
+    notes BLOB NOT NULL,
+    questions BLOB,
+    outline TEXT,
+    original_bytes INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_materials (
+    session_id TEXT NOT NULL,
+    materials_id TEXT NOT NULL REFERENCES materials(id) ON DELETE CASCADE,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, materials_id)
+);
+"""
+
+
+def materials_key(notes_text: str, questions_text: Optional[str] = None) -> str:
+    """Content hash identifying a set of extracted materials."""
+    digest = hashlib.sha256(notes_text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((questions_text or "").encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return None if text is None else zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def _decompress(blob: Optional[bytes]) -> Optional[str]:
+    return None if blob is None else zlib.decompress(blob).decode("utf-8")
+
+
+class MaterialsStore:
+    """
+    Compressed SQLite store for the text extracted from uploads.
+
+    Materials are stored once, keyed by a hash of their content, and linked to every
+    session that uploaded them, so chat and planning requests send a materials id
+    (or just their session id) instead of the full text.
+    """
+
+    def __init__(self, path: str = MATERIALS_STORE_PATH):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            path: SQLite database file, or ``":memory:"``
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a database file was created."""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(materials)")}
+        with self._conn:
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE materials ADD COLUMN {name} {definition}")
+
+    def save(self, notes_text: str, questions_text: Optional[str] = None, session_id: Optional[str] = None,
+             outline: Optional[List[Dict[str, Any]]] = None) -> str:
+        """
+        Store extracted materials, or reuse the stored copy of identical ones.
+
+        Args:
+            notes_text: Text extracted from the note files
+            questions_text: Text extracted from the question files
+            session_id: Session the upload belongs to
+            outline: Outline of the notes (utils.document_outline entries), kept for planning prompts
+
+        Returns:
+            str: The materials id
+        """
+        materials_id = materials_key(notes_text, questions_text)
+        now = time.time()
+        with self._lock, self._conn:
+            exists = self._conn.execute("SELECT 1 FROM materials WHERE id = ?", (materials_id,)).fetchone()
+            if not exists:
+                notes_blob = _compress(notes_text)
+                questions_blob = _compress(questions_text)
+                original_bytes = len(notes_text.encode("utf-8")) + len((questions_text or "").encode("utf-8"))
+                stored_bytes = len(notes_blob) + len(questions_blob or b"")
+                self._conn.execute(
+                    "INSERT INTO materials (id, notes, questions, original_bytes, stored_bytes, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (materials_id, notes_blob, questions_blob, original_bytes, stored_bytes, now)
+                )
+                logger.info(f"Stored materials {materials_id}: {original_bytes} bytes compressed to {stored_bytes}")
+            if outline:
+                self._conn.execute("UPDATE materials SET outline = ? WHERE id = ?",
+                                   (json.dumps(outline, separators=(",", ":")), materials_id))
+            if session_id:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO session_materials (session_id, materials_id, created_at) VALUES (?, ?, ?)",
+                    (session_id, materials_id, now)
+                )
+        return materials_id
+
+    def get(self, materials_id: str) -> Optional[Dict[str, Optional[str]]]:
+        """
+        The stored materials.
+
+        Returns:
+            dict: ``{"notes", "questions"}`` (questions may be None), or None if the id is unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT notes, questions FROM materials WHERE id = ?", (materials_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"notes": _decompress(row["notes"]), "questions": _decompress(row["questions"])}
+
+    def get_outline(self, materials_id: str) -> Optional[List[Dict[str, Any]]]:
+        """The outline stored with the notes (``title``, ``level``, pages and text offsets), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT outline FROM materials WHERE id = ?", (materials_id,)).fetchone()
+        return json.loads(row["outline"]) if row and row["outline"] else None
+
+    def latest_for_session(self, session_id: str) -> Optional[str]:
+        """The id of the materials most recently uploaded in a session, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT materials_id FROM session_materials WHERE session_id = ? ORDER BY created_at DESC LIMIT 1",
+                (session_id,)
+            ).fetchone()
+        return row["materials_id"] if row else None
+
+    def resolve_text(self, materials_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[str]:
+        """
+        The combined notes and questions text for a materials id, or for a session's latest upload.
+
+        Returns:
+            str: The text in the "Class Notes / Practice Questions" layout used for planning, or None
+        """
+        materials_id = materials_id or (self.latest_for_session(session_id) if session_id else None)
+        materials = self.get(materials_id) if materials_id else None
+        if materials is None:
+            return None
+        if not materials["questions"]:
+            return materials["notes"]
+        return f"Class Notes:\n{materials['notes']}\n\nPractice Questions:\n{materials['questions']}"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Stored materials and their compression.
+
+        Returns:
+            dict: ``materials``, ``sessions``, ``original_bytes``, ``stored_bytes`` and ``compression_ratio``
+        """
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT COUNT(*) AS materials, COALESCE(SUM(original_bytes), 0) AS original_bytes, "
+                "COALESCE(SUM(stored_bytes), 0) AS stored_bytes FROM materials"
+            ).fetchone()
+            sessions = self._conn.execute("SELECT COUNT(DISTINCT session_id) FROM session_materials").fetchone()[0]
+        stats = dict(totals)
+        stats["sessions"] = sessions
+        stats["compression_ratio"] = (round(stats["stored_bytes"] / stats["original_bytes"], 3)
+                                      if stats["original_bytes"] else 0.0)
+        return stats
+
+
+# Shared store used by the upload, preview, chat and planning routes
+materials_store = MaterialsStore()
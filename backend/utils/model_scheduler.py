@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Priority classes for model execution
+INTERACTIVE = "interactive"  # Chat turns - latency sensitive
+BATCH = "batch"              # Plan generation / structuring - long running
+
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# Number of recent wait samples kept per priority class for percentiles
+WAIT_SAMPLE_SIZE = 500
+
+
+class ModelScheduler:
+    """
+    Priority-aware admission control in front of model execution.
+
+    A fixed number of execution slots is shared between interactive chat and
+    batch plan generation. A share of those slots is reserved for interactive
+    work, so batch jobs can never occupy all of them. When a slot frees up,
+    waiting chat turns are always admitted before batch jobs, and batch jobs
+    are admitted round-robin across sessions so one user's long structuring
+    run cannot starve everyone else.
+    """
+
+    def __init__(self, max_concurrency: int = 4, interactive_reserved: int = 1):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrency: Total number of model calls allowed to run at once
+            interactive_reserved: Slots that only interactive calls may use
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        # Always leave at least one slot usable by batch work
+        self.interactive_reserved = max(0, min(interactive_reserved, self.max_concurrency - 1))
+
+        self._running: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._interactive_waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        # session_id -> queue of waiters, iterated round-robin
+        self._batch_waiters: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+
+        self._admitted: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._total_wait: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._max_wait: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._recent_waits: Dict[str, Deque[float]] = {
+            priority: deque(maxlen=WAIT_SAMPLE_SIZE) for priority in PRIORITIES
+        }
+
+    @property
+    def batch_limit(self) -> int:
+        """Maximum number of batch calls that may run concurrently."""
+        return self.max_concurrency - self.interactive_reserved
+
+    def _total_running(self) -> int:
+        return sum(self._running.values())
+
+    def _can_admit(self, priority: str) -> bool:
+        if self._total_running() >= self.max_concurrency:
+            return False
+        if priority == BATCH and self._running[BATCH] >= self.batch_limit:
+            return False
+        return True
+
+    def _has_waiters(self, priority: str) -> bool:
+        if priority == INTERACTIVE:
+            return bool(self._interactive_waiters)
+        return bool(self._batch_waiters)
+
+    def saturated(self, priority: str = BATCH) -> bool:
+        """Whether a new call of the given priority would have to wait for a slot."""
+        return self._has_waiters(priority) or not self._can_admit(priority)
+
+    def _record_admission(self, priority: str, wait_seconds: float) -> None:
+        self._running[priority] += 1
+        self._admitted[priority] += 1
+        self._total_wait[priority] += wait_seconds
+        self._max_wait[priority] = max(self._max_wait[priority], wait_seconds)
+        self._recent_waits[priority].append(wait_seconds)
+
+    def _next_batch_waiter(self) -> Optional[Tuple[asyncio.Future, float]]:
+        """Pop the next live batch waiter, rotating through sessions."""
+        while self._batch_waiters:
+            session_id, queue = self._batch_waiters.popitem(last=False)
+            while queue:
+                waiter = queue.popleft()
+                if not waiter[0].done():
+                    if queue:
+                        # Session still has work queued, send it to the back of the line
+                        self._batch_waiters[session_id] = queue
+                    return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, interactive first."""
+        while self._interactive_waiters and self._can_admit(INTERACTIVE):
+            future, enqueued_at = self._interactive_waiters.popleft()
+            if future.done():
+                continue
+            self._record_admission(INTERACTIVE, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+        while self._batch_waiters and self._can_admit(BATCH):
+            waiter = self._next_batch_waiter()
+            if waiter is None:
+                break
+            future, enqueued_at = waiter
+            self._record_admission(BATCH, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _remove_waiter(self, priority: str, session_id: str, future: asyncio.Future) -> None:
+        if priority == INTERACTIVE:
+            self._interactive_waiters = deque(w for w in self._interactive_waiters if w[0] is not future)
+            return
+        queue = self._batch_waiters.get(session_id)
+        if queue is None:
+            return
+        remaining = deque(w for w in queue if w[0] is not future)
+        if remaining:
+            self._batch_waiters[session_id] = remaining
+        else:
+            del self._batch_waiters[session_id]
+
+    async def acquire(self, priority: str = BATCH, session_id: Optional[str] = None) -> None:
+        """
+        Wait for an execution slot.
+
+        Args:
+            priority: INTERACTIVE or BATCH
+            session_id: Session the call belongs to, used for batch fair-share
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        if not self._has_waiters(priority) and self._can_admit(priority):
+            self._record_admission(priority, 0.0)
+            return
+
+        session_key = session_id or "anonymous"
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, time.monotonic())
+        if priority == INTERACTIVE:
+            self._interactive_waiters.append(waiter)
+        else:
+            self._batch_waiters.setdefault(session_key, deque()).append(waiter)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted right before cancellation, give it back
+                self.release(priority)
+            else:
+                self._remove_waiter(priority, session_key, future)
+            raise
+
+    def release(self, priority: str = BATCH) -> None:
+        """Return an execution slot and admit the next waiter."""
+        if self._running[priority] > 0:
+            self._running[priority] -= 1
+        else:
+            logger.warning(f"Release called for {priority} with no running calls")
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = BATCH, session_id: Optional[str] = None):
+        """Async context manager that holds an execution slot for its body."""
+        await self.acquire(priority, session_id)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def run_blocking(self, func: Callable[..., Any], *args: Any, priority: str = BATCH,
+                           session_id: Optional[str] = None, **kwargs: Any) -> Any:
+        """
+        Run a blocking model call (e.g. ``Crew.kickoff``) in a worker thread once a slot is free.
+
+        Args:
+            func: The blocking callable to run
+            priority: INTERACTIVE or BATCH
+            session_id: Session the call belongs to
+
+        Returns:
+            Whatever ``func`` returns
+        """
+        async with self.slot(priority, session_id):
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of queue and wait-time metrics per priority class.
+
+        Returns:
+            dict: Slot configuration plus running/waiting counts and wait times in milliseconds
+        """
+        classes = {}
+        for priority in PRIORITIES:
+            samples = sorted(self._recent_waits[priority])
+            admitted = self._admitted[priority]
+            if priority == INTERACTIVE:
+                waiting = sum(1 for future, _ in self._interactive_waiters if not future.done())
+            else:
+                waiting = sum(1 for queue in self._batch_waiters.values() for future, _ in queue if not future.done())
+            classes[priority] = {
+                "running": self._running[priority],
+                "waiting": waiting,
+                "admitted": admitted,
+                "avg_wait_ms": round(1000 * self._total_wait[priority] / admitted, 2) if admitted else 0.0,
+                "p50_wait_ms": round(1000 * samples[len(samples) // 2], 2) if samples else 0.0,
+                "p95_wait_ms": round(1000 * samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2) if samples else 0.0,
+                "max_wait_ms": round(1000 * self._max_wait[priority], 2),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "interactive_reserved": self.interactive_reserved,
+            "batch_sessions_waiting": len(self._batch_waiters),
+            "classes": classes,
+        }
+
+
+# Shared scheduler used by all routes that call the model
+model_scheduler = ModelScheduler(
+    max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", "4")),
+    interactive_reserved=int(os.getenv("MODEL_INTERACTIVE_RESERVED", "1")),
+)
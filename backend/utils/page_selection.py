@@ -0,0 +1,204 @@
+import logging
+import os
+import re
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rough size of a model token in characters of English text
+CHARS_PER_TOKEN = 4
+
+# Target passage length in characters; passages are cut at paragraph, line or sentence breaks
+PASSAGE_CHARS = 1200
+
+# Weight of similarity to the uploaded questions, relative to centrality in the document
+QUESTION_WEIGHT = 1.0
+
+# Marks where passages were left out of the selected text
+GAP_MARKER = "[...]"
+
+WORD = re.compile(r"[a-z][a-z0-9]{2,}")
+
+
+def materials_token_budget() -> int:
+    """Most tokens of notes sent to the planner (MATERIALS_TOKEN_BUDGET, 15000 by default, 0 for no limit)."""
+    return int(os.getenv("MATERIALS_TOKEN_BUDGET", "15000"))
+
+
+def materials_char_budget() -> int:
+    """The materials token budget in characters, 0 for no limit."""
+    return max(materials_token_budget(), 0) * CHARS_PER_TOKEN
+
+
+def split_passages(text: str, boundaries: Sequence[int] = (), size: int = PASSAGE_CHARS) -> List[Tuple[int, int]]:
+    """
+    Split text into passages of about ``size`` characters.
+
+    Passages end at the last paragraph break in the second half of the window, else at a line
+    break, a sentence end or a space, and never cross one of ``boundaries`` (e.g. section starts).
+
+    Returns:
+        list: ``(start, end)`` offsets of the non-blank passages, in order
+    """
+    spans = []
+    start = 0
+    for stop in sorted({offset for offset in boundaries if 0 < offset < len(text)}) + [len(text)]:
+        while stop - start > size:
+            window_start = start + size // 2
+            window = text[window_start:start + size]
+            cut = start + size
+            for separator in ("\n\n", "\n", ". ", " "):
+                index = window.rfind(separator)
+                if index >= 0:
+                    cut = window_start + index + len(separator)
+                    break
+            spans.append((start, cut))
+            start = cut
+        if stop > start:
+            spans.append((start, stop))
+        start = stop
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+
+def _term_weights(documents: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sparse TF-IDF weights of the documents' terms.
+
+    Returns:
+        tuple: ``(rows, columns, weights, vocabulary)``: one entry per distinct term of each
+               document, with log-scaled term frequency times smoothed IDF, rows L2-normalized
+    """
+    tokens = [WORD.findall(document.lower()) for document in documents]
+    row_of_token = np.repeat(np.arange(len(documents)), [len(words) for words in tokens])
+    if not len(row_of_token):
+        empty = np.zeros(0)
+        return empty.astype(int), empty.astype(int), empty, np.zeros(0, dtype=str)
+    vocabulary, column_of_token = np.unique(np.concatenate([np.array(words, dtype=str) for words in tokens if words]),
+                                            return_inverse=True)
+    keys, counts = np.unique(row_of_token * len(vocabulary) + column_of_token, return_counts=True)
+    rows, columns = keys // len(vocabulary), keys % len(vocabulary)
+
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    weights = (1 + np.log(counts)) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(documents)))
+    return rows, columns, weights / norms[rows], vocabulary
+
+
+def score_passages(passages: Sequence[str], questions_text: Optional[str] = None) -> np.ndarray:
+    """
+    Score passages by TF-IDF centrality and, when questions are given, similarity to them.
+
+    Centrality is a passage's mean cosine similarity to every other passage, so passages on
+    the document's main topics rank above front matter, exercises lists and stray pages.
+    Both parts are scaled to a maximum of 1 before they are combined with QUESTION_WEIGHT.
+
+    Args:
+        passages: Passage texts
+        questions_text: Text of the uploaded practice questions
+
+    Returns:
+        np.ndarray: One score per passage, higher is more representative
+    """
+    if len(passages) < 2:
+        return np.ones(len(passages))
+    rows, columns, weights, vocabulary = _term_weights(passages)
+    # Sum of all passage vectors; a passage's similarity to the others is its dot product with it, minus itself
+    total = np.bincount(columns, weights=weights, minlength=len(vocabulary))
+    dot = np.bincount(rows, weights=weights * total[columns], minlength=len(passages))
+    has_terms = np.bincount(rows, minlength=len(passages)) > 0
+    scores = np.where(has_terms, dot - 1, 0.0) / (len(passages) - 1)
+    scores = scores / scores.max() if scores.max() > 0 else scores
+
+    question_words = WORD.findall((questions_text or "").lower())
+    if question_words and len(vocabulary):
+        terms, counts = np.unique(np.array(question_words, dtype=str), return_counts=True)
+        positions = np.searchsorted(vocabulary, terms)
+        known = (positions < len(vocabulary)) & (vocabulary[np.minimum(positions, len(vocabulary) - 1)] == terms)
+        question = np.zeros(len(vocabulary))
+        question[positions[known]] = 1 + np.log(counts[known])
+        similarity = np.bincount(rows, weights=weights * question[columns], minlength=len(passages))
+        if similarity.max() > 0:
+            scores = scores + QUESTION_WEIGHT * similarity / similarity.max()
+    return scores
+
+
+def trim_text(text: str, limit: int) -> str:
+    """The start of a text, cut at a sentence or word boundary and marked with GAP_MARKER."""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < limit // 2:
+        boundary = cut.rfind(" ")
+    return cut[:boundary + 1 if boundary > 0 else limit].rstrip() + f" {GAP_MARKER}"
+
+
+def keep_passages(text: str, spans: Sequence[Tuple[int, int]], scores: Sequence[float], max_chars: int) -> str:
+    """
+    The best scored passages that fit in ``max_chars``, in document order.
+
+    Passages are taken by descending score, skipping any that no longer fit. Left-out runs
+    of passages are replaced with GAP_MARKER; if not even the best passage fits, its start is kept.
+    The result is never longer than ``max_chars``: each passage is charged for its line break and
+    a gap marker after it, and one more marker is set aside for a gap before the first passage.
+    """
+    if not spans:
+        return ""
+    lengths = np.array([end - start for start, end in spans])
+    scores = np.asarray(scores, dtype=float)
+    if lengths.sum() <= max_chars:
+        return text[spans[0][0]:spans[-1][1]].strip()
+
+    marker = len(GAP_MARKER) + 1
+    lengths = lengths + marker + 1
+    kept = np.zeros(len(spans), dtype=bool)
+    remaining = max_chars - marker
+    for index in np.lexsort((np.arange(len(spans)), -scores)):
+        if lengths[index] <= remaining:
+            kept[index] = True
+            remaining -= lengths[index]
+    if not kept.any():
+        best = int(np.argmax(scores))
+        return trim_text(text[spans[best][0]:spans[best][1]].strip(), max(max_chars - marker, 0))
+
+    parts = []
+    for index, (start, end) in enumerate(spans):
+        if kept[index]:
+            parts.append(text[start:end].strip())
+        elif not parts or parts[-1] != GAP_MARKER:
+            parts.append(GAP_MARKER)
+    return "\n".join(parts)
+
+
+def select_passages(text: str, questions_text: Optional[str] = None, max_chars: Optional[int] = None) -> str:
+    """
+    Cut study material down to a character budget by keeping its most representative passages.
+
+    The text is split into passages of about PASSAGE_CHARS, each scored by score_passages,
+    and the best are kept in document order (see keep_passages). Text within the budget is
+    returned unchanged, so small uploads reach the planner as they are.
+
+    Args:
+        text: The extracted notes text
+        questions_text: Text of the uploaded practice questions, used to favour passages on them
+        max_chars: Character budget (default: MATERIALS_TOKEN_BUDGET tokens, 0 for no limit)
+
+    Returns:
+        str: The selected text
+    """
+    max_chars = materials_char_budget() if max_chars is None else max_chars
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    started = time.perf_counter()
+    spans = split_passages(text)
+    selected = keep_passages(text, spans, score_passages([text[start:end] for start, end in spans], questions_text),
+                             max_chars)
+    logger.info(f"Selected passages from {len(spans)}: ~{len(text) // CHARS_PER_TOKEN} tokens cut to "
+                f"~{len(selected) // CHARS_PER_TOKEN} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return selected
@@ -0,0 +1,229 @@
+import copy
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set
+
+from pydantic import TypeAdapter, ValidationError
+
+from models.study_plan_models import FrontendConcept, FrontendDay, FrontendFormula
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Frontend plan field holding the per-day entries
+DAYS_SECTION = "dailyBreakdown"
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+# Validators for each top-level field of a frontend plan; fields not listed are not checked.
+# They run in strict mode: the patched value is stored as sent, so "0" must not pass for a bool
+SECTION_TYPES: Dict[str, TypeAdapter] = {
+    "overallGoal": TypeAdapter(str),
+    "totalStudyDays": TypeAdapter(int),
+    "hoursPerDay": TypeAdapter(float),
+    "keyConcepts": TypeAdapter(List[FrontendConcept]),
+    "generalTips": TypeAdapter(List[str]),
+    "keyFormulas": TypeAdapter(List[FrontendFormula]),
+    DAYS_SECTION: TypeAdapter(List[FrontendDay]),
+}
+DAY_TYPE = TypeAdapter(FrontendDay)
+
+
+class PatchError(ValueError):
+    """A patch operation is malformed, points at nothing, or leaves the plan invalid."""
+
+
+class PatchTestFailed(PatchError):
+    """A ``test`` operation did not match, i.e. the client's copy of the plan is out of date."""
+
+
+@dataclass
+class TouchedRows:
+    """The stored rows a patch reads and writes."""
+    sections: Set[str] = field(default_factory=set)
+    # Indexes into dailyBreakdown, when every operation stays inside single days
+    days: Set[int] = field(default_factory=set)
+    # True when an operation adds, removes or moves whole days, so the list itself changes
+    all_days: bool = False
+
+
+def parse_pointer(path: Any) -> List[str]:
+    """Split a JSON pointer (``/dailyBreakdown/0/items/2/isCompleted``) into unescaped tokens."""
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"Invalid path {path!r}: paths are JSON pointers starting with '/'")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _validate_operation(operation: Any) -> None:
+    if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+        raise PatchError(f"Invalid operation {operation!r}: 'op' must be one of {', '.join(OPERATIONS)}")
+    parse_pointer(operation.get("path"))
+    if operation["op"] in ("move", "copy"):
+        parse_pointer(operation.get("from"))
+    if operation["op"] in ("add", "replace", "test") and "value" not in operation:
+        raise PatchError(f"Operation {operation['op']} on {operation['path']} needs a 'value'")
+
+
+def touched_rows(operations: List[Dict[str, Any]]) -> TouchedRows:
+    """
+    Work out which stored sections and days a list of operations touches.
+
+    Raises:
+        PatchError: If an operation is malformed
+    """
+    touched = TouchedRows()
+    for operation in operations:
+        _validate_operation(operation)
+        pointers = [operation["path"]] + ([operation["from"]] if operation["op"] in ("move", "copy") else [])
+        for pointer in pointers:
+            tokens = parse_pointer(pointer)
+            if tokens[0] != DAYS_SECTION:
+                touched.sections.add(tokens[0])
+            elif len(tokens) == 1 or (len(tokens) == 2 and operation["op"] not in ("replace", "test")):
+                touched.all_days = True
+            elif tokens[1].isdigit():
+                touched.days.add(int(tokens[1]))
+            else:
+                raise PatchError(f"Invalid day index {tokens[1]!r} in {pointer}")
+    return touched
+
+
+def _list_index(container: List[Any], token: str, pointer: str, allow_end: bool = False) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"Invalid list index {token!r} in {pointer}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Index {index} out of range in {pointer}")
+    return index
+
+
+def _resolve(document: Any, tokens: List[str], pointer: str) -> Any:
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise PatchError(f"Path {pointer} does not exist")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_list_index(value, token, pointer)]
+        else:
+            raise PatchError(f"Path {pointer} does not exist")
+    return value
+
+
+def _get(document: Dict[str, Any], pointer: str) -> Any:
+    return _resolve(document, parse_pointer(pointer), pointer)
+
+
+def _add(document: Dict[str, Any], pointer: str, value: Any) -> None:
+    tokens = parse_pointer(pointer)
+    parent = _resolve(document, tokens[:-1], pointer)
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, tokens[-1], pointer, allow_end=True), value)
+    else:
+        raise PatchError(f"Cannot add at {pointer}: parent is not an object or list")
+
+
+def _remove(document: Dict[str, Any], pointer: str) -> Any:
+    tokens = parse_pointer(pointer)
+    parent = _resolve(document, tokens[:-1], pointer)
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise PatchError(f"Path {pointer} does not exist")
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, tokens[-1], pointer))
+    raise PatchError(f"Path {pointer} does not exist")
+
+
+def apply_operations(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> None:
+    """
+    Apply JSON Patch (RFC 6902) operations to ``document`` in place.
+
+    Args:
+        document: The plan, or the part of it that the operations touch
+        operations: ``{"op", "path", ...}`` dicts; ops are add, remove, replace, move, copy and test
+
+    Raises:
+        PatchTestFailed: If a ``test`` operation does not match
+        PatchError: If an operation is malformed or its path does not exist
+    """
+    for operation in operations:
+        op, path = operation["op"], operation["path"]
+        if op == "test":
+            if _get(document, path) != operation["value"]:
+                raise PatchTestFailed(f"Test failed at {path}")
+        elif op == "add":
+            _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(document, path)
+        elif op == "replace":
+            _remove(document, path)
+            _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            if path.startswith(operation["from"] + "/"):
+                raise PatchError(f"Cannot move {operation['from']} into its own child {path}")
+            _add(document, path, _remove(document, operation["from"]))
+        elif op == "copy":
+            _add(document, path, copy.deepcopy(_get(document, operation["from"])))
+
+
+def _errors(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'value'}: {item['msg']}" for item in error.errors()
+    )
+
+
+def validate_section(name: str, value: Any) -> None:
+    """
+    Validate one top-level field of a frontend plan.
+
+    Raises:
+        PatchError: If the value does not match the field's model
+    """
+    adapter = SECTION_TYPES.get(name)
+    if adapter is None:
+        return
+    try:
+        adapter.validate_python(value, strict=True)
+    except ValidationError as e:
+        raise PatchError(f"Invalid {name}: {_errors(e)}")
+
+
+def validate_day(index: int, day: Any) -> None:
+    """
+    Validate one entry of ``dailyBreakdown``.
+
+    Raises:
+        PatchError: If the day does not match FrontendDay
+    """
+    try:
+        DAY_TYPE.validate_python(day, strict=True)
+    except ValidationError as e:
+        raise PatchError(f"Invalid {DAYS_SECTION}/{index}: {_errors(e)}")
+
+
+def parse_etag(header: str) -> int:
+    """
+    Plan version from an ``If-Match`` / ``If-None-Match`` value such as ``"3"`` or ``W/"3"``.
+
+    Raises:
+        PatchError: If the value is not a plan ETag
+    """
+    value = header.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise PatchError(f"Invalid ETag {header!r}")
+    return int(value)
+
+
+def make_etag(version: int) -> str:
+    """ETag header value for a plan version."""
+    return f'"{version}"'
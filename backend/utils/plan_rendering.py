@@ -0,0 +1,126 @@
+import logging
+from typing import Any, Dict, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _bullet(name: Any, text: Any) -> str:
+    if name and text:
+        return f"- **{name}**: {text}"
+    return f"- {name or text}"
+
+
+def render_overview_markdown(plan: Dict[str, Any]) -> str:
+    """
+    Render the markdown overview shown on the preview page from a structured plan.
+
+    The headings follow the planner's own overview (one ``## Day N`` section per
+    day), so the text can also be fed to the section parser and regex structurer.
+
+    Args:
+        plan: A structured plan in backend format
+
+    Returns:
+        str: The overview as markdown
+    """
+    days = plan.get("total_study_day")
+    hours = plan.get("hour_per_day")
+    lines: List[str] = ["# Study Plan Overview", ""]
+    if days and hours:
+        lines += [f"Study Duration: {days} days, {hours:g} hours per day", ""]
+
+    lines += ["## Overall Goal", str(plan.get("overall_goal") or "").strip(), ""]
+
+    concepts = plan.get("core_concepts") or []
+    if concepts:
+        lines.append("## Core Concepts")
+        for concept in concepts:
+            explanation = concept.get("explanation") or ""
+            if concept.get("importance"):
+                explanation = f"{explanation} (importance: {concept['importance']})".strip()
+            lines.append(_bullet(concept.get("name"), explanation))
+        lines.append("")
+
+    for day in plan.get("daily_schedule") or []:
+        lines.append(f"## Day {day.get('day')}: {day.get('focus_area') or ''}".rstrip(": "))
+        lines.append(f"Focus Area: {day.get('focus_area') or ''}")
+        for item in day.get("study_item") or []:
+            minutes = item.get("duration_minutes")
+            timing = f" ({minutes} minutes)" if minutes else ""
+            description = item.get("description")
+            lines.append(f"- {item.get('topic')}{timing}" + (f": {description}" if description else ""))
+            for objective in item.get("learning_objectives") or []:
+                lines.append(f"  - {objective}")
+        if day.get("summary"):
+            lines.append(f"Summary: {day['summary']}")
+        if day.get("review_topics"):
+            lines.append(f"Review: {', '.join(day['review_topics'])}")
+        lines.append("")
+
+    formulas = plan.get("key_formulas") or []
+    if formulas:
+        lines.append("## Key Formulas")
+        for formula in formulas:
+            text = f"`{formula.get('formula')}`" if formula.get("formula") else ""
+            if formula.get("description"):
+                text = f"{text} - {formula['description']}" if text else formula["description"]
+            lines.append(_bullet(formula.get("name"), text))
+        lines.append("")
+
+    tips = plan.get("general_tip") or []
+    if tips:
+        lines.append("## Study Tips")
+        lines += [f"- {tip}" for tip in tips]
+        lines.append("")
+
+    return "\n".join(lines).strip() + "\n"
+
+
+def simplified_json_from_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the preview's simplified JSON from a structured plan.
+
+    The result maps back onto the same plan through
+    ``local_structurer.structure_from_simplified_json``, so a client that still posts
+    it to /plan/structure-plan is served locally without another model call.
+
+    Args:
+        plan: A structured plan in backend format
+
+    Returns:
+        dict: ``overall_goal``, ``core_concepts``, ``daily_focus``, ``key_formulas`` and ``study_tips``
+    """
+    daily_focus = []
+    for index, day in enumerate(plan.get("daily_schedule") or []):
+        items = [item for item in day.get("study_item") or [] if item.get("topic")]
+        daily_focus.append({
+            "day": day.get("day") or index + 1,
+            "focus_area": day.get("focus_area"),
+            "topics": [item["topic"] for item in items],
+            "subtopics": {item["topic"]: item["learning_objectives"] for item in items if item.get("learning_objectives")},
+            "time_allocation": {item["topic"]: f"{item['duration_minutes']} minutes"
+                                for item in items if item.get("duration_minutes")},
+        })
+
+    return {
+        "overall_goal": plan.get("overall_goal"),
+        "core_concepts": [
+            {key: concept.get(key) for key in
+             ("name", "explanation", "importance", "related_concepts", "examples", "difficulty_level")
+             if concept.get(key) is not None}
+            for concept in plan.get("core_concepts") or []
+        ],
+        "daily_focus": daily_focus,
+        "key_formulas": [
+            {
+                "name": formula.get("name"),
+                "formula": formula.get("formula"),
+                "description": formula.get("description"),
+                "application": formula.get("usage_context"),
+            }
+            for formula in plan.get("key_formulas") or []
+        ],
+        "study_tips": list(plan.get("general_tip") or []),
+    }
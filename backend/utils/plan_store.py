@@ -0,0 +1,410 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from utils.plan_patch import (
+    DAYS_SECTION, PatchError, apply_operations, touched_rows, validate_day, validate_section
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", "./data/plans.db")
+
+# Columns added after the first release, with their definitions, for older database files
+ADDED_COLUMNS = {
+    "materials_id": "TEXT",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    materials_id TEXT,
+    study_days INTEGER,
+    hours_per_day REAL,
+    raw_plan TEXT,
+    simplified_json TEXT,
+    preview_plan TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plan_sections (
+    plan_id TEXT NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (plan_id, name)
+);
+CREATE TABLE IF NOT EXISTS plan_days (
+    plan_id TEXT NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    day INTEGER NOT NULL,
+    focus_area TEXT,
+    content TEXT NOT NULL,
+    PRIMARY KEY (plan_id, day)
+);
+CREATE TABLE IF NOT EXISTS plan_changes (
+    plan_id TEXT NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    operations TEXT,
+    PRIMARY KEY (plan_id, version)
+);
+"""
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _loads(text: Optional[str]) -> Any:
+    return None if text is None else json.loads(text)
+
+
+class VersionConflict(Exception):
+    """The client's plan version (ETag) is not the stored one."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Plan is at version {current_version}")
+        self.current_version = current_version
+
+
+class PlanStore:
+    """
+    SQLite store for generated plans, so clients pass a plan id instead of resending its text.
+
+    A plan row keeps what /preview produced (raw plan, simplified JSON, preview). The
+    structured plan is stored in the frontend format split by top-level field, with
+    ``dailyBreakdown`` stored one row per day, so a single day or section can be read
+    without loading the rest of the plan.
+    """
+
+    def __init__(self, path: str = PLAN_STORE_PATH):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            path: SQLite database file, or ``":memory:"``
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a database file was created."""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(plans)")}
+        with self._conn:
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE plans ADD COLUMN {name} {definition}")
+
+    def create(self, raw_plan: Optional[str] = None, simplified_json: Optional[Dict[str, Any]] = None,
+               preview_plan: Optional[Dict[str, Any]] = None, structured_plan: Optional[Dict[str, Any]] = None,
+               study_days: Optional[int] = None, hours_per_day: Optional[float] = None,
+               session_id: Optional[str] = None, materials_id: Optional[str] = None) -> str:
+        """
+        Store a new plan.
+
+        Args:
+            raw_plan: The planner's overview text
+            simplified_json: The preview's simplified JSON
+            preview_plan: The preview payload shown on the preview page
+            structured_plan: The structured plan in frontend format, if it already exists
+            study_days: Requested number of study days
+            hours_per_day: Requested hours per day
+            session_id: Session that generated the plan
+            materials_id: Stored materials the plan was generated from
+
+        Returns:
+            str: The new plan id
+        """
+        plan_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO plans (id, session_id, materials_id, study_days, hours_per_day, raw_plan, "
+                "simplified_json, preview_plan, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (plan_id, session_id, materials_id, study_days, hours_per_day, raw_plan, _dumps(simplified_json),
+                 _dumps(preview_plan), now, now)
+            )
+            if structured_plan:
+                self._write_structured(plan_id, structured_plan)
+        logger.info(f"Stored plan {plan_id}")
+        return plan_id
+
+    def get(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The plan's preview data and request parameters (without the structured plan).
+
+        Returns:
+            dict: ``id``, ``session_id``, ``materials_id``, ``study_days``, ``hours_per_day``, ``raw_plan``,
+                  ``simplified_json``, ``preview_plan``, ``version``, ``created_at``, ``updated_at``; None if unknown
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        if row is None:
+            return None
+        plan = dict(row)
+        plan["simplified_json"] = _loads(plan["simplified_json"])
+        plan["preview_plan"] = _loads(plan["preview_plan"])
+        return plan
+
+    def _write_structured(self, plan_id: str, structured_plan: Dict[str, Any]) -> None:
+        self._conn.execute("DELETE FROM plan_sections WHERE plan_id = ?", (plan_id,))
+        self._conn.executemany(
+            "INSERT INTO plan_sections (plan_id, name, content) VALUES (?, ?, ?)",
+            [(plan_id, name, _dumps(value)) for name, value in structured_plan.items()
+             if name != DAYS_SECTION and value is not None]
+        )
+        self._write_structured_days(plan_id, structured_plan.get(DAYS_SECTION) or [])
+
+    def _bump_version(self, plan_id: str, operations: Optional[List[Dict[str, Any]]]) -> Optional[int]:
+        """Increment the plan version and log the change; None operations mark a full rewrite."""
+        updated = self._conn.execute(
+            "UPDATE plans SET version = version + 1, updated_at = ? WHERE id = ?", (time.time(), plan_id)
+        ).rowcount
+        if not updated:
+            return None
+        version = self._conn.execute("SELECT version FROM plans WHERE id = ?", (plan_id,)).fetchone()["version"]
+        self._conn.execute(
+            "INSERT INTO plan_changes (plan_id, version, operations) VALUES (?, ?, ?)",
+            (plan_id, version, _dumps(operations))
+        )
+        return version
+
+    def save_structured_plan(self, plan_id: str, structured_plan: Dict[str, Any], study_days: Optional[int] = None,
+                             hours_per_day: Optional[float] = None, expected_version: Optional[int] = None) -> bool:
+        """
+        Store (or replace) the structured plan of an existing plan.
+
+        Args:
+            plan_id: The plan id
+            structured_plan: The structured plan in frontend format
+            study_days: New number of study days, if it changed
+            hours_per_day: New hours per day, if it changed
+            expected_version: The version the new plan was derived from, or None to skip the check
+
+        Returns:
+            bool: False if the plan id is unknown
+
+        Raises:
+            VersionConflict: If ``expected_version`` is not the stored version
+        """
+        with self._lock, self._conn:
+            if expected_version is not None:
+                row = self._conn.execute("SELECT version FROM plans WHERE id = ?", (plan_id,)).fetchone()
+                if row is not None and row["version"] != expected_version:
+                    raise VersionConflict(row["version"])
+            version = self._bump_version(plan_id, None)
+            if version is not None:
+                self._write_structured(plan_id, structured_plan)
+                if study_days is not None or hours_per_day is not None:
+                    self._conn.execute(
+                        "UPDATE plans SET study_days = COALESCE(?, study_days), "
+                        "hours_per_day = COALESCE(?, hours_per_day) WHERE id = ?",
+                        (study_days, hours_per_day, plan_id)
+                    )
+        return version is not None
+
+    def _load_touched(self, plan_id: str, touched: Any) -> Dict[str, Any]:
+        """The sections and days a patch touches, with each partial day keyed by its list index."""
+        document: Dict[str, Any] = {}
+        for name in touched.sections:
+            row = self._conn.execute(
+                "SELECT content FROM plan_sections WHERE plan_id = ? AND name = ?", (plan_id, name)
+            ).fetchone()
+            if row is not None:
+                document[name] = _loads(row["content"])
+        if touched.all_days:
+            rows = self._conn.execute(
+                "SELECT content FROM plan_days WHERE plan_id = ? ORDER BY day", (plan_id,)
+            ).fetchall()
+            document[DAYS_SECTION] = [_loads(row["content"]) for row in rows]
+        elif touched.days:
+            document[DAYS_SECTION] = {}
+            for index in sorted(touched.days):
+                row = self._conn.execute(
+                    "SELECT content FROM plan_days WHERE plan_id = ? ORDER BY day LIMIT 1 OFFSET ?", (plan_id, index)
+                ).fetchone()
+                if row is not None:
+                    document[DAYS_SECTION][str(index)] = _loads(row["content"])
+        return document
+
+    def patch_structured_plan(self, plan_id: str, operations: List[Dict[str, Any]],
+                              expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Apply JSON Patch operations to a stored structured plan.
+
+        Only the sections and days the operations point at are read, validated and
+        written back; operations that add, remove or move whole days rewrite the day list.
+
+        Args:
+            plan_id: The plan id
+            operations: RFC 6902 operations with paths into the frontend plan,
+                        e.g. ``/dailyBreakdown/0/items/2/isCompleted``
+            expected_version: The version the client patched against (from If-Match), or None to skip the check
+
+        Returns:
+            dict: ``{"version", "changed"}`` with the new version and the pointers of the rewritten
+                  sections and days, or None if the plan id is unknown
+
+        Raises:
+            VersionConflict: If ``expected_version`` is not the stored version
+            PatchError: If an operation fails or leaves a touched part invalid
+        """
+        touched = touched_rows(operations)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT version FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is None:
+                return None
+            if expected_version is not None and expected_version != row["version"]:
+                raise VersionConflict(row["version"])
+
+            document = self._load_touched(plan_id, touched)
+            old_days = {index: day.get("day") for index, day in document.get(DAYS_SECTION, {}).items()} \
+                if isinstance(document.get(DAYS_SECTION), dict) else {}
+            apply_operations(document, operations)
+
+            changed = []
+            for name in sorted(touched.sections):
+                if name in document:
+                    validate_section(name, document[name])
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO plan_sections (plan_id, name, content) VALUES (?, ?, ?)",
+                        (plan_id, name, _dumps(document[name]))
+                    )
+                else:
+                    self._conn.execute("DELETE FROM plan_sections WHERE plan_id = ? AND name = ?", (plan_id, name))
+                changed.append(f"/{name}")
+
+            days = document.get(DAYS_SECTION)
+            try:
+                if touched.all_days:
+                    validate_section(DAYS_SECTION, days)
+                    if len({day["day"] for day in days}) != len(days):
+                        raise sqlite3.IntegrityError("duplicate day numbers")
+                    self._write_structured_days(plan_id, days)
+                    changed.append(f"/{DAYS_SECTION}")
+                elif isinstance(days, dict):
+                    for index, day in sorted(days.items(), key=lambda item: int(item[0])):
+                        validate_day(int(index), day)
+                        self._conn.execute(
+                            "UPDATE plan_days SET day = ?, focus_area = ?, content = ? WHERE plan_id = ? AND day = ?",
+                            (day["day"], day.get("focusArea"), _dumps(day), plan_id, old_days[index])
+                        )
+                        changed.append(f"/{DAYS_SECTION}/{index}")
+            except sqlite3.IntegrityError:
+                raise PatchError("Two days of the plan would have the same day number")
+
+            version = self._bump_version(plan_id, operations)
+        return {"version": version, "changed": changed}
+
+    def _write_structured_days(self, plan_id: str, days: List[Dict[str, Any]]) -> None:
+        """Replace the plan's day rows; days are renumbered by position if any number is missing or repeated."""
+        numbers = [day.get("day") for day in days]
+        if not all(isinstance(number, int) and number > 0 for number in numbers) or len(set(numbers)) != len(days):
+            logger.warning(f"Plan {plan_id} has missing or repeated day numbers {numbers}, renumbering its days")
+            days = [dict(day, day=index + 1) for index, day in enumerate(days)]
+        self._conn.execute("DELETE FROM plan_days WHERE plan_id = ?", (plan_id,))
+        self._conn.executemany(
+            "INSERT INTO plan_days (plan_id, day, focus_area, content) VALUES (?, ?, ?, ?)",
+            [(plan_id, day["day"], day.get("focusArea"), _dumps(day)) for day in days]
+        )
+
+    def changes_since(self, plan_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """
+        The patch operations that take a client's copy from ``version`` to the current one.
+
+        Returns:
+            dict: ``{"version", "operations", "reset"}``; ``reset`` is True (and operations empty)
+                  when the plan was rewritten since, so the client has to fetch it again.
+                  None if the plan id is unknown
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is None:
+                return None
+            changes = self._conn.execute(
+                "SELECT version, operations FROM plan_changes WHERE plan_id = ? AND version > ? ORDER BY version",
+                (plan_id, version)
+            ).fetchall()
+        current = row["version"]
+        complete = version <= current and len(changes) == current - version
+        if not complete or any(change["operations"] is None for change in changes):
+            return {"version": current, "operations": [], "reset": True}
+        operations = [operation for change in changes for operation in _loads(change["operations"])]
+        return {"version": current, "operations": operations, "reset": False}
+
+    def get_structured_plan(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """The full structured plan in frontend format, or None if it has not been structured yet."""
+        with self._lock:
+            sections = self._conn.execute(
+                "SELECT name, content FROM plan_sections WHERE plan_id = ?", (plan_id,)
+            ).fetchall()
+            days = self._conn.execute(
+                "SELECT content FROM plan_days WHERE plan_id = ? ORDER BY day", (plan_id,)
+            ).fetchall()
+        if not sections and not days:
+            return None
+        plan = {row["name"]: _loads(row["content"]) for row in sections}
+        plan[DAYS_SECTION] = [_loads(row["content"]) for row in days]
+        return plan
+
+    def get_section(self, plan_id: str, name: str) -> Optional[Any]:
+        """One top-level field of the structured plan (``dailyBreakdown`` is assembled from the day rows)."""
+        if name == DAYS_SECTION:
+            plan = self.get_structured_plan(plan_id)
+            return plan[DAYS_SECTION] if plan else None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM plan_sections WHERE plan_id = ? AND name = ?", (plan_id, name)
+            ).fetchone()
+        return _loads(row["content"]) if row else None
+
+    def get_day(self, plan_id: str, day: int) -> Optional[Dict[str, Any]]:
+        """One entry of the structured plan's ``dailyBreakdown`` by day number."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM plan_days WHERE plan_id = ? AND day = ?", (plan_id, day)
+            ).fetchone()
+        return _loads(row["content"]) if row else None
+
+    def outline(self, plan_id: str) -> Dict[str, Any]:
+        """
+        What the structured plan contains, without its content.
+
+        Returns:
+            dict: ``sections`` (stored top-level field names) and ``days`` (``{"day", "focusArea"}`` per day)
+        """
+        with self._lock:
+            sections = self._conn.execute(
+                "SELECT name FROM plan_sections WHERE plan_id = ? ORDER BY name", (plan_id,)
+            ).fetchall()
+            days = self._conn.execute(
+                "SELECT day, focus_area FROM plan_days WHERE plan_id = ? ORDER BY day", (plan_id,)
+            ).fetchall()
+        names: List[str] = [row["name"] for row in sections]
+        if days:
+            names.append(DAYS_SECTION)
+        return {
+            "sections": names,
+            "days": [{"day": row["day"], "focusArea": row["focus_area"]} for row in days],
+        }
+
+
+# Shared store used by the upload, preview, structuring and plan routes
+plan_store = PlanStore()
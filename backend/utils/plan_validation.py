@@ -0,0 +1,156 @@
+import copy
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from models.study_plan_models import (
+    Assessment, CoreConcept, DailySchedule, KeyFormula, LearningResource, StudyItem
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# List sections of a StructuredStudyPlan that are validated element by element
+SECTION_MODELS: Dict[str, Type[BaseModel]] = {
+    "core_concepts": CoreConcept,
+    "daily_schedule": DailySchedule,
+    "key_formulas": KeyFormula,
+    "resources": LearningResource,
+    "assessments": Assessment,
+}
+
+
+@dataclass
+class InvalidElement:
+    """One element of a plan that failed validation and where it lives."""
+    # e.g. ("core_concepts", 3) or ("daily_schedule", 1, "study_item", 0)
+    path: Tuple[Any, ...]
+    model: Type[BaseModel]
+    element: Any
+    errors: str
+    # Short description of where the element sits, for the regeneration prompt
+    context: str = ""
+
+
+def _validation_errors(model: Type[BaseModel], element: Any) -> Optional[str]:
+    """Compact validation errors for ``element`` against ``model``, or None if it is valid."""
+    if not isinstance(element, dict):
+        return f"expected an object, got {type(element).__name__}"
+    try:
+        model(**element)
+    except ValidationError as e:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'value'}: {error['msg']}" for error in e.errors()
+        )
+    return None
+
+
+def _invalid_day_parts(index: int, day: Dict[str, Any]) -> List[InvalidElement]:
+    """Invalid study items of a day, or the whole day if its own fields are broken."""
+    items = day.get("study_item")
+    context = f"day {day.get('day', index + 1)} of a study plan, focus area: {day.get('focus_area', 'unknown')}"
+    bad_items = []
+    if isinstance(items, list):
+        for item_index, item in enumerate(items):
+            errors = _validation_errors(StudyItem, item)
+            if errors:
+                bad_items.append(InvalidElement(
+                    ("daily_schedule", index, "study_item", item_index), StudyItem, item, errors, context
+                ))
+
+    # Check the day's own fields with its items set aside
+    shell = dict(day, study_item=[]) if isinstance(items, list) else day
+    errors = _validation_errors(DailySchedule, shell)
+    if errors:
+        return [InvalidElement(("daily_schedule", index), DailySchedule, day, errors, f"day {index + 1} of a study plan")]
+    return bad_items
+
+
+def find_invalid_elements(plan: Dict[str, Any]) -> List[InvalidElement]:
+    """
+    Validate every list element of a structured plan on its own.
+
+    Study items are checked individually, so one bad item marks only that item
+    rather than its whole day.
+
+    Args:
+        plan: A structured plan in backend format, not yet validated
+
+    Returns:
+        list: The elements that fail validation, in plan order
+    """
+    invalid: List[InvalidElement] = []
+    for section, model in SECTION_MODELS.items():
+        elements = plan.get(section)
+        if not isinstance(elements, list):
+            continue
+        for index, element in enumerate(elements):
+            if section == "daily_schedule" and isinstance(element, dict):
+                invalid.extend(_invalid_day_parts(index, element))
+                continue
+            errors = _validation_errors(model, element)
+            if errors:
+                invalid.append(InvalidElement((section, index), model, element, errors, f"{section} of a study plan"))
+    return invalid
+
+
+def _field_summary(model: Type[BaseModel]) -> str:
+    fields = []
+    for name, info in model.model_fields.items():
+        if isinstance(info.annotation, type):
+            annotation = info.annotation.__name__
+        else:
+            annotation = str(info.annotation).replace("typing.", "").replace(f"{model.__module__}.", "")
+        fields.append(f"{name} ({annotation}{', required' if info.is_required() else ''})")
+    return ", ".join(fields)
+
+
+def build_element_prompt(invalid: InvalidElement) -> str:
+    """
+    Build a short prompt asking the model to fix a single invalid element.
+
+    Args:
+        invalid: The element to regenerate
+
+    Returns:
+        str: A prompt of a few hundred tokens at most
+    """
+    return (
+        f"Fix this {invalid.model.__name__} from {invalid.context} so it passes validation.\n"
+        f"Validation errors: {invalid.errors}\n"
+        f"Fields: {_field_summary(invalid.model)}\n"
+        f"Current JSON: {json.dumps(invalid.element, ensure_ascii=False)}\n"
+        "Keep the existing content where it is valid. Return ONLY the corrected JSON object."
+    )
+
+
+def splice_elements(plan: Dict[str, Any], replacements: Dict[Tuple[Any, ...], Optional[Any]]) -> Dict[str, Any]:
+    """
+    Put regenerated elements back into a plan.
+
+    Args:
+        plan: The structured plan the elements came from
+        replacements: Element path -> corrected element, or None to drop the element
+
+    Returns:
+        dict: A copy of the plan with the replacements applied
+    """
+    spliced = copy.deepcopy(plan)
+
+    def parent_of(path):
+        container = spliced
+        for part in path[:-1]:
+            container = container[part]
+        return container
+
+    for path, element in replacements.items():
+        if element is not None:
+            parent_of(path)[path[-1]] = element
+    # Drop from the back so earlier indices stay valid
+    for path in sorted((p for p, e in replacements.items() if e is None), reverse=True):
+        del parent_of(path)[path[-1]]
+    return spliced
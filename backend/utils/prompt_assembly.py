@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "templates", "study_plan_template.json")
+
+# Indentation left over from triple-quoted prompts inside functions and classes
+LEADING_WHITESPACE = re.compile(r"^[ \t]+", re.MULTILINE)
+BLANK_LINES = re.compile(r"\n{3,}")
+
+# source -> {"calls", "reported", "prompt_tokens", "cached_tokens"}
+_cache_stats: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {"calls": 0, "reported": 0, "prompt_tokens": 0, "cached_tokens": 0}
+)
+
+
+def minify_json(value: Any) -> str:
+    """Serialize ``value`` without indentation or spaces after separators."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def static_prefix(text: str) -> str:
+    """
+    Normalize a fixed prompt segment: strip indentation and collapse blank runs.
+
+    Static segments are built once at import time with this, so every request
+    sends them byte for byte identically and provider prefix caches can match.
+    """
+    return BLANK_LINES.sub("\n\n", LEADING_WHITESPACE.sub("", text)).strip()
+
+
+def assemble(prefix: str, *parts: Optional[str]) -> str:
+    """
+    Join a prompt with the static prefix first and the per-request parts after it.
+
+    Args:
+        prefix: A segment built with static_prefix
+        parts: Request-specific segments (materials, plan text, constraints); empty ones are skipped
+
+    Returns:
+        str: The prompt
+    """
+    return "\n\n".join([prefix] + [part.strip() for part in parts if part and part.strip()])
+
+
+@lru_cache(maxsize=1)
+def load_plan_template() -> Optional[Dict[str, Any]]:
+    """The structurer JSON template, read from disk once per process (None if it is missing)."""
+    try:
+        with open(TEMPLATE_PATH, "r") as f:
+            template = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read template file {TEMPLATE_PATH}: {e}")
+        return None
+    logger.info("Loaded study plan template from %s", TEMPLATE_PATH)
+    return template
+
+
+def _cache_usage(usage_source: Any) -> Optional[Tuple[int, int]]:
+    """
+    ``(prompt_tokens, cached_tokens)`` reported by the provider, or None if it reported nothing.
+
+    Understands langchain messages (``usage_metadata`` and OpenAI-style
+    ``token_usage`` in ``response_metadata``) and CrewAI ``UsageMetrics``.
+    """
+    usage_metadata = getattr(usage_source, "usage_metadata", None)
+    if usage_metadata and usage_metadata.get("input_tokens"):
+        details = usage_metadata.get("input_token_details") or {}
+        return int(usage_metadata["input_tokens"]), int(details.get("cache_read") or 0)
+
+    metadata = getattr(usage_source, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    if usage.get("prompt_tokens"):
+        details = usage.get("prompt_tokens_details") or {}
+        return int(usage["prompt_tokens"]), int(details.get("cached_tokens") or 0)
+
+    if getattr(usage_source, "prompt_tokens", None):
+        return int(usage_source.prompt_tokens), int(getattr(usage_source, "cached_prompt_tokens", 0) or 0)
+    return None
+
+
+def record_prompt_cache(source: str, usage_source: Any) -> None:
+    """
+    Record how many prompt tokens of one call the provider served from its prefix cache.
+
+    Args:
+        source: Name of the prompt, e.g. ``"preview"`` or ``"structurer.core"``
+        usage_source: The model response, final stream chunk or crew token usage
+    """
+    stats = _cache_stats[source]
+    stats["calls"] += 1
+    usage = _cache_usage(usage_source)
+    if usage is None:
+        return
+    stats["reported"] += 1
+    stats["prompt_tokens"] += usage[0]
+    stats["cached_tokens"] += usage[1]
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Cached-token ratio per prompt.
+
+    Returns:
+        dict: ``{source: {"calls", "reported", "prompt_tokens", "cached_tokens", "cached_ratio"}}``;
+              calls whose response carried no usage are counted in calls but not in reported
+    """
+    return {
+        source: dict(counts, cached_ratio=round(counts["cached_tokens"] / counts["prompt_tokens"], 3)
+                     if counts["prompt_tokens"] else 0.0)
+        for source, counts in sorted(_cache_stats.items())
+    }
@@ -0,0 +1,209 @@
+import copy
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from utils.spaced_repetition import is_review_item, schedule_reviews
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Relative weight of each priority when study time is taken away or added
+PRIORITY_WEIGHTS = {"high": 3.0, "medium": 2.0, "low": 1.0}
+DEFAULT_PRIORITY_WEIGHT = PRIORITY_WEIGHTS["medium"]
+
+# Shortest study item the scheduler will produce, in minutes
+MIN_ITEM_MINUTES = 10
+
+# Fewest hours per day the routes accept; a day must hold at least one MIN_ITEM_MINUTES item
+MIN_HOURS_PER_DAY = 0.25
+
+
+def _flatten_items(plan: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray, np.ndarray]:
+    """Study items in topic order, with their durations, priority weights and source day indexes."""
+    items, durations, weights, source_days = [], [], [], []
+    for day_index, day in enumerate(plan.get("daily_schedule") or []):
+        # Review items are rebuilt for the new schedule
+        for item in day.get("study_item") or []:
+            if is_review_item(item):
+                continue
+            items.append(item)
+            durations.append(max(float(item.get("duration_minutes") or 0), 1.0))
+            weights.append(PRIORITY_WEIGHTS.get(str(item.get("priority") or "").lower(), DEFAULT_PRIORITY_WEIGHT))
+            source_days.append(day_index)
+    return items, np.array(durations), np.array(weights), np.array(source_days, dtype=int)
+
+
+def _select_items(durations: np.ndarray, weights: np.ndarray, capacity: float) -> np.ndarray:
+    """
+    Indexes of the items to keep, in topic order, when not every item fits at the minimum duration.
+
+    Lower priority items go first, and among equal priority the latest ones.
+    """
+    fits = int(capacity // MIN_ITEM_MINUTES)
+    if fits >= len(durations):
+        return np.arange(len(durations))
+    # Highest weight first, earlier items first within a weight
+    order = np.lexsort((np.arange(len(durations)), -weights))
+    return np.sort(order[:max(fits, 1)])
+
+
+def _fit_durations(durations: np.ndarray, weights: np.ndarray, capacity: float) -> np.ndarray:
+    """
+    Rescale item durations so they add up to ``capacity`` minutes.
+
+    Time taken away comes mostly from low priority items (in proportion to duration / weight)
+    and no item drops below MIN_ITEM_MINUTES; time added goes mostly to high priority items
+    (in proportion to duration * weight).
+    """
+    total = durations.sum()
+    if capacity >= total:
+        share = durations * weights
+        return durations + (capacity - total) * share / share.sum()
+
+    fitted = durations.copy()
+    remaining = total - capacity
+    floor = np.minimum(durations, MIN_ITEM_MINUTES)
+    # Water-filling: items that hit the minimum stop shrinking and the rest take over their share
+    for _ in range(len(durations)):
+        room = fitted - floor
+        open_items = room > 1e-9
+        if remaining <= 1e-9 or not open_items.any():
+            break
+        share = np.where(open_items, fitted / weights, 0.0)
+        cut = np.minimum(remaining * share / share.sum(), room)
+        fitted -= cut
+        remaining -= cut.sum()
+    return fitted
+
+
+def _split_long_items(durations: np.ndarray, day_minutes: float, days: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split items longer than a day, and the longest items until there is one per day.
+
+    Returns:
+        tuple: ``(item index per part, part number, part duration)``
+    """
+    parts = np.maximum(np.ceil(durations / day_minutes - 1e-9), 1).astype(int)
+    while parts.sum() < days:
+        longest = int(np.argmax(durations / parts))
+        parts[longest] += 1
+    owner = np.repeat(np.arange(len(durations)), parts)
+    first_part = np.cumsum(parts) - parts
+    part_number = np.arange(parts.sum()) - np.repeat(first_part, parts) + 1
+    return owner, part_number, (durations / parts)[owner]
+
+
+def _round_per_day(minutes: np.ndarray, day_of: np.ndarray, days: int, day_minutes: int) -> np.ndarray:
+    """Round to whole minutes so that every day adds up to exactly ``day_minutes`` (largest remainder)."""
+    rounded = np.floor(minutes)
+    remainder = minutes - rounded
+    deficit = day_minutes - np.bincount(day_of, weights=rounded, minlength=days)
+    # Rank parts within their day by descending remainder
+    order = np.lexsort((-remainder, day_of))
+    starts = np.searchsorted(day_of[order], np.arange(days))
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order)) - starts[day_of[order]]
+    rounded += rank < deficit[day_of]
+    return rounded.astype(int)
+
+
+def reschedule_plan(plan: Dict[str, Any], days: int, hours_per_day: float) -> Dict[str, Any]:
+    """
+    Re-pack a structured plan's study items into a new number of days and hours per day.
+
+    Items keep their topic order. Durations are rescaled so each day adds up to
+    ``hours_per_day * 60`` minutes: lost time comes mostly out of low priority items, and
+    if even the minimum duration does not fit, the lowest priority items are left out.
+    Items longer than a day are split into parts. Each new day takes the focus area of
+    the original day it draws most of its time from, and review topics and items are
+    rebuilt with schedule_reviews. No model is involved.
+
+    Args:
+        plan: A structured plan in backend format
+        days: New number of study days
+        hours_per_day: New hours per day
+
+    Returns:
+        dict: A copy of the plan with the new ``daily_schedule``, ``total_study_day``,
+              ``hour_per_day`` and ``estimated_completion_time``
+
+    Raises:
+        ValueError: If days are not positive, a day is shorter than MIN_ITEM_MINUTES or the
+            plan has no study items
+    """
+    if days < 1 or hours_per_day <= 0:
+        raise ValueError(f"Days and hours per day must be positive, got {days} and {hours_per_day}")
+    day_minutes = int(round(hours_per_day * 60))
+    if day_minutes < MIN_ITEM_MINUTES:
+        raise ValueError(f"A study day must be at least {MIN_ITEM_MINUTES} minutes, got {hours_per_day} hours")
+    items, durations, weights, source_days = _flatten_items(plan)
+    if not items:
+        raise ValueError("The plan has no study items to reschedule")
+
+    capacity = float(days * day_minutes)
+    keep = _select_items(durations, weights, capacity)
+    if len(keep) < len(items):
+        logger.info(f"Leaving out {len(items) - len(keep)} low priority items that do not fit in {days} x {hours_per_day} h")
+    items = [items[i] for i in keep]
+    durations, weights, source_days = durations[keep], weights[keep], source_days[keep]
+
+    fitted = _fit_durations(durations, weights, capacity)
+    owner, part_number, minutes = _split_long_items(fitted, day_minutes, days)
+
+    # Each part goes to the day its midpoint falls in; then each day is scaled to exactly fill it
+    midpoints = np.cumsum(minutes) - minutes / 2
+    day_of = np.minimum((midpoints // day_minutes).astype(int), days - 1)
+    day_totals = np.bincount(day_of, weights=minutes, minlength=days)
+    minutes = minutes * (day_minutes / np.where(day_totals > 0, day_totals, 1))[day_of]
+    minutes = _round_per_day(minutes, day_of, days, day_minutes)
+
+    # Focus area of each new day: the original day that contributes most of its minutes
+    original_days = plan.get("daily_schedule") or []
+    contribution = np.zeros((days, len(original_days)))
+    np.add.at(contribution, (day_of, source_days[owner]), minutes)
+    dominant = contribution.argmax(axis=1)
+
+    part_counts = np.bincount(owner, minlength=len(items))
+    schedule: List[Dict[str, Any]] = []
+    for day_index in range(days):
+        parts = np.flatnonzero(day_of == day_index)
+        if len(parts) == 0:
+            source = original_days[int(dominant[day_index])] if original_days else {}
+            schedule.append({
+                "day": day_index + 1, "date": None, "focus_area": "Review and practice",
+                "study_item": [], "summary": "Review earlier topics and practice problems",
+                "learning_goals": source.get("learning_goals"), "review_topics": [],
+            })
+            continue
+        study_items = []
+        for part in parts:
+            item = copy.deepcopy(items[owner[part]])
+            if part_counts[owner[part]] > 1:
+                item["topic"] = f"{item.get('topic')} (part {part_number[part]} of {part_counts[owner[part]]})"
+            item["duration_minutes"] = int(minutes[part])
+            study_items.append(item)
+        sources = [original_days[i] for i in sorted(set(source_days[owner[parts]].tolist()))]
+        main_source = original_days[int(dominant[day_index])]
+        summaries = [day.get("summary") for day in sources if day.get("summary")]
+        goals = [goal for day in sources for goal in (day.get("learning_goals") or [])]
+        schedule.append({
+            "day": day_index + 1,
+            "date": None,
+            "focus_area": main_source.get("focus_area") or f"Study day {day_index + 1}",
+            "study_item": study_items,
+            "summary": " ".join(dict.fromkeys(summaries)) or main_source.get("summary"),
+            "learning_goals": list(dict.fromkeys(goals)) or None,
+            "review_topics": [],
+        })
+
+    rescheduled = copy.deepcopy({key: value for key, value in plan.items() if key != "daily_schedule"})
+    rescheduled.update({
+        "daily_schedule": schedule,
+        "total_study_day": days,
+        "hour_per_day": hours_per_day,
+        "estimated_completion_time": float(days * hours_per_day),
+    })
+    return schedule_reviews(rescheduled)
@@ -0,0 +1,154 @@
+import logging
+import re
+from typing import Any, Dict, List, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SM-2 ease factor bounds and the first two intervals, in days
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+FIRST_INTERVALS = (1, 6)
+
+# Recall quality (SM-2 scale 0-5) assumed for a topic of each priority: important topics
+# are treated as harder to retain, so their ease drops and they come back sooner
+PRIORITY_QUALITY = {"high": 3, "medium": 4, "low": 5}
+DEFAULT_QUALITY = PRIORITY_QUALITY["medium"]
+
+# Review topics per day, and the time a review item takes per topic and at most of a day
+MAX_REVIEW_TOPICS = 4
+REVIEW_MINUTES_PER_TOPIC = 5
+MAX_REVIEW_SHARE = 0.25
+
+# Topic of the study item that holds a day's reviews
+REVIEW_PREFIX = "Review: "
+
+# Suffix the rescheduler adds to split items, e.g. "Conduction (part 2 of 3)"
+PART_SUFFIX = re.compile(r"\s*\(part \d+ of \d+\)$")
+
+
+def is_review_item(item: Dict[str, Any]) -> bool:
+    """Whether a study item is a review item added by schedule_reviews."""
+    return str(item.get("topic") or "").startswith(REVIEW_PREFIX)
+
+
+def next_ease(ease: float, quality: int) -> float:
+    """SM-2 ease factor after a repetition of recall quality ``quality`` (0-5)."""
+    return max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+
+def review_offsets(quality: int, horizon: int) -> List[int]:
+    """
+    Days after a topic was studied on which it is reviewed, up to ``horizon`` days.
+
+    Intervals follow SM-2: 1 day, 6 days, then each interval times the ease factor,
+    with the ease updated after every repetition.
+    """
+    offsets: List[int] = []
+    ease, interval, offset = INITIAL_EASE, 0, 0
+    for repetition in range(horizon):
+        interval = FIRST_INTERVALS[repetition] if repetition < len(FIRST_INTERVALS) else int(round(interval * ease))
+        ease = next_ease(ease, quality)
+        offset += interval
+        if offset > horizon:
+            break
+        offsets.append(offset)
+    return offsets
+
+
+def _topic_name(item: Dict[str, Any]) -> str:
+    return PART_SUFFIX.sub("", str(item.get("topic") or "")).strip()
+
+
+def _last_study_days(schedule: List[Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
+    """Topic -> (index of the last day it is studied, recall quality), in order of introduction."""
+    topics: Dict[str, Tuple[int, int]] = {}
+    for day_index, day in enumerate(schedule):
+        for item in day.get("study_item") or []:
+            topic = _topic_name(item)
+            if not topic or is_review_item(item):
+                continue
+            quality = PRIORITY_QUALITY.get(str(item.get("priority") or "").lower(), DEFAULT_QUALITY)
+            if topic in topics:
+                quality = min(quality, topics[topic][1])
+            topics[topic] = (day_index, quality)
+    return topics
+
+
+def _fit_minutes(durations: List[int], total: int) -> List[int]:
+    """Scale whole-minute durations to add up to ``total`` (largest remainder), keeping each at least 1."""
+    current = sum(durations)
+    exact = [duration * total / current for duration in durations]
+    fitted = [max(int(value), 1) for value in exact]
+    order = sorted(range(len(durations)), key=lambda index: exact[index] - int(exact[index]), reverse=True)
+    difference = total - sum(fitted)
+    position = 0
+    while difference and position < 10 * len(order):
+        index = order[position % len(order)]
+        step = 1 if difference > 0 else -1
+        if fitted[index] + step >= 1:
+            fitted[index] += step
+            difference -= step
+        position += 1
+    return fitted
+
+
+def _review_item(topics: List[str], minutes: int) -> Dict[str, Any]:
+    return {
+        "topic": f"{REVIEW_PREFIX}{', '.join(topics)}",
+        "description": f"Recall the key points of {', '.join(topics)} without notes, then check them and redo one practice problem each.",
+        "duration_minutes": minutes,
+        "resource": None,
+        "is_completed": False,
+        "learning_objectives": [f"Recall {topic}" for topic in topics],
+        "priority": "medium",
+    }
+
+
+def schedule_reviews(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill ``review_topics`` of every day and add a review study item, in place.
+
+    Each topic is reviewed on the days SM-2 spacing gives after the last day it is
+    studied, with the ease set from its priority. A day reviews at most MAX_REVIEW_TOPICS
+    topics (lower priority and later topics are left out first) and never one it studies.
+    The review item's minutes come out of the day's other items, so the day total stays
+    the same. Review items from an earlier run are replaced, so the function can be
+    applied again after the schedule changes. No model is involved.
+
+    Args:
+        plan: A structured plan in backend format
+
+    Returns:
+        dict: The same plan
+    """
+    schedule = [day for day in plan.get("daily_schedule") or [] if isinstance(day, dict)]
+    reviews: List[List[Tuple[int, int, str]]] = [[] for _ in schedule]
+    for order, (topic, (day_index, quality)) in enumerate(_last_study_days(schedule).items()):
+        for offset in review_offsets(quality, len(schedule) - 1 - day_index):
+            reviews[day_index + offset].append((quality, order, topic))
+
+    for day, due in zip(schedule, reviews):
+        items = [item for item in day.get("study_item") or [] if isinstance(item, dict)]
+        studied = {_topic_name(item) for item in items}
+        # Lowest recall quality (highest priority) first, then order of introduction
+        topics = [topic for _, _, topic in sorted(due) if topic not in studied][:MAX_REVIEW_TOPICS]
+        day["review_topics"] = topics
+
+        day_minutes = sum(int(item.get("duration_minutes") or 0) for item in items)
+        lessons = [item for item in items if not is_review_item(item)]
+        review_minutes = min(REVIEW_MINUTES_PER_TOPIC * len(topics), int(day_minutes * MAX_REVIEW_SHARE))
+        if review_minutes < REVIEW_MINUTES_PER_TOPIC or not lessons:
+            review_minutes = 0
+        day["study_item"] = lessons
+        if not lessons:
+            continue
+        durations = [max(int(item.get("duration_minutes") or 0), 1) for item in lessons]
+        if sum(durations) != day_minutes - review_minutes:
+            durations = _fit_minutes(durations, max(day_minutes - review_minutes, len(lessons)))
+        for item, minutes in zip(lessons, durations):
+            item["duration_minutes"] = minutes
+        if review_minutes:
+            day["study_item"].append(_review_item(topics, review_minutes))
+    return plan
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def speculation_enabled() -> bool:
+    """Whether a successful preview starts structuring in the background (SPECULATIVE_STRUCTURING, on by default)."""
+    return os.getenv("SPECULATIVE_STRUCTURING", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def plan_key(raw_plan: str) -> str:
+    """Content hash identifying a preview's raw plan text."""
+    return hashlib.sha256(raw_plan.strip().encode("utf-8")).hexdigest()
+
+
+class SpeculativeStructurer:
+    """
+    Structured plans computed in the background while the student reads the preview.
+
+    Each raw plan gets at most one background task, keyed by its content hash. When
+    /plan/structure-plan arrives for the same text it takes over that task: a finished
+    result is returned at once and an in-flight one is awaited instead of starting a
+    second model call. Tasks nobody claims within ``ttl_seconds`` are cancelled.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        """
+        Initialize the store.
+
+        Args:
+            ttl_seconds: How long an unclaimed task (running or finished) is kept before it is discarded
+        """
+        self.ttl_seconds = ttl_seconds
+        # key -> (task, expiry timer)
+        self._entries: Dict[str, Tuple[asyncio.Task, asyncio.TimerHandle]] = {}
+        self._counts: Dict[str, int] = {
+            "started": 0, "duplicates": 0, "hits": 0, "joined": 0, "misses": 0,
+            "failed": 0, "expired_running": 0, "expired_finished": 0,
+        }
+
+    def start(self, raw_plan: str, structure: Callable[[], Awaitable[Any]]) -> Optional[str]:
+        """
+        Start structuring ``raw_plan`` in the background unless it is already being structured.
+
+        Args:
+            raw_plan: The preview's raw plan text
+            structure: Returns the coroutine that structures the plan, e.g. a structure_raw_plan call
+
+        Returns:
+            str: The plan's content hash, or None if a task for it already exists
+        """
+        key = plan_key(raw_plan)
+        if key in self._entries:
+            self._counts["duplicates"] += 1
+            return None
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(structure())
+        timer = loop.call_later(self.ttl_seconds, self._expire, key, task)
+        self._entries[key] = (task, timer)
+        self._counts["started"] += 1
+        logger.info(f"Started speculative structuring for plan {key[:12]}")
+        return key
+
+    def _expire(self, key: str, task: asyncio.Task) -> None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        del self._entries[key]
+        if task.done():
+            self._counts["expired_finished"] += 1
+            if not task.cancelled():
+                # Retrieve the outcome so a failed task does not log "exception was never retrieved"
+                task.exception()
+        else:
+            self._counts["expired_running"] += 1
+            task.cancel()
+        logger.info(f"Discarded unclaimed speculative structuring for plan {key[:12]}")
+
+    def pending(self, raw_plan: str) -> bool:
+        """Whether a background task (running or finished) exists for ``raw_plan``."""
+        return plan_key(raw_plan) in self._entries
+
+    async def claim(self, raw_plan: str) -> Optional[Any]:
+        """
+        Take the background result for ``raw_plan``, waiting for it if it is still running.
+
+        The task is shielded, so a client that disconnects while waiting does not cancel it.
+
+        Returns:
+            The structuring result, or None if there was no task or it failed
+        """
+        key = plan_key(raw_plan)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self._counts["misses"] += 1
+            return None
+        task, timer = entry
+        timer.cancel()
+
+        if task.done():
+            self._counts["hits"] += 1
+        else:
+            self._counts["joined"] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            result = None
+        except Exception as e:
+            logger.warning(f"Speculative structuring for plan {key[:12]} failed: {e}")
+            result = None
+
+        if result is None or (isinstance(result, dict) and "error" in result):
+            self._counts["failed"] += 1
+            return None
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counts of speculative tasks by outcome.
+
+        Returns:
+            dict: ``started``, ``hits`` (finished before the request), ``joined`` (still running),
+                  ``misses``, ``failed``, ``expired_running`` (cancelled), ``expired_finished``
+                  (computed but never used), plus ``pending`` and ``ttl_seconds``
+        """
+        return dict(self._counts, pending=len(self._entries), ttl_seconds=self.ttl_seconds)
+
+
+# Shared store used by the preview and structure-plan routes
+speculative_structurer = SpeculativeStructurer(
+    ttl_seconds=float(os.getenv("SPECULATIVE_STRUCTURING_TTL", "300")),
+)
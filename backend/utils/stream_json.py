@@ -0,0 +1,146 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Top-level arrays whose elements are emitted as soon as they are complete
+DEFAULT_STREAMED_SECTIONS = ("daily_schedule", "core_concepts", "key_formulas")
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a JSON object arriving as a token stream.
+
+    Feed it chunks of model output as they arrive. Any text before the first
+    ``{`` (for example a ```json fence) is skipped. Every element of a watched
+    top-level array is decoded and returned as soon as its closing brace is
+    seen, and the whole object is returned once the top-level brace closes,
+    after which all further input is ignored.
+
+    Each character is scanned once, so the cost is linear in the output size.
+    """
+
+    def __init__(self, sections: Tuple[str, ...] = DEFAULT_STREAMED_SECTIONS):
+        """
+        Initialize the parser.
+
+        Args:
+            sections: Names of top-level array fields whose elements should be emitted
+        """
+        self.sections = set(sections)
+        self.buffer: List[str] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.done = False
+
+        self._started = False
+        self._length = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # Stack of [container_type, key_of_this_container, expecting_key, last_key]
+        self._stack: List[List[Any]] = []
+        self._element_start: Optional[int] = None
+        self._element_section: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """The JSON text consumed so far, starting at the top-level brace."""
+        return "".join(self.buffer)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume the next chunk of model output.
+
+        Args:
+            chunk: The next piece of streamed text
+
+        Returns:
+            list: ``(section, element)`` tuples for each completed element, followed by
+                  ``("complete", plan)`` once the top-level object has closed
+        """
+        events: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return events
+
+        for char in chunk:
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+
+            self.buffer.append(char)
+            position = self._length
+            self._length += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string(position)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                self._open(char, position)
+            elif char in "}]":
+                event = self._close(position)
+                if event:
+                    events.append(event)
+                if not self._stack:
+                    self.done = True
+                    self.result = self._decode(0, position + 1)
+                    events.append(("complete", self.result))
+                    break
+            elif char == ":" and self._stack and self._stack[-1][0] == "object":
+                self._stack[-1][2] = False
+            elif char == "," and self._stack and self._stack[-1][0] == "object":
+                self._stack[-1][2] = True
+
+        return events
+
+    def _close_string(self, position: int) -> None:
+        top = self._stack[-1] if self._stack else None
+        if top and top[0] == "object" and top[2]:
+            top[3] = json.loads("".join(self.buffer[self._string_start:position + 1]))
+
+    def _open(self, char: str, position: int) -> None:
+        key = None
+        if self._stack and self._stack[-1][0] == "object":
+            key = self._stack[-1][3]
+        container = "object" if char == "{" else "array"
+        self._stack.append([container, key, container == "object", None])
+
+        # An object directly inside a watched top-level array starts a streamed element
+        if (container == "object" and len(self._stack) == 3
+                and self._stack[1][0] == "array" and self._stack[1][1] in self.sections):
+            self._element_start = position
+            self._element_section = self._stack[1][1]
+
+    def _close(self, position: int) -> Optional[Tuple[str, Any]]:
+        if not self._stack:
+            return None
+        self._stack.pop()
+        if len(self._stack) == 2 and self._element_start is not None:
+            section = self._element_section
+            element = self._decode(self._element_start, position + 1)
+            self._element_start = None
+            self._element_section = None
+            if element is not None:
+                return (section, element)
+        return None
+
+    def _decode(self, start: int, end: int) -> Any:
+        snippet = "".join(self.buffer[start:end])
+        try:
+            return json.loads(snippet)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not decode streamed JSON fragment: {e}")
+            return None
@@ -0,0 +1,205 @@
+import copy
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from models.study_plan_models import StructuredStudyPlan
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Structured output modes, from most to least constrained
+JSON_SCHEMA = "json_schema"  # Provider enforces the StructuredStudyPlan JSON schema
+JSON_OBJECT = "json_object"  # Provider guarantees syntactically valid JSON only
+TEMPLATE = "template"        # No provider support: the template is pasted into the prompt
+
+CONSTRAINED_MODES = (JSON_SCHEMA, JSON_OBJECT)
+
+# Error text that means the provider or model rejected the response_format parameter
+UNSUPPORTED_MARKERS = ("response_format", "json_schema", "json_object", "structured output", "structured_outputs")
+
+# Models that rejected a mode, so later calls go straight to the next one
+_unsupported: Dict[str, set] = defaultdict(set)
+
+# mode -> {"calls", "retries", "prompt_tokens", "fallbacks"}
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "retries": 0, "prompt_tokens": 0, "fallbacks": 0})
+
+# output format ("compact" | "full") -> {"plans", "output_tokens", "seconds"}
+_output_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {"plans": 0, "output_tokens": 0, "seconds": 0.0})
+
+# Single-pass plans generated, and failed single passes that ran the two-pass preview afterwards
+_single_pass_stats: Dict[str, int] = {"plans": 0, "fallbacks": 0}
+
+_plan_schema: Optional[Dict[str, Any]] = None
+
+# Fields filled locally after structuring (utils.spaced_repetition), left out of the schema sent to the model
+LOCAL_FIELDS = {"DailySchedule": ("review_topics",)}
+
+
+def configured_mode() -> str:
+    """The structured output mode requested through STRUCTURED_OUTPUT_MODE (default json_schema)."""
+    mode = os.getenv("STRUCTURED_OUTPUT_MODE", JSON_SCHEMA).strip().lower()
+    if mode in ("off", "none", "false", ""):
+        return TEMPLATE
+    if mode not in CONSTRAINED_MODES + (TEMPLATE,):
+        logger.warning(f"Unknown STRUCTURED_OUTPUT_MODE '{mode}', using {JSON_SCHEMA}")
+        return JSON_SCHEMA
+    return mode
+
+
+def plan_json_schema(sections: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    JSON schema for a StructuredStudyPlan, optionally limited to some top-level fields.
+
+    Args:
+        sections: Top-level fields to keep (e.g. ``("daily_schedule",)``), or None for the full plan
+
+    Returns:
+        dict: A JSON schema object; nested models are kept under ``$defs``
+    """
+    global _plan_schema
+    if _plan_schema is None:
+        _plan_schema = StructuredStudyPlan.model_json_schema()
+        for model_name, fields in LOCAL_FIELDS.items():
+            properties = _plan_schema.get("$defs", {}).get(model_name, {}).get("properties", {})
+            for name in fields:
+                properties.pop(name, None)
+    schema = copy.deepcopy(_plan_schema)
+    if sections:
+        schema["properties"] = {name: schema["properties"][name] for name in sections}
+        schema["required"] = [name for name in schema.get("required", []) if name in sections]
+        schema["title"] = "_".join(sections)
+    return schema
+
+
+def resolve_mode(model_name: str) -> str:
+    """The most constrained mode that ``model_name`` has not rejected yet."""
+    mode = configured_mode()
+    if mode == TEMPLATE:
+        return TEMPLATE
+    for candidate in CONSTRAINED_MODES[CONSTRAINED_MODES.index(mode):]:
+        if candidate not in _unsupported[model_name]:
+            return candidate
+    return TEMPLATE
+
+
+def response_format(mode: str, schema_name: str, sections: Optional[Sequence[str]] = None,
+                    schema: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    The OpenAI-compatible ``response_format`` parameter for a mode.
+
+    Args:
+        mode: JSON_SCHEMA, JSON_OBJECT or TEMPLATE
+        schema_name: Name reported to the provider for the schema
+        sections: Top-level plan fields the response should contain
+        schema: A schema to send instead of the StructuredStudyPlan one (e.g. the compact wire format)
+
+    Returns:
+        dict: The parameter to bind to the model, or None for TEMPLATE
+    """
+    if mode == JSON_SCHEMA:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "schema": schema or plan_json_schema(sections), "strict": False}
+        }
+    if mode == JSON_OBJECT:
+        return {"type": "json_object"}
+    return None
+
+
+def is_unsupported_error(error: Exception) -> bool:
+    """Whether an API error means the provider does not support the requested response_format."""
+    message = str(error).lower()
+    return any(marker in message for marker in UNSUPPORTED_MARKERS)
+
+
+def mark_unsupported(model_name: str, mode: str, error: Exception) -> None:
+    """Remember that ``model_name`` rejected ``mode`` so the next call falls back immediately."""
+    _unsupported[model_name].add(mode)
+    _stats[mode]["fallbacks"] += 1
+    logger.warning(f"{model_name} does not support {mode} output, falling back: {str(error)[:200]}")
+
+
+def prompt_tokens(response: Any, messages: Iterable[Any]) -> int:
+    """Prompt tokens reported by the provider, or a 4-characters-per-token estimate."""
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    if usage.get("prompt_tokens"):
+        return int(usage["prompt_tokens"])
+    return sum(len(str(getattr(message, "content", message))) for message in messages) // 4
+
+
+def record_structuring_call(mode: str, tokens: int) -> None:
+    """Count one structuring call and its prompt size under ``mode``."""
+    _stats[mode]["calls"] += 1
+    _stats[mode]["prompt_tokens"] += tokens
+
+
+def record_structuring_retry(mode: str) -> None:
+    """Count a retry (or a failed request the client has to repeat) caused by output produced under ``mode``."""
+    _stats[mode]["retries"] += 1
+
+
+def record_structuring_output(output_format: str, tokens: int, seconds: float) -> None:
+    """Count the output tokens and generation time of one structured plan in ``output_format``."""
+    _output_stats[output_format]["plans"] += 1
+    _output_stats[output_format]["output_tokens"] += tokens
+    _output_stats[output_format]["seconds"] += seconds
+
+
+def record_single_pass(fallback: bool) -> None:
+    """Count one single-pass plan request, and whether it fell back to the two-pass preview."""
+    _single_pass_stats["plans"] += 1
+    if fallback:
+        _single_pass_stats["fallbacks"] += 1
+
+
+def structuring_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Retry rate and prompt size per structured output mode.
+
+    Returns:
+        dict: ``{mode: {"calls", "retries", "retry_rate", "avg_prompt_tokens", "fallbacks"}}``
+              plus the models that rejected each mode under ``"unsupported"`` and
+              ``{format: {"plans", "avg_output_tokens", "avg_seconds"}}`` under ``"output"``, and
+              ``{"plans", "fallbacks", "fallback_rate"}`` of single-pass generation under ``"single_pass"``
+    """
+    stats: Dict[str, Any] = {}
+    for mode, counts in _stats.items():
+        calls = counts["calls"]
+        stats[mode] = {
+            "calls": calls,
+            "retries": counts["retries"],
+            "retry_rate": round(counts["retries"] / calls, 3) if calls else 0.0,
+            "avg_prompt_tokens": round(counts["prompt_tokens"] / calls) if calls else 0,
+            "fallbacks": counts["fallbacks"],
+        }
+    stats["unsupported"] = {model: sorted(modes) for model, modes in _unsupported.items() if modes}
+    stats["output"] = {
+        output_format: {
+            "plans": counts["plans"],
+            "avg_output_tokens": round(counts["output_tokens"] / counts["plans"]),
+            "avg_seconds": round(counts["seconds"] / counts["plans"], 2),
+        }
+        for output_format, counts in _output_stats.items() if counts["plans"]
+    }
+    plans = _single_pass_stats["plans"]
+    stats["single_pass"] = dict(
+        _single_pass_stats,
+        fallback_rate=round(_single_pass_stats["fallbacks"] / plans, 3) if plans else 0.0
+    )
+    return stats
+
+
+def constrained_call_arguments(model_name: str, schema_name: str,
+                               sections: Optional[Sequence[str]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Mode and ``response_format`` to use for the next call to ``model_name``.
+
+    Returns:
+        tuple: ``(mode, response_format)``; response_format is None in TEMPLATE mode
+    """
+    mode = resolve_mode(model_name)
+    return mode, response_format(mode, schema_name, sections)
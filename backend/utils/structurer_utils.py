@@ -1,6 +1,9 @@
 import json
 import re
-from typing import Dict, Any, List, Optional, Union
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from utils.formula_detection import detect_formulas
 
 # Import pydantic models for structured data
 try:
@@ -25,9 +28,9 @@ except ImportError:
     class DailySchedule(BaseModel):
         day: int
         date: Optional[str] = None
-        focus_area: Optional[str] = None
-        study_items: List[StudyItem]
-        summary: Optional[str] = None
+        focus_area: str
+        study_item: List[StudyItem]
+        summary: str
     
     class KeyFormula(BaseModel):
         name: str
@@ -37,13 +40,148 @@ except ImportError:
     class StructuredStudyPlan(BaseModel):
         overall_goal: str
         total_study_day: int
-        hour_per_day: int
+        hour_per_day: float
         core_concepts: List[CoreConcept] = Field(default_factory=list)
         daily_schedule: List[DailySchedule] = Field(default_factory=list)
         general_tip: Optional[List[str]] = None
         key_formulas: Optional[List[KeyFormula]] = None
 
-def generate_structured_study_plan(raw_plan: str, days: int, hours_per_day: int) -> StructuredStudyPlan:
+# --- Single-pass section tree ---
+#
+# The raw plan is tokenized once into a flat list of sections, one per "##"-or-deeper
+# heading, and each heading is classified (goal, overview, concepts, day, tips,
+# formulas) as it is read. Extractors then only look at the sections they need
+# instead of rescanning the whole document with "(?=##|$)" lookaheads. Section
+# boundaries match the old lookahead behaviour: a section runs from its heading to
+# the next heading of level 2 or deeper, while level-1 headings are ordinary content.
+
+BULLET_PATTERN = re.compile(r'[*\-+]\s*([^\n]+)')
+CONCEPT_ITEM_PATTERN = re.compile(r'[*\-+]\s*([^:\n]+)(?::\s*|\s*-\s*)([^\n]+)')
+FORMULA_ITEM_PATTERN = re.compile(r'[*\-+]\s*([^:\n]+)\s*:\s*([^\n]+?)(?:\s*-\s*|\s*:\s*)([^\n]+)?')
+TIME_ALLOCATION_PATTERN = re.compile(
+    r'[*\-+]\s*([^\n:]+)\s*(?:\(|:)\s*(\d+)\s*(?:hours|hour|hrs|hr|min|minutes)\s*(?:\)|,|;)\s*([^\n]*)',
+    re.IGNORECASE
+)
+FOCUS_AREA_PATTERN = re.compile(r'Focus\s*(?:Area|Topic)s?[:\s]([^\n]+)', re.IGNORECASE)
+SUMMARY_PATTERN = re.compile(r'Summary[:\s]([^\n]+)', re.IGNORECASE)
+CONCEPT_PHRASE_PATTERN = re.compile(r'(?:Key|Core|Important)\s+Concepts[:\n](.*)', re.DOTALL | re.IGNORECASE)
+
+LINE_BULLET_PATTERN = re.compile(r'^[^\S\n]*[*\-+][^\S\n]*([^\n]+)', re.MULTILINE)
+LINE_TIME_ALLOCATION_PATTERN = re.compile(r'^[^\S\n]*' + TIME_ALLOCATION_PATTERN.pattern, re.MULTILINE | re.IGNORECASE)
+
+# Section kinds recognised from the start of a heading title ("Day" is case-sensitive)
+SECTION_KIND_PATTERN = re.compile(
+    r'(?P<goal>Goal|Overall\s*Goal)'
+    r'|(?P<overview>Introduction|Overview)'
+    r'|(?P<concepts>Core\s*Concepts|Key\s*Concepts|Fundamental\s*Concepts)'
+    r'|(?P<tips>General\s*Tips|Study\s*Tips|Tips)'
+    r'|(?P<formulas>Key\s*Formulas|Formulas|Equations)'
+    r'|(?-i:(?P<day>Day\s*(?P<day_number>\d+)))',
+    re.IGNORECASE
+)
+
+
+@dataclass
+class PlanSection:
+    """A heading and everything up to the next heading of level 2 or deeper."""
+    level: int                      # Number of '#' characters in the heading, 0 for the preamble
+    title: str                      # Heading text without the '#' run and surrounding whitespace
+    start: int                      # Offset of the heading line
+    end: int                        # Offset where the next section starts
+    marker_end: int = 0             # Offset just past the '#' run
+    kind: Optional[str] = None      # goal, overview, concepts, tips, formulas or day
+    keyword_end: int = 0            # Offset just past the keyword that set the kind
+    day_number: Optional[str] = None
+    children: List["PlanSection"] = field(default_factory=list)
+
+
+@dataclass
+class PlanDocument:
+    """A raw plan tokenized into a section tree."""
+    text: str
+    sections: List[PlanSection]     # All sections in document order, preamble first
+    root: PlanSection               # The preamble; top-level headings are its children
+    by_kind: Dict[str, List[PlanSection]] = field(default_factory=dict)
+
+    def section_text(self, section: PlanSection) -> str:
+        """The full text of a section, heading line included."""
+        return self.text[section.start:section.end]
+
+    def sections_of(self, kind: str) -> List[PlanSection]:
+        """Sections of the given kind, in document order."""
+        return self.by_kind.get(kind, [])
+
+    def bullets(self, section: PlanSection) -> List[str]:
+        """Bullet lines in the section, without their markers."""
+        return [match.group(1).strip() for match in LINE_BULLET_PATTERN.finditer(self.text, section.start, section.end)]
+
+    def time_allocations(self, section: PlanSection) -> List[Tuple[str, str, str]]:
+        """``(topic, amount, details)`` for bullets such as "- Topic (45 minutes): details"."""
+        return [match.groups() for match in LINE_TIME_ALLOCATION_PATTERN.finditer(self.text, section.start, section.end)]
+
+
+def parse_plan_sections(raw_plan: str) -> PlanDocument:
+    """
+    Tokenize a raw markdown plan into a section tree in a single pass.
+    
+    Only heading lines are visited while building the tree; bullets and time
+    allocations are read from a section's span when asked for.
+    
+    Args:
+        raw_plan: The raw study plan text
+        
+    Returns:
+        A PlanDocument holding every section in document order, as a tree and by kind
+    """
+    length = len(raw_plan)
+    root = PlanSection(level=0, title="", start=0, end=length)
+    document = PlanDocument(text=raw_plan, sections=[root], root=root)
+    stack = [root]
+
+    marker_start = raw_plan.find("##")
+    while marker_start >= 0:
+        marker_end = marker_start + 2
+        while marker_end < length and raw_plan[marker_end] == "#":
+            marker_end += 1
+        next_marker = raw_plan.find("##", marker_end)
+
+        line_start = raw_plan.rfind("\n", 0, marker_start) + 1
+        if line_start != marker_start and not raw_plan[line_start:marker_start].isspace():
+            # "##" in the middle of a line is not a heading
+            marker_start = next_marker
+            continue
+        line_end = raw_plan.find("\n", marker_end)
+        if line_end < 0:
+            line_end = length
+        heading = raw_plan[marker_end:line_end]
+        title_start = marker_end + len(heading) - len(heading.lstrip())
+        level = marker_end - marker_start
+
+        section = PlanSection(level=level, title=heading.strip(), start=line_start, end=length,
+                              marker_end=marker_end)
+        kind_match = SECTION_KIND_PATTERN.match(raw_plan, title_start, line_end)
+        if kind_match:
+            section.kind = kind_match.lastgroup if kind_match.lastgroup != "day_number" else "day"
+            section.keyword_end = kind_match.end()
+            section.day_number = kind_match.group("day_number")
+            document.by_kind.setdefault(section.kind, []).append(section)
+
+        document.sections[-1].end = line_start
+        while len(stack) > 1 and stack[-1].level >= level:
+            stack.pop()
+        stack[-1].children.append(section)
+        stack.append(section)
+        document.sections.append(section)
+        marker_start = next_marker
+
+    return document
+
+
+def _as_document(raw_plan: Union[str, PlanDocument]) -> PlanDocument:
+    return raw_plan if isinstance(raw_plan, PlanDocument) else parse_plan_sections(raw_plan)
+
+
+def generate_structured_study_plan(raw_plan: str, days: int, hours_per_day: float) -> StructuredStudyPlan:
     """
     Generate a structured study plan from the raw LLM output.
     
@@ -55,22 +193,27 @@ def generate_structured_study_plan(raw_plan: str, days: int, hours_per_day: int)
     Returns:
         A structured study plan object
     """
+    # Tokenize the raw plan once and share the section tree between all extractors
+    document = parse_plan_sections(raw_plan)
+    
     # Extract the overall goal from the raw plan
-    overall_goal = extract_overall_goal(raw_plan)
+    overall_goal = extract_overall_goal(document, days, hours_per_day)
     
     # Extract core concepts
-    core_concepts_data = extract_core_concepts(raw_plan)
+    core_concepts_data = extract_core_concepts(document)
     core_concepts = [CoreConcept(**concept) for concept in core_concepts_data]
     
     # Extract daily schedule
-    daily_schedule_data = extract_daily_schedule(raw_plan, days)
+    daily_schedule_data = extract_daily_schedule(document, days)
     daily_schedule = [DailySchedule(**day_data) for day_data in daily_schedule_data]
     
     # Extract general tips
-    general_tips = extract_general_tips(raw_plan)
+    general_tips = extract_general_tips(document)
     
-    # Extract key formulas
-    key_formulas_data = extract_key_formulas(raw_plan)
+    # Extract key formulas, or prefill the ones found in the plan's text when it has no formulas section
+    key_formulas_data = extract_key_formulas(document) or [
+        formula.as_key_formula() for formula in detect_formulas(raw_plan)
+    ]
     key_formulas = [KeyFormula(**formula) for formula in key_formulas_data] if key_formulas_data else None
     
     # Create and return the structured study plan
@@ -84,54 +227,61 @@ def generate_structured_study_plan(raw_plan: str, days: int, hours_per_day: int)
         key_formulas=key_formulas
     )
 
-def extract_overall_goal(raw_plan: str) -> str:
+def extract_overall_goal(raw_plan: Union[str, PlanDocument], days: Optional[int] = None,
+                         hours_per_day: Optional[float] = None) -> str:
     """
     Extract the overall goal from the raw study plan.
     
     Args:
-        raw_plan: The raw study plan text
+        raw_plan: The raw study plan text or its parsed section tree
+        days: Optional number of study days, used in the default goal
+        hours_per_day: Optional hours per day, used in the default goal
         
     Returns:
         The overall goal as a string
     """
+    document = _as_document(raw_plan)
+    
     # Try to find an explicit goal statement
-    goal_matches = re.search(r'(?:##\s*Goal|##\s*Overall\s*Goal)\s*(.+?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
-    if goal_matches:
-        return goal_matches.group(1).strip()
+    goal_sections = document.sections_of("goal")
+    if goal_sections:
+        return document.text[goal_sections[0].keyword_end:goal_sections[0].end].strip()
     
     # If no explicit goal, try to extract from introduction
-    intro_matches = re.search(r'(?:##\s*Introduction|##\s*Overview)\s*(.+?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
-    if intro_matches:
-        intro_text = intro_matches.group(1).strip()
+    intro_sections = document.sections_of("overview")
+    if intro_sections:
+        intro_text = document.text[intro_sections[0].keyword_end:intro_sections[0].end].strip()
         # Take the first paragraph as the goal
         paragraphs = intro_text.split('\n\n')
         if paragraphs:
             return paragraphs[0].strip()
     
     # Default goal if nothing is found
-    return f"Master the study materials over {days} days with {hours_per_day} hours per day."
+    if days and hours_per_day:
+        return f"Master the study materials over {days} days with {hours_per_day} hours per day."
+    return "Master the study materials."
 
-def extract_core_concepts(raw_plan: str) -> List[Dict[str, Any]]:
+def extract_core_concepts(raw_plan: Union[str, PlanDocument]) -> List[Dict[str, Any]]:
     """
     Extract core concepts from the raw study plan.
     
     Args:
-        raw_plan: The raw study plan text
+        raw_plan: The raw study plan text or its parsed section tree
         
     Returns:
         A list of core concept dictionaries
     """
+    document = _as_document(raw_plan)
     concepts = []
     # Look for sections that might contain core concepts
-    concept_sections = re.findall(r'(?:##\s*Core\s*Concepts|##\s*Key\s*Concepts|##\s*Fundamental\s*Concepts).*?(?=##|$)', 
-                                 raw_plan, re.DOTALL | re.IGNORECASE)
+    concept_sections = document.sections_of("concepts")
     
     if not concept_sections:
         # Try to find concepts in bullet points
-        bullets_match = re.findall(r'(?:Key|Core|Important)\s+Concepts[:\n](.*?)(?=##|$)', raw_plan, re.DOTALL | re.IGNORECASE)
-        if bullets_match:
-            for match in bullets_match:
-                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', match)
+        for section in document.sections:
+            bullets_match = CONCEPT_PHRASE_PATTERN.search(document.section_text(section))
+            if bullets_match:
+                bullet_points = BULLET_PATTERN.findall(bullets_match.group(1))
                 for point in bullet_points:
                     concepts.append({
                         "name": point.strip(),
@@ -140,8 +290,9 @@ def extract_core_concepts(raw_plan: str) -> List[Dict[str, Any]]:
     else:
         # Process the sections that contain concepts
         for section in concept_sections:
+            section_text = document.section_text(section)
             # Try to extract concepts with explanations (in format: Concept - Explanation)
-            concept_items = re.findall(r'[*\-+]\s*([^:\n]+)(?::\s*|\s*-\s*)([^\n]+)', section)
+            concept_items = CONCEPT_ITEM_PATTERN.findall(section_text)
             
             # If we found structured concept items
             if concept_items:
@@ -152,7 +303,7 @@ def extract_core_concepts(raw_plan: str) -> List[Dict[str, Any]]:
                     })
             else:
                 # Just extract bullet points as concept names
-                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
+                bullet_points = BULLET_PATTERN.findall(section_text)
                 for point in bullet_points:
                     concepts.append({
                         "name": point.strip(),
@@ -167,89 +318,93 @@ def extract_core_concepts(raw_plan: str) -> List[Dict[str, Any]]:
     
     return concepts
 
-def extract_daily_schedule(raw_plan: str, total_days: int) -> List[Dict[str, Any]]:
+def extract_daily_schedule(raw_plan: Union[str, PlanDocument], total_days: int) -> List[Dict[str, Any]]:
     """
     Extract the daily schedule from the raw study plan.
     
+    A day runs from its "## Day N" heading to the next day heading, so sections that
+    follow the last day without a new day heading are still read as part of that day.
+    
     Args:
-        raw_plan: The raw study plan text
+        raw_plan: The raw study plan text or its parsed section tree
         total_days: Total number of study days
         
     Returns:
         A list of daily schedule dictionaries
     """
+    document = _as_document(raw_plan)
     daily_schedule = []
     
-    # Try to find day sections
-    day_sections = re.findall(r'##\s*Day\s*(\d+)[^#]*', raw_plan, re.DOTALL)
-    day_contents = re.split(r'##\s*Day\s*\d+', raw_plan)[1:] # Skip the text before first day
-    
-    # If we found day sections
-    if day_sections and len(day_sections) == len(day_contents):
-        for i, (day_num, day_content) in enumerate(zip(day_sections, day_contents)):
-            # Extract focus area if available
-            focus_area_match = re.search(r'Focus\s*(?:Area|Topic)s?[:\s]([^\n]+)', day_content, re.IGNORECASE)
-            focus_area = focus_area_match.group(1).strip() if focus_area_match else f"Day {day_num} Studies"
-            
-            # Extract summary if available
-            summary_match = re.search(r'Summary[:\s]([^\n]+)', day_content, re.IGNORECASE)
-            summary = summary_match.group(1).strip() if summary_match else None
-            
-            # Extract study items
-            study_items = []
-            
-            # First, look for structured time allocations
-            time_allocations = re.findall(r'[*\-+]\s*([^\n:]+)\s*(?:\(|:)\s*(\d+)\s*(?:hours|hour|hrs|hr|min|minutes)\s*(?:\)|,|;)\s*([^\n]*)', day_content, re.IGNORECASE)
+    # Each day's content starts right after "## Day N" and ends where the next day's "##" begins
+    day_sections = document.sections_of("day")
+    for i, section in enumerate(day_sections):
+        day_num = section.day_number
+        content_end = day_sections[i + 1].marker_end - 2 if i + 1 < len(day_sections) else len(document.text)
+        day_content = document.text[section.keyword_end:content_end]
+        
+        # Extract focus area if available
+        focus_area_match = FOCUS_AREA_PATTERN.search(day_content)
+        focus_area = focus_area_match.group(1).strip() if focus_area_match else f"Day {day_num} Studies"
+        
+        # Extract summary if available
+        summary_match = SUMMARY_PATTERN.search(day_content)
+        summary = summary_match.group(1).strip() if summary_match else f"Study {focus_area}."
+        
+        # Extract study items
+        study_items = []
+        
+        # First, look for structured time allocations
+        time_allocations = TIME_ALLOCATION_PATTERN.findall(day_content)
+        
+        if time_allocations:
+            for topic, duration, details in time_allocations:
+                # Convert hours to minutes if needed
+                duration_value = int(duration)
+                if 'hour' in details.lower() or 'hr' in details.lower():
+                    duration_value *= 60
+                    
+                study_items.append({
+                    "topic": topic.strip(),
+                    "description": details.strip() if details.strip() else f"Study {topic.strip()}",
+                    "duration_minutes": duration_value,
+                    "resource": None,
+                    "is_completed": False
+                })
+        else:
+            # If no structured time allocations, look for bullet points
+            topics = BULLET_PATTERN.findall(day_content)
             
-            if time_allocations:
-                for topic, duration, details in time_allocations:
-                    # Convert hours to minutes if needed
-                    duration_value = int(duration)
-                    if 'hour' in details.lower() or 'hr' in details.lower():
-                        duration_value *= 60
-                        
-                    study_items.append({
-                        "topic": topic.strip(),
-                        "description": details.strip() if details.strip() else f"Study {topic.strip()}",
-                        "duration_minutes": duration_value,
-                        "resource": None,
-                        "is_completed": False
-                    })
-            else:
-                # If no structured time allocations, look for bullet points
-                topics = re.findall(r'[*\-+]\s*([^\n]+)', day_content)
-                
-                # Calculate approximate minutes per topic to match the day's total hours
-                total_minutes = 240  # Default to 4 hours if not specified
-                minutes_per_topic = total_minutes // len(topics) if topics else 60
-                
-                for topic in topics:
-                    study_items.append({
-                        "topic": topic.strip(),
-                        "description": f"Study {topic.strip()}",
-                        "duration_minutes": minutes_per_topic,
-                        "resource": None,
-                        "is_completed": False
-                    })
+            # Calculate approximate minutes per topic to match the day's total hours
+            total_minutes = 240  # Default to 4 hours if not specified
+            minutes_per_topic = total_minutes // len(topics) if topics else 60
             
-            # If no study items were found, create a default one
-            if not study_items:
-                study_items = [{
-                    "topic": f"Day {day_num} Studies",
-                    "description": f"Complete studies for day {day_num}",
-                    "duration_minutes": 240,  # Default to 4 hours
+            for topic in topics:
+                study_items.append({
+                    "topic": topic.strip(),
+                    "description": f"Study {topic.strip()}",
+                    "duration_minutes": minutes_per_topic,
                     "resource": None,
                     "is_completed": False
-                }]
-            
-            # Add the day to the schedule
-            daily_schedule.append({
-                "day": int(day_num),
-                "date": None,
-                "focus_area": focus_area,
-                "study_items": study_items,
-                "summary": summary
-            })
+                })
+        
+        # If no study items were found, create a default one
+        if not study_items:
+            study_items = [{
+                "topic": f"Day {day_num} Studies",
+                "description": f"Complete studies for day {day_num}",
+                "duration_minutes": 240,  # Default to 4 hours
+                "resource": None,
+                "is_completed": False
+            }]
+        
+        # Add the day to the schedule
+        daily_schedule.append({
+            "day": int(day_num),
+            "date": None,
+            "focus_area": focus_area,
+            "study_item": study_items,
+            "summary": summary
+        })
     
     # If we couldn't extract the daily schedule, create a default one
     if not daily_schedule:
@@ -258,39 +413,36 @@ def extract_daily_schedule(raw_plan: str, total_days: int) -> List[Dict[str, Any
                 "day": day,
                 "date": None,
                 "focus_area": f"Day {day} Studies",
-                "study_items": [{
+                "study_item": [{
                     "topic": f"Day {day} Studies",
                     "description": f"Complete studies for day {day}",
                     "duration_minutes": 240,  # Default to 4 hours
                     "resource": None,
                     "is_completed": False
                 }],
-                "summary": None
+                "summary": f"Study the material planned for day {day}."
             })
     
     return daily_schedule
 
-def extract_general_tips(raw_plan: str) -> List[str]:
+def extract_general_tips(raw_plan: Union[str, PlanDocument]) -> List[str]:
     """
     Extract general study tips from the raw plan.
     
     Args:
-        raw_plan: The raw study plan text
+        raw_plan: The raw study plan text or its parsed section tree
         
     Returns:
         A list of general tips
     """
+    document = _as_document(raw_plan)
     tips = []
     
     # Look for sections that might contain general tips
-    tip_sections = re.findall(r'(?:##\s*General\s*Tips|##\s*Study\s*Tips|##\s*Tips).*?(?=##|$)', 
-                             raw_plan, re.DOTALL | re.IGNORECASE)
-    
-    if tip_sections:
-        for section in tip_sections:
-            # Extract bullet points as tips
-            bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
-            tips.extend([point.strip() for point in bullet_points])
+    for section in document.sections_of("tips"):
+        # Extract bullet points as tips
+        bullet_points = BULLET_PATTERN.findall(document.section_text(section))
+        tips.extend([point.strip() for point in bullet_points])
     
     # If no tips were found, provide some default ones
     if not tips:
@@ -304,53 +456,51 @@ def extract_general_tips(raw_plan: str) -> List[str]:
     
     return tips
 
-def extract_key_formulas(raw_plan: str) -> List[Dict[str, Any]]:
+def extract_key_formulas(raw_plan: Union[str, PlanDocument]) -> List[Dict[str, Any]]:
     """
     Extract key formulas from the raw plan.
     
     Args:
-        raw_plan: The raw study plan text
+        raw_plan: The raw study plan text or its parsed section tree
         
     Returns:
         A list of key formula dictionaries
     """
+    document = _as_document(raw_plan)
     formulas = []
     
     # Look for sections that might contain formulas
-    formula_sections = re.findall(r'(?:##\s*Key\s*Formulas|##\s*Formulas|##\s*Equations).*?(?=##|$)', 
-                                 raw_plan, re.DOTALL | re.IGNORECASE)
-    
-    if formula_sections:
-        for section in formula_sections:
-            # Try to extract structured formulas (Name: Formula - Description)
-            formula_items = re.findall(r'[*\-+]\s*([^:\n]+)\s*:\s*([^\n]+?)(?:\s*-\s*|\s*:\s*)([^\n]+)?', section)
-            
-            if formula_items:
-                for name, formula, description in formula_items:
+    for section in document.sections_of("formulas"):
+        section_text = document.section_text(section)
+        # Try to extract structured formulas (Name: Formula - Description)
+        formula_items = FORMULA_ITEM_PATTERN.findall(section_text)
+        
+        if formula_items:
+            for name, formula, description in formula_items:
+                formulas.append({
+                    "name": name.strip(),
+                    "formula": formula.strip(),
+                    "description": description.strip() if description else f"Formula for {name.strip()}"
+                })
+        else:
+            # Just extract bullet points as formula names
+            bullet_points = BULLET_PATTERN.findall(section_text)
+            for point in bullet_points:
+                # Try to split the point into formula and description
+                parts = point.split(':', 1)
+                if len(parts) == 2:
+                    name = parts[0].strip()
+                    formula_text = parts[1].strip()
                     formulas.append({
-                        "name": name.strip(),
-                        "formula": formula.strip(),
-                        "description": description.strip() if description else f"Formula for {name.strip()}"
+                        "name": name,
+                        "formula": formula_text,
+                        "description": f"Formula for {name}"
                     })
-            else:
-                # Just extract bullet points as formula names
-                bullet_points = re.findall(r'[*\-+]\s*([^\n]+)', section)
-                for point in bullet_points:
-                    # Try to split the point into formula and description
-                    parts = point.split(':', 1)
-                    if len(parts) == 2:
-                        name = parts[0].strip()
-                        formula_text = parts[1].strip()
-                        formulas.append({
-                            "name": name,
-                            "formula": formula_text,
-                            "description": f"Formula for {name}"
-                        })
-                    else:
-                        formulas.append({
-                            "name": f"Formula {len(formulas) + 1}",
-                            "formula": point.strip(),
-                            "description": "Important formula from the study material."
-                        })
-    
-    return formulas
\ No newline at end of file
+                else:
+                    formulas.append({
+                        "name": f"Formula {len(formulas) + 1}",
+                        "formula": point.strip(),
+                        "description": "Important formula from the study material."
+                    })
+    
+    return formulas
@@ -0,0 +1,253 @@
+import logging
+import math
+import os
+import re
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from utils.document_outline import ExtractedDocument, OutlineEntry
+from utils.page_selection import CHARS_PER_TOKEN
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Lines at the top and bottom of a page that are checked for headers, footers and page numbers
+EDGE_LINES = 2
+
+# A page-edge line is boilerplate when it repeats (digits ignored) on this many pages and this share of them
+BOILERPLATE_MIN_PAGES = 4
+BOILERPLATE_PAGE_SHARE = 0.3
+
+# MinHash signature size, split into LSH bands of BAND_ROWS rows (candidates at about 50% similarity)
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4
+
+# Estimated Jaccard similarity of word shingles above which a paragraph repeats an earlier one
+DUPLICATE_THRESHOLD = 0.8
+
+# Paragraphs shorter than this (in words) are never dropped: headings, formulas and short answers repeat legitimately
+MIN_DUPLICATE_WORDS = 8
+SHINGLE_WORDS = 3
+
+# Paragraphs end at a blank line, or at a line ending a sentence or question
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*|(?<=[.?!])[ \t]*\n")
+# Question numbering that changes between papers: "3.", "Q4)", "(b)"
+ENUMERATOR = re.compile(r"^\s*(?:q(?:uestion)?\s*)?\(?[a-z0-9]{1,3}[.)]\s+")
+PAGE_NUMBER = re.compile(r"(?:page\s*)?[-–(\[]?\s*#\s*[-–)\]]?(?:\s*(?:of|/)\s*#)?")
+WORDY = re.compile(r"[a-z]{3,}")
+WORD = re.compile(r"[a-z0-9]+")
+
+# Universal hashing modulo a prime above 2**32, with fixed coefficients so signatures are stable across runs
+PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240524)
+_A = _rng.integers(1, 2 ** 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 31, NUM_PERMUTATIONS, dtype=np.uint64)
+
+# label ("notes" | "questions") -> {"documents", "boilerplate_lines", "duplicate_paragraphs", "bytes_removed", "tokens_removed"}
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+    "documents": 0, "boilerplate_lines": 0, "duplicate_paragraphs": 0, "bytes_removed": 0, "tokens_removed": 0
+})
+
+
+def cleaning_enabled() -> bool:
+    """Whether uploaded materials are cleaned before they are stored (CLEAN_MATERIALS, on by default)."""
+    return os.getenv("CLEAN_MATERIALS", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+@dataclass
+class CleaningReport:
+    """What clean_document removed from one document."""
+    boilerplate_lines: int = 0
+    duplicate_paragraphs: int = 0
+    bytes_removed: int = 0      # UTF-8 size of the removed text
+    tokens_removed: int = 0     # Estimated at CHARS_PER_TOKEN characters per token
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _line_key(line: str) -> str:
+    """A line with digits, case and spacing ignored, so "Page 3 of 40" and "Page 4 of 40" match."""
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def _boilerplate_spans(document: ExtractedDocument) -> List[Tuple[int, int]]:
+    """
+    ``(start, end)`` of the repeated headers, footers and page numbers of a document.
+
+    Only the first and last EDGE_LINES non-blank lines of each page are considered, and a line
+    counts as boilerplate when it repeats on at least BOILERPLATE_MIN_PAGES pages and
+    BOILERPLATE_PAGE_SHARE of them, and is either a page number or contains a word.
+    """
+    bounds = list(document.page_offsets) + [len(document.text)]
+    if len(bounds) - 1 < BOILERPLATE_MIN_PAGES:
+        return []
+    edges = []
+    pages_with_key: Dict[str, set] = defaultdict(set)
+    for page, (page_start, page_end) in enumerate(zip(bounds, bounds[1:])):
+        lines = [(page_start + match.start(), page_start + match.end())
+                 for match in re.finditer(r"[^\n]*\n?", document.text[page_start:page_end])
+                 if match.group().strip()]
+        for start, end in lines[:EDGE_LINES] + lines[EDGE_LINES:][-EDGE_LINES:]:
+            key = _line_key(document.text[start:end])
+            edges.append((key, start, end))
+            pages_with_key[key].add(page)
+
+    needed = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_PAGE_SHARE * (len(bounds) - 1)))
+    boilerplate = {key for key, pages in pages_with_key.items()
+                   if len(pages) >= needed and (WORDY.search(key) or PAGE_NUMBER.fullmatch(key))}
+    return [(start, end) for key, start, end in edges if key in boilerplate]
+
+
+def _paragraphs(text: str) -> List[Tuple[int, int]]:
+    """``(start, end)`` of each paragraph, including the break after it."""
+    spans, start = [], 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        if match.end() > start:
+            spans.append((start, match.end()))
+            start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def _signatures(shingle_sets: Sequence[np.ndarray]) -> np.ndarray:
+    """MinHash signatures, one row of NUM_PERMUTATIONS values per (non-empty) shingle set."""
+    hashes = np.concatenate(shingle_sets)
+    starts = np.cumsum([0] + [len(shingles) for shingles in shingle_sets[:-1]])
+    signatures = np.empty((len(shingle_sets), NUM_PERMUTATIONS), dtype=np.uint64)
+    # Permute in blocks to bound memory for long documents
+    for block in range(0, NUM_PERMUTATIONS, 16):
+        permuted = (_A[block:block + 16, None] * hashes[None, :] + _B[block:block + 16, None]) % PRIME
+        signatures[:, block:block + 16] = np.minimum.reduceat(permuted, starts, axis=1).T
+    return signatures
+
+
+def _duplicate_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    ``(start, end)`` of paragraphs that nearly repeat an earlier paragraph of the text.
+
+    Paragraphs of at least MIN_DUPLICATE_WORDS words are compared as sets of word shingles,
+    with question numbering stripped. MinHash signatures are bucketed per LSH band; a paragraph
+    whose estimated similarity to an earlier kept paragraph in one of its buckets reaches
+    DUPLICATE_THRESHOLD is dropped, so the first occurrence is the one that stays.
+    """
+    candidates, shingle_sets = [], []
+    for start, end in _paragraphs(text):
+        words = WORD.findall(ENUMERATOR.sub("", text[start:end].lower()))
+        if len(words) < MIN_DUPLICATE_WORDS:
+            continue
+        shingles = {" ".join(words[index:index + SHINGLE_WORDS]) for index in range(len(words) - SHINGLE_WORDS + 1)}
+        candidates.append((start, end))
+        shingle_sets.append(np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64))
+    if len(candidates) < 2:
+        return []
+
+    signatures = _signatures(shingle_sets)
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    duplicates = []
+    for index, signature in enumerate(signatures):
+        keys = [(band, signature[band:band + BAND_ROWS].tobytes()) for band in range(0, NUM_PERMUTATIONS, BAND_ROWS)]
+        earlier = {other for key in keys for other in buckets.get(key, ())}
+        if any(np.mean(signatures[other] == signature) >= DUPLICATE_THRESHOLD for other in earlier):
+            duplicates.append(candidates[index])
+            continue
+        for key in keys:
+            buckets[key].append(index)
+    return duplicates
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _remove_spans(document: ExtractedDocument, spans: List[Tuple[int, int]]) -> Tuple[ExtractedDocument, str]:
+    """The document without ``spans``, with page offsets and outline moved to match, and the removed text."""
+    spans = _merge(spans)
+    if not spans:
+        return document, ""
+    starts = np.array([start for start, _ in spans])
+    ends = np.array([end for _, end in spans])
+    removed_before = np.concatenate([[0], np.cumsum(ends - starts)])
+
+    def shift(offset: int) -> int:
+        index = int(np.searchsorted(ends, offset, side="right"))
+        inside = offset - starts[index] if index < len(spans) and starts[index] < offset else 0
+        return int(offset - removed_before[index] - inside)
+
+    kept, removed, position = [], [], 0
+    for start, end in spans:
+        kept.append(document.text[position:start])
+        removed.append(document.text[start:end])
+        position = end
+    kept.append(document.text[position:])
+    cleaned = ExtractedDocument(
+        text="".join(kept),
+        page_offsets=[shift(offset) for offset in document.page_offsets],
+        outline=[OutlineEntry(title=entry.title, level=entry.level, start_page=entry.start_page,
+                              end_page=entry.end_page, start=shift(entry.start), end=shift(entry.end))
+                 for entry in document.outline],
+        outline_source=document.outline_source,
+    )
+    return cleaned, "".join(removed)
+
+
+def clean_document(document: ExtractedDocument, label: str = "notes") -> Tuple[ExtractedDocument, CleaningReport]:
+    """
+    Remove repeated page furniture and near-duplicate paragraphs from extracted materials.
+
+    Headers, footers, course banners and page numbers are found by comparing page edges
+    (see _boilerplate_spans); repeated paragraphs and questions, e.g. from overlapping note
+    sets or question papers of several years, are found with MinHash/LSH (see
+    _duplicate_spans). Page offsets and outline offsets are moved to match the cleaned text.
+
+    Args:
+        document: The extracted (possibly combined) document
+        label: Kind of material, used for the totals in cleaning_stats
+
+    Returns:
+        tuple: The cleaned document and a CleaningReport of what was removed
+    """
+    started = time.perf_counter()
+    boilerplate = _boilerplate_spans(document)
+    document, removed = _remove_spans(document, boilerplate)
+    duplicates = _duplicate_spans(document.text)
+    document, removed_duplicates = _remove_spans(document, duplicates)
+    removed += removed_duplicates
+
+    report = CleaningReport(
+        boilerplate_lines=len(boilerplate),
+        duplicate_paragraphs=len(duplicates),
+        bytes_removed=len(removed.encode("utf-8")),
+        tokens_removed=len(removed) // CHARS_PER_TOKEN,
+    )
+    totals = _stats[label]
+    totals["documents"] += 1
+    for field, value in report.to_dict().items():
+        totals[field] += value
+    logger.info(f"Cleaned {label}: removed {report.boilerplate_lines} boilerplate lines and "
+                f"{report.duplicate_paragraphs} duplicate paragraphs, {report.bytes_removed} bytes "
+                f"(~{report.tokens_removed} tokens), in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return document, report
+
+
+def cleaning_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Totals of what cleaning removed from uploaded materials.
+
+    Returns:
+        dict: ``{label: {"documents", "boilerplate_lines", "duplicate_paragraphs", "bytes_removed", "tokens_removed"}}``
+    """
+    return {label: dict(totals) for label, totals in _stats.items()}
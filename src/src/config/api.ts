@@ -8,8 +8,10 @@ export const BACKEND_API_URL = process.env.NEXT_PUBLIC_BACKEND_URL || process.en
 export const API_ENDPOINTS = {
   CHAT: '/chat/chat',
   PREVIEW: '/preview',
+  PREVIEW_STREAM: '/preview/stream',
   UPLOAD: '/upload',
   STRUCTURE_PLAN: '/plan/structure-plan',
+  STRUCTURE_PLAN_STREAM: '/plan/structure-plan/stream',
   GENERATE_PLAN: '/plan/generate-plan'
 };
 